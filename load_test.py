@@ -0,0 +1,465 @@
+#!/usr/bin/env python3
+"""
+HTTP Load Test
+==============
+
+Load generator for the two FastAPI services:
+
+- recommend:      POST /recommend      (personalisation_algo/src/main.py)
+- generate-image: POST /generate-image (api.py)
+
+Requests are drawn from the data files (customer IDs from transactions,
+product names and categories from the product catalog) and sent by a fixed
+number of closed-loop workers at each concurrency level. For every level the
+report gives throughput, latency percentiles and error rates; the highest
+throughput across levels is the saturation estimate. Results are saved as
+JSON and can be compared with a previous run.
+
+The app can be driven in-process (ASGI, no server needed; requires httpx) or
+over HTTP against a running server (httpx if installed, otherwise urllib).
+
+Usage:
+    # In-process, concurrency sweep
+    python load_test.py recommend --in-process --concurrency 1,4,16 --requests 200
+
+    # Against a running server
+    python load_test.py generate-image --url http://localhost:9000 --concurrency 1,2 --requests 20
+
+    # Request mix and comparison with a previous run
+    python load_test.py recommend --in-process --mix known=0.9,unknown=0.1 \\
+        --output results/new.json --compare results/old.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+try:
+    import httpx
+    HAS_HTTPX = True
+except ImportError:
+    HAS_HTTPX = False
+
+
+ROOT = Path(__file__).parent.resolve()
+RECOMMENDER_DIR = ROOT / 'personalisation_algo'
+
+# Request kinds per target; --mix assigns weights to these
+TARGETS = {
+    'recommend': {
+        'path': '/recommend',
+        'kinds': ['known', 'unknown'],
+        'default_mix': {'known': 1.0},
+    },
+    'generate-image': {
+        'path': '/generate-image',
+        'kinds': ['square', 'vertical', 'horizontal'],
+        'default_mix': {'square': 1.0},
+    },
+}
+
+
+def parse_mix(mix: Optional[str], target: str) -> Dict[str, float]:
+    """Parse 'kind=weight,...' into normalized weights for a target."""
+    if not mix:
+        return TARGETS[target]['default_mix']
+
+    weights = {}
+    for part in mix.split(','):
+        kind, _, weight = part.partition('=')
+        kind = kind.strip()
+        if kind not in TARGETS[target]['kinds']:
+            raise ValueError(f"Unknown request kind '{kind}' for {target}; "
+                             f"expected one of {TARGETS[target]['kinds']}")
+        weights[kind] = float(weight) if weight else 1.0
+
+    total = sum(weights.values())
+    if total <= 0:
+        raise ValueError("Request mix weights must sum to a positive value")
+    return {kind: weight / total for kind, weight in weights.items()}
+
+
+def build_payload_factory(
+    target: str,
+    mix: Dict[str, float],
+    products_path: Path,
+    transactions_path: Path,
+    clickstream_path: Path,
+    seed: int
+) -> Callable[[], Tuple[str, Dict]]:
+    """
+    Create a function returning (kind, JSON payload) for each request.
+
+    Args:
+        target: 'recommend' or 'generate-image'
+        mix: Normalized weights per request kind
+        products_path: Product catalog CSV
+        transactions_path: Transactions CSV (customer IDs)
+        clickstream_path: Clickstream CSV (passed through to /recommend)
+        seed: Random seed for the request sequence
+
+    Returns:
+        Payload factory
+    """
+    rng = random.Random(seed)
+    kinds = list(mix.keys())
+    weights = list(mix.values())
+
+    if target == 'recommend':
+        customer_ids = pd.read_csv(transactions_path, usecols=['customer_id'])['customer_id'].unique().tolist()
+        paths = {
+            'products_path': str(products_path.resolve()),
+            'transactions_path': str(transactions_path.resolve()),
+            'clickstream_path': str(clickstream_path.resolve()),
+        }
+
+        def make_payload():
+            kind = rng.choices(kinds, weights)[0]
+            if kind == 'known':
+                customer_id = rng.choice(customer_ids)
+            else:
+                customer_id = f"UNKNOWN{rng.randrange(10**6):06d}"
+            return kind, {'customer_id': customer_id, **paths}
+
+    else:
+        products = pd.read_csv(products_path, usecols=['product_name', 'product_category'])
+        catalog = list(zip(products['product_name'], products['product_category']))
+
+        def make_payload():
+            kind = rng.choices(kinds, weights)[0]
+            product_name, product_category = rng.choice(catalog)
+            return kind, {
+                'product_name': product_name,
+                'product_category': product_category,
+                'layout': kind,
+                'seed': rng.randrange(1000),
+                'as_base64': True,
+            }
+
+    return make_payload
+
+
+def load_app(target: str):
+    """Import the target's FastAPI app for in-process testing."""
+    if target == 'recommend':
+        # The recommender resolves config/ and data/ relative to its directory
+        os.chdir(RECOMMENDER_DIR)
+        sys.path.insert(0, str(RECOMMENDER_DIR))
+        from src.main import create_app
+        return create_app()
+
+    sys.path.insert(0, str(ROOT))
+    from api import app
+    return app
+
+
+async def run_level_httpx(
+    client,
+    path: str,
+    make_payload: Callable,
+    concurrency: int,
+    total_requests: int,
+    duration: Optional[float]
+) -> List[Tuple[str, float, int, Optional[str]]]:
+    """Drive one concurrency level with asyncio workers sharing an httpx client."""
+    results = []
+    issued = 0
+    deadline = time.perf_counter() + duration if duration else None
+
+    def next_payload():
+        nonlocal issued
+        if deadline is not None:
+            if time.perf_counter() >= deadline:
+                return None
+        elif issued >= total_requests:
+            return None
+        issued += 1
+        return make_payload()
+
+    async def worker():
+        while True:
+            request = next_payload()
+            if request is None:
+                return
+            kind, payload = request
+            start = time.perf_counter()
+            detail = None
+            try:
+                response = await client.post(path, json=payload)
+                status = response.status_code
+                if status >= 400:
+                    detail = response.text[:300]
+            except Exception as e:
+                status = 0
+                detail = repr(e)
+            results.append((kind, time.perf_counter() - start, status, detail))
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return results
+
+
+def run_level_urllib(
+    base_url: str,
+    path: str,
+    make_payload: Callable,
+    concurrency: int,
+    total_requests: int,
+    duration: Optional[float],
+    timeout: float
+) -> List[Tuple[str, float, int, Optional[str]]]:
+    """Drive one concurrency level with threads and urllib (no httpx)."""
+    deadline = time.perf_counter() + duration if duration else None
+    requests = [make_payload() for _ in range(total_requests)] if deadline is None else None
+
+    def send(kind, payload):
+        request = urllib.request.Request(
+            base_url.rstrip('/') + path,
+            data=json.dumps(payload).encode('utf-8'),
+            headers={'Content-Type': 'application/json'},
+            method='POST'
+        )
+        start = time.perf_counter()
+        detail = None
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                response.read()
+                status = response.status
+        except urllib.error.HTTPError as e:
+            status = e.code
+            detail = e.read().decode('utf-8', errors='replace')[:300]
+        except Exception as e:
+            status = 0
+            detail = repr(e)
+        return kind, time.perf_counter() - start, status, detail
+
+    def timed_worker():
+        results = []
+        while time.perf_counter() < deadline:
+            results.append(send(*make_payload()))
+        return results
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        if requests is not None:
+            return list(pool.map(lambda request: send(*request), requests))
+        futures = [pool.submit(timed_worker) for _ in range(concurrency)]
+        return [result for future in futures for result in future.result()]
+
+
+def summarize(results: List[Tuple[str, float, int, Optional[str]]], elapsed: float, concurrency: int) -> Dict:
+    """Latency percentiles, error rates and throughput for one level."""
+    latencies = np.array([latency for _, latency, _, _ in results]) * 1000
+    statuses = np.array([status for _, _, status, _ in results])
+    ok = (statuses >= 200) & (statuses < 300)
+
+    status_counts = {}
+    for status in statuses:
+        key = str(status) if status else 'connection_error'
+        status_counts[key] = status_counts.get(key, 0) + 1
+
+    kinds = {}
+    for kind in sorted({kind for kind, _, _, _ in results}):
+        kind_latencies = np.array([latency for k, latency, _, _ in results if k == kind]) * 1000
+        kinds[kind] = {
+            'requests': len(kind_latencies),
+            'p50_ms': float(np.percentile(kind_latencies, 50)),
+            'p95_ms': float(np.percentile(kind_latencies, 95)),
+        }
+
+    return {
+        'concurrency': concurrency,
+        'requests': len(results),
+        'elapsed_seconds': elapsed,
+        'throughput_rps': len(results) / elapsed if elapsed > 0 else 0.0,
+        'success_rps': int(ok.sum()) / elapsed if elapsed > 0 else 0.0,
+        'error_rate': float(1 - ok.mean()) if len(results) else 0.0,
+        'latency_ms': {
+            'p50': float(np.percentile(latencies, 50)) if len(results) else 0.0,
+            'p95': float(np.percentile(latencies, 95)) if len(results) else 0.0,
+            'p99': float(np.percentile(latencies, 99)) if len(results) else 0.0,
+            'max': float(latencies.max()) if len(results) else 0.0,
+            'mean': float(latencies.mean()) if len(results) else 0.0,
+        },
+        'status_counts': status_counts,
+        'by_kind': kinds,
+        # First distinct error responses, to tell timeouts from server errors
+        'error_samples': list(dict.fromkeys(detail for _, _, _, detail in results if detail))[:5],
+    }
+
+
+async def run_httpx(args, path, make_payload, levels) -> List[Dict]:
+    """Run all concurrency levels with httpx (in-process or over HTTP)."""
+    if args.in_process:
+        app = load_app(args.target)
+        transport = httpx.ASGITransport(app=app)
+        client = httpx.AsyncClient(transport=transport, base_url='http://load-test', timeout=args.timeout)
+    else:
+        limits = httpx.Limits(max_connections=max(levels), max_keepalive_connections=max(levels))
+        client = httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits)
+
+    summaries = []
+    async with client:
+        for _ in range(args.warmup):
+            await client.post(path, json=make_payload()[1])
+        for concurrency in levels:
+            start = time.perf_counter()
+            results = await run_level_httpx(
+                client, path, make_payload, concurrency, args.requests, args.duration
+            )
+            summaries.append(summarize(results, time.perf_counter() - start, concurrency))
+            print_level(summaries[-1])
+    return summaries
+
+
+def run_urllib(args, path, make_payload, levels) -> List[Dict]:
+    """Run all concurrency levels with urllib threads."""
+    summaries = []
+    for _ in range(args.warmup):
+        run_level_urllib(args.url, path, make_payload, 1, 1, None, args.timeout)
+    for concurrency in levels:
+        start = time.perf_counter()
+        results = run_level_urllib(
+            args.url, path, make_payload, concurrency, args.requests, args.duration, args.timeout
+        )
+        summaries.append(summarize(results, time.perf_counter() - start, concurrency))
+        print_level(summaries[-1])
+    return summaries
+
+
+def print_level(summary: Dict):
+    """Print one concurrency level."""
+    latency = summary['latency_ms']
+    print(f"  c={summary['concurrency']:<4} {summary['requests']:>6} req  "
+          f"{summary['throughput_rps']:8.1f} rps  "
+          f"p50 {latency['p50']:8.1f} ms  p95 {latency['p95']:8.1f} ms  p99 {latency['p99']:8.1f} ms  "
+          f"errors {summary['error_rate']:6.1%}")
+
+
+def compare(current: Dict, previous_path: str):
+    """Print per-level changes against a previous results file."""
+    with open(previous_path, 'r') as f:
+        previous = json.load(f)
+
+    previous_levels = {level['concurrency']: level for level in previous['levels']}
+    print(f"\nComparison with {previous_path} ({previous.get('timestamp', 'unknown time')}):")
+    for level in current['levels']:
+        before = previous_levels.get(level['concurrency'])
+        if before is None:
+            continue
+
+        def change(new, old):
+            return f"{(new - old) / old:+.1%}" if old else "n/a"
+
+        print(f"  c={level['concurrency']:<4} "
+              f"rps {change(level['throughput_rps'], before['throughput_rps']):>8}  "
+              f"p50 {change(level['latency_ms']['p50'], before['latency_ms']['p50']):>8}  "
+              f"p95 {change(level['latency_ms']['p95'], before['latency_ms']['p95']):>8}  "
+              f"p99 {change(level['latency_ms']['p99'], before['latency_ms']['p99']):>8}  "
+              f"errors {level['error_rate'] - before['error_rate']:+.1%}")
+
+
+def git_revision() -> Optional[str]:
+    """Current git commit, if available, to label results."""
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Load test the recommendation and image generation APIs",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__
+    )
+    parser.add_argument('target', choices=sorted(TARGETS))
+    where = parser.add_mutually_exclusive_group(required=True)
+    where.add_argument('--in-process', action='store_true', help="Call the ASGI app directly (requires httpx)")
+    where.add_argument('--url', help="Base URL of a running server, e.g. http://localhost:8000")
+    parser.add_argument('--concurrency', default='1,4,16', help="Comma-separated concurrency levels")
+    parser.add_argument('--requests', type=int, default=100, help="Requests per concurrency level")
+    parser.add_argument('--duration', type=float, default=None,
+                        help="Seconds per concurrency level (overrides --requests)")
+    parser.add_argument('--mix', default=None,
+                        help="Request kind weights: recommend known/unknown, generate-image square/vertical/horizontal")
+    parser.add_argument('--warmup', type=int, default=2, help="Untimed requests before the first level")
+    parser.add_argument('--timeout', type=float, default=120.0, help="Per-request timeout in seconds")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--products', default=str(RECOMMENDER_DIR / 'data/sample/sample_products.csv'))
+    parser.add_argument('--transactions', default=str(RECOMMENDER_DIR / 'data/sample/sample_transactions.csv'))
+    parser.add_argument('--clickstream', default=str(RECOMMENDER_DIR / 'data/sample/sample_clickstream.csv'))
+    parser.add_argument('--output', default=None, help="Save results as JSON")
+    parser.add_argument('--compare', default=None, help="Previous results JSON to compare against")
+    args = parser.parse_args()
+
+    if args.in_process and not HAS_HTTPX:
+        print("✗ In-process mode requires httpx: pip install httpx")
+        sys.exit(1)
+
+    levels = [int(level) for level in args.concurrency.split(',')]
+    mix = parse_mix(args.mix, args.target)
+    make_payload = build_payload_factory(
+        args.target, mix, Path(args.products), Path(args.transactions), Path(args.clickstream), args.seed
+    )
+    path = TARGETS[args.target]['path']
+
+    mode = 'in-process' if args.in_process else args.url
+    amount = f"{args.duration}s" if args.duration else f"{args.requests} requests"
+    print("=" * 80)
+    print(f"Load test: {args.target} ({path}) via {mode}")
+    print(f"Mix: {mix}   Levels: {levels}   {amount} per level")
+    print("=" * 80)
+
+    if HAS_HTTPX:
+        levels_summary = asyncio.run(run_httpx(args, path, make_payload, levels))
+    else:
+        levels_summary = run_urllib(args, path, make_payload, levels)
+
+    saturation = max(levels_summary, key=lambda level: level['success_rps'])
+    print(f"\nSaturation throughput: {saturation['success_rps']:.1f} successful rps "
+          f"at concurrency {saturation['concurrency']}")
+
+    results = {
+        'target': args.target,
+        'mode': mode,
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'git_revision': git_revision(),
+        'mix': mix,
+        'requests_per_level': None if args.duration else args.requests,
+        'duration_per_level': args.duration,
+        'levels': levels_summary,
+        'saturation': {
+            'concurrency': saturation['concurrency'],
+            'success_rps': saturation['success_rps'],
+        },
+    }
+
+    if args.compare:
+        compare(results, args.compare)
+
+    if args.output:
+        output = Path(args.output)
+        output.parent.mkdir(parents=True, exist_ok=True)
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\n✓ Results saved to {output}")
+
+
+if __name__ == '__main__':
+    main()
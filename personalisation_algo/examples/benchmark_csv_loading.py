@@ -0,0 +1,166 @@
+"""
+Benchmark: CSV ingestion with inferred types vs declared schemas
+
+Compares the previous load path (pd.read_csv with type inference, then
+pd.to_datetime with format inference, one file after the other) with
+CsvLoader reading the same files with their declared schemas: sequentially,
+concurrently and in chunks. Reports time, throughput and the memory of the
+loaded tables.
+
+Usage:
+    python examples/benchmark_csv_loading.py [--rows 2000000] [--customers 200000]
+        [--chunksize 500000] [--peak-memory]
+    python examples/benchmark_csv_loading.py --files products.csv transactions.csv clickstream.csv
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.schemas import CLICKSTREAM, PRODUCTS, TRANSACTIONS, CsvLoader, HAS_PYARROW
+
+
+def make_files(directory, rows, customers, seed=0):
+    """Write synthetic products, transactions and clickstream CSVs."""
+    rng = np.random.default_rng(seed)
+    categories = np.array(['dairy', 'bakery', 'produce', 'meat', 'frozen', 'snacks', 'beverages', 'pantry'])
+    product_ids = np.array([f"P{i:04d}" for i in range(1000)])
+    product_categories = rng.choice(categories, len(product_ids))
+    pd.DataFrame({
+        'product_id': product_ids,
+        'product_name': [f"Product {i}" for i in range(len(product_ids))],
+        'product_category': product_categories,
+        'is_discounted': rng.random(len(product_ids)) < 0.2,
+        'in_stock': rng.random(len(product_ids)) < 0.9,
+        'price': rng.uniform(0.5, 20, len(product_ids)).round(2)
+    }).to_csv(os.path.join(directory, 'products.csv'), index=False)
+
+    customer_ids = pd.Series(rng.integers(0, customers, rows)).map('C{:07d}'.format)
+    products = rng.integers(0, len(product_ids), rows)
+    dates = pd.Timestamp('2023-01-01') + pd.to_timedelta(rng.integers(0, 700, rows), unit='D')
+    pd.DataFrame({
+        'customer_id': customer_ids,
+        'product_id': product_ids[products],
+        'date_of_transaction': dates.strftime('%Y-%m-%d'),
+        'quantity': rng.integers(1, 5, rows),
+        'product_category': product_categories[products],
+        'total_amount': rng.uniform(1, 50, rows).round(2),
+        'store_id': rng.choice(['S001', 'S002', 'S003'], rows)
+    }).to_csv(os.path.join(directory, 'transactions.csv'), index=False)
+
+    products = rng.integers(0, len(product_ids), rows)
+    timestamps = pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 330 * 86400, rows), unit='s')
+    pd.DataFrame({
+        'customer_id': customer_ids,
+        'session_id': pd.Series(rng.integers(0, rows // 10 + 1, rows)).map('S{}'.format),
+        'event_id': pd.Series(np.arange(rows)).map('E{}'.format),
+        'event_timestamp': timestamps.strftime('%Y-%m-%dT%H:%M:%S'),
+        'event_type': rng.choice(['view', 'click', 'add_to_cart'], rows, p=[0.7, 0.25, 0.05]),
+        'page_category': product_categories[products],
+        'device_type': rng.choice(['mobile', 'web', 'app'], rows),
+        'product_id': product_ids[products]
+    }).to_csv(os.path.join(directory, 'clickstream.csv'), index=False)
+
+    return tuple(os.path.join(directory, name) for name in ('products.csv', 'transactions.csv', 'clickstream.csv'))
+
+
+def inferred_load(paths):
+    """The load path before declared schemas."""
+    products = pd.read_csv(paths[0])
+    transactions = pd.read_csv(paths[1])
+    transactions['date_of_transaction'] = pd.to_datetime(transactions['date_of_transaction'])
+    clickstream = pd.read_csv(paths[2])
+    clickstream['event_timestamp'] = pd.to_datetime(clickstream['event_timestamp'])
+    return products, transactions, clickstream
+
+
+def schema_load(paths, csv_config):
+    """Load with CsvLoader, as RecommendationEngine.build_dataset does."""
+    loader = CsvLoader({'csv': csv_config})
+    return loader.gather(
+        lambda: loader.read(paths[0], PRODUCTS),
+        lambda: loader.read(paths[1], TRANSACTIONS),
+        lambda: loader.read(paths[2], CLICKSTREAM)
+    )
+
+
+def measure(label, func, total_bytes, peak_memory):
+    """Run func, returning its tables, elapsed seconds and the tables' memory."""
+    start = time.perf_counter()
+    tables = func()
+    elapsed = time.perf_counter() - start
+    rows = sum(len(table) for table in tables)
+    table_bytes = sum(table.memory_usage(deep=True).sum() for table in tables)
+
+    peak = ''
+    if peak_memory:
+        del tables
+        tracemalloc.start()
+        tables = func()
+        peak = f"   peak {tracemalloc.get_traced_memory()[1] / 1e6:8.1f} MB"
+        tracemalloc.stop()
+
+    print(f"  {label:<26} {elapsed:7.2f}s {rows / elapsed / 1e6:7.2f}M rows/s "
+          f"{total_bytes / elapsed / 1e6:7.1f} MB/s   tables {table_bytes / 1e6:7.1f} MB{peak}")
+    return tables, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark CSV ingestion")
+    parser.add_argument('--rows', type=int, default=2_000_000, help="Transactions and clickstream rows each")
+    parser.add_argument('--customers', type=int, default=200_000)
+    parser.add_argument('--chunksize', type=int, default=500_000)
+    parser.add_argument('--files', nargs=3, default=None,
+                        metavar=('PRODUCTS', 'TRANSACTIONS', 'CLICKSTREAM'),
+                        help="Benchmark existing files instead of synthetic ones")
+    parser.add_argument('--peak-memory', action='store_true',
+                        help="Also trace peak Python memory (a second, slower run of each path)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        if args.files:
+            paths = tuple(args.files)
+        else:
+            print(f"Generating {args.rows:,} transactions and clickstream events "
+                  f"({args.customers:,} customers)...")
+            paths = make_files(directory, args.rows, args.customers)
+        total_bytes = sum(os.path.getsize(path) for path in paths)
+
+        print(f"\n{'='*70}")
+        print("CSV INGESTION BENCHMARK")
+        print(f"{'='*70}")
+        print(f"Files: {total_bytes / 1e6:.1f} MB, parser: {'pyarrow' if HAS_PYARROW else 'c'}, "
+              f"CPUs: {os.cpu_count()}\n")
+
+        baseline, baseline_seconds = measure(
+            "inferred, sequential", lambda: inferred_load(paths), total_bytes, args.peak_memory
+        )
+        runs = [
+            ("schema, sequential", {'concurrent': False}),
+            ("schema, concurrent", {'concurrent': True}),
+            (f"schema, chunks of {args.chunksize:,}", {'concurrent': True, 'chunksize': args.chunksize}),
+            ("schema, no categoricals", {'concurrent': True, 'categorical': False}),
+        ]
+        for label, csv_config in runs:
+            tables, seconds = measure(
+                label, lambda: schema_load(paths, csv_config), total_bytes, args.peak_memory
+            )
+            for expected, table in zip(baseline, tables):
+                pd.testing.assert_frame_equal(
+                    expected, table, check_dtype=False, check_categorical=False
+                )
+            print(f"  {'':<26} {baseline_seconds / seconds:6.2f}x vs inferred, same values")
+
+
+if __name__ == '__main__':
+    main()
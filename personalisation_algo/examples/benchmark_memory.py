@@ -0,0 +1,134 @@
+"""
+Benchmark: resident memory of the transactions and clickstream tables
+
+Loads the same files in fresh processes, as read by CsvLoader and after
+compact_table, and reports each process's resident memory growth per
+million rows together with the tables' own size. Also times fetching one
+customer's rows as scoring does (slice, then expand_table).
+
+Usage:
+    python examples/benchmark_memory.py [--rows 2000000] [--customers 200000]
+    python examples/benchmark_memory.py --files products.csv transactions.csv clickstream.csv
+"""
+
+import gc
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from benchmark_csv_loading import make_files
+from src.compact import compact_table, expand_table, release_memory, table_bytes
+from src.schemas import CLICKSTREAM, TRANSACTIONS, CsvLoader
+
+
+def resident_bytes():
+    """Current resident set size of this process."""
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def measure_layout(transactions_path, clickstream_path, compact, samples):
+    """Load the tables in this process and return memory and slice timings."""
+    gc.collect()
+    baseline = resident_bytes()
+
+    loader = CsvLoader({})
+    transactions, clickstream = loader.gather(
+        lambda: loader.read(transactions_path, TRANSACTIONS),
+        lambda: loader.read(clickstream_path, CLICKSTREAM)
+    )
+    if compact:
+        transactions, clickstream = compact_table(transactions), compact_table(clickstream)
+    gc.collect()
+    release_memory()
+    resident = resident_bytes() - baseline
+
+    customers = transactions['customer_id'].drop_duplicates().head(samples).tolist()
+    start = time.perf_counter()
+    for customer_id in customers:
+        expand_table(transactions[transactions['customer_id'] == customer_id])
+        expand_table(clickstream[clickstream['customer_id'] == customer_id])
+    slice_ms = (time.perf_counter() - start) / max(len(customers), 1) * 1000
+
+    return {
+        'rows': len(transactions) + len(clickstream),
+        'resident': resident,
+        'tables': table_bytes(transactions, clickstream),
+        'slice_ms': slice_ms,
+        'dtypes': {
+            f"{name}.{column}": str(dtype)
+            for name, table in (('transactions', transactions), ('clickstream', clickstream))
+            for column, dtype in table.dtypes.items()
+        }
+    }
+
+
+def run_child(transactions_path, clickstream_path, compact, samples):
+    """Measure one layout in a fresh interpreter, so memory freed by the other is not reused."""
+    output = subprocess.run(
+        [sys.executable, __file__, '--child', 'compact' if compact else 'loaded',
+         '--samples', str(samples), '--tables', transactions_path, clickstream_path],
+        check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark table memory")
+    parser.add_argument('--rows', type=int, default=2_000_000, help="Transactions and clickstream rows each")
+    parser.add_argument('--customers', type=int, default=200_000)
+    parser.add_argument('--samples', type=int, default=200, help="Customers to time slices for")
+    parser.add_argument('--files', nargs=3, default=None,
+                        metavar=('PRODUCTS', 'TRANSACTIONS', 'CLICKSTREAM'),
+                        help="Benchmark existing files instead of synthetic ones")
+    parser.add_argument('--child', choices=('loaded', 'compact'), help=argparse.SUPPRESS)
+    parser.add_argument('--tables', nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        result = measure_layout(args.tables[0], args.tables[1], args.child == 'compact', args.samples)
+        print(json.dumps(result))
+        return
+
+    if sys.platform != 'linux':
+        sys.exit("Resident memory is read from /proc; run this benchmark on Linux")
+
+    with tempfile.TemporaryDirectory() as directory:
+        if args.files:
+            paths = tuple(args.files)
+        else:
+            print(f"Generating {args.rows:,} transactions and clickstream events "
+                  f"({args.customers:,} customers)...")
+            paths = make_files(directory, args.rows, args.customers)
+
+        loaded = run_child(paths[1], paths[2], False, args.samples)
+        compact = run_child(paths[1], paths[2], True, args.samples)
+
+    print(f"\n{'='*70}")
+    print("TABLE MEMORY BENCHMARK")
+    print(f"{'='*70}")
+    print(f"Transactions + clickstream: {loaded['rows']:,} rows\n")
+    print(f"  {'':<10} {'resident MB/M rows':>19} {'tables MB/M rows':>17} {'slice ms':>9}")
+    for label, result in (('loaded', loaded), ('compact', compact)):
+        per_million = 1e6 / result['rows'] / 1e6
+        print(f"  {label:<10} {result['resident'] * per_million:19.1f} "
+              f"{result['tables'] * per_million:17.1f} {result['slice_ms']:9.2f}")
+    print(f"\n  Resident memory {loaded['resident'] / max(compact['resident'], 1):.2f}x smaller, "
+          f"tables {loaded['tables'] / compact['tables']:.2f}x smaller\n")
+
+    print(f"  {'column':<34} {'loaded':<16} compact")
+    for column, dtype in compact['dtypes'].items():
+        if dtype != loaded['dtypes'][column]:
+            print(f"  {column:<34} {loaded['dtypes'][column]:<16} {dtype}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""
+Benchmark: sequential vs thread-pool evaluation of scoring components
+
+Generates a synthetic catalog with a few heavy customers and scores each of
+them with parallel_scoring disabled and enabled, reporting per-component
+and wall-clock time and checking the scores are identical.
+
+Usage:
+    python examples/benchmark_parallel_scoring.py [--customers 20]
+        [--transactions-per-customer 5000] [--clicks-per-customer 5000]
+        [--products 5000] [--workers 4] [--sparse]
+"""
+
+import sys
+import copy
+import time
+import argparse
+import logging
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import yaml
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.scoring_engine import ProductScoringEngine
+from src.interaction_matrix import InteractionMatrix
+
+
+CATEGORIES = ['dairy', 'bakery', 'produce', 'meat', 'frozen', 'snacks', 'beverages', 'pantry']
+
+
+def make_data(customers, transactions_per_customer, clicks_per_customer, products, seed=0):
+    """Generate a synthetic catalog, transactions and clickstream."""
+    rng = np.random.default_rng(seed)
+    end = pd.Timestamp('2024-11-20')
+    catalog = pd.DataFrame({
+        'product_id': [f'P{i:05d}' for i in range(products)],
+        'product_name': [f'Product {i}' for i in range(products)],
+        'product_category': rng.choice(CATEGORIES, products),
+        'is_discounted': rng.random(products) < 0.2,
+        'in_stock': True,
+        'price': rng.uniform(1, 20, products).round(2)
+    })
+    categories = catalog.set_index('product_id')['product_category']
+    customer_ids = [f'C{i:05d}' for i in range(customers)]
+
+    rows = customers * transactions_per_customer
+    product_ids = rng.choice(catalog['product_id'].to_numpy(), rows)
+    transactions = pd.DataFrame({
+        'customer_id': np.repeat(customer_ids, transactions_per_customer),
+        'product_id': product_ids,
+        'date_of_transaction': end - pd.to_timedelta(rng.integers(0, 900, rows), unit='D'),
+        'quantity': rng.integers(1, 5, rows),
+        'product_category': categories.loc[product_ids].to_numpy(),
+        'total_amount': 1.0,
+        'store_id': 'S001'
+    })
+
+    rows = customers * clicks_per_customer
+    product_ids = rng.choice(catalog['product_id'].to_numpy(), rows)
+    clickstream = pd.DataFrame({
+        'customer_id': np.repeat(customer_ids, clicks_per_customer),
+        'session_id': 'S1',
+        'event_id': np.arange(rows).astype(str),
+        'event_timestamp': end - pd.to_timedelta(rng.integers(0, 90 * 86400, rows), unit='s'),
+        'event_type': rng.choice(['view', 'click', 'add_to_cart'], rows),
+        'page_category': categories.loc[product_ids].to_numpy(),
+        'device_type': 'mobile',
+        'product_id': product_ids
+    })
+    return catalog, transactions, clickstream, customer_ids, end
+
+
+def run(engine, customer_ids, catalog, transactions, clickstream, current_time, inputs):
+    """Score every customer, returning final scores, summed component timings and wall time."""
+    totals = {}
+    finals = []
+    start = time.perf_counter()
+    for customer_id in customer_ids:
+        timings = {}
+        scored = engine.score_products(
+            customer_id, catalog, transactions, clickstream, current_time,
+            timings=timings, **inputs
+        )
+        finals.append(scored['final_score'].to_numpy())
+        for name, seconds in timings.items():
+            totals[name] = totals.get(name, 0.0) + seconds
+    return np.vstack(finals), totals, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark parallel component scoring")
+    parser.add_argument('--customers', type=int, default=20)
+    parser.add_argument('--transactions-per-customer', type=int, default=5_000)
+    parser.add_argument('--clicks-per-customer', type=int, default=5_000)
+    parser.add_argument('--products', type=int, default=5_000)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--sparse', action='store_true',
+                        help='Read history from an InteractionMatrix instead of the tables')
+    args = parser.parse_args()
+    logging.disable(logging.WARNING)
+
+    with open(Path(__file__).parent.parent / 'config' / 'config.yaml') as f:
+        config = yaml.safe_load(f)
+    config['selection']['random_seed'] = 42
+
+    print(f"Generating {args.customers} customers with {args.transactions_per_customer:,} "
+          f"transactions and {args.clicks_per_customer:,} clicks each...")
+    catalog, transactions, clickstream, customer_ids, current_time = make_data(
+        args.customers, args.transactions_per_customer, args.clicks_per_customer, args.products
+    )
+    inputs = {'popularity': ProductScoringEngine(config).compute_popularity(transactions)}
+    if args.sparse:
+        inputs['interactions'] = InteractionMatrix.build(catalog, transactions, clickstream, config)
+
+    results = {}
+    for label, enabled in [('sequential', False), ('parallel', True)]:
+        engine_config = copy.deepcopy(config)
+        engine_config['parallel_scoring'] = {'enabled': enabled, 'max_workers': args.workers}
+        engine = ProductScoringEngine(engine_config)
+        # Warm up caches and the thread pool
+        run(engine, customer_ids[:1], catalog, transactions, clickstream, current_time, inputs)
+        results[label] = run(engine, customer_ids, catalog, transactions, clickstream, current_time, inputs)
+
+    print(f"\n{'='*70}")
+    print(f"COMPONENT SCORING BENCHMARK ({'sparse' if args.sparse else 'table'} path)")
+    print(f"{'='*70}")
+    print(f"  {'component':<24} {'sequential':>14} {'parallel':>14}")
+    for name in results['sequential'][1]:
+        sequential_ms = results['sequential'][1][name] / args.customers * 1000
+        parallel_ms = results['parallel'][1].get(name, 0.0) / args.customers * 1000
+        print(f"  {name:<24} {sequential_ms:11.1f} ms {parallel_ms:11.1f} ms")
+    sequential_ms = results['sequential'][2] / args.customers * 1000
+    parallel_ms = results['parallel'][2] / args.customers * 1000
+    print(f"  {'wall per customer':<24} {sequential_ms:11.1f} ms {parallel_ms:11.1f} ms")
+    print(f"\n  Speedup: {sequential_ms / parallel_ms:.2f}x")
+    identical = np.array_equal(results['sequential'][0], results['parallel'][0])
+    print(f"  Identical scores: {identical}")
+
+
+if __name__ == '__main__':
+    main()
@@ -3,14 +3,46 @@ Comprehensive test of the recommendation algorithm
 Tests all major functionality and requirements
 """
 
+import gc
+import json
+import logging
+import shutil
+import subprocess
 import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from types import SimpleNamespace
 from datetime import datetime
 
+import numpy as np
+import pandas as pd
+import yaml
+from fastapi.testclient import TestClient
+
 # Add parent directory to path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from src.main import RecommendationEngine
+from src.main import RecommendationEngine, create_app
+from src.base_scores import BaseScoreCache
+from src.batch import run_batch
+from src.candidate_generator import measure_recall
+from src.catalog_feed import CatalogFeed
+from src.compact import expand_table, table_bytes
+from src.copurchase import CoPurchaseIndex
+from src.events import EventIngestor
+from src.factor_model import FactorModel
+from src.history_horizon import HistoryHorizon, deviation_report
+from src.latency_budget import LatencyBudget
+from src.refresher import DatasetRefresher
+from src.replay import replay
+from src.rollup import row_counts
+from src.schemas import CLICKSTREAM, PRODUCTS, TRANSACTIONS, CsvLoader
+from src.selector import ProductSelector
+from src.sharding import ShardSpec, WrongShardError, shard_of
+from src.sketches import ProductPopularitySketch
+from src.weight_grid import evaluate_weight_grid
 
 
 def test_single_recommendation():
@@ -243,6 +275,1624 @@ def test_output_format():
     print("\nTEST 6 PASSED ✓\n")
 
 
+def _engine_with(settings):
+    """Engine on config/config.yaml with some sections updated (or replaced, if not mappings)."""
+    with open('config/config.yaml') as f:
+        config = yaml.safe_load(f)
+    for section, values in settings.items():
+        if isinstance(values, dict):
+            config.setdefault(section, {}).update(values)
+        else:
+            config[section] = values
+    path = Path(tempfile.mkdtemp()) / 'config.yaml'
+    with open(path, 'w') as f:
+        yaml.safe_dump(config, f)
+    return RecommendationEngine(str(path))
+
+
+def _synthetic_history(products, customers=30, days=20, seed=0):
+    """Random transactions (whole days) and clickstream (any time) over the catalog."""
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp('2024-11-01')
+    customer_ids = [f"C{i:03d}" for i in range(customers)]
+    
+    n_transactions = customers * 12
+    rows = rng.integers(0, len(products), n_transactions)
+    transactions = pd.DataFrame({
+        'customer_id': rng.choice(customer_ids, n_transactions),
+        'product_id': products['product_id'].values[rows],
+        'date_of_transaction': start + pd.to_timedelta(rng.integers(0, days, n_transactions), unit='D'),
+        'quantity': rng.integers(1, 4, n_transactions),
+        'product_category': products['product_category'].values[rows],
+        'total_amount': 1.0,
+        'store_id': 'S001'
+    })
+    
+    n_clicks = customers * 20
+    rows = rng.integers(0, len(products), n_clicks)
+    clickstream = pd.DataFrame({
+        'customer_id': rng.choice(customer_ids, n_clicks),
+        'session_id': 'S001',
+        'event_id': [f"E{i:05d}" for i in range(n_clicks)],
+        'event_timestamp': start + pd.to_timedelta(rng.integers(0, days * 86400, n_clicks), unit='s'),
+        'event_type': rng.choice(['view', 'click', 'add_to_cart'], n_clicks),
+        'page_category': products['product_category'].values[rows],
+        'device_type': 'mobile',
+        'product_id': products['product_id'].values[rows]
+    })
+    return transactions, clickstream
+
+
+def test_replay_base_scores():
+    """Test that replay with sub-day steps is unaffected by the base score cache"""
+    print("\n" + "="*70)
+    print("TEST 7: Replay With Sub-Day Steps")
+    print("="*70)
+    
+    recommendations = {}
+    for enabled in (True, False):
+        engine = _engine_with({'base_scores': {'enabled': enabled}, 'selection': {'random_seed': 7}})
+        products, _, _ = engine.load_data(
+            'data/sample_products.csv',
+            'data/sample_transactions.csv',
+            'data/sample_clickstream.csv'
+        )
+        transactions, clickstream = _synthetic_history(products)
+        
+        picks = []
+        recommend_product = engine.recommend_product
+        def recording(*args, **kwargs):
+            result = recommend_product(*args, **kwargs)
+            picks.append(result and (result['customer_id'], result['recommended_product_id']))
+            return result
+        engine.recommend_product = recording
+        
+        selector, base_scores, dataset = engine.selector, engine.base_scores, engine.dataset
+        replay(
+            engine, products, transactions, clickstream,
+            start=pd.Timestamp('2024-11-10'), end=pd.Timestamp('2024-11-20'), step='6h'
+        )
+        recommendations[enabled] = picks
+        assert (
+            engine.selector is selector and engine.base_scores is base_scores and
+            engine.dataset is dataset
+        ), "Replay should restore the engine's selector, base score cache and dataset"
+    
+    assert len(recommendations[True]) > 0, "Replay should send requests"
+    assert recommendations[True] == recommendations[False], \
+        "Replay should recommend the same products with and without the base score cache"
+    
+    print(f"✓ {len(recommendations[True])} replayed recommendations identical with and without the cache")
+    print("\nTEST 7 PASSED ✓\n")
+
+
+def _synthetic_files(products_path='data/products.csv', **history_args):
+    """Paths of the catalog and of synthetic history written as CSV files (see _synthetic_history)."""
+    directory = Path(tempfile.mkdtemp())
+    products = pd.read_csv(products_path)
+    transactions, clickstream = _synthetic_history(products, **history_args)
+    
+    paths = [str(directory / name) for name in ('products.csv', 'transactions.csv', 'clickstream.csv')]
+    shutil.copy(products_path, paths[0])
+    transactions.to_csv(paths[1], index=False, date_format='%Y-%m-%d')
+    clickstream.to_csv(paths[2], index=False, date_format='%Y-%m-%dT%H:%M:%S')
+    return paths
+
+
+def _sample_copy():
+    """Paths of a temporary copy of the sample data files."""
+    directory = Path(tempfile.mkdtemp())
+    paths = []
+    for name in ('sample_products.csv', 'sample_transactions.csv', 'sample_clickstream.csv'):
+        shutil.copy(Path('data') / name, directory / name)
+        paths.append(str(directory / name))
+    return paths
+
+
+# Score components that draw no random numbers
+DETERMINISTIC_COMPONENTS = [
+    'category_affinity', 'repurchase_likelihood', 'clickstream_intent', 'product_popularity'
+]
+
+
+def _scores_of(engine, customer_ids, current_time, **scoring_inputs):
+    """Deterministic score components of every product for several customers, stacked."""
+    dataset = engine.dataset
+    inputs = {**dataset.scoring_inputs(), **scoring_inputs}
+    frames = [
+        engine.scoring_engine.score_products(
+            customer_id, dataset.products, dataset.transactions, dataset.clickstream,
+            current_time=current_time, **inputs
+        )[DETERMINISTIC_COMPONENTS]
+        for customer_id in customer_ids
+    ]
+    return pd.concat(frames, keys=customer_ids)
+
+
+def _customer_scores(engine, customer_id, current_time):
+    """Deterministic score components of every product for a customer."""
+    dataset = engine.dataset
+    scored = engine.scoring_engine.score_products(
+        customer_id, dataset.products, dataset.transactions, dataset.clickstream,
+        current_time=current_time, **dataset.scoring_inputs()
+    )
+    return scored[['category_affinity', 'repurchase_likelihood', 'product_popularity']]
+
+
+def test_live_events_match_reload():
+    """Test that ingested purchases score the same live as after a flush and reload"""
+    print("\n" + "="*70)
+    print("TEST 8: Live Events Match Reload")
+    print("="*70)
+    
+    paths = _sample_copy()
+    current_time = datetime(2024, 11, 29, 1, 0)
+    engine = _engine_with({'events': {'flush_interval_seconds': 0}})
+    engine.load_data(*paths)
+    ingestor = EventIngestor(engine, engine.config)
+    
+    # A repeat purchase late in the day, 13 days and 7 hours before scoring
+    ingestor.ingest(
+        [{'customer_id': 'C001', 'product_id': 'P001', 'date_of_transaction': '2024-11-15T18:00:00'}],
+        []
+    )
+    live = _customer_scores(engine, 'C001', current_time)
+    ingestor.flush()
+    
+    reloaded = _engine_with({'events': {'flush_interval_seconds': 0}})
+    reloaded.load_data(*paths)
+    after_reload = _customer_scores(reloaded, 'C001', current_time)
+    
+    assert np.allclose(live.values, after_reload.values), \
+        "Live scores after /events should equal scores after flush and reload"
+    
+    print(f"✓ {len(live)} products score the same live and after reload")
+    print("\nTEST 8 PASSED ✓\n")
+
+
+def test_live_events_match_reload_truncated():
+    """Test live events against a reload when history is truncated at load time"""
+    print("\n" + "="*70)
+    print("TEST 9: Live Events Match Reload (History Horizon)")
+    print("="*70)
+    
+    # The 14-day horizon prunes every sample transaction, so repurchase and
+    # popularity rely on the load-time summary rather than on raw rows
+    settings = {
+        'events': {'flush_interval_seconds': 0},
+        'interactions': {'enabled': False},
+        'history_horizon': {'enabled': True, 'tolerance': 0.9, 'reference_time': '2024-12-01'}
+    }
+    paths = _sample_copy()
+    current_time = datetime(2024, 12, 10, 1, 0)
+    engine = _engine_with(settings)
+    engine.load_data(*paths)
+    ingestor = EventIngestor(engine, engine.config)
+    
+    # Two more purchases of a product C001 already bought before the horizon
+    ingestor.ingest(
+        [
+            {'customer_id': 'C001', 'product_id': 'P001', 'date_of_transaction': '2024-11-20'},
+            {'customer_id': 'C001', 'product_id': 'P001', 'date_of_transaction': '2024-12-04'}
+        ],
+        []
+    )
+    live = _customer_scores(engine, 'C001', current_time)
+    ingestor.flush()
+    
+    reloaded = _engine_with(settings)
+    reloaded.load_data(*paths)
+    after_reload = _customer_scores(reloaded, 'C001', current_time)
+    
+    assert np.allclose(live.values, after_reload.values), \
+        "Live scores after /events should equal scores after flush and reload"
+    
+    print(f"✓ {len(live)} products score the same live and after reload")
+    print("\nTEST 9 PASSED ✓\n")
+
+
+def _run_cli(module, *args):
+    """Standard output of `python -m <module> <args>`, asserting it succeeded."""
+    result = subprocess.run(
+        [sys.executable, '-m', module, *args], capture_output=True, text=True
+    )
+    assert result.returncode == 0, f"python -m {module} failed:\n{result.stderr[-2000:]}"
+    return result.stdout
+
+
+def test_history_horizon_cli():
+    """Test the history horizon report CLI on the loaded tables"""
+    print("\n" + "="*70)
+    print("TEST 10: History Horizon Report CLI")
+    print("="*70)
+    
+    # Anchored well after the sample data, so every row is pruned
+    tolerance = 0.5
+    output = _run_cli(
+        'src.history_horizon',
+        'data/sample_products.csv', 'data/sample_transactions.csv', 'data/sample_clickstream.csv',
+        '--tolerance', str(tolerance), '--reference-time', '2025-03-01'
+    )
+    assert "Transactions kept: 0 / 18" in output, "Every sample transaction should be pruned"
+    
+    deviations = {}
+    for line in output.split("Maximum score deviation:")[1].splitlines():
+        if ':' in line:
+            name, value = line.split(':')
+            deviations[name.strip()] = float(value)
+    assert 'final_score' in deviations, "Report should include the final score deviation"
+    for name, deviation in deviations.items():
+        assert deviation <= tolerance, f"{name} deviates by {deviation} > {tolerance}"
+    
+    print(f"✓ Report ran on the loaded tables, max deviation {max(deviations.values()):.6f}")
+    print("\nTEST 10 PASSED ✓\n")
+
+
+def test_base_score_invalidations_bounded():
+    """Test that the base score cache remembers a bounded number of invalidations"""
+    print("\n" + "="*70)
+    print("TEST 11: Base Score Cache Invalidations")
+    print("="*70)
+    
+    cache = BaseScoreCache({'base_scores': {'enabled': True, 'max_customers': 5}})
+    names = ('category_affinity',)
+    index = pd.Index(['P001'])
+    day = pd.Timestamp('2024-11-20')
+    
+    # Every ingested purchase comes with a newer dataset version
+    for version in range(1, 101):
+        cache.invalidate([f"C{version:03d}"], SimpleNamespace(version=version))
+    assert len(cache._invalidated) <= 6, \
+        f"Invalidations should be capped, {len(cache._invalidated)} remembered"
+    
+    # A request still on a dataset older than a forgotten invalidation must not store
+    cache.store('C001', names, index, np.array([[0.5]]), day, version=1)
+    _, missing = cache.lookup('C001', names, index, day)
+    assert missing.all(), "Scores predating an invalidation should not be stored"
+    
+    # Current requests still store and hit
+    cache.store('C001', names, index, np.array([[0.5]]), day, version=100)
+    values, missing = cache.lookup('C001', names, index, day)
+    assert not missing.any() and values[0, 0] == 0.5, "Current scores should be cached"
+    
+    print(f"✓ 100 invalidations, {len(cache._invalidated)} remembered, stale stores rejected")
+    print("\nTEST 11 PASSED ✓\n")
+
+
+def test_events_with_utc_offsets():
+    """Test that ingested timestamps with a UTC offset are stored as naive UTC"""
+    print("\n" + "="*70)
+    print("TEST 12: Event Timestamps With UTC Offsets")
+    print("="*70)
+    
+    engine = _engine_with({'events': {'flush_interval_seconds': 0}})
+    engine.load_data(*_sample_copy())
+    ingestor = EventIngestor(engine, engine.config)
+    
+    ingestor.ingest(
+        [{'customer_id': 'C001', 'product_id': 'P003', 'date_of_transaction': '2024-11-20T01:30:00+02:00'}],
+        [
+            {'customer_id': 'C001', 'product_id': 'P003', 'event_type': 'view',
+             'event_timestamp': '2024-11-20T01:30:00+02:00'},
+            {'customer_id': 'C001', 'product_id': 'P003', 'event_type': 'view',
+             'event_timestamp': '2024-11-20T01:30:00'}
+        ]
+    )
+    transactions = expand_table(engine.dataset.transactions)
+    clickstream = expand_table(engine.dataset.clickstream)
+    
+    assert transactions['date_of_transaction'].iloc[-1] == pd.Timestamp('2024-11-19'), \
+        "A purchase at 01:30+02:00 should be dated by its UTC day"
+    assert clickstream['event_timestamp'].iloc[-2:].tolist() == [
+        pd.Timestamp('2024-11-19T23:30:00'), pd.Timestamp('2024-11-20T01:30:00')
+    ], "Offsets should be converted to UTC and naive times kept"
+    
+    print("✓ Offset timestamps stored as naive UTC, naive timestamps unchanged")
+    print("\nTEST 12 PASSED ✓\n")
+
+
+def test_snapshot_table_layout():
+    """Test that a snapshot is only restored with the table layout it was saved in"""
+    print("\n" + "="*70)
+    print("TEST 13: Snapshot Table Layout")
+    print("="*70)
+    
+    paths = _sample_copy()
+    snapshot_path = tempfile.mkdtemp()
+    engine = _engine_with({'compact_tables': {'enabled': True}})
+    engine.load_data(*paths)
+    engine.save_snapshot(snapshot_path)
+    
+    expanded = _engine_with({'compact_tables': {'enabled': False}})
+    assert not expanded.restore_snapshot(snapshot_path), \
+        "Compact tables should not be restored into an engine without compaction"
+    
+    compact = _engine_with({'compact_tables': {'enabled': True}})
+    assert compact.restore_snapshot(snapshot_path), "The same layout should restore"
+    assert compact.dataset.transactions.dtypes.equals(engine.dataset.transactions.dtypes), \
+        "Restored tables should keep the saved layout"
+    
+    print("✓ Snapshot restored only with a matching table layout")
+    print("\nTEST 13 PASSED ✓\n")
+
+
+def _sample_products():
+    """The sample catalog as load_data returns it."""
+    engine = _engine_with({})
+    products, _, _ = engine.load_data(
+        'data/sample_products.csv',
+        'data/sample_transactions.csv',
+        'data/sample_clickstream.csv'
+    )
+    return products
+
+
+def test_history_horizon_bound():
+    """Test that truncating history beyond the decay horizon stays within the tolerance"""
+    print("\n" + "="*70)
+    print("TEST 14: History Horizon Error Bound")
+    print("="*70)
+    
+    # A short decay, so 40 days of history reach well beyond the horizon
+    tolerance = 0.05
+    engine = _engine_with({
+        'history_horizon': {'enabled': False, 'tolerance': tolerance, 'reference_time': '2024-12-10'},
+        'category_affinity': {'decay_days': 5},
+        'compact_tables': {'enabled': False}
+    })
+    products = _sample_products()
+    transactions, clickstream = _synthetic_history(products, days=40)
+    customer_ids = sorted(transactions['customer_id'].unique())
+    
+    for current_time in (datetime(2024, 12, 10), datetime(2024, 12, 15)):
+        report = deviation_report(
+            engine.scoring_engine, HistoryHorizon(engine.config),
+            products, transactions, clickstream, customer_ids, current_time
+        )
+        assert report['transactions_kept'] < report['transactions_total'], "Old transactions should be pruned"
+        assert report['clickstream_kept'] < report['clickstream_total'], "Old clicks should be pruned"
+        for name, deviation in report['max_deviation'].items():
+            assert deviation <= tolerance, f"{name} deviates by {deviation} > {tolerance} at {current_time}"
+    
+    print(f"✓ Kept {report['transactions_kept']}/{report['transactions_total']} transactions, "
+          f"max deviation {max(report['max_deviation'].values()):.6f} <= {tolerance}")
+    print("\nTEST 14 PASSED ✓\n")
+
+
+def test_popularity_sketch_error():
+    """Test HyperLogLog distinct customer counts against exact counts"""
+    print("\n" + "="*70)
+    print("TEST 15: Popularity Sketch Error Bound")
+    print("="*70)
+    
+    # Each customer buys their product twice on average
+    rng = np.random.default_rng(0)
+    frames = []
+    for product_id, customers in (('P001', 50), ('P002', 3000), ('P003', 60000)):
+        customer_ids = np.array([f"C{i:06d}" for i in range(customers)])
+        frames.append(pd.DataFrame({
+            'customer_id': np.concatenate([customer_ids, rng.choice(customer_ids, customers)]),
+            'product_id': product_id,
+            'quantity': 1
+        }))
+    transactions = pd.concat(frames).sample(frac=1, random_state=0)
+    exact = transactions.groupby('product_id')['customer_id'].nunique()
+    
+    sketch = ProductPopularitySketch.from_frames(
+        [transactions.iloc[:50000], transactions.iloc[50000:]], precision=10
+    )
+    estimate = sketch.estimate()['unique_customers']
+    relative = ((estimate[exact.index] - exact) / exact).abs()
+    assert (relative <= 3 * sketch.relative_error).all(), \
+        f"Distinct counts off by {relative.max():.3f}, beyond 3 standard errors"
+    
+    # Sketches built on separate parts merge to the sketch of the whole
+    even = ProductPopularitySketch.from_frames([transactions.iloc[::2]], precision=10)
+    odd = ProductPopularitySketch.from_frames([transactions.iloc[1::2]], precision=10)
+    merged = even.merge(odd).estimate()
+    assert merged.loc[estimate.index].equals(sketch.estimate()), \
+        "Merged sketches should equal one sketch over all rows"
+    
+    print(f"✓ Max relative error {relative.max():.4f} (standard error {sketch.relative_error:.4f})")
+    print("\nTEST 15 PASSED ✓\n")
+
+
+def test_candidate_recall():
+    """Test that scoring candidates recovers the full-catalog top products"""
+    print("\n" + "="*70)
+    print("TEST 16: Candidate Generation Recall")
+    print("="*70)
+    
+    paths = _synthetic_files(customers=200, days=30)
+    engine = _engine_with({'candidate_generation': {
+        'enabled': True, 'max_candidates': 60, 'per_category': 20, 'popular_count': 40
+    }})
+    products, transactions, clickstream = engine.load_data(*paths)
+    customer_ids = sorted(expand_table(transactions)['customer_id'].unique())[:40]
+    
+    report = measure_recall(
+        engine, customer_ids, products, transactions, clickstream,
+        k=10, current_time=datetime(2024, 12, 1)
+    )
+    assert report['mean_candidates'] <= 60, "Candidates should be capped at max_candidates"
+    assert report['mean_recall'] >= 0.8, f"Recall@10 {report['mean_recall']:.2f} is below 0.8"
+    
+    print(f"✓ {report['mean_candidates']:.0f} of {len(products)} products scored, "
+          f"recall@10 {report['mean_recall']:.2f}")
+    print("\nTEST 16 PASSED ✓\n")
+
+
+def test_interaction_matrix_scores():
+    """Test that scoring from the sparse interaction matrices matches the table path"""
+    print("\n" + "="*70)
+    print("TEST 17: Interaction Matrix Scores")
+    print("="*70)
+    
+    paths = _synthetic_files(customers=30, days=30)
+    sparse_engine = _engine_with({'interactions': {'enabled': True}})
+    sparse_engine.load_data(*paths)
+    table_engine = _engine_with({'interactions': {'enabled': False}})
+    table_engine.load_data(*paths)
+    assert sparse_engine.dataset.interactions is not None, "Interaction matrices should be built"
+    customer_ids = sorted(expand_table(table_engine.dataset.transactions)['customer_id'].unique())
+    
+    # At the matrices' reference time and at a later time they are rescaled to
+    for current_time in (datetime(2024, 12, 1), datetime(2024, 12, 3, 15, 30)):
+        sparse_scores = _scores_of(sparse_engine, customer_ids, current_time)
+        table_scores = _scores_of(table_engine, customer_ids, current_time)
+        assert np.allclose(sparse_scores.values, table_scores.values), \
+            f"Sparse and table scores should agree at {current_time}"
+    
+    print(f"✓ {len(customer_ids)} customers score the same from matrices and tables")
+    print("\nTEST 17 PASSED ✓\n")
+
+
+def test_copurchase_index():
+    """Test the blocked co-purchase build against dense co-occurrence"""
+    print("\n" + "="*70)
+    print("TEST 18: Co-Purchase Index")
+    print("="*70)
+    
+    products = _sample_products()
+    transactions, _ = _synthetic_history(products, customers=40, days=5)
+    top_m = 3
+    config = {'copurchase': {'top_m': top_m, 'similarity': 'cosine', 'block_size': 4}}
+    index = CoPurchaseIndex.build(transactions, config)
+    whole = CoPurchaseIndex.build(transactions, {'copurchase': {**config['copurchase'], 'block_size': 4096}})
+    assert np.array_equal(index.neighbors, whole.neighbors) and np.array_equal(index.weights, whole.weights), \
+        "Building in blocks should not change the index"
+    
+    # Dense cosine similarity of baskets (one customer, day and store)
+    baskets = pd.crosstab(
+        [transactions['customer_id'], transactions['date_of_transaction'], transactions['store_id']],
+        transactions['product_id']
+    ).clip(upper=1)[index.product_ids]
+    cooccurrence = (baskets.T @ baskets).values.astype(float)
+    counts = np.diag(cooccurrence).copy()
+    cosine = cooccurrence / np.sqrt(np.outer(counts, counts))
+    np.fill_diagonal(cosine, 0.0)
+    expected = -np.sort(-cosine, axis=1)[:, :top_m]
+    assert np.allclose(index.weights, expected, atol=1e-6), \
+        "Kept neighbors should be the top co-purchase similarities"
+    
+    print(f"✓ Top-{top_m} neighbors of {len(index.product_ids)} products match dense co-occurrence")
+    print("\nTEST 18 PASSED ✓\n")
+
+
+def test_factor_model():
+    """Test the factor model's low-rank fit and blocked top-k retrieval"""
+    print("\n" + "="*70)
+    print("TEST 19: Factor Model")
+    print("="*70)
+    
+    rank = 8
+    engine = _engine_with({'factor_model': {'rank': rank}})
+    engine.load_data(*_synthetic_files(customers=60, days=30))
+    interactions = engine.dataset.interactions
+    model = FactorModel.build(interactions, engine.config)
+    
+    # A truncated SVD leaves exactly the discarded singular values as error
+    ratings = interactions.matrices['purchase_quantity'].copy()
+    ratings.data = np.log1p(ratings.data)
+    click_weight = engine.config['factor_model']['click_weight']
+    ratings = (ratings + click_weight * interactions.matrices['click_event_weight']).toarray()
+    fitted = model.customer_factors.astype(float) @ model.product_factors.T.astype(float)
+    singular_values = np.linalg.svd(ratings, compute_uv=False)
+    assert np.isclose(((ratings - fitted) ** 2).sum(), (singular_values[rank:] ** 2).sum()), \
+        "Factors should be the best rank-k approximation of the interactions"
+    
+    # Blocked retrieval returns each customer's best products, unknown customers skipped
+    customer_ids = list(model.customer_ids)
+    known, positions, scores = model.top_k(customer_ids + ['UNKNOWN'], k=5, block_size=7)
+    assert known == customer_ids, "Known customers should be returned in order"
+    for row, customer_id in enumerate(known):
+        affinity = model.affinity(customer_id)
+        assert np.allclose(scores[row], np.sort(affinity)[::-1][:5], atol=1e-5), \
+            f"Top-k of {customer_id} should be its highest affinities"
+        assert np.allclose(affinity[positions[row]], scores[row], atol=1e-5), \
+            f"Top-k positions of {customer_id} should point at their scores"
+    
+    print(f"✓ Rank-{rank} fit is optimal, blocked top-5 matches per-customer affinity")
+    print("\nTEST 19 PASSED ✓\n")
+
+
+def test_weight_grid():
+    """Test that one grid scoring pass ranks like separate runs per configuration"""
+    print("\n" + "="*70)
+    print("TEST 20: Weight Grid Evaluation")
+    print("="*70)
+    
+    weight_grid = {
+        'baseline': {'category_affinity': 0.30, 'repurchase_likelihood': 0.25, 'clickstream_intent': 0.25,
+                     'product_popularity': 0.10, 'exploration': 0.10},
+        'intent': {'category_affinity': 0.20, 'repurchase_likelihood': 0.20, 'clickstream_intent': 0.45,
+                   'product_popularity': 0.10, 'exploration': 0.05},
+        'copurchase': {'category_affinity': 0.25, 'repurchase_likelihood': 0.25, 'clickstream_intent': 0.25,
+                       'product_popularity': 0.10, 'exploration': 0.05, 'copurchase': 0.10}
+    }
+    paths = _synthetic_files(customers=20, days=30)
+    current_time = datetime(2024, 12, 1)
+    
+    engine = _engine_with({'selection': {'random_seed': 3}})
+    products, transactions, clickstream = engine.load_data(*paths)
+    loaded = engine.dataset
+    customer_ids = sorted(expand_table(transactions)['customer_id'].unique())[:8]
+    report = evaluate_weight_grid(
+        engine, customer_ids, products, transactions, clickstream, weight_grid,
+        k=10, current_time=current_time
+    )
+    assert loaded.copurchase is None and engine.dataset.copurchase is not None, \
+        "Missing components should be added to a new dataset, not the loaded one"
+    
+    for name, weights in weight_grid.items():
+        single = _engine_with({'scoring_weights': weights, 'selection': {'random_seed': 3}})
+        single.load_data(*paths)
+        dataset = single.dataset
+        for customer_id in customer_ids:
+            scored = single.scoring_engine.score_products(
+                customer_id, dataset.products, dataset.transactions, dataset.clickstream,
+                current_time, **dataset.scoring_inputs()
+            )
+            filtered = single.constraint_filter.filter_products(
+                customer_id, scored, dataset.transactions, current_time,
+                interactions=dataset.interactions
+            )
+            expected = filtered.nlargest(10, 'final_score')['product_id'].tolist()
+            assert report['top_products'][name][customer_id] == expected, \
+                f"Grid top products of {customer_id} under {name} should match a separate run"
+    
+    print(f"✓ {len(weight_grid)} configurations ranked from one pass match separate runs")
+    print("\nTEST 20 PASSED ✓\n")
+
+
+def test_replay_backtest():
+    """Test that replay only shows past history and counts hits in the horizon"""
+    print("\n" + "="*70)
+    print("TEST 21: Replay Backtest")
+    print("="*70)
+    
+    engine = _engine_with({'selection': {'random_seed': 7}})
+    products = _sample_products()
+    transactions, clickstream = _synthetic_history(products, customers=10)
+    
+    requests = []
+    recommend_product = engine.recommend_product
+    def recording(customer_id, products, customer_txns, customer_clicks, current_time=None):
+        result = recommend_product(customer_id, products, customer_txns, customer_clicks, current_time=current_time)
+        requests.append((
+            customer_id, current_time, customer_txns, customer_clicks,
+            result and result['recommended_product_id']
+        ))
+        return result
+    engine.recommend_product = recording
+    
+    report = replay(
+        engine, products, transactions, clickstream,
+        start=pd.Timestamp('2024-11-05'), end=pd.Timestamp('2024-11-15'), horizon_days=3
+    )
+    assert report['requests'] == len(requests) > 0, "Every active customer should be sent a request"
+    
+    hits = 0
+    for customer_id, current_time, customer_txns, customer_clicks, product_id in requests:
+        assert (customer_txns['customer_id'] == customer_id).all(), "Requests should only see their customer"
+        assert (customer_txns['date_of_transaction'] < current_time).all() and \
+            (customer_clicks['event_timestamp'] < current_time).all(), "Requests should only see the past"
+        bought = transactions[
+            (transactions['customer_id'] == customer_id) &
+            (transactions['date_of_transaction'] >= current_time) &
+            (transactions['date_of_transaction'] < current_time + pd.Timedelta(days=3))
+        ]
+        hits += product_id in set(bought['product_id'])
+    assert report['hits'] == hits, f"Replay counted {report['hits']} hits, expected {hits}"
+    
+    print(f"✓ {report['requests']} requests saw only past history, {hits} hits counted")
+    print("\nTEST 21 PASSED ✓\n")
+
+
+def test_load_test_harness():
+    """Test the HTTP load test harness against the in-process API"""
+    print("\n" + "="*70)
+    print("TEST 22: Load Test Harness")
+    print("="*70)
+    
+    load_test = Path(__file__).resolve().parent.parent.parent / 'load_test.py'
+    directory = Path(tempfile.mkdtemp())
+    arguments = [
+        sys.executable, str(load_test), 'recommend', '--in-process', '--concurrency', '1,4',
+        '--requests', '12', '--mix', 'known=0.5,unknown=0.5', '--warmup', '1'
+    ]
+    for name, extra in (('first', []), ('second', ['--compare', str(directory / 'first.json')])):
+        result = subprocess.run(
+            arguments + ['--output', str(directory / f'{name}.json')] + extra,
+            capture_output=True, text=True
+        )
+        assert result.returncode == 0, f"Load test failed:\n{result.stderr[-2000:]}"
+    assert "Comparison with" in result.stdout, "The second run should compare with the first"
+    
+    with open(directory / 'second.json') as f:
+        report = json.load(f)
+    assert [level['concurrency'] for level in report['levels']] == [1, 4], "Every level should be reported"
+    for level in report['levels']:
+        # Known customers can run out of products not shown recently (404)
+        assert level['requests'] == sum(level['status_counts'].values()) == 12, \
+            f"Level {level['concurrency']} should send 12 requests"
+        assert set(level['status_counts']) <= {'200', '404'}, \
+            f"Level {level['concurrency']} had server errors: {level['error_samples']}"
+        assert sum(kind['requests'] for kind in level['by_kind'].values()) == 12, \
+            "Requests should be split by kind"
+        latency = level['latency_ms']
+        assert 0 < latency['p50'] <= latency['p95'] <= latency['p99'] <= latency['max'], \
+            "Latency percentiles should be ordered"
+    assert report['saturation']['success_rps'] == max(level['success_rps'] for level in report['levels'])
+    
+    print(f"✓ 2 levels of 12 requests, saturation {report['saturation']['success_rps']:.0f} rps "
+          f"at concurrency {report['saturation']['concurrency']}")
+    print("\nTEST 22 PASSED ✓\n")
+
+
+def test_latency_budget_fallback():
+    """Test that a spent latency budget falls back to popularity and a short one skips components"""
+    print("\n" + "="*70)
+    print("TEST 23: Latency Budget Fallback")
+    print("="*70)
+    
+    engine = _engine_with({'base_scores': {'enabled': False}})
+    products, transactions, clickstream = engine.load_data(
+        'data/sample_products.csv',
+        'data/sample_transactions.csv',
+        'data/sample_clickstream.csv'
+    )
+    
+    # Spent before scoring starts: popularity fallback, no customer scoring
+    spent = LatencyBudget(0.001, start=time.perf_counter() - 1.0)
+    result = engine.recommend_product('C001', products, transactions, clickstream, budget=spent)
+    assert result is not None, "A spent budget should still return a recommendation"
+    assert result['fallback'] == 'popularity' and result['fallback_reason'] == 'deadline', \
+        "A spent budget should fall back to popularity"
+    assert 'category_affinity' in result['degraded_components'] and \
+        'product_popularity' not in result['degraded_components'], \
+        "The fallback should report every component but popularity as degraded"
+    recommended = products[products['product_id'] == result['recommended_product_id']].iloc[0]
+    assert recommended['in_stock'] and not recommended['is_discounted'], \
+        "The fallback should still apply the constraints"
+    
+    # A component expected to take longer than the time left is skipped
+    engine.scoring_engine._component_seconds['category_affinity'] = 3600.0
+    result = engine.recommend_product(
+        'C001', products, transactions, clickstream, budget=LatencyBudget(10.0)
+    )
+    assert result['fallback'] is None, "A budget with time left should not fall back"
+    assert result['degraded_components'] == ['category_affinity'], \
+        "Only the component that does not fit should be skipped"
+    assert result['score_components']['category_affinity'] == 0.0, \
+        "A skipped component should score 0"
+    
+    print("✓ Spent budget fell back to popularity")
+    print("✓ Component expected to overrun the budget was skipped")
+    print("\nTEST 23 PASSED ✓\n")
+
+
+# Scorer plugin module written by test_scorer_plugins
+PRICE_PLUGIN = """
+from src.scorers import Scorer, register_scorer
+
+CALLS = []
+
+def score_low_price(engine, products, inputs):
+    CALLS.append(inputs['customer_id'])
+    return 1.0 - products['price'] / products['price'].max()
+
+register_scorer(Scorer('low_price', inputs=('customer_id',), compute=score_low_price), replace=True)
+"""
+
+
+def test_scorer_plugins():
+    """Test that plugin scorers are registered from the config and zero weights are not computed"""
+    print("\n" + "="*70)
+    print("TEST 24: Scorer Plugins")
+    print("="*70)
+    
+    directory = Path(tempfile.mkdtemp())
+    (directory / 'price_plugin.py').write_text(PRICE_PLUGIN)
+    sys.path.insert(0, str(directory))
+    try:
+        weights = {'category_affinity': 0.30, 'repurchase_likelihood': 0.25, 'clickstream_intent': 0.25,
+                   'product_popularity': 0.10, 'exploration': 0.05, 'low_price': 0.05}
+        engine = _engine_with({
+            'scorer_plugins': ['price_plugin'], 'scoring_weights': weights,
+            'base_scores': {'enabled': False}
+        })
+    finally:
+        sys.path.remove(str(directory))
+    plugin = sys.modules['price_plugin']
+    products, transactions, clickstream = engine.load_data(
+        'data/sample_products.csv',
+        'data/sample_transactions.csv',
+        'data/sample_clickstream.csv'
+    )
+    current_time = datetime(2024, 11, 29)
+    
+    scored = engine.scoring_engine.score_products(
+        'C001', products, transactions, clickstream, current_time, **engine.dataset.scoring_inputs()
+    )
+    assert plugin.CALLS == ['C001'], "The plugin scorer should run once per request"
+    expected = 1.0 - products['price'] / products['price'].max()
+    assert np.allclose(scored['low_price'], expected), "The plugin's scores should be added as a column"
+    final = sum(weight * scored[name] for name, weight in weights.items())
+    assert np.allclose(scored['final_score'], final), "The plugin's weight should count in the final score"
+    
+    # Zero weights: the plugin is not run and a core component scores 0
+    engine.scoring_engine.weights = {**weights, 'low_price': 0.0, 'repurchase_likelihood': 0.0,
+                                     'category_affinity': 0.55}
+    scored = engine.scoring_engine.score_products(
+        'C001', products, transactions, clickstream, current_time, **engine.dataset.scoring_inputs()
+    )
+    assert plugin.CALLS == ['C001'], "A zero-weight scorer should not be run"
+    assert 'low_price' not in scored.columns, "A zero-weight plugin should not be reported"
+    assert (scored['repurchase_likelihood'] == 0.0).all(), "A zero-weight core component should score 0"
+    
+    print("✓ Plugin scorer registered from scorer_plugins and weighted into the final score")
+    print("✓ Zero-weight components not computed")
+    print("\nTEST 24 PASSED ✓\n")
+
+
+def test_parallel_scoring():
+    """Test that scoring components on the shared thread pool matches serial scoring"""
+    print("\n" + "="*70)
+    print("TEST 25: Parallel Scoring")
+    print("="*70)
+    
+    weights = {'category_affinity': 0.25, 'repurchase_likelihood': 0.20, 'clickstream_intent': 0.20,
+               'product_popularity': 0.10, 'exploration': 0.05, 'copurchase': 0.10, 'factor_affinity': 0.10}
+    components = DETERMINISTIC_COMPONENTS + ['copurchase', 'factor_affinity']
+    paths = _synthetic_files(customers=30, days=30)
+    current_time = datetime(2024, 12, 1)
+    
+    scores = {}
+    for parallel in (False, True):
+        engine = _engine_with({
+            'parallel_scoring': {'enabled': parallel, 'max_workers': 4},
+            'scoring_weights': weights,
+            'base_scores': {'enabled': False}
+        })
+        engine.load_data(*paths)
+        dataset = engine.dataset
+        customer_ids = sorted(expand_table(dataset.transactions)['customer_id'].unique())
+        
+        # Several requests at once share the pool
+        def score(customer_id):
+            return engine.scoring_engine.score_products(
+                customer_id, dataset.products, dataset.transactions, dataset.clickstream,
+                current_time, **dataset.scoring_inputs()
+            )[components]
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            scores[parallel] = pd.concat(list(pool.map(score, customer_ids)), keys=customer_ids)
+        assert (engine.scoring_engine._executor is not None) == parallel, \
+            "Only parallel scoring should start the shared pool"
+    
+    assert np.allclose(scores[True].values, scores[False].values), \
+        "Parallel and serial scoring should give the same components"
+    
+    print(f"✓ {len(customer_ids)} concurrent requests scored the same in parallel and serially")
+    print("\nTEST 25 PASSED ✓\n")
+
+
+def test_request_random_streams():
+    """Test that seeded recommendations do not depend on request order or concurrency"""
+    print("\n" + "="*70)
+    print("TEST 26: Per-Request Random Streams")
+    print("="*70)
+    
+    paths = _synthetic_files(customers=60, days=30)
+    current_time = datetime(2024, 12, 1)
+    # Other customers' history, so saving it takes long enough for requests to overlap
+    history = {
+        f"X{i:04d}": {f"P{j:03d}": '2024-11-01T00:00:00' for j in range(1, 21)}
+        for i in range(2000)
+    }
+    
+    picks = {}
+    for concurrent in (False, True):
+        engine = _engine_with({
+            'selection': {'random_seed': 5},
+            'parallel_scoring': {'enabled': concurrent},
+            'base_scores': {'enabled': False}
+        })
+        products, transactions, clickstream = engine.load_data(*paths)
+        shown_products_path = Path(tempfile.mkdtemp()) / 'shown_products.json'
+        engine.selector = ProductSelector(engine.config, str(shown_products_path))
+        engine.selector.merge_shown_products(history)
+        customer_ids = sorted(expand_table(transactions)['customer_id'].unique())
+        
+        def recommend(customer_id):
+            result = engine.recommend_product(
+                customer_id, products, transactions, clickstream, current_time=current_time
+            )
+            return customer_id, (result['recommended_product_id'], result['score_components']['exploration'])
+        errors = []
+        handler = logging.Handler(logging.ERROR)
+        handler.emit = lambda record: errors.append(record.getMessage())
+        logging.getLogger('src.selector').addHandler(handler)
+        try:
+            if concurrent:
+                order = list(np.random.default_rng(0).permutation(customer_ids))
+                with ThreadPoolExecutor(max_workers=8) as pool:
+                    picks[concurrent] = dict(pool.map(recommend, order))
+            else:
+                picks[concurrent] = dict(map(recommend, customer_ids))
+        finally:
+            logging.getLogger('src.selector').removeHandler(handler)
+        
+        assert not errors, f"Selections should not fail: {errors[0]}"
+        with open(shown_products_path) as f:
+            assert json.load(f) == engine.selector.shown_products, \
+                "The saved shown products should include every request"
+    
+    assert picks[True] == picks[False], \
+        "Seeded picks should not depend on request order or concurrency"
+    
+    # Without a seed every request draws fresh numbers
+    engine = _engine_with({'selection': {'random_seed': None}})
+    engine.load_data(*paths)
+    dataset = engine.dataset
+    draws = [
+        engine.scoring_engine.score_products(
+            'C001', dataset.products, dataset.transactions, dataset.clickstream,
+            current_time, **dataset.scoring_inputs()
+        )['exploration'].values
+        for _ in range(2)
+    ]
+    assert not np.array_equal(*draws), "Unseeded requests should draw different exploration scores"
+    
+    print(f"✓ {len(picks[True])} seeded picks identical in order and across 8 threads in shuffled order")
+    print("✓ Shown products saved consistently under concurrent requests")
+    print("\nTEST 26 PASSED ✓\n")
+
+
+def test_batch_checkpoint_resume():
+    """Test that a batch run interrupted mid-chunk resumes to the same output as an uninterrupted run"""
+    print("\n" + "="*70)
+    print("TEST 27: Batch Checkpoint Resume")
+    print("="*70)
+    
+    paths = _synthetic_files(customers=23, days=30)
+    current_time = datetime(2024, 12, 1)
+    directory = Path(tempfile.mkdtemp())
+    
+    def batch_engine(shown_products_path):
+        engine = _engine_with({'selection': {'random_seed': 11}})
+        products, transactions, clickstream = engine.load_data(*paths)
+        engine.selector = ProductSelector(engine.config, str(directory / shown_products_path))
+        customer_ids = expand_table(transactions)['customer_id'].drop_duplicates().tolist()
+        return engine, (customer_ids, products, transactions, clickstream)
+    
+    engine, inputs = batch_engine('full.json')
+    run_batch(engine, *inputs, output=str(directory / 'full.csv'), output_format='csv',
+              chunk_size=5, current_time=current_time)
+    
+    # Fail on the 13th customer, in the middle of the third chunk
+    engine, inputs = batch_engine('resumed.json')
+    recommend_product = engine.recommend_product
+    calls = []
+    def failing(**kwargs):
+        calls.append(kwargs['customer_id'])
+        if len(calls) == 13:
+            raise RuntimeError("Interrupted")
+        return recommend_product(**kwargs)
+    engine.recommend_product = failing
+    output = directory / 'resumed.csv'
+    try:
+        run_batch(engine, *inputs, output=str(output), output_format='csv',
+                  chunk_size=5, current_time=current_time)
+        raise AssertionError("The batch run should have been interrupted")
+    except RuntimeError:
+        pass
+    with open(output, 'a') as f:
+        f.write("C999,P_partially_written")
+    
+    engine, inputs = batch_engine('resumed.json')
+    stats = run_batch(engine, *inputs, output=str(output), output_format='csv',
+                      chunk_size=5, resume=True)
+    assert stats['resumed_after'] == 10, "The resumed run should skip the two completed chunks"
+    assert stats['customers'] == len(inputs[0]) - 10, "The resumed run should process the rest"
+    assert output.read_text() == (directory / 'full.csv').read_text(), \
+        "Interrupted and resumed output should equal an uninterrupted run"
+    
+    print(f"✓ Interrupted after 12 of {len(inputs[0])} customers, resumed after {stats['resumed_after']}")
+    print("✓ Resumed output identical to an uninterrupted run")
+    print("\nTEST 27 PASSED ✓\n")
+
+
+def test_events_endpoint():
+    """Test that POST /events updates the served dataset and is flushed to the CSV files"""
+    print("\n" + "="*70)
+    print("TEST 28: Events Endpoint")
+    print("="*70)
+    
+    paths = _sample_copy()
+    products_path, transactions_path, clickstream_path = paths
+    files = {'products_path': products_path, 'transactions_path': transactions_path,
+             'clickstream_path': clickstream_path}
+    rows = [len(pd.read_csv(path)) for path in paths]
+    
+    with TestClient(create_app()) as client:
+        response = client.post('/recommend', json={'customer_id': 'C001', **files})
+        assert response.status_code == 200, f"/recommend failed: {response.text}"
+        
+        response = client.post('/events', json={
+            'transactions': [{'customer_id': 'C002', 'product_id': 'P005',
+                              'date_of_transaction': '2024-11-28', 'quantity': 2}],
+            'clickstream': [{'customer_id': 'C002', 'event_type': 'add_to_cart', 'product_id': 'P006',
+                             'event_timestamp': '2024-11-28T10:00:00', 'session_id': 'S009'}]
+        })
+        assert response.status_code == 200, f"/events failed: {response.text}"
+        assert response.json()['transactions'] == 1 and response.json()['clickstream'] == 1, \
+            "Both events should be accepted"
+        
+        response = client.post('/events', json={'clickstream': [{'event_type': 'view'}]})
+        assert response.status_code == 400, "Events without a customer should be rejected"
+        
+        ready = client.get('/ready').json()
+        assert ready['status'] == 'warm' and ready['pending_events'] == 2, \
+            "Accepted events should be pending until flushed"
+        response = client.post('/recommend', json={'customer_id': 'C002', **files})
+        assert response.status_code == 200, f"/recommend after /events failed: {response.text}"
+    
+    # Shutdown writes the pending events
+    transactions = pd.read_csv(transactions_path)
+    clickstream = pd.read_csv(clickstream_path)
+    assert (len(transactions), len(clickstream)) == (rows[1] + 1, rows[2] + 1), \
+        "Each event should be appended as one row"
+    purchase = transactions.iloc[-1]
+    assert (purchase['customer_id'], purchase['product_id'], purchase['quantity'],
+            purchase['product_category']) == ('C002', 'P005', 2, 'dairy'), \
+        "The purchase should be written with its catalog category"
+    assert str(purchase['date_of_transaction']).startswith('2024-11-28'), \
+        "The purchase should keep its date"
+    click = clickstream.iloc[-1]
+    assert (click['customer_id'], click['event_type'], click['product_id'], click['event_timestamp']) == \
+        ('C002', 'add_to_cart', 'P006', '2024-11-28T10:00:00'), "The click should be written as sent"
+    
+    print("✓ /events accepted a purchase and a click, rejected an event without a customer")
+    print("✓ Pending events appended to the source CSV files on shutdown")
+    print("\nTEST 28 PASSED ✓\n")
+
+
+def test_snapshot_round_trip():
+    """Test that a restored snapshot scores and recommends like the engine that saved it"""
+    print("\n" + "="*70)
+    print("TEST 29: Snapshot Round Trip")
+    print("="*70)
+    
+    settings = {
+        'scoring_weights': {'category_affinity': 0.25, 'repurchase_likelihood': 0.20, 'clickstream_intent': 0.20,
+                            'product_popularity': 0.10, 'exploration': 0.05, 'copurchase': 0.10,
+                            'factor_affinity': 0.10},
+        'candidate_generation': {'enabled': True},
+        'selection': {'random_seed': 13},
+        'base_scores': {'enabled': False}
+    }
+    components = DETERMINISTIC_COMPONENTS + ['copurchase', 'factor_affinity']
+    paths = _synthetic_files(customers=30, days=30)
+    current_time = datetime(2024, 12, 1)
+    directory = Path(tempfile.mkdtemp())
+    
+    def snapshot_engine(shown_products_path):
+        engine = _engine_with(settings)
+        engine.selector = ProductSelector(engine.config, str(directory / shown_products_path))
+        return engine
+    
+    def recommendations(engine, customer_ids):
+        dataset = engine.dataset
+        return [
+            engine.recommend_product(
+                customer_id, *dataset.as_tuple(), current_time=current_time, dataset=dataset
+            )['recommended_product_id']
+            for customer_id in customer_ids
+        ]
+    
+    def scores(engine, customer_ids):
+        dataset = engine.dataset
+        return np.vstack([
+            engine.scoring_engine.score_products(
+                customer_id, *dataset.as_tuple(), current_time, **dataset.scoring_inputs()
+            )[components].values
+            for customer_id in customer_ids
+        ])
+    
+    saved = snapshot_engine('saved.json')
+    saved.load_data(*paths)
+    customer_ids = sorted(expand_table(saved.dataset.transactions)['customer_id'].unique())
+    recommendations(saved, customer_ids[:10])
+    saved.save_snapshot(str(directory / 'snapshot'))
+    
+    restored = snapshot_engine('restored.json')
+    assert restored.restore_snapshot(str(directory / 'snapshot')), "The snapshot should restore"
+    assert restored.dataset_source == 'snapshot', "The dataset should come from the snapshot"
+    assert restored.dataset.is_current(tuple(paths)), "The restored dataset should serve the source files"
+    assert restored.selector.shown_products == saved.selector.shown_products, \
+        "Shown products should be restored"
+    
+    assert np.allclose(scores(saved, customer_ids), scores(restored, customer_ids)), \
+        "Restored state should score like the loaded state"
+    assert recommendations(restored, customer_ids) == recommendations(saved, customer_ids), \
+        "Restored engine should recommend like the engine that saved it"
+    
+    # A change to the source files makes the snapshot stale
+    with open(paths[1], 'a') as f:
+        f.write("C000,P001,2024-12-01,1,dairy,1.0,S001\n")
+    assert not snapshot_engine('stale.json').restore_snapshot(str(directory / 'snapshot')), \
+        "A snapshot older than its source files should not be restored"
+    
+    print(f"✓ {len(customer_ids)} customers score and recommend the same after a restore")
+    print("✓ Snapshot of changed source files not restored")
+    print("\nTEST 29 PASSED ✓\n")
+
+
+def test_dataset_refresh():
+    """Test that the refresher swaps in a rebuilt dataset when the files change"""
+    print("\n" + "="*70)
+    print("TEST 30: Background Dataset Refresh")
+    print("="*70)
+    
+    paths = _sample_copy()
+    current_time = datetime(2024, 11, 29)
+    settings = {
+        'refresh': {'enabled': True, 'source': 'files', 'products_path': paths[0],
+                    'transactions_path': paths[1], 'clickstream_path': paths[2]},
+        'events': {'flush_interval_seconds': 0}
+    }
+    
+    # Nothing loaded yet: the configured files are loaded off the request path
+    engine = _engine_with(settings)
+    ingestor = EventIngestor(engine, engine.config)
+    refresher = DatasetRefresher(engine, engine.config, ingestor=ingestor)
+    assert refresher.check() and engine.dataset is not None, "The configured files should be loaded"
+    assert not refresher.check(), "Unchanged files should not be reloaded"
+    
+    # The files change and an event arrives while an in-flight request holds the dataset
+    with open(paths[1], 'a') as f:
+        f.write("C003,P001,2024-11-27,1,dairy,3.99,S001\n")
+    ingestor.ingest([{'customer_id': 'C001', 'product_id': 'P002', 'date_of_transaction': '2024-11-28'}], [])
+    old = engine.dataset
+    old_transactions = len(old.transactions)
+    assert refresher.check(), "Changed files should be rebuilt and swapped in"
+    
+    new = engine.dataset
+    assert new is not old and len(old.transactions) == old_transactions, \
+        "The old dataset should be left as it was for the requests holding it"
+    assert len(new.transactions) == old_transactions + 1, "The new dataset should hold the file change"
+    purchases = set(zip(*expand_table(new.transactions)[['customer_id', 'product_id']].tail(2).values.T))
+    assert purchases == {('C003', 'P001'), ('C001', 'P002')}, \
+        "The new dataset should hold the file change and the ingested event"
+    assert refresher.retired_datasets >= 1, "The replaced dataset should be tracked while held"
+    del old
+    gc.collect()
+    assert refresher.retired_datasets == 0, "The replaced dataset should be freed once released"
+    
+    reloaded = _engine_with({})
+    reloaded.load_data(*paths)
+    customer_ids = ['C001', 'C002', 'C003']
+    assert np.allclose(
+        _scores_of(engine, customer_ids, current_time).values,
+        _scores_of(reloaded, customer_ids, current_time).values
+    ), "The refreshed dataset should score like a fresh load"
+    
+    print("✓ Configured files loaded, changed files rebuilt and swapped in with the pending event")
+    print("✓ Replaced dataset kept for in-flight requests and freed afterwards")
+    print("\nTEST 30 PASSED ✓\n")
+
+
+def test_shared_snapshot():
+    """Test that workers in shared snapshot mode follow the versions a publisher writes"""
+    print("\n" + "="*70)
+    print("TEST 31: Shared Snapshot Workers")
+    print("="*70)
+    
+    paths = _sample_copy()
+    snapshot_path = str(Path(tempfile.mkdtemp()) / 'snapshot')
+    current_time = datetime(2024, 11, 29)
+    customer_ids = ['C001', 'C002', 'C003']
+    
+    # The publisher as `python -m src.snapshot publish` runs it
+    publisher = _engine_with({})
+    publisher.load_data(*paths)
+    first_version = publisher.save_snapshot(snapshot_path)
+    publishing = _engine_with({
+        'refresh': {'source': 'files', 'save_snapshot': True},
+        'snapshot': {'path': snapshot_path, 'shared': False}
+    }).config
+    publisher_refresher = DatasetRefresher(publisher, publishing)
+    
+    worker = _engine_with({'snapshot': {'path': snapshot_path, 'shared': True}})
+    worker_refresher = DatasetRefresher(worker, worker.config)
+    assert worker_refresher.enabled and worker_refresher.source == 'snapshot', \
+        "Shared workers should follow the snapshot"
+    assert worker_refresher.check() and worker.snapshot_version == first_version, \
+        "The worker should attach to the published version"
+    assert worker.current_dataset(*paths, allow_stale=True) is worker.dataset, \
+        "The worker should serve the published files"
+    assert isinstance(worker.dataset.transactions['customer_id'].dtype, pd.CategoricalDtype), \
+        "Shared string columns should stay categoricals over the mapped codes"
+    assert np.allclose(
+        _scores_of(worker, customer_ids, current_time).values,
+        _scores_of(publisher, customer_ids, current_time).values
+    ), "The worker should score like the publisher"
+    
+    # A change to the CSVs is republished and picked up by the worker
+    with open(paths[1], 'a') as f:
+        f.write("C002,P001,2024-11-28,1,dairy,3.99,S001\n")
+    assert publisher_refresher.check(), "The publisher should rebuild the changed files"
+    assert worker_refresher.check() and worker.snapshot_version != first_version, \
+        "The worker should attach to the new version"
+    assert not worker_refresher.check(), "The worker should not reattach to the same version"
+    assert len(worker.dataset.transactions) == len(publisher.dataset.transactions), \
+        "The new version should hold the change"
+    assert np.allclose(
+        _scores_of(worker, customer_ids, current_time).values,
+        _scores_of(publisher, customer_ids, current_time).values
+    ), "The worker should score like the publisher after the change"
+    
+    print("✓ Worker attached to the published snapshot and scored like the publisher")
+    print("✓ Republished version after a file change picked up by the worker")
+    print("\nTEST 31 PASSED ✓\n")
+
+
+def test_shard_filtering():
+    """Test that each shard keeps only its customers and scores them like one engine"""
+    print("\n" + "="*70)
+    print("TEST 32: Customer Shards")
+    print("="*70)
+    
+    num_shards = 3
+    weights = {'category_affinity': 0.25, 'repurchase_likelihood': 0.20, 'clickstream_intent': 0.20,
+               'product_popularity': 0.10, 'exploration': 0.05, 'copurchase': 0.10, 'factor_affinity': 0.10}
+    components = DETERMINISTIC_COMPONENTS + ['copurchase', 'factor_affinity']
+    paths = _synthetic_files(customers=40, days=30)
+    current_time = datetime(2024, 12, 1)
+    
+    unsharded = _engine_with({'scoring_weights': weights})
+    unsharded.load_data(*paths)
+    transactions = expand_table(unsharded.dataset.transactions)
+    clickstream = expand_table(unsharded.dataset.clickstream)
+    
+    # Shard selectors keep their history next to the unsharded file
+    shard_files = [Path(ShardSpec(shard, num_shards).path('data/shown_products.json')) for shard in range(num_shards)]
+    existing = [path.exists() for path in shard_files]
+    kept_rows = [0, 0]
+    try:
+        for shard in range(num_shards):
+            engine = _engine_with({'scoring_weights': weights,
+                                   'sharding': {'num_shards': num_shards, 'shard_id': shard}})
+            engine.load_data(*paths)
+            dataset = engine.dataset
+            owned = [customer_id for customer_id in transactions['customer_id'].unique()
+                     if shard_of(customer_id, num_shards) == shard]
+            shard_transactions = expand_table(dataset.transactions)
+            shard_clickstream = expand_table(dataset.clickstream)
+            assert set(shard_transactions['customer_id']) == set(owned), \
+                f"Shard {shard} should keep exactly its customers' transactions"
+            assert set(shard_clickstream['customer_id']) <= set(owned), \
+                f"Shard {shard} should keep only its customers' clicks"
+            kept_rows[0] += len(shard_transactions)
+            kept_rows[1] += len(shard_clickstream)
+            
+            for customer_id in owned:
+                expected = unsharded.scoring_engine.score_products(
+                    customer_id, *unsharded.dataset.as_tuple(), current_time,
+                    **unsharded.dataset.scoring_inputs()
+                )[components]
+                actual = engine.scoring_engine.score_products(
+                    customer_id, *dataset.as_tuple(), current_time, **dataset.scoring_inputs()
+                )[components]
+                assert np.allclose(actual.values, expected.values), \
+                    f"Shard {shard} should score {customer_id} like the unsharded engine"
+            
+            foreign = next(customer_id for customer_id in transactions['customer_id'].unique()
+                           if customer_id not in owned)
+            try:
+                engine.shard.check([foreign])
+                raise AssertionError(f"Shard {shard} should reject {foreign}")
+            except WrongShardError:
+                pass
+    finally:
+        for path, existed in zip(shard_files, existing):
+            if not existed and path.exists():
+                path.unlink()
+    
+    assert kept_rows == [len(transactions), len(clickstream)], \
+        "The shards together should keep every row once"
+    
+    print(f"✓ {num_shards} shards keep only their customers, every row once")
+    print("✓ Owned customers score like the unsharded engine, others are rejected")
+    print("\nTEST 32 PASSED ✓\n")
+
+
+def test_rollup_scores():
+    """Test that compacting old rows into daily rollups leaves the scores unchanged"""
+    print("\n" + "="*70)
+    print("TEST 33: Rollup Scores")
+    print("="*70)
+    
+    weights = {'category_affinity': 0.25, 'repurchase_likelihood': 0.20, 'clickstream_intent': 0.20,
+               'product_popularity': 0.10, 'exploration': 0.05, 'copurchase': 0.10, 'factor_affinity': 0.10}
+    components = DETERMINISTIC_COMPONENTS + ['copurchase', 'factor_affinity']
+    # Few customers and products, so rolled-up days merge many rows
+    paths = _synthetic_files('data/sample_products.csv', customers=10, days=30)
+    current_time = datetime(2024, 12, 3, 15, 30)
+    
+    raw = _engine_with({'scoring_weights': weights})
+    raw.load_data(*paths)
+    raw_rows = [len(pd.read_csv(path)) for path in paths[1:]]
+    
+    # Rows before 2024-11-15 (midnight that many days ago) are rolled up
+    older_than_days = (datetime.now().date() - datetime(2024, 11, 15).date()).days
+    _run_cli('src.rollup', 'compact', paths[1], paths[2], '--older-than-days', str(older_than_days))
+    kept_rows = [len(pd.read_csv(path)) for path in paths[1:]]
+    assert all(0 < kept < total for kept, total in zip(kept_rows, raw_rows)), \
+        "Old rows should move into the rollups and recent ones stay raw"
+    
+    rolled = _engine_with({'scoring_weights': weights})
+    rolled.load_data(*paths)
+    assert [int(row_counts(table).sum()) for table in (rolled.dataset.transactions, rolled.dataset.clickstream)] \
+        == raw_rows, "Rollup rows should stand for every rolled-up row"
+    assert len(rolled.dataset.clickstream) < raw_rows[1], "Rolled-up clicks should take fewer rows"
+    
+    customer_ids = sorted(expand_table(raw.dataset.transactions)['customer_id'].unique())
+    for customer_id in customer_ids:
+        expected, actual = [
+            engine.scoring_engine.score_products(
+                customer_id, *engine.dataset.as_tuple(), current_time, **engine.dataset.scoring_inputs()
+            )[components].values
+            for engine in (raw, rolled)
+        ]
+        assert np.allclose(actual, expected), f"Rolled-up history should score {customer_id} like raw history"
+    
+    print(f"✓ {raw_rows[0] - kept_rows[0]} transactions and {raw_rows[1] - kept_rows[1]} clicks rolled up")
+    print(f"✓ {len(customer_ids)} customers score the same from rollups and raw rows")
+    print("\nTEST 33 PASSED ✓\n")
+
+
+def test_csv_schemas():
+    """Test that typed, chunked and concurrent CSV reads give the same tables as plain reads"""
+    print("\n" + "="*70)
+    print("TEST 34: Typed CSV Loading")
+    print("="*70)
+    
+    paths = _synthetic_files(customers=30, days=30)
+    schemas = (PRODUCTS, TRANSACTIONS, CLICKSTREAM)
+    expected = [pd.read_csv(path) for path in paths]
+    for frame, schema in zip(expected, schemas):
+        for column in schema.time_formats:
+            frame[column] = pd.to_datetime(frame[column])
+    
+    for settings in ({}, {'concurrent': False, 'categorical': False}, {'chunksize': 37}):
+        loader = CsvLoader({'csv': settings})
+        tables = loader.gather(*[
+            lambda path=path, schema=schema: loader.read(path, schema)
+            for path, schema in zip(paths, schemas)
+        ])
+        for table, frame, schema in zip(tables, expected, schemas):
+            assert table.astype(object).equals(frame.astype(object)), \
+                f"{schema.name} read with {settings} should hold the same values"
+        transactions = tables[1]
+        assert transactions['quantity'].dtype == np.int64 and \
+            pd.api.types.is_string_dtype(transactions['customer_id']), \
+            "Declared numeric and ID types should be used"
+        assert isinstance(transactions['store_id'].dtype, pd.CategoricalDtype) == settings.get('categorical', True), \
+            "Low-cardinality columns should be categorical unless turned off"
+    
+    # Another timestamp format is inferred; a value of the wrong type is an error
+    clicks = expected[2].copy()
+    other_format = Path(tempfile.mkdtemp()) / 'clickstream.csv'
+    clicks.to_csv(other_format, index=False, date_format='%Y-%m-%d %H:%M:%S')
+    table = CsvLoader({}).read(str(other_format), CLICKSTREAM)
+    assert table['event_timestamp'].equals(expected[2]['event_timestamp']), \
+        "Timestamps in another format should be inferred"
+    transactions = expected[1].copy()
+    transactions['quantity'] = transactions['quantity'].astype(object)
+    transactions.loc[0, 'quantity'] = 'two'
+    bad_type = Path(tempfile.mkdtemp()) / 'transactions.csv'
+    transactions.to_csv(bad_type, index=False)
+    try:
+        CsvLoader({}).read(str(bad_type), TRANSACTIONS)
+        raise AssertionError("A quantity that is not a number should be rejected")
+    except ValueError as e:
+        assert 'transactions schema' in str(e), "The error should name the schema"
+    
+    # Serial, uncategorized and chunked loading scores the same
+    current_time = datetime(2024, 12, 1)
+    engines = []
+    for settings in ({}, {'concurrent': False, 'categorical': False, 'chunksize': 37}):
+        engine = _engine_with({'csv': settings})
+        engine.load_data(*paths)
+        engines.append(engine)
+    customer_ids = sorted(expected[1]['customer_id'].unique())
+    assert np.allclose(
+        _scores_of(engines[0], customer_ids, current_time).values,
+        _scores_of(engines[1], customer_ids, current_time).values
+    ), "Every loading mode should give the same scores"
+    
+    print("✓ Typed reads match plain reads (concurrent, serial, chunked)")
+    print("✓ Other timestamp formats inferred, mistyped values rejected")
+    print("\nTEST 34 PASSED ✓\n")
+
+
+def test_compact_tables():
+    """Test that compact tables expand to the loaded ones and score the same"""
+    print("\n" + "="*70)
+    print("TEST 35: Compact Tables")
+    print("="*70)
+    
+    weights = {'category_affinity': 0.25, 'repurchase_likelihood': 0.20, 'clickstream_intent': 0.20,
+               'product_popularity': 0.10, 'exploration': 0.05, 'copurchase': 0.10, 'factor_affinity': 0.10}
+    components = DETERMINISTIC_COMPONENTS + ['copurchase', 'factor_affinity']
+    paths = _synthetic_files(customers=30, days=30)
+    current_time = datetime(2024, 12, 1)
+    
+    for interactions in (True, False):
+        engines = {}
+        for compact in (True, False):
+            engine = _engine_with({
+                'scoring_weights': weights, 'selection': {'random_seed': 17},
+                'compact_tables': {'enabled': compact}, 'interactions': {'enabled': interactions}
+            })
+            engine.load_data(*paths)
+            engine.selector.shown_products = {}
+            engine.selector.autosave = False
+            engines[compact] = engine
+        compact, expanded = engines[True].dataset, engines[False].dataset
+        
+        if interactions:
+            assert compact.transactions['date_of_transaction'].dtype == np.int32 and \
+                compact.clickstream['event_timestamp'].dtype == np.uint32 and \
+                compact.transactions['quantity'].dtype == np.int16 and \
+                isinstance(compact.transactions['customer_id'].dtype, pd.CategoricalDtype), \
+                "Times, quantities and IDs should be stored narrow"
+            assert table_bytes(compact.transactions, compact.clickstream) < \
+                table_bytes(expanded.transactions, expanded.clickstream), "Compact tables should take less memory"
+            for name in ('transactions', 'clickstream'):
+                restored, loaded = expand_table(getattr(compact, name)), getattr(expanded, name)
+                exact = [column for column in loaded.columns if column != 'total_amount']
+                assert restored[exact].astype(object).equals(loaded[exact].astype(object)), \
+                    f"Expanded {name} should equal the loaded table"
+            assert np.allclose(
+                expand_table(compact.transactions)['total_amount'], expanded.transactions['total_amount']
+            ), "Amounts should only be rounded to float32"
+        
+        customer_ids = sorted(expand_table(compact.transactions)['customer_id'].unique())
+        for customer_id in customer_ids:
+            scores, recommendations = [], []
+            for engine in engines.values():
+                dataset = engine.dataset
+                scores.append(engine.scoring_engine.score_products(
+                    customer_id, *dataset.as_tuple(), current_time, **dataset.scoring_inputs()
+                )[components].values)
+                recommendations.append(engine.recommend_product(
+                    customer_id, *dataset.as_tuple(), current_time=current_time, dataset=dataset
+                )['recommended_product_id'])
+            assert np.allclose(*scores), f"{customer_id} should score the same from compact tables"
+            assert recommendations[0] == recommendations[1], \
+                f"{customer_id} should be recommended the same product from compact tables"
+    
+    print("✓ Compact tables are smaller and expand to the loaded tables")
+    print(f"✓ {len(customer_ids)} customers score and recommend the same, with and without interaction matrices")
+    print("\nTEST 35 PASSED ✓\n")
+
+
+def test_base_score_cache():
+    """Test that scores served from the base score cache equal freshly computed scores"""
+    print("\n" + "="*70)
+    print("TEST 36: Base Score Cache")
+    print("="*70)
+    
+    weights = {'category_affinity': 0.25, 'repurchase_likelihood': 0.20, 'clickstream_intent': 0.20,
+               'product_popularity': 0.10, 'exploration': 0.05, 'copurchase': 0.10, 'factor_affinity': 0.10}
+    components = DETERMINISTIC_COMPONENTS + ['copurchase', 'factor_affinity']
+    paths = _synthetic_files(customers=20, days=30)
+    
+    engines = {}
+    for enabled in (True, False):
+        engine = _engine_with({
+            'scoring_weights': weights, 'base_scores': {'enabled': enabled},
+            'events': {'flush_interval_seconds': 0}
+        })
+        engine.load_data(*paths)
+        engines[enabled] = engine
+    cached, uncached = engines[True], engines[False]
+    customer_ids = sorted(expand_table(cached.dataset.transactions)['customer_id'].unique())
+    
+    def scores(engine, customer_id, current_time, rows=slice(None)):
+        dataset = engine.dataset
+        return engine.scoring_engine.score_products(
+            customer_id, dataset.products.iloc[rows], dataset.transactions, dataset.clickstream,
+            current_time, base_scores=engine.base_scores.for_dataset(dataset), **dataset.scoring_inputs()
+        )[components].values
+    
+    def assert_same(customer_id, current_time, rows=slice(None)):
+        assert np.allclose(scores(cached, customer_id, current_time, rows),
+                           scores(uncached, customer_id, current_time, rows)), \
+            f"Cached scores of {customer_id} at {current_time} should equal uncached ones"
+    
+    # Some rows first, then the whole catalog (the entry is extended), then hits
+    current_time = datetime(2024, 12, 1, 9)
+    for customer_id in customer_ids:
+        assert_same(customer_id, current_time, slice(0, 50))
+        assert_same(customer_id, current_time)
+        assert_same(customer_id, current_time.replace(hour=18))
+    stats = cached.base_scores.stats()
+    assert stats['customers'] == len(customer_ids) and stats['hits'] >= len(customer_ids), \
+        "Every customer should be cached and later requests hit"
+    
+    # A purchase invalidates the customer, and entries expire with the day
+    purchase = [{'customer_id': customer_ids[0], 'product_id': 'P010', 'date_of_transaction': '2024-12-01'}]
+    for engine in engines.values():
+        EventIngestor(engine, engine.config).ingest(purchase, [])
+    assert_same(customer_ids[0], current_time)
+    for customer_id in customer_ids[:5]:
+        assert_same(customer_id, datetime(2024, 12, 2, 9))
+    
+    print(f"✓ {len(customer_ids)} customers scored the same from the cache ({stats['hits']} hits)")
+    print("✓ Purchases and a new day recompute the cached components")
+    print("\nTEST 36 PASSED ✓\n")
+
+
+def test_catalog_feed():
+    """Test that stock and discount updates apply to the served catalog without a reload"""
+    print("\n" + "="*70)
+    print("TEST 37: Live Catalog Updates")
+    print("="*70)
+    
+    paths = _sample_copy()
+    files = {'products_path': paths[0], 'transactions_path': paths[1], 'clickstream_path': paths[2]}
+    product_ids = pd.read_csv(paths[0])['product_id'].tolist()
+    
+    # Through /catalog: only P008, out of stock in the file, is left to recommend
+    updates = [{'product_id': product_id, 'in_stock': product_id == 'P008'} for product_id in product_ids]
+    with TestClient(create_app()) as client:
+        assert client.post('/recommend', json={'customer_id': 'C001', **files}).status_code == 200
+        updates.append({'product_id': 'P999', 'in_stock': True})
+        response = client.post('/catalog', json={'products': updates})
+        assert response.status_code == 200, f"/catalog failed: {response.text}"
+        assert response.json() == {'products': len(updates), 'changed': len(product_ids), 'unknown': 1}, \
+            "Every catalog product should change, and P999 is unknown"
+        response = client.post('/catalog', json={'products': [{'product_id': 'P001', 'in_stock': 'maybe'}]})
+        assert response.status_code == 400, "A flag that is not a boolean should be rejected"
+        
+        response = client.post('/recommend', json={'customer_id': 'NEW01', **files})
+        assert response.status_code == 200 and response.json()['recommended_product_id'] == 'P008', \
+            "Only the product back in stock should be recommended"
+        assert client.get('/ready').json()['catalog_updates']['products'] == len(updates), \
+            "Every updated product should be kept for reloads"
+    
+    # Through a watched feed file, kept across reloads until products.csv is rewritten
+    feed_path = Path(tempfile.mkdtemp()) / 'catalog_feed.csv'
+    engine = _engine_with({'catalog_feed': {'path': str(feed_path)}})
+    feed = CatalogFeed(engine, engine.config)
+    engine.load_data(*paths)
+    pd.DataFrame({'product_id': ['P001', 'P011'], 'in_stock': ['false', ''],
+                  'is_discounted': ['', 'false']}).to_csv(feed_path, index=False)
+    assert feed.check() and not feed.check(), "The feed file should be applied once per change"
+    
+    def flags(product_id):
+        products = engine.dataset.products.set_index('product_id')
+        return bool(products.loc[product_id, 'in_stock']), bool(products.loc[product_id, 'is_discounted'])
+    assert flags('P001') == (False, False) and flags('P011') == (True, False), \
+        "Only the flags given in the feed should change"
+    constraints = engine.constraint_filter
+    transactions = engine.dataset.transactions
+    def allowed():
+        scored = engine.dataset.products.assign(final_score=1.0)
+        return set(constraints.filter_products(
+            'NEW01', scored, transactions, datetime(2024, 11, 29), catalog_mask=engine.dataset.catalog_mask
+        )['product_id'])
+    assert 'P001' not in allowed() and 'P011' in allowed(), "The constraint mask should follow the feed"
+    
+    engine.load_data(*paths)
+    assert flags('P001') == (False, False), "Live flags should survive a reload of an older products file"
+    time.sleep(0.01)
+    Path(paths[0]).write_text(Path(paths[0]).read_text())
+    engine.load_data(*paths)
+    assert flags('P001') == (True, False) and flags('P011') == (True, True), \
+        "A products file written after the update should win"
+    
+    print("✓ /catalog updates changed the recommendable products without a reload")
+    print("✓ Feed file applied on change, kept across reloads until the products file is rewritten")
+    print("\nTEST 37 PASSED ✓\n")
+
+
+def test_audience_selection():
+    """Test that audience selection ranks customers like per-customer scoring"""
+    print("\n" + "="*70)
+    print("TEST 38: Audience Selection")
+    print("="*70)
+    
+    weights = {'category_affinity': 0.25, 'repurchase_likelihood': 0.20, 'clickstream_intent': 0.20,
+               'product_popularity': 0.10, 'exploration': 0.05, 'copurchase': 0.10, 'factor_affinity': 0.10}
+    paths = _synthetic_files('data/sample_products.csv', customers=40, days=30)
+    current_time = datetime(2024, 12, 1, 12)
+    
+    # Small blocks, so customers are scored in several passes
+    engine = _engine_with({'scoring_weights': weights, 'audience': {'block_cells': 50}})
+    engine.load_data(*paths)
+    dataset = engine.dataset
+    customer_ids = list(dataset.interactions.customer_ids)
+    
+    # Deterministic final score of every eligible product, per customer
+    expected = {}
+    for customer_id in customer_ids:
+        scored = engine.scoring_engine.score_products(
+            customer_id, *dataset.as_tuple(), current_time, **dataset.scoring_inputs()
+        )
+        eligible = engine.constraint_filter.filter_products(
+            customer_id, scored, dataset.transactions, current_time,
+            interactions=dataset.interactions, catalog_mask=dataset.catalog_mask
+        )
+        expected[customer_id] = (
+            eligible['final_score'] - weights['exploration'] * eligible['exploration']
+        ).groupby(eligible['product_id']).max()
+    
+    product_id = expand_table(dataset.transactions)['product_id'].value_counts().index[0]
+    products = dataset.products
+    category = products.set_index('product_id').loc[product_id, 'product_category']
+    category_products = set(products.loc[products['product_category'] == category, 'product_id'])
+    for target in ({'product_id': product_id}, {'category': category}):
+        result = engine.select_audience(top_n=10, current_time=current_time, **target)
+        best = {}
+        for customer_id, scores in expected.items():
+            scores = scores[scores.index.isin([product_id] if 'product_id' in target else category_products)]
+            if len(scores) > 0:
+                best[customer_id] = scores.max()
+        ranking = sorted(best.items(), key=lambda item: (-item[1], item[0]))[:10]
+        
+        audience = result['audience']
+        assert [entry['customer_id'] for entry in audience] == [customer_id for customer_id, _ in ranking], \
+            f"The audience for {target} should be the top customers by their recommendation scores"
+        assert np.allclose([entry['score'] for entry in audience], [score for _, score in ranking]), \
+            f"Audience scores for {target} should equal the deterministic final scores"
+        assert all(
+            np.isclose(expected[entry['customer_id']][entry['product_id']], best[entry['customer_id']])
+            for entry in audience
+        ), "Each customer should be reported with their best product"
+        if 'product_id' in target:
+            assert result['excluded_customers'] == len(customer_ids) - len(best) > 0, \
+                "Customers who bought the product recently should be excluded"
+    
+    # The endpoint
+    files = {'products_path': paths[0], 'transactions_path': paths[1], 'clickstream_path': paths[2]}
+    with TestClient(create_app()) as client:
+        response = client.post('/audience', json={'product_id': product_id, 'top_n': 5, **files})
+        assert response.status_code == 200 and len(response.json()['audience']) == 5, \
+            f"/audience failed: {response.text}"
+        response = client.post('/audience', json={'product_id': product_id, 'category': category, **files})
+        assert response.status_code == 400, "A product and a category together should be rejected"
+    
+    print(f"✓ Audiences for {product_id} and category {category} match per-customer scoring "
+          f"of {len(customer_ids)} customers")
+    print("✓ /audience returns the top customers and rejects ambiguous targets")
+    print("\nTEST 38 PASSED ✓\n")
+
+
 def main():
     """Run all tests"""
     print("\n" + "="*70)
@@ -256,6 +1906,38 @@ def main():
         test_batch_recommendations()
         test_score_components()
         test_output_format()
+        test_replay_base_scores()
+        test_live_events_match_reload()
+        test_live_events_match_reload_truncated()
+        test_history_horizon_cli()
+        test_base_score_invalidations_bounded()
+        test_events_with_utc_offsets()
+        test_snapshot_table_layout()
+        test_history_horizon_bound()
+        test_popularity_sketch_error()
+        test_candidate_recall()
+        test_interaction_matrix_scores()
+        test_copurchase_index()
+        test_factor_model()
+        test_weight_grid()
+        test_replay_backtest()
+        test_load_test_harness()
+        test_latency_budget_fallback()
+        test_scorer_plugins()
+        test_parallel_scoring()
+        test_request_random_streams()
+        test_batch_checkpoint_resume()
+        test_events_endpoint()
+        test_snapshot_round_trip()
+        test_dataset_refresh()
+        test_shared_snapshot()
+        test_shard_filtering()
+        test_rollup_scores()
+        test_csv_schemas()
+        test_compact_tables()
+        test_base_score_cache()
+        test_catalog_feed()
+        test_audience_selection()
         
         print("\n" + "="*70)
         print("ALL TESTS PASSED ✓✓✓")
@@ -0,0 +1,559 @@
+"""
+Audience Selection
+
+This module answers the reverse of recommend_product: which customers to
+show a product, or any product of a category (e.g. a campaign's creatives),
+to. Rather than scoring the whole catalog once per customer, it scores every
+customer against the target products at once, reading the target columns of
+the interaction matrices plus a few per-customer aggregates (row maxima of
+the normalized components). Its cost grows with customers x target products
+instead of customers x catalog.
+
+A customer's score for a product is the deterministic part of the final
+score recommend_product would give it: the weighted components of the
+sparse scoring path, without exploration. Components registered by plugins
+are not supported and are reported as skipped.
+
+The same constraints apply as to recommendations: products the stock and
+discount rules exclude are not targeted at all, and customers who bought a
+product within constraints.exclude_recent_purchases_days are left out of its
+audience. For a category, each customer is scored against every eligible
+product of it and is reported with their best one.
+
+Usage:
+    python -m src.main audience <products.csv> <transactions.csv> <clickstream.csv>
+        (--product P001 | --category Dairy) [--top-n 100] [--output audience.jsonl]
+"""
+
+import argparse
+import json
+import logging
+import sys
+import threading
+import time
+import weakref
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from src.interaction_matrix import to_epoch_seconds, SECONDS_PER_DAY
+from src.scoring_engine import weighted_components
+
+
+# Components that can be scored for every customer at once
+AUDIENCE_COMPONENTS = (
+    'category_affinity',
+    'repurchase_likelihood',
+    'clickstream_intent',
+    'product_popularity',
+    'copurchase',
+    'factor_affinity'
+)
+
+# Matrices whose target columns are read
+_TARGET_MATRICES = (
+    'purchase_count',
+    'last_purchase',
+    'cycle_days_sum',
+    'click_recency',
+    'click_event_weight'
+)
+
+
+class AudienceSelector:
+    """
+    Score every customer against a product or category and keep the best ones.
+    """
+
+    def __init__(self, config: Dict, scoring_engine, constraint_filter):
+        """
+        Initialize the selector.
+
+        Args:
+            config: Configuration dictionary (uses the audience section)
+            scoring_engine: ProductScoringEngine whose weights and component
+                parameters the scores follow
+            constraint_filter: ConstraintFilter whose rules are applied
+        """
+        audience_config = config.get('audience', {}) or {}
+        self.config = config
+        self.scoring_engine = scoring_engine
+        self.constraint_filter = constraint_filter
+        self.top_n = audience_config.get('top_n', 100)
+        self.block_cells = audience_config.get('block_cells', 4_000_000)
+        self.logger = logging.getLogger(__name__)
+
+        # Per-customer aggregates that depend only on the loaded state, kept
+        # for the objects they were computed from (see _aggregate)
+        self._aggregates: Dict[str, Tuple[Tuple, object]] = {}
+        self._lock = threading.Lock()
+
+    def select(
+        self,
+        dataset,
+        product_id: Optional[str] = None,
+        category: Optional[str] = None,
+        top_n: Optional[int] = None,
+        current_time: datetime = None
+    ) -> Dict:
+        """
+        Top customers for a product or for the products of a category.
+
+        Args:
+            dataset: EngineDataset with an InteractionMatrix
+            product_id: Product to find an audience for
+            category: Category to find an audience for (instead of product_id)
+            top_n: Number of customers (defaults to audience.top_n)
+            current_time: Current timestamp (defaults to now)
+
+        Returns:
+            Dictionary with the audience (customer_id, product_id, score and
+            score_components of each customer, best first) and counts of the
+            customers scored and products and customers excluded
+
+        Raises:
+            ValueError: If not exactly one of product_id and category is
+                given, the target is not in the catalog, top_n is not
+                positive or the dataset has no interaction matrix
+        """
+        if (product_id is None) == (category is None):
+            raise ValueError("Give exactly one of product_id or category")
+        if top_n is None:
+            top_n = self.top_n
+        if top_n <= 0:
+            raise ValueError(f"top_n must be positive, got {top_n}")
+        interactions = dataset.interactions
+        if interactions is None:
+            raise ValueError("Audience selection needs the interaction matrix (interactions.enabled)")
+        if current_time is None:
+            current_time = datetime.now()
+        start = time.perf_counter()
+
+        products = dataset.products
+        if product_id is not None:
+            label = f"product {product_id}"
+            targets = products[products['product_id'] == product_id]
+        else:
+            label = f"category {category}"
+            targets = products[products['product_category'] == category]
+        if len(targets) == 0:
+            raise ValueError(f"Unknown {label}")
+        eligible = self.constraint_filter.filter_catalog(targets, dataset.catalog_mask)
+
+        components, skipped = self._components(dataset)
+        scores, best, values = self._score(dataset, eligible, components, current_time)
+        selected = _top(scores, interactions.customer_ids, top_n)
+
+        audience = []
+        for row in selected:
+            audience.append({
+                'customer_id': interactions.customer_ids[row],
+                'product_id': eligible['product_id'].iloc[best[row]],
+                'score': float(scores[row]),
+                'score_components': {name: float(values[name][row]) for name in components}
+            })
+        result = {
+            'product_id': product_id,
+            'category': category,
+            'audience': audience,
+            'customers_scored': len(interactions.customer_ids),
+            'excluded_customers': int((best < 0).sum()) if len(eligible) else 0,
+            'eligible_products': len(eligible),
+            'excluded_products': len(targets) - len(eligible),
+            'skipped_components': skipped,
+            'timestamp': current_time.isoformat()
+        }
+        self.logger.info(
+            f"Selected {len(audience)} of {result['customers_scored']} customers for {label} "
+            f"({len(eligible)} eligible products) in {time.perf_counter() - start:.3f}s"
+        )
+        return result
+
+    def _components(self, dataset) -> Tuple[List[str], List[str]]:
+        """Weighted components that are scored, and those skipped."""
+        components, skipped = [], []
+        for name in weighted_components(self.scoring_engine.weights):
+            if name == 'exploration':
+                continue
+            missing = (
+                (name == 'copurchase' and dataset.copurchase is None) or
+                (name == 'factor_affinity' and dataset.factors is None)
+            )
+            if name not in AUDIENCE_COMPONENTS or missing:
+                skipped.append(name)
+            else:
+                components.append(name)
+        if skipped:
+            self.logger.warning(f"Audience scores leave out components {skipped}")
+        return components, skipped
+
+    def _score(
+        self,
+        dataset,
+        eligible: pd.DataFrame,
+        components: List[str],
+        current_time: datetime
+    ) -> Tuple[np.ndarray, np.ndarray, Dict[str, np.ndarray]]:
+        """
+        Best score of each customer over the eligible products.
+
+        Products are scored in blocks of about block_cells customer x product
+        cells; each block is a dense array per component.
+
+        Returns:
+            Tuple of (score per customer, -inf if every product is excluded
+            for them; position in eligible of their best product, -1 if none;
+            component values at that product by name)
+        """
+        interactions = dataset.interactions
+        n_customers = len(interactions.customer_ids)
+        scores = np.full(n_customers, -np.inf)
+        best = np.full(n_customers, -1, dtype=np.int64)
+        values = {name: np.zeros(n_customers) for name in components}
+        if len(eligible) == 0 or n_customers == 0:
+            return scores, best, values
+
+        # One pass over each matrix reads every target column (the catalog's
+        # products are all columns); blocks are sliced from the narrow
+        # column-major result
+        columns = interactions.product_columns(eligible['product_id'])
+        target = {
+            name: interactions.matrices[name][:, columns].tocsc()
+            for name in _TARGET_MATRICES
+        }
+        context = {
+            'now': to_epoch_seconds(current_time),
+            'category_columns': interactions.category_columns(eligible['product_category']),
+            'popularity': self.scoring_engine._score_product_popularity(
+                eligible, dataset.transactions, popularity=dataset.popularity
+            ).to_numpy(dtype=np.float64)
+        }
+        if 'clickstream_intent' in components:
+            context['click_max'] = self._click_max(interactions, current_time)
+
+        weights = self.scoring_engine.weights
+        days = self.constraint_filter.constraints.get('exclude_recent_purchases_days', 0)
+        cutoff = to_epoch_seconds(current_time - timedelta(days=days)) if days > 0 else None
+
+        block_size = max(1, self.block_cells // n_customers)
+        rows = np.arange(n_customers)
+        for block_start in range(0, len(eligible), block_size):
+            block = slice(block_start, min(block_start + block_size, len(eligible)))
+            block_values = {
+                name: self._score_component(name, dataset, eligible, block, target, context)
+                for name in components
+            }
+            total = np.zeros((n_customers, block.stop - block.start))
+            for name in components:
+                total = total + weights[name] * block_values[name]
+            if cutoff is not None:
+                # Recently bought: not in the audience for that product
+                total[_dense(target['last_purchase'], block) >= cutoff] = -np.inf
+
+            block_best = np.argmax(total, axis=1)
+            block_scores = total[rows, block_best]
+            better = block_scores > scores
+            scores[better] = block_scores[better]
+            best[better] = block_start + block_best[better]
+            for name in components:
+                values[name][better] = block_values[name][rows[better], block_best[better]]
+        return scores, best, values
+
+    def _score_component(
+        self,
+        name: str,
+        dataset,
+        eligible: pd.DataFrame,
+        block: slice,
+        target: Dict[str, sparse.csc_matrix],
+        context: Dict
+    ) -> np.ndarray:
+        """
+        One component for every customer x product of a block.
+
+        Follows the sparse scorers of ProductScoringEngine column by column.
+
+        Returns:
+            Dense array [customers, block products]
+        """
+        interactions = dataset.interactions
+        config = self.config
+
+        if name == 'category_affinity':
+            category_scores, row_max = self._aggregate(
+                'category_affinity', (interactions,), lambda: _category_scores(interactions)
+            )
+            scores = _dense(category_scores, context['category_columns'][block], known_only=True)
+            return _divide_rows(scores, row_max)
+
+        if name == 'repurchase_likelihood':
+            repurchase_config = config['repurchase_likelihood']
+            purchase_count = _dense(target['purchase_count'], block)
+            last_purchase = _dense(target['last_purchase'], block)
+            cycle_days_sum = _dense(target['cycle_days_sum'], block)
+            days_since = np.floor((context['now'] - last_purchase) / SECONDS_PER_DAY)
+            avg_cycle = np.where(
+                purchase_count >= 2,
+                cycle_days_sum / np.maximum(purchase_count - 1, 1),
+                repurchase_config['expected_cycle_days']
+            )
+            deviation = np.abs(days_since - avg_cycle)
+            scores = np.exp(-(deviation ** 2) / (2 * repurchase_config['cycle_std_days'] ** 2))
+            return np.where(purchase_count >= max(repurchase_config['min_purchases'], 1), scores, 0.0)
+
+        if name == 'clickstream_intent':
+            recency_weight, decay = _click_parameters(config, interactions, context['now'])
+            scores = (
+                recency_weight * (_dense(target['click_recency'], block) * decay) +
+                (1 - recency_weight) * _dense(target['click_event_weight'], block)
+            )
+            return _divide_rows(scores, context['click_max'])
+
+        if name == 'product_popularity':
+            popularity = context['popularity'][block]
+            return np.broadcast_to(popularity, (len(interactions.customer_ids), len(popularity)))
+
+        if name == 'copurchase':
+            copurchase = dataset.copurchase
+            history, neighbors, row_max = self._aggregate(
+                'copurchase', (interactions, copurchase),
+                lambda: _copurchase_history(interactions, copurchase, config)
+            )
+            columns = copurchase.product_ids.get_indexer(eligible['product_id'].iloc[block])
+            scores = np.zeros((history.shape[0], len(columns)))
+            known = columns >= 0
+            if known.any():
+                scores[:, known] = (history @ neighbors[:, columns[known]]).toarray()
+            return _divide_rows(scores, row_max)
+
+        if name == 'factor_affinity':
+            factors = dataset.factors
+            rows, minimum, spread = self._aggregate(
+                'factor_affinity', (interactions, factors),
+                lambda: _factor_ranges(interactions, factors, self.block_cells)
+            )
+            columns = factors.product_ids.get_indexer(eligible['product_id'].iloc[block])
+            scores = np.zeros((len(rows), len(columns)))
+            known_rows = rows >= 0
+            known = columns >= 0
+            if known.any() and known_rows.any():
+                affinity = (
+                    factors.customer_factors[rows[known_rows]] @ factors.product_factors[columns[known]].T
+                )
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    scaled = (affinity - minimum[known_rows, None]) / spread[known_rows, None]
+                scaled[spread[known_rows] <= 0] = 0.0
+                scores[np.ix_(known_rows, known)] = scaled
+            return scores
+
+        raise ValueError(f"Score component '{name}' cannot be computed for an audience")
+
+    def _click_max(self, interactions, current_time: datetime) -> np.ndarray:
+        """Row maximum of each customer's click scores at current_time."""
+        recency_weight, decay = _click_parameters(
+            self.config, interactions, to_epoch_seconds(current_time)
+        )
+        recency = interactions.matrices['click_recency']
+        scores = recency.copy()
+        scores.data = (
+            recency_weight * (recency.data * decay) +
+            (1 - recency_weight) * interactions.matrices['click_event_weight'].data
+        )
+        return _row_max(scores)
+
+    def _aggregate(self, name: str, sources: Tuple, compute):
+        """
+        Per-customer aggregate computed once for the objects it is read from.
+
+        Only weak references to the sources are kept, so datasets that are
+        replaced are still freed.
+        """
+        with self._lock:
+            entry = self._aggregates.get(name)
+            if entry is not None and all(ref() is source for ref, source in zip(entry[0], sources)):
+                return entry[1]
+            value = compute()
+            self._aggregates[name] = (tuple(weakref.ref(source) for source in sources), value)
+            return value
+
+
+def _dense(matrix, columns, known_only: bool = False) -> np.ndarray:
+    """
+    Dense [rows, columns] block of a sparse matrix.
+
+    Args:
+        matrix: CSR or CSC matrix
+        columns: Slice, or column indices (-1 reads as 0 with known_only)
+        known_only: Whether columns may hold -1
+
+    Returns:
+        float64 array
+    """
+    if not known_only:
+        return matrix[:, columns].toarray().astype(np.float64, copy=False)
+    block = np.zeros((matrix.shape[0], len(columns)))
+    known = columns >= 0
+    if known.any():
+        block[:, known] = matrix[:, columns[known]].toarray()
+    return block
+
+
+def _row_max(matrix: sparse.csr_matrix) -> np.ndarray:
+    """Maximum stored value of each row (0 for empty rows)."""
+    row_max = np.zeros(matrix.shape[0])
+    filled = np.diff(matrix.indptr) > 0
+    if filled.any():
+        row_max[filled] = np.maximum.reduceat(matrix.data, matrix.indptr[:-1][filled])
+    return row_max
+
+
+def _divide_rows(scores: np.ndarray, row_max: np.ndarray) -> np.ndarray:
+    """Scale each row by its maximum, leaving rows with a maximum <= 0 as they are."""
+    scale = np.where(row_max > 0, row_max, 1.0)
+    return scores / scale[:, None]
+
+
+def _category_scores(interactions) -> Tuple[sparse.csr_matrix, np.ndarray]:
+    """Category scores weight * log1p(quantity) and their row maxima."""
+    weights = interactions.matrices['category_weight']
+    scores = weights.copy()
+    scores.data = weights.data * np.log1p(interactions.matrices['category_quantity'].data)
+    return scores.tocsc(), _row_max(scores)
+
+
+def _click_parameters(config: Dict, interactions, now: float) -> Tuple[float, float]:
+    """Recency weight, and the decay from the matrix reference time to now."""
+    click_config = config['clickstream_intent']
+    hours_since_reference = (now - to_epoch_seconds(interactions.reference_time)) / 3600
+    return click_config['recency_weight'], np.exp(-hours_since_reference / click_config['decay_hours'])
+
+
+def _copurchase_history(
+    interactions,
+    copurchase,
+    config: Dict
+) -> Tuple[sparse.csr_matrix, sparse.csc_matrix, np.ndarray]:
+    """
+    Each customer's top history_size purchase weights over the co-purchase
+    index's products, the product x neighbor similarity matrix, and the row
+    maxima of the customers' neighbor scores.
+    """
+    history_size = config.get('copurchase', {}).get('history_size', 20)
+    weights = interactions.matrices['purchase_weight'].tocoo()
+    rows, columns, values = weights.row, weights.col, weights.data
+
+    # Keep each row's history_size largest weights
+    order = np.lexsort((-values, rows))
+    rows, columns, values = rows[order], columns[order], values[order]
+    starts = np.searchsorted(rows, rows, side='left')
+    keep = np.arange(len(rows)) - starts < history_size
+    index_rows = copurchase.product_ids.get_indexer(interactions.product_ids[columns[keep]])
+    known = index_rows >= 0
+    history = sparse.csr_matrix(
+        (values[keep][known], (rows[keep][known], index_rows[known])),
+        shape=(weights.shape[0], len(copurchase.product_ids))
+    )
+
+    neighbors = _neighbor_matrix(copurchase)
+    row_max = np.zeros(history.shape[0])
+    block_rows = 4096
+    for block_start in range(0, history.shape[0], block_rows):
+        row_max[block_start:block_start + block_rows] = _row_max(
+            (history[block_start:block_start + block_rows] @ neighbors).tocsr()
+        )
+    return history, neighbors.tocsc(), row_max
+
+
+def _neighbor_matrix(copurchase) -> sparse.csr_matrix:
+    """Product x neighbor similarity matrix of a CoPurchaseIndex."""
+    size = len(copurchase.product_ids)
+    rows = np.repeat(np.arange(size), copurchase.neighbors.shape[1])
+    neighbors = copurchase.neighbors.ravel()
+    valid = neighbors >= 0
+    return sparse.csr_matrix(
+        (copurchase.weights.ravel()[valid].astype(np.float64), (rows[valid], neighbors[valid])),
+        shape=(size, size)
+    )
+
+
+def _factor_ranges(interactions, factors, block_cells: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Factor row of each customer (-1 if unknown), and the minimum and spread
+    of their affinity over the model's products.
+    """
+    rows = factors.customer_ids.get_indexer(interactions.customer_ids)
+    minimum = np.zeros(len(rows), dtype=np.float32)
+    spread = np.zeros(len(rows), dtype=np.float32)
+    known = np.flatnonzero(rows >= 0)
+    product_factors_t = np.ascontiguousarray(factors.product_factors.T)
+    block_size = max(1, block_cells // max(len(factors.product_ids), 1))
+    for block_start in range(0, len(known), block_size):
+        block = known[block_start:block_start + block_size]
+        affinity = factors.customer_factors[rows[block]] @ product_factors_t
+        minimum[block] = affinity.min(axis=1)
+        spread[block] = affinity.max(axis=1) - minimum[block]
+    return rows, minimum, spread
+
+
+def _top(scores: np.ndarray, customer_ids: pd.Index, top_n: int) -> np.ndarray:
+    """Rows of the top_n finite scores, best first, ties by customer ID."""
+    candidates = np.flatnonzero(np.isfinite(scores))
+    if len(candidates) > top_n:
+        # Keep every customer tied with the last one so ties break by ID
+        kth = np.partition(scores[candidates], len(candidates) - top_n)[len(candidates) - top_n]
+        candidates = candidates[scores[candidates] >= kth]
+    order = pd.DataFrame({
+        'score': scores[candidates],
+        'customer_id': np.asarray(customer_ids[candidates], dtype=object)
+    }).sort_values(['score', 'customer_id'], ascending=[False, True], kind='stable')
+    return candidates[order.index.to_numpy()[:top_n]]
+
+
+def main(argv: Optional[List[str]] = None):
+    """CLI entry point: audience selection (python -m src.main audience ...)."""
+    from src.main import RecommendationEngine
+
+    parser = argparse.ArgumentParser(
+        prog='python -m src.main audience',
+        description="Top customers to target with a product or category"
+    )
+    parser.add_argument('products')
+    parser.add_argument('transactions')
+    parser.add_argument('clickstream')
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--product', default=None, help="Product ID")
+    target.add_argument('--category', default=None, help="Product category")
+    parser.add_argument('--top-n', type=int, default=None, help="Defaults to audience.top_n")
+    parser.add_argument('--output', default='-', help="JSONL output file, '-' for stdout")
+    parser.add_argument('--config', default='config/config.yaml')
+    args = parser.parse_args(argv)
+
+    engine = RecommendationEngine(args.config)
+    engine.load_data(
+        products_path=args.products,
+        transactions_path=args.transactions,
+        clickstream_path=args.clickstream
+    )
+    try:
+        result = engine.select_audience(
+            product_id=args.product, category=args.category, top_n=args.top_n
+        )
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    output = sys.stdout if args.output == '-' else open(args.output, 'w')
+    try:
+        for entry in result['audience']:
+            output.write(json.dumps(entry) + '\n')
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    print(f"Selected {len(result['audience']):,} of {result['customers_scored']:,} customers "
+          f"({result['eligible_products']} eligible products, "
+          f"{result['excluded_customers']:,} customers excluded by recent purchases)"
+          + (f" -> {args.output}" if args.output != '-' else ""),
+          file=sys.stderr, flush=True)
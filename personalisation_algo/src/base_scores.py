@@ -0,0 +1,241 @@
+"""
+Base Score Cache
+
+Within a browsing session only the clickstream component of a customer's
+scores changes: category affinity, repurchase likelihood, popularity,
+co-purchase and factor affinity are built from purchases and load-time
+state. This module keeps those slow components between requests, so a
+request only recomputes the session components (clickstream intent and
+exploration) and adds them to the cached base.
+
+- Customer components are cached per customer, for the catalog rows that
+  have been scored. A request for other rows (e.g. new candidates)
+  computes just those rows and extends the entry.
+- Components that do not read the customer (product popularity, and any
+  plugin scorer declaring no customer input) are cached once for everyone.
+- Entries hold for one day: the slow components decay in whole days.
+- An ingested purchase drops the customer's entry, and a dataset reload
+  clears the cache. Each entry records the version of the dataset it was
+  computed from (see EngineDataset.version), so a request still holding an
+  older dataset never stores scores that predate an invalidation.
+  Invalidations are remembered for as many customers as entries are kept;
+  forgetting the oldest raises the version a request needs to store at all.
+
+Cached components must score each product independently of the other
+products scored, as the built-in components do.
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+# Components cached by default: everything except clickstream intent and exploration
+DEFAULT_COMPONENTS = (
+    'category_affinity',
+    'repurchase_likelihood',
+    'product_popularity',
+    'copurchase',
+    'factor_affinity'
+)
+
+# Key of the entry holding components that do not depend on the customer
+SHARED = None
+
+
+class BaseScoreCache:
+    """
+    Slow score components per customer, reused across requests.
+    """
+
+    def __init__(self, config: Dict):
+        """
+        Initialize the cache.
+
+        Args:
+            config: Configuration dictionary (uses the base_scores section)
+        """
+        base_config = config.get('base_scores', {}) or {}
+        self.enabled = base_config.get('enabled', False)
+        self.components = tuple(base_config.get('components', DEFAULT_COMPONENTS))
+        self.max_customers = base_config.get('max_customers', 10000)
+
+        self._entries: 'OrderedDict[Optional[str], Dict]' = OrderedDict()
+        self._floor = 0
+        self._invalidated: 'OrderedDict[Optional[str], int]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def for_dataset(self, dataset) -> Optional['BaseScores']:
+        """
+        Cache access for requests scored against a dataset.
+
+        Args:
+            dataset: EngineDataset the request reads, or None
+
+        Returns:
+            BaseScores to pass to score_products, or None if the cache is
+            disabled or there is no dataset
+        """
+        if not self.enabled or dataset is None:
+            return None
+        return BaseScores(self, dataset.version)
+
+    def clear(self, dataset=None):
+        """
+        Drop every entry, e.g. when a reloaded dataset is swapped in.
+
+        Args:
+            dataset: The new dataset; requests on older ones stop storing entries
+        """
+        with self._lock:
+            self._entries.clear()
+            self._invalidated.clear()
+            if dataset is not None:
+                self._floor = max(self._floor, dataset.version)
+
+    def invalidate(self, customer_ids: Iterable[str], dataset):
+        """
+        Drop the entries of customers with new purchases, and the shared
+        entry (purchases change popularity).
+
+        Args:
+            customer_ids: Customers whose purchases changed
+            dataset: Dataset that includes the purchases
+        """
+        with self._lock:
+            for customer_id in [SHARED, *customer_ids]:
+                self._entries.pop(customer_id, None)
+                self._invalidated[customer_id] = dataset.version
+                self._invalidated.move_to_end(customer_id)
+            # Requests on datasets older than a forgotten invalidation may
+            # not store anything: entries already held all passed its check
+            while len(self._invalidated) > self.max_customers + 1:
+                _, version = self._invalidated.popitem(last=False)
+                self._floor = max(self._floor, version)
+
+    def stats(self) -> Dict:
+        """Number of cached customers and the hit and miss counts since start."""
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'customers': sum(key is not SHARED for key in self._entries),
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+    def lookup(
+        self,
+        key: Optional[str],
+        names: Tuple[str, ...],
+        index: pd.Index,
+        day: pd.Timestamp
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Cached scores of some products.
+
+        Args:
+            key: Customer ID, or SHARED
+            names: Components, in column order
+            index: Labels of the products
+            day: Day being scored
+
+        Returns:
+            Tuple of (scores [len(index), len(names)], with NaN rows where
+            missing; boolean mask of the missing rows)
+        """
+        values = np.full((len(index), len(names)), np.nan)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and not self._valid(key, entry, names, day):
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return values, np.ones(len(index), dtype=bool)
+            if key is not SHARED:
+                self._entries.move_to_end(key)
+            positions = entry['index'].get_indexer(index)
+        found = positions >= 0
+        values[found] = entry['values'][positions[found]]
+        with self._lock:
+            if found.all():
+                self.hits += 1
+            else:
+                self.misses += 1
+        return values, ~found
+
+    def store(
+        self,
+        key: Optional[str],
+        names: Tuple[str, ...],
+        index: pd.Index,
+        values: np.ndarray,
+        day: pd.Timestamp,
+        version: int
+    ):
+        """
+        Add scores of products to an entry.
+
+        Args:
+            key: Customer ID, or SHARED
+            names: Components, in column order
+            index: Labels of the newly scored products
+            values: Their scores [len(index), len(names)]
+            day: Day they were scored for
+            version: Version of the dataset they were computed from
+        """
+        with self._lock:
+            if version < max(self._floor, self._invalidated.get(key, 0)):
+                return
+            entry = self._entries.get(key)
+            if entry is None or not self._valid(key, entry, names, day):
+                entry = {'names': names, 'day': day, 'version': version,
+                         'index': index, 'values': values}
+            else:
+                # Rows computed from any dataset since the last invalidation agree
+                new = ~index.isin(entry['index'])
+                entry = {**entry, 'index': entry['index'].append(index[new]),
+                         'values': np.concatenate([entry['values'], values[new]])}
+            self._entries[key] = entry
+            if key is not SHARED:
+                self._entries.move_to_end(key)
+                customers = len(self._entries) - (SHARED in self._entries)
+                while customers > self.max_customers:
+                    oldest = next(customer for customer in self._entries if customer is not SHARED)
+                    del self._entries[oldest]
+                    customers -= 1
+
+    def _valid(self, key: Optional[str], entry: Dict, names: Tuple[str, ...], day: pd.Timestamp) -> bool:
+        """Whether an entry can serve a request (call with the lock held)."""
+        return (
+            entry['names'] == names and entry['day'] == day and
+            entry['version'] >= self._invalidated.get(key, 0)
+        )
+
+
+class BaseScores:
+    """
+    A BaseScoreCache bound to the dataset version one request reads.
+    """
+
+    def __init__(self, cache: BaseScoreCache, version: int):
+        self.cache = cache
+        self.version = version
+
+    def components(self, names: List[str]) -> List[str]:
+        """Those of names the cache holds, in the same order."""
+        return [name for name in names if name in self.cache.components]
+
+    def lookup(self, key: Optional[str], names: Tuple[str, ...], index: pd.Index, day: pd.Timestamp):
+        """See BaseScoreCache.lookup."""
+        return self.cache.lookup(key, names, index, day)
+
+    def store(self, key: Optional[str], names: Tuple[str, ...], index: pd.Index,
+              values: np.ndarray, day: pd.Timestamp):
+        """See BaseScoreCache.store."""
+        self.cache.store(key, names, index, values, day, self.version)
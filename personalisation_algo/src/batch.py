@@ -0,0 +1,385 @@
+"""
+Streaming Batch Recommendations
+
+This module generates recommendations for a stream of customer IDs in
+fixed-size chunks, writing each chunk to the output as soon as it is done.
+Memory stays bounded by the chunk size rather than the customer count.
+
+After every chunk the output is flushed and a checkpoint records how many
+customers are done and where the output ends. A resumed run truncates the
+output to that point, skips the customers already processed and reuses the
+original run's timestamp.
+
+Output formats:
+    jsonl    one recommendation object per line
+    csv      one row per recommendation, score components as score_* columns
+    parquet  a directory with one part file per chunk (requires pyarrow)
+
+Usage:
+    python -m src.main batch <products.csv> <transactions.csv> <clickstream.csv>
+        [--customers ids.txt|-] [--output recommendations.jsonl]
+        [--format jsonl|csv|parquet] [--chunk-size 1000] [--resume]
+"""
+
+import argparse
+import itertools
+import json
+import logging
+import os
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+
+OUTPUT_FORMATS = ('jsonl', 'csv', 'parquet')
+
+
+def read_customer_ids(source: str) -> Iterator[str]:
+    """
+    Stream customer IDs from a file with one ID per line.
+
+    Blank lines and a leading 'customer_id' header are skipped.
+
+    Args:
+        source: Path to the file, or '-' for stdin
+
+    Yields:
+        Customer IDs in file order
+    """
+    stream = sys.stdin if source == '-' else open(source, 'r')
+    try:
+        for line_number, line in enumerate(stream):
+            customer_id = line.strip()
+            if not customer_id or (line_number == 0 and customer_id == 'customer_id'):
+                continue
+            yield customer_id
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+def flatten_recommendation(recommendation: Dict) -> Dict:
+    """
+    Flatten a recommendation for columnar output.
+
+    Args:
+        recommendation: Output of RecommendationEngine.recommend_product
+
+    Returns:
+        Dictionary with score components as score_<name> fields
+    """
+    row = {key: value for key, value in recommendation.items() if key != 'score_components'}
+    for name, score in recommendation.get('score_components', {}).items():
+        row[f'score_{name}'] = score
+    return row
+
+
+class BatchCheckpoint:
+    """
+    Progress of a batch run, stored as JSON next to the output.
+    """
+
+    def __init__(self, path: Path):
+        """
+        Initialize the checkpoint.
+
+        Args:
+            path: Checkpoint file path
+        """
+        self.path = Path(path)
+
+    def load(self) -> Optional[Dict]:
+        """Saved state, or None if there is no checkpoint."""
+        if not self.path.exists():
+            return None
+        with open(self.path, 'r') as f:
+            return json.load(f)
+
+    def save(self, state: Dict):
+        """Write the state atomically (a crash leaves the previous checkpoint intact)."""
+        temporary = self.path.with_name(self.path.name + '.tmp')
+        with open(temporary, 'w') as f:
+            json.dump(state, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self.path)
+
+
+class BatchWriter:
+    """
+    Append chunks of recommendations to the output in one of OUTPUT_FORMATS.
+    """
+
+    def __init__(self, output: str, output_format: str = 'jsonl', position: int = 0):
+        """
+        Open the output.
+
+        Args:
+            output: Output file (directory for parquet), or '-' for stdout
+            output_format: One of OUTPUT_FORMATS
+            position: Where a resumed run continues: byte offset for jsonl
+                and csv, next part number for parquet (0 starts afresh)
+        """
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown output format '{output_format}', expected one of {OUTPUT_FORMATS}")
+        if output_format == 'parquet' and not HAS_PYARROW:
+            raise ValueError("Parquet output requires pyarrow (pip install pyarrow)")
+        if output == '-' and output_format == 'parquet':
+            raise ValueError("Parquet output cannot be written to stdout")
+
+        self.output = output
+        self.output_format = output_format
+        self.position = position
+
+        if output_format == 'parquet':
+            self.stream = None
+            Path(output).mkdir(parents=True, exist_ok=True)
+            if position == 0:
+                for part in Path(output).glob('part-*.parquet'):
+                    part.unlink()
+        elif output == '-':
+            self.stream = sys.stdout.buffer
+        else:
+            Path(output).parent.mkdir(parents=True, exist_ok=True)
+            # Drop anything written after the checkpoint (an interrupted chunk)
+            self.stream = open(output, 'r+b' if position > 0 else 'wb')
+            self.stream.seek(position)
+            self.stream.truncate()
+
+    def write_chunk(self, recommendations: List[Dict]):
+        """
+        Write one chunk and flush it.
+
+        Args:
+            recommendations: Recommendations of the chunk
+        """
+        if self.output_format == 'parquet':
+            if recommendations:
+                frame = pd.DataFrame([flatten_recommendation(r) for r in recommendations])
+                frame.to_parquet(Path(self.output) / f'part-{self.position:05d}.parquet', index=False)
+            self.position += 1
+            return
+
+        if self.output_format == 'jsonl':
+            text = ''.join(json.dumps(recommendation) + '\n' for recommendation in recommendations)
+        elif recommendations:
+            frame = pd.DataFrame([flatten_recommendation(r) for r in recommendations])
+            text = frame.to_csv(header=self.position == 0, index=False)
+        else:
+            text = ''
+        self.stream.write(text.encode('utf-8'))
+        self.stream.flush()
+        if self.stream is sys.stdout.buffer:
+            self.position += len(text.encode('utf-8'))
+        else:
+            os.fsync(self.stream.fileno())
+            self.position = self.stream.tell()
+
+    def close(self):
+        """Close the output file."""
+        if self.stream is not None and self.stream is not sys.stdout.buffer:
+            self.stream.close()
+
+
+def _chunks(items: Iterable[str], size: int) -> Iterator[List[str]]:
+    iterator = iter(items)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def run_batch(
+    engine,
+    customer_ids: Iterable[str],
+    products: pd.DataFrame,
+    transactions: pd.DataFrame,
+    clickstream: pd.DataFrame,
+    output: str,
+    output_format: str = 'jsonl',
+    chunk_size: int = 1000,
+    checkpoint_path: Optional[str] = None,
+    resume: bool = False,
+    current_time: datetime = None,
+    progress=None
+) -> Dict:
+    """
+    Recommend for a stream of customers, writing results chunk by chunk.
+
+    Args:
+        engine: RecommendationEngine with the data loaded
+        customer_ids: Customer IDs to process (consumed lazily)
+        products: Product catalog DataFrame
+        transactions: Transaction history DataFrame
+        clickstream: Clickstream data DataFrame
+        output: Output path (directory for parquet), or '-' for stdout
+        output_format: One of OUTPUT_FORMATS
+        chunk_size: Customers per chunk
+        checkpoint_path: Checkpoint file (defaults to <output>.checkpoint;
+            no checkpoint is kept for stdout)
+        resume: Continue from an existing checkpoint
+        current_time: Timestamp for all recommendations (defaults to now, or
+            the checkpointed time when resuming)
+        progress: Optional callable receiving the stats dict after each chunk
+
+    Returns:
+        Stats dictionary with customers, recommendations, missing, chunks,
+        seconds and customers_per_second for this run
+    """
+    logger = logging.getLogger(__name__)
+    if chunk_size <= 0:
+        raise ValueError(f"chunk_size must be positive, got {chunk_size}")
+
+    checkpoint = None
+    if output != '-':
+        checkpoint = BatchCheckpoint(checkpoint_path or f"{output.rstrip('/')}.checkpoint")
+    state = checkpoint.load() if checkpoint and resume else None
+    if state is not None:
+        if state['format'] != output_format:
+            raise ValueError(
+                f"Checkpoint was written for {state['format']} output, not {output_format}"
+            )
+        current_time = datetime.fromisoformat(state['current_time'])
+        logger.info(f"Resuming after {state['customers_done']} customers")
+    else:
+        if resume:
+            logger.warning("No checkpoint found, starting from the beginning")
+        if current_time is None:
+            current_time = datetime.now()
+        state = {
+            'format': output_format,
+            'current_time': current_time.isoformat(),
+            'customers_done': 0,
+            'recommendations': 0,
+            'missing': 0,
+            'chunks': 0,
+            'position': 0
+        }
+
+    customer_ids = itertools.islice(customer_ids, state['customers_done'], None)
+    writer = BatchWriter(output, output_format, position=state['position'])
+
+    # Shown products are saved once per chunk instead of after every customer
+    selector = engine.selector
+    autosave = selector.autosave
+    selector.autosave = False
+
+    stats = {'customers': 0, 'recommendations': 0, 'missing': 0, 'chunks': 0,
+             'resumed_after': state['customers_done']}
+    start = time.perf_counter()
+    try:
+        for chunk in _chunks(customer_ids, chunk_size):
+            recommendations = []
+            for customer_id in chunk:
+                recommendation = engine.recommend_product(
+                    customer_id=customer_id,
+                    products=products,
+                    transactions=transactions,
+                    clickstream=clickstream,
+                    current_time=current_time
+                )
+                if recommendation:
+                    recommendations.append(recommendation)
+                else:
+                    stats['missing'] += 1
+            writer.write_chunk(recommendations)
+            selector.save_shown_products()
+
+            stats['customers'] += len(chunk)
+            stats['recommendations'] += len(recommendations)
+            stats['chunks'] += 1
+            if checkpoint is not None:
+                state['customers_done'] += len(chunk)
+                state['recommendations'] += len(recommendations)
+                state['missing'] += len(chunk) - len(recommendations)
+                state['chunks'] += 1
+                state['position'] = writer.position
+                checkpoint.save(state)
+            if progress is not None:
+                progress(_with_rate(stats, time.perf_counter() - start))
+    finally:
+        selector.autosave = autosave
+        writer.close()
+
+    return _with_rate(stats, time.perf_counter() - start)
+
+
+def _with_rate(stats: Dict, seconds: float) -> Dict:
+    return dict(
+        stats,
+        seconds=seconds,
+        customers_per_second=stats['customers'] / seconds if seconds > 0 else 0.0
+    )
+
+
+def main(argv: Optional[List[str]] = None):
+    """CLI entry point: batch recommendations (python -m src.main batch ...)."""
+    from src.main import RecommendationEngine
+
+    parser = argparse.ArgumentParser(
+        prog='python -m src.main batch',
+        description="Stream recommendations for many customers to JSONL, CSV or Parquet"
+    )
+    parser.add_argument('products')
+    parser.add_argument('transactions')
+    parser.add_argument('clickstream')
+    parser.add_argument('--customers', default=None,
+                        help="File with one customer ID per line, '-' for stdin "
+                             "(defaults to every customer in the transactions)")
+    parser.add_argument('--output', default='recommendations.jsonl',
+                        help="Output file (directory for parquet), '-' for stdout")
+    parser.add_argument('--format', choices=OUTPUT_FORMATS, default=None,
+                        help="Output format (defaults to the output's extension, else jsonl)")
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--checkpoint', default=None, help="Defaults to <output>.checkpoint")
+    parser.add_argument('--resume', action='store_true', help="Continue from the checkpoint")
+    parser.add_argument('--config', default='config/config.yaml')
+    args = parser.parse_args(argv)
+
+    output_format = args.format
+    if output_format is None:
+        suffix = Path(args.output).suffix.lstrip('.')
+        output_format = suffix if suffix in OUTPUT_FORMATS else 'jsonl'
+
+    engine = RecommendationEngine(args.config)
+    # Per-customer progress is reported per chunk instead
+    for name in ('src.main', 'src.constraint_filter', 'src.selector'):
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+    products, transactions, clickstream = engine.load_data(
+        products_path=args.products,
+        transactions_path=args.transactions,
+        clickstream_path=args.clickstream
+    )
+    if args.customers:
+        customer_ids = read_customer_ids(args.customers)
+    else:
+        customer_ids = iter(transactions['customer_id'].drop_duplicates().tolist())
+
+    def report(stats):
+        print(f"  {stats['resumed_after'] + stats['customers']:,} customers done "
+              f"({stats['recommendations']:,} recommendations, {stats['missing']:,} missing) "
+              f"{stats['customers_per_second']:.1f} customers/s",
+              file=sys.stderr, flush=True)
+
+    stats = run_batch(
+        engine, customer_ids, products, transactions, clickstream,
+        output=args.output, output_format=output_format, chunk_size=args.chunk_size,
+        checkpoint_path=args.checkpoint, resume=args.resume, progress=report
+    )
+    print(f"Processed {stats['customers']:,} customers in {stats['seconds']:.1f}s "
+          f"({stats['customers_per_second']:.1f} customers/s): "
+          f"{stats['recommendations']:,} recommendations, {stats['missing']:,} missing"
+          + (f" -> {args.output}" if args.output != '-' else ""),
+          file=sys.stderr, flush=True)
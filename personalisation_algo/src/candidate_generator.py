@@ -0,0 +1,441 @@
+"""
+Candidate Generator
+
+This module narrows the product catalog to a few hundred candidates per
+customer before full scoring. Candidates are the union of pluggable sources
+(clicked products, purchased products, top affinity categories and globally
+popular products), each backed by an index precomputed at load time.
+
+Usage (recall measurement against full-catalog scoring):
+    python -m src.candidate_generator <products.csv> <transactions.csv> <clickstream.csv>
+        [--k 20] [--sample 100] [--current-time 2024-11-20T12:00:00]
+"""
+
+import argparse
+import logging
+import time
+from datetime import datetime
+from typing import Callable, Dict, List
+
+import numpy as np
+import pandas as pd
+
+from src.rollup import row_counts
+
+
+# Registry of candidate sources by config name
+CANDIDATE_SOURCES: Dict[str, type] = {}
+
+
+def register_candidate_source(name: str) -> Callable:
+    """
+    Class decorator registering a candidate source under a config name.
+
+    Args:
+        name: Name used in candidate_generation.sources
+
+    Returns:
+        Decorator
+    """
+    def decorator(cls):
+        cls.name = name
+        CANDIDATE_SOURCES[name] = cls
+        return cls
+    return decorator
+
+
+class CandidateSource:
+    """
+    Base class for candidate sources.
+
+    A source builds an index once per data load and answers per-customer
+    lookups from it without touching the raw tables.
+    """
+
+    name = ''
+
+    def __init__(self, config: Dict):
+        """
+        Initialize the source with configuration.
+
+        Args:
+            config: Configuration dictionary
+        """
+        self.config = config
+        self.candidate_config = config.get('candidate_generation', {}) or {}
+
+    def build(
+        self,
+        products: pd.DataFrame,
+        transactions: pd.DataFrame,
+        clickstream: pd.DataFrame,
+        popularity_rank: pd.Series
+    ):
+        """
+        Build the source index.
+
+        Args:
+            products: Product catalog
+            transactions: Full transaction history
+            clickstream: Full clickstream data
+            popularity_rank: Product IDs ordered from most to least popular
+
+        Returns:
+            Index object passed back to lookup()
+        """
+        raise NotImplementedError
+
+    def lookup(self, index, customer_id: str) -> np.ndarray:
+        """
+        Return candidate product IDs for a customer.
+
+        Args:
+            index: Object returned by build()
+            customer_id: Customer ID
+
+        Returns:
+            Array of product IDs
+        """
+        raise NotImplementedError
+
+
+def _products_by_customer(frame: pd.DataFrame) -> Dict[str, np.ndarray]:
+    """Map each customer to the distinct product IDs in their rows."""
+    rows = frame[frame['product_id'].notna()]
+    return rows.groupby('customer_id')['product_id'].unique().to_dict()
+
+
+@register_candidate_source('clicked')
+class ClickedProductsSource(CandidateSource):
+    """Products the customer has interacted with in the clickstream."""
+
+    def build(self, products, transactions, clickstream, popularity_rank):
+        return _products_by_customer(clickstream)
+
+    def lookup(self, index, customer_id):
+        return index.get(customer_id, np.empty(0, dtype=object))
+
+
+@register_candidate_source('purchased')
+class PurchasedProductsSource(CandidateSource):
+    """Products the customer has bought before (repurchase candidates)."""
+
+    def build(self, products, transactions, clickstream, popularity_rank):
+        return _products_by_customer(transactions)
+
+    def lookup(self, index, customer_id):
+        return index.get(customer_id, np.empty(0, dtype=object))
+
+
+@register_candidate_source('affinity_categories')
+class AffinityCategorySource(CandidateSource):
+    """
+    Most popular products from the customer's top affinity categories.
+
+    Categories are ranked with the category affinity formula (decayed weight
+    times log quantity); the decay is anchored at the latest transaction,
+    which does not change the ranking within a customer.
+    """
+
+    def build(self, products, transactions, clickstream, popularity_rank):
+        top_categories = self.candidate_config.get('top_categories', 5)
+        per_category = self.candidate_config.get('per_category', 50)
+        decay_days = self.config['category_affinity']['decay_days']
+
+        # Category -> most popular products in that category
+        ranked = products.set_index('product_id').reindex(popularity_rank)
+        ranked = ranked[ranked['product_category'].notna()]
+        category_products = {
+            category: group.index.values[:per_category]
+            for category, group in ranked.groupby('product_category', sort=False)
+        }
+
+        customer_categories = {}
+        if len(transactions) > 0:
+            anchor = transactions['date_of_transaction'].max()
+            days_ago = (anchor - transactions['date_of_transaction']).dt.days
+            frame = pd.DataFrame({
+                'customer_id': transactions['customer_id'],
+                'product_category': transactions['product_category'],
+                'weight': np.exp(-days_ago / decay_days) * row_counts(transactions),
+                'quantity': transactions['quantity']
+            })
+            scores = frame.groupby(['customer_id', 'product_category']).sum()
+            scores['score'] = scores['weight'] * np.log1p(scores['quantity'])
+            top = (
+                scores['score']
+                .sort_values(ascending=False)
+                .groupby(level='customer_id')
+                .head(top_categories)
+                .reset_index()
+            )
+            customer_categories = top.groupby('customer_id')['product_category'].apply(list).to_dict()
+
+        return {
+            'customer_categories': customer_categories,
+            'category_products': category_products
+        }
+
+    def lookup(self, index, customer_id):
+        categories = index['customer_categories'].get(customer_id, [])
+        arrays = [
+            index['category_products'][category]
+            for category in categories
+            if category in index['category_products']
+        ]
+        if not arrays:
+            return np.empty(0, dtype=object)
+        return np.concatenate(arrays)
+
+
+@register_candidate_source('popular')
+class PopularSource(CandidateSource):
+    """Globally most popular products (shared by every customer)."""
+
+    def build(self, products, transactions, clickstream, popularity_rank):
+        popular_count = self.candidate_config.get('popular_count', 100)
+        return popularity_rank[:popular_count]
+
+    def lookup(self, index, customer_id):
+        return index
+
+
+class CandidateIndex:
+    """
+    Per-source indexes plus the catalog position of every product.
+    """
+
+    def __init__(self, source_indexes: Dict, product_positions: Dict[str, int]):
+        self.source_indexes = source_indexes
+        self.product_positions = product_positions
+
+
+class CandidateGenerator:
+    """
+    Union candidate sources into a bounded candidate set per customer.
+    """
+
+    def __init__(self, config: Dict):
+        """
+        Initialize the candidate generator with configuration.
+
+        Args:
+            config: Configuration dictionary
+        """
+        self.config = config
+        self.candidate_config = config.get('candidate_generation', {}) or {}
+        self.logger = logging.getLogger(__name__)
+
+        source_names = self.candidate_config.get(
+            'sources', ['clicked', 'purchased', 'affinity_categories', 'popular']
+        )
+        unknown = [name for name in source_names if name not in CANDIDATE_SOURCES]
+        if unknown:
+            raise ValueError(f"Unknown candidate sources: {unknown}")
+        self.sources = [CANDIDATE_SOURCES[name](config) for name in source_names]
+
+    @property
+    def enabled(self) -> bool:
+        """Whether candidate generation runs ahead of scoring."""
+        return bool(self.candidate_config.get('enabled', False))
+
+    def build_index(
+        self,
+        products: pd.DataFrame,
+        transactions: pd.DataFrame,
+        clickstream: pd.DataFrame,
+        popularity: pd.DataFrame
+    ) -> CandidateIndex:
+        """
+        Build all source indexes once per data load.
+
+        Args:
+            products: Product catalog
+            transactions: Full transaction history (datetime columns)
+            clickstream: Full clickstream data
+            popularity: Per-product unique_customers and total_quantity
+
+        Returns:
+            CandidateIndex
+        """
+        start = time.perf_counter()
+        popularity_rank = self._popularity_rank(products, popularity)
+
+        source_indexes = {
+            source.name: source.build(products, transactions, clickstream, popularity_rank)
+            for source in self.sources
+        }
+        product_positions = pd.Series(
+            np.arange(len(products)), index=products['product_id'].values
+        )
+        product_positions = product_positions[~product_positions.index.duplicated()].to_dict()
+
+        self.logger.info(
+            f"Built candidate indexes for {len(self.sources)} sources "
+            f"in {time.perf_counter() - start:.2f}s"
+        )
+        return CandidateIndex(source_indexes, product_positions)
+
+    def _popularity_rank(self, products: pd.DataFrame, popularity: pd.DataFrame) -> np.ndarray:
+        """Product IDs ordered by the popularity component's score."""
+        customer_weight = self.config['product_popularity']['customer_weight']
+        frequency_weight = self.config['product_popularity']['frequency_weight']
+
+        stats = popularity.reindex(products['product_id'].unique()).fillna(0.0)
+        score = pd.Series(0.0, index=stats.index)
+        if stats['unique_customers'].max() > 0:
+            score += customer_weight * stats['unique_customers'] / stats['unique_customers'].max()
+        if stats['total_quantity'].max() > 0:
+            score += frequency_weight * stats['total_quantity'] / stats['total_quantity'].max()
+        return score.sort_values(ascending=False, kind='stable').index.values
+
+    def generate(self, customer_id: str, index: CandidateIndex) -> np.ndarray:
+        """
+        Candidate catalog positions for a customer.
+
+        Sources are unioned in configured order and the result is capped at
+        max_candidates, so earlier sources take priority.
+
+        Args:
+            customer_id: Customer ID
+            index: CandidateIndex from build_index
+
+        Returns:
+            Sorted array of row positions into the product catalog
+        """
+        max_candidates = self.candidate_config.get('max_candidates', 300)
+
+        seen = {}
+        for source in self.sources:
+            for product_id in source.lookup(index.source_indexes[source.name], customer_id):
+                if product_id not in seen:
+                    position = index.product_positions.get(product_id)
+                    if position is not None:
+                        seen[product_id] = position
+            if len(seen) >= max_candidates:
+                break
+
+        positions = np.fromiter(seen.values(), dtype=np.int64, count=len(seen))
+        return np.sort(positions[:max_candidates])
+
+
+def measure_recall(
+    engine,
+    customer_ids: List[str],
+    products: pd.DataFrame,
+    transactions: pd.DataFrame,
+    clickstream: pd.DataFrame,
+    k: int = 20,
+    current_time: datetime = None
+) -> Dict:
+    """
+    Compare candidate-restricted scoring with full-catalog scoring.
+
+    For each customer, the top-k eligible products by the deterministic part
+    of the final score (exploration excluded) are computed on the full catalog
+    and on the candidate set; recall@k is the fraction of the full top-k that
+    the candidate path also returns.
+
+    Args:
+        engine: RecommendationEngine whose dataset holds a candidate index
+        customer_ids: Customers to evaluate
+        products: Product catalog returned by engine.load_data
+        transactions: Transactions returned by engine.load_data
+        clickstream: Clickstream returned by engine.load_data
+        k: Cutoff for recall
+        current_time: Scoring time (defaults to now)
+
+    Returns:
+        Report dictionary
+    """
+    if current_time is None:
+        current_time = datetime.now()
+
+    dataset = engine.dataset
+    if dataset is None or dataset.candidate_index is None:
+        raise ValueError("Engine has no candidate index; load data with candidate generation enabled")
+
+    exploration_weight = engine.scoring_engine.weights['exploration']
+    recalls = []
+    candidate_counts = []
+    full_seconds = 0.0
+    candidate_seconds = 0.0
+
+    def top_k(catalog):
+        scored = engine.scoring_engine.score_products(
+            customer_id, catalog, transactions, clickstream, current_time,
+            **dataset.scoring_inputs()
+        )
+        filtered = engine.constraint_filter.filter_products(
+            customer_id, scored, transactions, current_time,
+            interactions=dataset.interactions
+        )
+        deterministic = filtered['final_score'] - exploration_weight * filtered['exploration']
+        return set(filtered.loc[deterministic.nlargest(k).index, 'product_id'])
+
+    for customer_id in customer_ids:
+        start = time.perf_counter()
+        full_top = top_k(products)
+        full_seconds += time.perf_counter() - start
+
+        start = time.perf_counter()
+        positions = engine.candidate_generator.generate(customer_id, dataset.candidate_index)
+        candidate_top = top_k(products.iloc[positions])
+        candidate_seconds += time.perf_counter() - start
+
+        candidate_counts.append(len(positions))
+        if full_top:
+            recalls.append(len(full_top & candidate_top) / len(full_top))
+
+    return {
+        'k': k,
+        'customers': len(customer_ids),
+        'catalog_size': len(products),
+        'mean_candidates': float(np.mean(candidate_counts)) if candidate_counts else 0.0,
+        'mean_recall': float(np.mean(recalls)) if recalls else 1.0,
+        'min_recall': float(np.min(recalls)) if recalls else 1.0,
+        'full_seconds': full_seconds,
+        'candidate_seconds': candidate_seconds
+    }
+
+
+def main():
+    """CLI entry point: measure candidate recall on replayed data."""
+    from src.main import RecommendationEngine
+
+    parser = argparse.ArgumentParser(description="Measure candidate generation recall")
+    parser.add_argument('products')
+    parser.add_argument('transactions')
+    parser.add_argument('clickstream')
+    parser.add_argument('--config', default='config/config.yaml')
+    parser.add_argument('--k', type=int, default=20)
+    parser.add_argument('--sample', type=int, default=100, help="Number of customers to evaluate")
+    parser.add_argument('--current-time', default=None, help="Replay time (ISO format)")
+    args = parser.parse_args()
+
+    engine = RecommendationEngine(args.config)
+    engine.config.setdefault('candidate_generation', {})['enabled'] = True
+    products, transactions, clickstream = engine.load_data(
+        args.products, args.transactions, args.clickstream
+    )
+
+    current_time = pd.Timestamp(args.current_time).to_pydatetime() if args.current_time else None
+    customer_ids = transactions['customer_id'].drop_duplicates().head(args.sample).tolist()
+    report = measure_recall(
+        engine, customer_ids, products, transactions, clickstream,
+        k=args.k, current_time=current_time
+    )
+
+    print("\n" + "="*60)
+    print("CANDIDATE GENERATION RECALL")
+    print("="*60)
+    print(f"Customers: {report['customers']}   Catalog: {report['catalog_size']} products")
+    print(f"Mean candidates per customer: {report['mean_candidates']:.1f}")
+    print(f"Recall@{report['k']}: mean {report['mean_recall']:.3f}, min {report['min_recall']:.3f}")
+    print(f"Scoring time: full {report['full_seconds']:.2f}s, "
+          f"candidates {report['candidate_seconds']:.2f}s")
+    print("="*60)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,335 @@
+"""
+Live Catalog Feed
+
+Stock and discount flags change many times a day. This module applies
+changes to them to the loaded catalog without reloading the products file.
+Changes arrive as records of a product_id plus in_stock and/or
+is_discounted, either
+
+- posted to the API's /catalog endpoint (see EventIngestor.update_catalog), or
+- in a feed file (catalog_feed.path): a CSV with the same columns, which is
+  polled and applied again whenever it is rewritten.
+
+An update only evaluates the rows whose flags change: their values in a new
+products table, whose other columns are shared with the previous one, and
+their entries in the precompiled constraint mask (see CatalogMask). Like an
+event batch, it swaps in a new EngineDataset, so requests in flight finish
+on the catalog they started with.
+
+Updates are kept until the products file is rewritten after them, and are
+applied again to every dataset reloaded or restored from a snapshot in the
+meantime: each flag takes the newer of the file's value and the live one.
+
+Constraints are applied to every request after scoring, and cached base
+scores (see src.base_scores) do not read the flags, so an update makes no
+cached state stale.
+"""
+
+import logging
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src.dataset import EngineDataset, file_signature
+
+
+# Product flags that can be updated live
+CATALOG_FLAGS = ('in_stock', 'is_discounted')
+
+# Accepted spellings of flag values (case-insensitive)
+FLAG_VALUES = {'true': True, 'false': False, '1': True, '0': False, 'yes': True, 'no': False}
+
+
+class LiveCatalog:
+    """
+    Flag updates received since the products file was written.
+    """
+
+    def __init__(self):
+        # product_id -> flag -> (time received, value)
+        self._updates: Dict[str, Dict[str, Tuple[float, bool]]] = {}
+        self._lock = threading.Lock()
+        self.last_update: Optional[float] = None
+        self.logger = logging.getLogger(__name__)
+
+    def update(
+        self,
+        dataset: EngineDataset,
+        records: List[Dict],
+        received: Optional[float] = None
+    ) -> Tuple[EngineDataset, Dict]:
+        """
+        Apply flag updates to a dataset and keep them for later reloads.
+
+        Args:
+            dataset: Dataset being served
+            records: Records with a product_id and in_stock and/or is_discounted
+            received: Time the values are current as of, in seconds since
+                the epoch (defaults to now); updates older than the products
+                file are ignored
+
+        Returns:
+            Tuple of (dataset with the new flags, or dataset itself if none
+            changed; dictionary with the products updated, changed and
+            unknown to the catalog)
+
+        Raises:
+            ValueError: If a record lacks a product_id or every flag, or a
+                flag value is not a boolean
+        """
+        changes = parse_updates(records)
+        if received is None:
+            received = time.time()
+        with self._lock:
+            for product_id, flags in changes.items():
+                entry = self._updates.setdefault(product_id, {})
+                for flag, value in flags.items():
+                    entry[flag] = (received, value)
+            self.last_update = time.time()
+
+        positions = _positions(dataset, list(changes))
+        changed = 0
+        if received > _loaded_at(dataset):
+            dataset, changed = _apply(dataset, changes, positions)
+        return dataset, {
+            'products': len(changes),
+            'changed': changed,
+            'unknown': int((positions < 0).sum())
+        }
+
+    def restore(self, dataset: EngineDataset) -> EngineDataset:
+        """
+        Apply the updates newer than a dataset's products file to it.
+
+        Updates the file is newer than are dropped.
+
+        Args:
+            dataset: Dataset about to be served
+
+        Returns:
+            Dataset with the updates, or dataset itself if there are none
+        """
+        loaded_at = _loaded_at(dataset)
+        with self._lock:
+            newer = {}
+            for product_id, entry in list(self._updates.items()):
+                flags = {flag: value for flag, (received, value) in entry.items() if received > loaded_at}
+                if flags:
+                    newer[product_id] = flags
+                if len(flags) < len(entry):
+                    if flags:
+                        self._updates[product_id] = {flag: entry[flag] for flag in flags}
+                    else:
+                        del self._updates[product_id]
+        if not newer:
+            return dataset
+
+        dataset, changed = _apply(dataset, newer, _positions(dataset, list(newer)))
+        self.logger.info(
+            f"Reapplied live flags of {len(newer)} products to the loaded catalog "
+            f"({changed} differed from the products file)"
+        )
+        return dataset
+
+    def stats(self) -> Dict:
+        """Number of products with live flags, and when the last update arrived."""
+        with self._lock:
+            return {'products': len(self._updates), 'last_update': self.last_update}
+
+
+class CatalogFeed:
+    """
+    Poll the feed file and apply it to the engine's catalog when it changes.
+    """
+
+    def __init__(self, engine, config: Dict, ingestor=None):
+        """
+        Initialize the feed.
+
+        Args:
+            engine: RecommendationEngine whose catalog is updated
+            config: Configuration dictionary (uses the catalog_feed section)
+            ingestor: EventIngestor of the engine, if events are ingested;
+                updates then go through it so they never race an event batch
+        """
+        feed_config = config.get('catalog_feed', {}) or {}
+        self.engine = engine
+        self.ingestor = ingestor
+        self.path = feed_config.get('path')
+        self.poll_interval = feed_config.get('poll_interval_seconds', 5)
+        self.logger = logging.getLogger(__name__)
+
+        self._signature: Optional[Tuple] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def check(self) -> bool:
+        """
+        Apply the feed file if it changed since it was last read.
+
+        The file's modification time is the time its values are current as
+        of. Nothing is read until a dataset is loaded.
+
+        Returns:
+            True if the file was read
+        """
+        if not self.path or self.engine.dataset is None:
+            return False
+        try:
+            signature = file_signature((self.path,))
+        except OSError:
+            return False
+        if signature == self._signature:
+            return False
+
+        try:
+            records = pd.read_csv(self.path, dtype=str, keep_default_na=False).to_dict('records')
+            summary = self._update(records, signature[0][0] / 1e9)
+        except (ValueError, OSError) as e:
+            # Not retried until the file changes again
+            self.logger.error(f"Error applying catalog feed {self.path}: {e}")
+            self._signature = signature
+            return False
+        self._signature = signature
+        self.logger.info(
+            f"Applied catalog feed {self.path}: {summary['changed']} of "
+            f"{summary['products']} products changed, {summary['unknown']} unknown"
+        )
+        return True
+
+    def start(self):
+        """Start polling every poll_interval_seconds in the background (if a path is set)."""
+        if not self.path or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='catalog-feed', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop polling."""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while True:
+            try:
+                self.check()
+            except Exception as e:
+                self.logger.error(f"Error polling catalog feed: {e}", exc_info=True)
+            if self._stop.wait(self.poll_interval):
+                return
+
+    def _update(self, records: List[Dict], received: float) -> Dict:
+        """Apply records to the engine's catalog."""
+        if self.ingestor is not None:
+            return self.ingestor.update_catalog(records, received)
+        with self._lock:
+            dataset, summary = self.engine.live_catalog.update(self.engine.dataset, records, received)
+            self.engine.dataset = dataset
+            return summary
+
+
+def parse_updates(records: List[Dict]) -> Dict[str, Dict[str, bool]]:
+    """
+    Validated flag updates.
+
+    Args:
+        records: Records with a product_id and in_stock and/or is_discounted
+            (missing or empty flags are left unchanged)
+
+    Returns:
+        Dictionary of product_id -> flag -> value; of several records for
+        a product, the last value of each flag wins
+
+    Raises:
+        ValueError: If a record lacks a product_id or every flag, or a flag
+            value is not a boolean
+    """
+    changes: Dict[str, Dict[str, bool]] = {}
+    for record in records:
+        product_id = record.get('product_id')
+        if not _given(product_id):
+            raise ValueError("Every catalog update needs a product_id")
+        flags = {
+            flag: _flag_value(record[flag], flag)
+            for flag in CATALOG_FLAGS if _given(record.get(flag))
+        }
+        if not flags:
+            raise ValueError(f"Every catalog update needs one of {list(CATALOG_FLAGS)}")
+        changes.setdefault(str(product_id), {}).update(flags)
+    return changes
+
+
+def _given(value) -> bool:
+    """Whether a record field holds a value."""
+    return value is not None and not (np.isscalar(value) and pd.isna(value)) and value != ''
+
+
+def _flag_value(value, flag: str) -> bool:
+    """One flag value as a bool."""
+    if isinstance(value, (bool, np.bool_)):
+        return bool(value)
+    if isinstance(value, (int, float, np.number)) and value in (0, 1):
+        return bool(value)
+    if isinstance(value, str) and value.strip().lower() in FLAG_VALUES:
+        return FLAG_VALUES[value.strip().lower()]
+    raise ValueError(f"Invalid {flag} value: {value!r}")
+
+
+def _loaded_at(dataset: EngineDataset) -> float:
+    """Modification time of the dataset's products file (0 if unknown)."""
+    if not dataset.source_signature:
+        return 0.0
+    return dataset.source_signature[0][0] / 1e9
+
+
+def _positions(dataset: EngineDataset, product_ids: List[str]) -> np.ndarray:
+    """Catalog row of each product ID (-1 if unknown)."""
+    if dataset.catalog_mask is not None:
+        return dataset.catalog_mask.positions(product_ids)
+    return pd.Index(dataset.products['product_id']).get_indexer(product_ids)
+
+
+def _apply(
+    dataset: EngineDataset,
+    changes: Dict[str, Dict[str, bool]],
+    positions: np.ndarray
+) -> Tuple[EngineDataset, int]:
+    """New dataset with changed flags, and the number of catalog rows changed."""
+    products = dataset.products
+    columns = {}
+    changed_rows = []
+    for flag in CATALOG_FLAGS:
+        if flag not in products.columns:
+            continue
+        given = [
+            (position, flags[flag])
+            for position, flags in zip(positions, changes.values())
+            if position >= 0 and flag in flags
+        ]
+        if not given:
+            continue
+        rows = np.array([position for position, _ in given], dtype=np.int64)
+        values = np.array([value for _, value in given], dtype=bool)
+        current = products[flag].to_numpy()
+        differs = current[rows] != values
+        if differs.any():
+            column = current.copy()
+            column[rows[differs]] = values[differs]
+            columns[flag] = column
+            changed_rows.append(rows[differs])
+    if not columns:
+        return dataset, 0
+
+    rows = np.unique(np.concatenate(changed_rows))
+    products = products.assign(**columns)
+    replaced = {'products': products}
+    if dataset.catalog_mask is not None:
+        replaced['catalog_mask'] = dataset.catalog_mask.update(products, rows)
+    return dataset.replace(**replaced), len(rows)
@@ -0,0 +1,232 @@
+"""
+Compact Tables
+
+This module keeps the engine's loaded transactions and clickstream in a
+narrow columnar layout:
+
+- Repetitive string columns (customer and product IDs, categories, stores,
+  event and device types) become categoricals: one copy of each distinct
+  value plus an 8-, 16- or 32-bit code per row. Near-unique columns such as
+  event IDs stay strings, where codes would only add to them.
+- date_of_transaction becomes int32 days since 1970-01-01, and
+  event_timestamp uint32 seconds since 1970-01-01 (until 2106).
+- quantity becomes int16, row_count int32 and total_amount float32.
+
+A column is only narrowed when every value fits exactly: timestamps with a
+time of day (or sub-second clicks, e.g. rolled-up ones), quantities beyond
+int16 and missing values keep their loaded type. total_amount is the one
+rounded column (to float32's 7 significant digits); no score reads it.
+
+Tables are compacted once load-time derived state has been built from them,
+and release_memory then hands the memory of the loaded rows back to the
+operating system where the C library allows it.
+Scoring reads one customer's rows at a time and expands them back to the
+loaded types with expand_table, so scores do not change. expand_table and
+match_layout leave tables that were never compacted as they are.
+"""
+
+import ctypes
+import ctypes.util
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+
+try:
+    _LIBC = ctypes.CDLL(ctypes.util.find_library('c'))
+    HAS_MALLOC_TRIM = hasattr(_LIBC, 'malloc_trim')
+except (OSError, TypeError):
+    HAS_MALLOC_TRIM = False
+
+
+# Integer encodings of timestamp columns: (numpy datetime unit, storage dtype)
+TIME_ENCODINGS = {
+    'date_of_transaction': ('D', np.int32),
+    'event_timestamp': ('s', np.uint32)
+}
+
+# Narrow storage of numeric columns, and the type they are expanded back to
+NARROW_TYPES = {
+    'quantity': (np.int16, np.int64),
+    'row_count': (np.int32, np.int64),
+    'total_amount': (np.float32, np.float64)
+}
+
+# Loaded type of the timestamp columns
+TIME_DTYPE = 'datetime64[us]'
+
+# Strings are coded when there are at most this many distinct values per row
+MAX_CODED_RATIO = 0.5
+
+
+def compact_table(frame: pd.DataFrame) -> pd.DataFrame:
+    """
+    Table in the compact layout.
+
+    Args:
+        frame: Transactions or clickstream table as loaded
+
+    Returns:
+        New DataFrame with the same columns and index
+    """
+    return pd.DataFrame(
+        {column: _compact_column(column, frame[column]) for column in frame.columns},
+        index=frame.index, copy=False
+    )
+
+
+def expand_table(frame: pd.DataFrame) -> pd.DataFrame:
+    """
+    Table with compact columns converted back to the loaded types.
+
+    Categoricals become the dtype of their categories, so this also decodes
+    the categorical columns of shared snapshots (see src.snapshot).
+
+    Args:
+        frame: Table, compact or not (usually one customer's rows)
+
+    Returns:
+        New DataFrame, or frame itself if nothing is compact
+    """
+    expanded: Dict[str, pd.Series] = {}
+    for column in frame.columns:
+        values = frame[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            expanded[column] = values.astype(values.cat.categories.dtype)
+        elif column in TIME_ENCODINGS and pd.api.types.is_integer_dtype(values.dtype):
+            unit, _ = TIME_ENCODINGS[column]
+            times = values.to_numpy().astype(np.int64).astype(f'datetime64[{unit}]').astype(TIME_DTYPE)
+            expanded[column] = pd.Series(times, index=frame.index)
+        elif column in NARROW_TYPES and values.dtype == NARROW_TYPES[column][0]:
+            expanded[column] = values.astype(NARROW_TYPES[column][1])
+    if not expanded:
+        return frame
+    frame = frame.copy()
+    for column, values in expanded.items():
+        frame[column] = values
+    return frame
+
+
+def match_layout(rows: pd.DataFrame, table: pd.DataFrame) -> pd.DataFrame:
+    """
+    New rows converted to a (possibly compact) table's column types.
+
+    Used before appending ingested events. Timestamps are truncated to the
+    table's unit, as writing them to the CSV files does; numeric values that
+    do not fit the table's narrow type are left wide, and concatenation then
+    widens the table's column. Categorical columns are left to concat_tables
+    (see src.schemas), which merges the categories.
+
+    Args:
+        rows: New rows with the loaded types
+        table: Table they will be appended to
+
+    Returns:
+        Converted rows
+
+    Raises:
+        ValueError: If a timestamp is outside the table's encoding range
+    """
+    converted = {}
+    for column in rows.columns.intersection(table.columns):
+        values = rows[column]
+        dtype = table[column].dtype
+        if (
+            column in TIME_ENCODINGS and pd.api.types.is_integer_dtype(dtype) and
+            pd.api.types.is_datetime64_any_dtype(values.dtype)
+        ):
+            unit, _ = TIME_ENCODINGS[column]
+            encoded = _encode_times(values.to_numpy().astype(f'datetime64[{unit}]'), dtype)
+            if encoded is None:
+                raise ValueError(f"{column} values are outside the range of the loaded table")
+            converted[column] = pd.Series(encoded, index=rows.index)
+        elif column in NARROW_TYPES and dtype == NARROW_TYPES[column][0]:
+            narrow = _narrow_numbers(values, dtype)
+            if narrow is not None:
+                converted[column] = narrow
+    if not converted:
+        return rows
+    return rows.assign(**converted)
+
+
+def release_memory():
+    """
+    Return freed heap memory to the operating system where the C library
+    supports it (glibc's malloc_trim), e.g. after replacing loaded tables
+    with compact ones. Does nothing elsewhere.
+    """
+    if HAS_MALLOC_TRIM:
+        _LIBC.malloc_trim(0)
+
+
+def table_bytes(*frames: pd.DataFrame) -> int:
+    """
+    Memory held by tables, including their string objects.
+
+    Args:
+        *frames: Tables
+
+    Returns:
+        Total size in bytes
+    """
+    return int(sum(frame.memory_usage(deep=True).sum() for frame in frames))
+
+
+def _compact_column(column: str, values: pd.Series):
+    """Narrowest exact storage of one column (the column itself if none)."""
+    dtype = values.dtype
+    if column in TIME_ENCODINGS and pd.api.types.is_datetime64_any_dtype(dtype):
+        unit, storage = TIME_ENCODINGS[column]
+        raw = values.to_numpy()
+        truncated = raw.astype(f'datetime64[{unit}]')
+        if not (truncated == raw).all():
+            return values
+        encoded = _encode_times(truncated, np.dtype(storage))
+        return values if encoded is None else encoded
+    if column in NARROW_TYPES and pd.api.types.is_numeric_dtype(dtype):
+        narrow = _narrow_numbers(values, np.dtype(NARROW_TYPES[column][0]))
+        return values if narrow is None else narrow
+    if isinstance(dtype, pd.CategoricalDtype):
+        return values
+    if pd.api.types.is_string_dtype(dtype) and len(values) > 0:
+        if values.nunique() <= MAX_CODED_RATIO * len(values):
+            coded = values.astype('category')
+            return coded.cat.rename_categories(_fresh_strings(coded.cat.categories))
+    return values
+
+
+def _fresh_strings(strings: pd.Index) -> pd.Index:
+    """
+    Copies of strings in newly allocated objects.
+
+    Categories are otherwise the first row's string object of each value,
+    scattered over the memory of all the rows read from the file, and keep
+    that memory from being returned once the rows are freed.
+    """
+    return pd.Index([value.encode().decode() for value in strings], dtype=strings.dtype)
+
+
+def _encode_times(times: np.ndarray, storage: np.dtype):
+    """Integer unit counts of datetime64 values, or None if any is missing or out of range."""
+    if np.isnat(times).any():
+        return None
+    counts = times.view(np.int64)
+    limits = np.iinfo(storage)
+    if len(counts) > 0 and (counts.min() < limits.min or counts.max() > limits.max):
+        return None
+    return counts.astype(storage)
+
+
+def _narrow_numbers(values: pd.Series, storage: np.dtype):
+    """Values in a narrow numeric dtype, or None if they do not all fit."""
+    if values.isna().any():
+        return None
+    if np.issubdtype(storage, np.integer):
+        if not pd.api.types.is_integer_dtype(values.dtype):
+            return None
+        limits = np.iinfo(storage)
+        if len(values) > 0 and (values.min() < limits.min or values.max() > limits.max):
+            return None
+    elif len(values) > 0 and np.abs(values).max() > np.finfo(storage).max:
+        return None
+    return values.astype(storage)
@@ -5,11 +5,82 @@ This module implements business rule constraints that filter out products
 that should not be recommended.
 """
 
+import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta
-from typing import Dict
+from typing import Dict, Optional
 import logging
 
+from src.compact import expand_table
+from src.interaction_matrix import to_epoch_seconds
+
+
+class CatalogMask:
+    """
+    Product-level constraints (stock and discount) precompiled over the catalog.
+    
+    These rules depend only on the product, so they are evaluated once per
+    loaded catalog, and again only for the rows a live update changes,
+    rather than on every request. Frames are looked up by their index, which
+    must be the catalog row number (as loaded, and kept by candidate subsets).
+    """
+    
+    def __init__(self, product_ids: pd.Index, rules: Dict[str, bool], excluded: np.ndarray):
+        """
+        Initialize the mask.
+        
+        Args:
+            product_ids: Product ID of each catalog row
+            rules: Flag column -> the value that excludes a product
+            excluded: True for each catalog row a rule excludes
+        """
+        self.product_ids = product_ids
+        self.rules = rules
+        self.excluded = excluded
+    
+    @classmethod
+    def build(cls, products: pd.DataFrame, rules: Dict[str, bool]) -> 'CatalogMask':
+        """
+        Compile the rules over a catalog.
+        
+        Args:
+            products: Product catalog with a default RangeIndex
+            rules: Flag column -> the value that excludes a product
+            
+        Returns:
+            CatalogMask
+        """
+        excluded = np.zeros(len(products), dtype=bool)
+        for flag, value in rules.items():
+            excluded |= products[flag].to_numpy() == value
+        return cls(pd.Index(products['product_id']), rules, excluded)
+    
+    def positions(self, product_ids) -> np.ndarray:
+        """Catalog row of each product ID (-1 if unknown)."""
+        return self.product_ids.get_indexer(product_ids)
+    
+    def update(self, products: pd.DataFrame, rows: np.ndarray) -> 'CatalogMask':
+        """
+        Mask with some rows re-evaluated against changed flags.
+        
+        Args:
+            products: Catalog with the new flag values
+            rows: Catalog rows whose flags changed
+            
+        Returns:
+            New CatalogMask; this one is left unchanged
+        """
+        excluded = self.excluded.copy()
+        changed = np.zeros(len(rows), dtype=bool)
+        for flag, value in self.rules.items():
+            changed |= products[flag].to_numpy()[rows] == value
+        excluded[rows] = changed
+        return CatalogMask(self.product_ids, self.rules, excluded)
+    
+    def keep(self, frame: pd.DataFrame) -> np.ndarray:
+        """True for each row of a frame of catalog rows that no rule excludes."""
+        return ~self.excluded[frame.index.to_numpy()]
+
 
 class ConstraintFilter:
     """
@@ -27,12 +98,38 @@ class ConstraintFilter:
         self.constraints = config['constraints']
         self.logger = logging.getLogger(__name__)
     
+    def compile(self, products: pd.DataFrame) -> Optional[CatalogMask]:
+        """
+        Precompile the stock and discount constraints over a loaded catalog.
+        
+        Args:
+            products: Product catalog as loaded
+            
+        Returns:
+            CatalogMask, or None if the catalog is not indexed by row number
+            or lacks a flag a constraint reads (filter_products then checks
+            the flags of every request's rows, warning about missing ones)
+        """
+        rules = {}
+        if self.constraints.get('exclude_discounted', False):
+            rules['is_discounted'] = True
+        if self.constraints.get('exclude_out_of_stock', False):
+            rules['in_stock'] = False
+        
+        if not products.index.equals(pd.RangeIndex(len(products))):
+            return None
+        if any(flag not in products.columns for flag in rules):
+            return None
+        return CatalogMask.build(products, rules)
+    
     def filter_products(
         self,
         customer_id: str,
         scored_products: pd.DataFrame,
         transactions: pd.DataFrame,
-        current_time: datetime = None
+        current_time: datetime = None,
+        interactions=None,
+        catalog_mask: Optional[CatalogMask] = None
     ) -> pd.DataFrame:
         """
         Apply all constraint filters to scored products.
@@ -42,6 +139,9 @@ class ConstraintFilter:
             scored_products: DataFrame with scored products
             transactions: Transaction history
             current_time: Current timestamp (defaults to now)
+            interactions: Optional InteractionMatrix to read last purchases from
+            catalog_mask: Optional CatalogMask of the catalog the products
+                were scored from, replacing the discount and stock filters
             
         Returns:
             Filtered DataFrame with valid products only
@@ -55,12 +155,52 @@ class ConstraintFilter:
         # Filter recently purchased products
         if self.constraints.get('exclude_recent_purchases_days', 0) > 0:
             filtered = self._filter_recent_purchases(
-                customer_id, filtered, transactions, current_time
+                customer_id, filtered, transactions, current_time, interactions
             )
             self.logger.debug(
                 f"After recent purchase filter: {len(filtered)}/{initial_count} products"
             )
         
+        filtered = self.filter_catalog(filtered, catalog_mask)
+        
+        self.logger.info(
+            f"Filtered {initial_count - len(filtered)} products, "
+            f"{len(filtered)} candidates remaining for customer {customer_id}"
+        )
+        
+        return filtered
+    
+    def filter_catalog(
+        self,
+        products: pd.DataFrame,
+        catalog_mask: Optional[CatalogMask] = None
+    ) -> pd.DataFrame:
+        """
+        Apply the product-level constraints (discount and stock).
+        
+        These are the constraints that do not depend on the customer, so
+        they can also be applied to products before any customer is scored.
+        
+        Args:
+            products: Catalog rows
+            catalog_mask: Optional CatalogMask of the catalog the rows come
+                from, replacing the discount and stock filters
+            
+        Returns:
+            Filtered DataFrame
+        """
+        initial_count = len(products)
+        filtered = products
+        
+        if catalog_mask is not None:
+            # Discount and stock rules, precompiled for the catalog
+            if catalog_mask.rules:
+                filtered = filtered[catalog_mask.keep(filtered)]
+                self.logger.debug(
+                    f"After discount and stock filters: {len(filtered)}/{initial_count} products"
+                )
+            return filtered
+        
         # Filter discounted products
         if self.constraints.get('exclude_discounted', False):
             filtered = self._filter_discounted(filtered)
@@ -75,11 +215,6 @@ class ConstraintFilter:
                 f"After stock filter: {len(filtered)}/{initial_count} products"
             )
         
-        self.logger.info(
-            f"Filtered {initial_count - len(filtered)} products, "
-            f"{len(filtered)} candidates remaining for customer {customer_id}"
-        )
-        
         return filtered
     
     def _filter_recent_purchases(
@@ -87,7 +222,8 @@ class ConstraintFilter:
         customer_id: str,
         products: pd.DataFrame,
         transactions: pd.DataFrame,
-        current_time: datetime
+        current_time: datetime,
+        interactions=None
     ) -> pd.DataFrame:
         """
         Exclude products purchased by customer in the last N days.
@@ -97,6 +233,7 @@ class ConstraintFilter:
             products: Scored products DataFrame
             transactions: Transaction history
             current_time: Current timestamp
+            interactions: Optional InteractionMatrix to read last purchases from
             
         Returns:
             Filtered products
@@ -104,8 +241,19 @@ class ConstraintFilter:
         days = self.constraints['exclude_recent_purchases_days']
         cutoff_date = current_time - timedelta(days=days)
         
+        if interactions is not None:
+            columns, last_purchase = interactions.row('last_purchase', customer_id)
+            recent = columns[last_purchase >= to_epoch_seconds(cutoff_date)]
+            recent_products = set(interactions.product_ids[recent])
+            if len(recent_products) > 0:
+                self.logger.debug(
+                    f"Excluding {len(recent_products)} recently purchased products "
+                    f"(within {days} days)"
+                )
+            return products[~products['product_id'].isin(recent_products)]
+        
         # Get customer transactions
-        customer_txns = transactions[transactions['customer_id'] == customer_id].copy()
+        customer_txns = expand_table(transactions[transactions['customer_id'] == customer_id].copy())
         
         if len(customer_txns) == 0:
             return products
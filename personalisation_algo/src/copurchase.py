@@ -0,0 +1,340 @@
+"""
+Co-Purchase Index
+
+This module builds an item-item "bought together" index from transaction
+baskets. A basket is one customer's purchases on one day (and store, when
+present). With B the basket x product incidence matrix, co-occurrence counts
+are C = B^T B; the build computes C one block of product columns at a time
+and keeps only the top-M neighbors of each product, so peak memory is
+bounded by the block size rather than the full product x product matrix.
+
+Similarity is cosine by default: C_ij / sqrt(n_i * n_j), where n_i is the
+number of baskets containing product i.
+
+Usage:
+    python -m src.copurchase build <out.npz> <transactions.csv> [...]
+        [--top-m 20] [--block-size 2048] [--chunksize 1000000]
+    python -m src.copurchase show <index.npz> <product_id>
+"""
+
+import argparse
+import logging
+import time
+from typing import Dict, Iterable, List
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+
+class CoPurchaseIndex:
+    """
+    Top-M co-purchase neighbors per product.
+
+    Attributes:
+        product_ids: Product ID of each row
+        neighbors: int32 [n_products, M] row numbers of neighbors (-1 padded)
+        weights: float32 [n_products, M] similarity of each neighbor
+    """
+
+    def __init__(self, product_ids: pd.Index, neighbors: np.ndarray, weights: np.ndarray):
+        self.product_ids = product_ids
+        self.neighbors = neighbors
+        self.weights = weights
+
+    @property
+    def top_m(self) -> int:
+        """Number of neighbors kept per product."""
+        return self.neighbors.shape[1]
+
+    @classmethod
+    def from_baskets(
+        cls,
+        basket_codes: np.ndarray,
+        product_codes: np.ndarray,
+        product_ids: pd.Index,
+        top_m: int = 20,
+        block_size: int = 2048,
+        similarity: str = 'cosine'
+    ) -> 'CoPurchaseIndex':
+        """
+        Build the index from (basket, product) code pairs.
+
+        Args:
+            basket_codes: Basket number of each purchase
+            product_codes: Product number of each purchase
+            product_ids: Product ID for each product number
+            top_m: Neighbors to keep per product
+            block_size: Product columns per block of B^T B
+            similarity: 'cosine' or 'count'
+
+        Returns:
+            CoPurchaseIndex
+        """
+        if similarity not in ('cosine', 'count'):
+            raise ValueError(f"Unknown co-purchase similarity: {similarity}")
+
+        logger = logging.getLogger(__name__)
+        start = time.perf_counter()
+
+        n_products = len(product_ids)
+        n_baskets = int(basket_codes.max()) + 1 if len(basket_codes) else 0
+
+        # Binary basket x product incidence (repeat purchases in a basket count once)
+        incidence = sparse.csr_matrix(
+            (np.ones(len(basket_codes), dtype=np.float32), (basket_codes, product_codes)),
+            shape=(n_baskets, n_products)
+        )
+        incidence.data[:] = 1.0
+        incidence_t = incidence.T.tocsr()
+        incidence_csc = incidence.tocsc()
+        basket_counts = np.asarray(incidence.sum(axis=0)).ravel()
+
+        neighbors = np.full((n_products, top_m), -1, dtype=np.int32)
+        weights = np.zeros((n_products, top_m), dtype=np.float32)
+
+        for block_start in range(0, n_products, block_size):
+            block_end = min(block_start + block_size, n_products)
+            cooccurrence = (incidence_t @ incidence_csc[:, block_start:block_end]).tocsc()
+
+            for offset in range(block_end - block_start):
+                product = block_start + offset
+                lo, hi = cooccurrence.indptr[offset], cooccurrence.indptr[offset + 1]
+                rows = cooccurrence.indices[lo:hi]
+                counts = cooccurrence.data[lo:hi]
+
+                keep = rows != product
+                rows, counts = rows[keep], counts[keep]
+                if len(rows) == 0:
+                    continue
+
+                if similarity == 'cosine':
+                    scores = counts / np.sqrt(basket_counts[rows] * basket_counts[product])
+                else:
+                    scores = counts
+
+                if len(rows) > top_m:
+                    best = np.argpartition(-scores, top_m - 1)[:top_m]
+                    rows, scores = rows[best], scores[best]
+                order = np.argsort(-scores, kind='stable')
+                neighbors[product, :len(order)] = rows[order]
+                weights[product, :len(order)] = scores[order]
+
+            logger.debug(f"Co-purchase block {block_start}-{block_end} of {n_products} done")
+
+        logger.info(
+            f"Built co-purchase index for {n_products} products from {n_baskets} baskets "
+            f"in {time.perf_counter() - start:.2f}s"
+        )
+        return cls(product_ids, neighbors, weights)
+
+    @classmethod
+    def build(cls, transactions: pd.DataFrame, config: Dict) -> 'CoPurchaseIndex':
+        """
+        Build the index from an in-memory transaction table.
+
+        Args:
+            transactions: Transaction history
+            config: Configuration dictionary
+
+        Returns:
+            CoPurchaseIndex
+        """
+        return cls.from_chunks([transactions], config)
+
+    @classmethod
+    def from_chunks(cls, chunks: Iterable[pd.DataFrame], config: Dict) -> 'CoPurchaseIndex':
+        """
+        Build the index from transaction chunks (e.g. a CSV read in chunks).
+
+        Baskets spanning chunk boundaries are joined by key, so chunks need
+        not be aligned to baskets.
+
+        Args:
+            chunks: Iterable of transaction DataFrames
+            config: Configuration dictionary
+
+        Returns:
+            CoPurchaseIndex
+        """
+        copurchase_config = config.get('copurchase', {}) or {}
+        basket_lookup: Dict = {}
+        product_lookup: Dict = {}
+        basket_parts: List[np.ndarray] = []
+        product_parts: List[np.ndarray] = []
+
+        for chunk in chunks:
+            key_columns = [
+                column for column in ('customer_id', 'date_of_transaction', 'store_id')
+                if column in chunk.columns
+            ]
+            # Missing values (e.g. no store_id on ingested rows) stay NaN
+            # under astype(str) with the string dtype, so blank them first
+            keys = chunk[key_columns].astype(object).fillna('').astype(str).agg('|'.join, axis=1)
+            basket_parts.append(_encode(keys.values, basket_lookup))
+            product_parts.append(_encode(chunk['product_id'].values, product_lookup))
+
+        basket_codes = np.concatenate(basket_parts) if basket_parts else np.empty(0, dtype=np.int64)
+        product_codes = np.concatenate(product_parts) if product_parts else np.empty(0, dtype=np.int64)
+
+        # Number products in ID order, so neighbors tied on similarity are
+        # kept the same way whatever order the rows come in
+        product_ids = np.array(list(product_lookup.keys()), dtype=object)
+        order = np.argsort(product_ids.astype(str), kind='stable')
+        renumber = np.empty(len(order), dtype=np.int64)
+        renumber[order] = np.arange(len(order))
+        product_codes = renumber[product_codes]
+
+        return cls.from_baskets(
+            basket_codes,
+            product_codes,
+            pd.Index(product_ids[order]),
+            top_m=copurchase_config.get('top_m', 20),
+            block_size=copurchase_config.get('block_size', 2048),
+            similarity=copurchase_config.get('similarity', 'cosine')
+        )
+
+    @classmethod
+    def from_csv(cls, paths: List[str], config: Dict, chunksize: int = 1_000_000) -> 'CoPurchaseIndex':
+        """
+        Build the index by streaming transaction CSVs in chunks.
+
+        Args:
+            paths: Transaction CSV paths
+            config: Configuration dictionary
+            chunksize: Rows per chunk
+
+        Returns:
+            CoPurchaseIndex
+        """
+        def chunks():
+            for path in paths:
+                header = pd.read_csv(path, nrows=0).columns
+                usecols = [
+                    column for column in ('customer_id', 'product_id', 'date_of_transaction', 'store_id')
+                    if column in header
+                ]
+                yield from pd.read_csv(path, usecols=usecols, chunksize=chunksize)
+
+        return cls.from_chunks(chunks(), config)
+
+    def neighbors_of(self, product_id: str) -> Dict[str, float]:
+        """Neighbors and similarities of a single product (for inspection)."""
+        row = self.product_ids.get_indexer([product_id])[0]
+        if row < 0:
+            return {}
+        valid = self.neighbors[row] >= 0
+        return dict(zip(
+            self.product_ids[self.neighbors[row][valid]],
+            self.weights[row][valid].astype(float).tolist()
+        ))
+
+    def score(
+        self,
+        history_products: np.ndarray,
+        history_weights: np.ndarray
+    ) -> pd.Series:
+        """
+        Accumulate neighbor similarities of the given purchases.
+
+        Runs in O(len(history_products) x M).
+
+        Args:
+            history_products: Product IDs the customer bought
+            history_weights: Weight of each purchase (e.g. recency)
+
+        Returns:
+            Series of summed weighted similarity indexed by neighbor product ID
+        """
+        rows = self.product_ids.get_indexer(history_products)
+        known = rows >= 0
+        rows, history_weights = rows[known], np.asarray(history_weights)[known]
+        if len(rows) == 0:
+            return pd.Series(dtype=np.float64)
+
+        neighbor_rows = self.neighbors[rows].ravel()
+        contributions = (self.weights[rows] * history_weights[:, None]).ravel()
+        valid = neighbor_rows >= 0
+        totals = np.bincount(
+            neighbor_rows[valid], weights=contributions[valid], minlength=len(self.product_ids)
+        )
+        touched = np.flatnonzero(totals)
+        return pd.Series(totals[touched], index=self.product_ids[touched])
+
+    def save(self, path: str):
+        """Save the index to an .npz file."""
+        np.savez_compressed(
+            path,
+            product_ids=np.asarray(self.product_ids, dtype=str),
+            neighbors=self.neighbors,
+            weights=self.weights
+        )
+
+    @classmethod
+    def load(cls, path: str) -> 'CoPurchaseIndex':
+        """Load an index saved with save()."""
+        with np.load(path) as data:
+            return cls(
+                pd.Index(data['product_ids'].astype(object)),
+                data['neighbors'].copy(),
+                data['weights'].copy()
+            )
+
+
+def _encode(values: np.ndarray, lookup: Dict) -> np.ndarray:
+    """Map values to dense integer codes, extending the lookup with new values."""
+    codes, uniques = pd.factorize(values)
+    unique_codes = np.empty(len(uniques), dtype=np.int64)
+    for i, value in enumerate(uniques):
+        code = lookup.get(value)
+        if code is None:
+            code = len(lookup)
+            lookup[value] = code
+        unique_codes[i] = code
+    return unique_codes[codes]
+
+
+def main():
+    """CLI entry point for building and inspecting co-purchase indexes."""
+    import yaml
+
+    parser = argparse.ArgumentParser(description="Co-purchase neighbor index")
+    parser.add_argument('--config', default='config/config.yaml')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build = subparsers.add_parser('build', help="Build an index from transaction CSVs")
+    build.add_argument('output')
+    build.add_argument('inputs', nargs='+')
+    build.add_argument('--top-m', type=int, default=None)
+    build.add_argument('--block-size', type=int, default=None)
+    build.add_argument('--chunksize', type=int, default=1_000_000)
+
+    show = subparsers.add_parser('show', help="Print a product's neighbors")
+    show.add_argument('index')
+    show.add_argument('product_id')
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    if args.command == 'build':
+        with open(args.config, 'r') as f:
+            config = yaml.safe_load(f)
+        copurchase_config = config.setdefault('copurchase', {})
+        if args.top_m is not None:
+            copurchase_config['top_m'] = args.top_m
+        if args.block_size is not None:
+            copurchase_config['block_size'] = args.block_size
+
+        index = CoPurchaseIndex.from_csv(args.inputs, config, chunksize=args.chunksize)
+        index.save(args.output)
+        print(f"Saved co-purchase index ({len(index.product_ids)} products, "
+              f"top {index.top_m}) to {args.output}")
+
+    elif args.command == 'show':
+        index = CoPurchaseIndex.load(args.index)
+        for product_id, weight in index.neighbors_of(args.product_id).items():
+            print(f"  {product_id}: {weight:.4f}")
+
+
+if __name__ == '__main__':
+    main()
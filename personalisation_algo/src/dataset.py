@@ -0,0 +1,170 @@
+"""
+Engine Dataset
+
+This module bundles the loaded data tables with the state derived from them
+at load time, so derived state is only ever used with the tables it was
+built from.
+"""
+
+import copy
+import itertools
+import os
+from typing import Optional, Tuple
+
+import pandas as pd
+
+from src.rollup import rollup_path
+
+
+# Source of EngineDataset.version numbers
+_VERSIONS = itertools.count(1)
+
+
+def file_signature(paths: Tuple[str, ...]) -> Tuple:
+    """
+    Modification time and size of each file, to detect changes on disk.
+
+    A file's rollup (see src.rollup) is part of its signature, so
+    compaction is detected like any other change.
+    """
+    signature = []
+    for path in paths:
+        stat = os.stat(path)
+        signature.append((stat.st_mtime_ns, stat.st_size))
+        if os.path.exists(rollup_path(path)):
+            stat = os.stat(rollup_path(path))
+            signature.append(('rollup', stat.st_mtime_ns, stat.st_size))
+    return tuple(signature)
+
+
+class EngineDataset:
+    """
+    Loaded products, transactions and clickstream plus load-time derived state.
+    """
+
+    def __init__(
+        self,
+        products: pd.DataFrame,
+        transactions: pd.DataFrame,
+        clickstream: pd.DataFrame,
+        history_summary=None,
+        popularity: pd.DataFrame = None,
+        candidate_index=None,
+        interactions=None,
+        copurchase=None,
+        factors=None,
+        catalog_mask=None,
+        source_paths: Optional[Tuple[str, str, str]] = None,
+        source_signature: Optional[Tuple] = None
+    ):
+        """
+        Initialize the dataset.
+
+        Args:
+            products: Product catalog DataFrame
+            transactions: Transaction history DataFrame
+            clickstream: Clickstream data DataFrame
+            history_summary: Optional HistorySummary for rows pruned at load time
+            popularity: Per-product popularity stats over the full history
+            candidate_index: Optional CandidateIndex for candidate generation
+            interactions: Optional InteractionMatrix of customer history
+            copurchase: Optional CoPurchaseIndex of bought-together neighbors
+            factors: Optional FactorModel of customer/product factors
+            catalog_mask: Optional CatalogMask of the product-level constraints
+                (set when the dataset is served, see RecommendationEngine.set_dataset)
+            source_paths: Absolute (products, transactions, clickstream) CSV
+                paths the tables were loaded from
+            source_signature: file_signature of source_paths when loaded
+        """
+        self.products = products
+        self.transactions = transactions
+        self.clickstream = clickstream
+        self.history_summary = history_summary
+        self.popularity = popularity
+        self.candidate_index = candidate_index
+        self.interactions = interactions
+        self.copurchase = copurchase
+        self.factors = factors
+        self.catalog_mask = catalog_mask
+        self.source_paths = source_paths
+        self.source_signature = source_signature
+        # Increases with every new dataset, including live updates (see replace)
+        self.version = next(_VERSIONS)
+
+    def matches(
+        self,
+        products: pd.DataFrame,
+        transactions: pd.DataFrame,
+        clickstream: pd.DataFrame
+    ) -> bool:
+        """
+        Check whether the given tables are the ones this dataset was built from.
+
+        Identity (not equality) is used: derived state is only valid for the
+        exact objects returned by the loader.
+
+        Args:
+            products: Product catalog DataFrame
+            transactions: Transaction history DataFrame
+            clickstream: Clickstream data DataFrame
+
+        Returns:
+            True if all three tables are the dataset's own tables
+        """
+        return (
+            products is self.products and
+            transactions is self.transactions and
+            clickstream is self.clickstream
+        )
+
+    def is_current(self, source_paths: Tuple[str, str, str]) -> bool:
+        """
+        Check whether the dataset was loaded from these files and they are unchanged.
+
+        Args:
+            source_paths: Absolute (products, transactions, clickstream) paths
+
+        Returns:
+            True if reloading the files would give the same tables
+        """
+        if self.source_paths != tuple(source_paths):
+            return False
+        try:
+            return file_signature(self.source_paths) == self.source_signature
+        except OSError:
+            return False
+
+    def replace(self, **changes) -> 'EngineDataset':
+        """
+        Shallow copy with some fields replaced.
+
+        Live updates build a new dataset this way and swap it in, so requests
+        already holding the old one keep a consistent view.
+
+        Args:
+            **changes: Field values to replace
+
+        Returns:
+            New EngineDataset
+        """
+        dataset = copy.copy(self)
+        for name, value in changes.items():
+            if not hasattr(self, name):
+                raise ValueError(f"EngineDataset has no field '{name}'")
+            setattr(dataset, name, value)
+        dataset.version = next(_VERSIONS)
+        return dataset
+
+    def scoring_inputs(self) -> dict:
+        """Derived state to pass to ProductScoringEngine.score_products as keyword arguments."""
+        return {
+            'history_summary': self.history_summary,
+            'popularity': self.popularity,
+            'interactions': self.interactions,
+            'copurchase': self.copurchase,
+            'factors': self.factors
+        }
+
+    def as_tuple(self) -> tuple:
+        """Return (products, transactions, clickstream) as returned by load_data."""
+        return self.products, self.transactions, self.clickstream
@@ -0,0 +1,480 @@
+"""
+Event Ingestion
+
+This module appends batches of new transactions and clickstream events to
+the engine's loaded dataset. Popularity and the interaction matrices are
+updated incrementally, so the next recommendation sees the events without
+a reload. Events are also buffered and periodically appended to the source
+CSV files, so a later reload or restart includes them.
+
+The loaded dataset is never modified in place: each batch builds a new
+EngineDataset and swaps it in, and requests already holding the previous
+one finish on a consistent view. Candidate indexes, the co-purchase index
+and the factor model are not updated until the next full load.
+
+Stock and discount updates to the catalog (see src.catalog_feed) are
+applied under the same lock, so they never replace a dataset an event batch
+just swapped in, or the other way round.
+"""
+
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl
+    HAS_FCNTL = True
+except ImportError:
+    HAS_FCNTL = False
+
+from src.compact import match_layout
+from src.dataset import EngineDataset, file_signature
+from src.rollup import ROW_COUNT
+from src.schemas import concat_tables
+
+
+class EventIngestor:
+    """
+    Apply event batches to a RecommendationEngine's dataset and flush them to disk.
+    """
+
+    def __init__(self, engine, config: Dict):
+        """
+        Initialize the ingestor.
+
+        Args:
+            engine: RecommendationEngine whose dataset receives the events
+            config: Configuration dictionary (uses the events section)
+        """
+        events_config = config.get('events', {})
+        self.engine = engine
+        self.flush_interval = events_config.get('flush_interval_seconds', 5.0)
+        self.flush_max_rows = events_config.get('flush_max_rows', 10000)
+        self.logger = logging.getLogger(__name__)
+
+        # Pending batches as (source_paths, transactions, clickstream)
+        self._pending: List[tuple] = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def pending_rows(self) -> int:
+        """Rows ingested but not yet written to the source files."""
+        with self._lock:
+            return sum(len(txns) + len(clicks) for _, txns, clicks in self._pending)
+
+    def ingest(
+        self,
+        transactions: List[Dict],
+        clickstream: List[Dict],
+        current_time: datetime = None
+    ) -> Dict:
+        """
+        Append a batch of events to the loaded dataset.
+
+        Missing timestamps default to current_time, missing quantities to 1,
+        and missing product categories are looked up in the catalog.
+
+        Args:
+            transactions: Transaction records (customer_id and product_id required)
+            clickstream: Clickstream records (customer_id and event_type required)
+            current_time: Timestamp for events without one (defaults to now)
+
+        Returns:
+            Dictionary with the accepted transactions and clickstream counts
+            and the rows pending a flush
+        """
+        if current_time is None:
+            current_time = datetime.now()
+
+        with self._lock:
+            dataset = self.engine.dataset
+            if dataset is None:
+                raise RuntimeError("No dataset is loaded to ingest events into")
+
+            new_transactions = self._transactions_frame(transactions, dataset, current_time)
+            new_clicks = self._clickstream_frame(clickstream, dataset, current_time)
+            if self.engine.shard is not None:
+                # Events of other shards' customers would be lost here
+                self.engine.shard.check(pd.concat([new_transactions['customer_id'], new_clicks['customer_id']]))
+
+            updated = self._apply(dataset, new_transactions, new_clicks)
+            if updated is not dataset:
+                if len(new_transactions) > 0:
+                    # Before the swap, so no request stores base scores without the purchases
+                    self.engine.base_scores.invalidate(new_transactions['customer_id'].unique(), updated)
+                self.engine.dataset = updated
+                if dataset.source_paths is not None:
+                    self._pending.append((dataset.source_paths, new_transactions, new_clicks))
+
+            pending_rows = sum(len(txns) + len(clicks) for _, txns, clicks in self._pending)
+
+        self.logger.info(
+            f"Ingested {len(new_transactions)} transactions and {len(new_clicks)} "
+            f"clickstream events ({pending_rows} rows pending flush)"
+        )
+        if pending_rows >= self.flush_max_rows:
+            # Skipped while a refresh holds the files; the next flush catches up
+            self.flush(blocking=False)
+            pending_rows = self.pending_rows
+
+        return {
+            'transactions': len(new_transactions),
+            'clickstream': len(new_clicks),
+            'pending_rows': pending_rows
+        }
+
+    def update_catalog(self, records: List[Dict], received: Optional[float] = None) -> Dict:
+        """
+        Apply stock and discount flag updates to the loaded catalog.
+
+        Args:
+            records: Records with a product_id and in_stock and/or is_discounted
+            received: Time the values are current as of, in seconds since
+                the epoch (defaults to now)
+
+        Returns:
+            Dictionary with the products updated, changed and unknown to the catalog
+        """
+        with self._lock:
+            dataset = self.engine.dataset
+            if dataset is None:
+                raise RuntimeError("No dataset is loaded to update the catalog of")
+            updated, summary = self.engine.live_catalog.update(dataset, records, received)
+            self.engine.dataset = updated
+
+        self.logger.info(
+            f"Updated catalog flags of {summary['changed']} of {summary['products']} products "
+            f"({summary['unknown']} unknown)"
+        )
+        return summary
+
+    def swap_dataset(
+        self,
+        dataset: EngineDataset,
+        source: str,
+        snapshot_version: Optional[str] = None
+    ) -> bool:
+        """
+        Replace the engine's dataset with one rebuilt from the same files.
+
+        Events that are pending a flush are missing from the files, so they
+        are applied to the new dataset before it is swapped in. Call with
+        hold_flush() held since before the files were read, so no event is
+        both in the files and replayed.
+
+        Args:
+            dataset: Dataset rebuilt from the source files
+            source: Where it came from ('csv' or 'snapshot')
+            snapshot_version: Snapshot version it was restored from
+
+        Returns:
+            True if swapped, False if the engine moved on to other files
+        """
+        with self._lock:
+            current = self.engine.dataset
+            if current is not None and current.source_paths != dataset.source_paths:
+                return False
+            for source_paths, txns, clicks in self._pending:
+                if source_paths == dataset.source_paths:
+                    dataset = self._apply(dataset, txns, clicks)
+            self.engine.set_dataset(dataset, source, snapshot_version)
+            return True
+
+    def hold_flush(self) -> threading.Lock:
+        """
+        Lock that keeps flushes from writing to the source files while held.
+
+        Events are still ingested (into memory) while it is held.
+        """
+        return self._flush_lock
+
+    def flush(self, blocking: bool = True) -> int:
+        """
+        Append pending events to their source CSV files.
+
+        Args:
+            blocking: Wait for a flush or refresh in progress; if False,
+                return 0 instead
+
+        Returns:
+            Number of rows written
+        """
+        if not self._flush_lock.acquire(blocking=blocking):
+            return 0
+        try:
+            with self._lock:
+                pending, self._pending = self._pending, []
+            if not pending:
+                return 0
+
+            start = time.perf_counter()
+            written = 0
+            by_source: Dict[tuple, List[tuple]] = {}
+            for source_paths, txns, clicks in pending:
+                by_source.setdefault(source_paths, []).append((txns, clicks))
+
+            for source_paths, batches in by_source.items():
+                _, transactions_path, clickstream_path = source_paths
+                try:
+                    before = file_signature(source_paths)
+                    written += _append_csv(transactions_path, [txns for txns, _ in batches])
+                    written += _append_csv(clickstream_path, [clicks for _, clicks in batches])
+                except OSError as e:
+                    self.logger.error(f"Error flushing events to {source_paths}: {e}")
+                    with self._lock:
+                        self._pending = [
+                            (source_paths, txns, clicks) for txns, clicks in batches
+                        ] + self._pending
+                    continue
+
+                # The files now match the in-memory tables: keep serving them,
+                # unless something else changed them since they were loaded
+                with self._lock:
+                    dataset = self.engine.dataset
+                    if (
+                        dataset is not None and dataset.source_paths == source_paths and
+                        dataset.source_signature == before
+                    ):
+                        dataset.source_signature = file_signature(source_paths)
+
+            self.logger.info(f"Flushed {written} event rows in {time.perf_counter() - start:.2f}s")
+            return written
+        finally:
+            self._flush_lock.release()
+
+    def start(self):
+        """Start flushing pending events every flush_interval_seconds in the background."""
+        if self._thread is not None or not self.flush_interval:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='event-flush', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the background flush and write any pending events."""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush(blocking=False)
+            except Exception as e:
+                self.logger.error(f"Error in periodic event flush: {e}", exc_info=True)
+
+    def _apply(
+        self,
+        dataset: EngineDataset,
+        new_transactions: pd.DataFrame,
+        new_clicks: pd.DataFrame
+    ) -> EngineDataset:
+        """New dataset with a validated batch appended (dataset itself if the batch is empty)."""
+        changes = {}
+        if len(new_transactions) > 0:
+            changes['transactions'] = concat_tables([
+                dataset.transactions, match_layout(new_transactions, dataset.transactions)
+            ])
+            if dataset.popularity is not None:
+                changes['popularity'] = self.engine.scoring_engine.update_popularity(
+                    dataset.popularity, new_transactions,
+                    self._first_purchases(dataset, new_transactions)
+                )
+            if dataset.history_summary is not None:
+                changes['history_summary'] = dataset.history_summary.with_transactions(new_transactions)
+        if len(new_clicks) > 0:
+            changes['clickstream'] = concat_tables([
+                dataset.clickstream, match_layout(new_clicks, dataset.clickstream)
+            ])
+        if not changes:
+            return dataset
+        if dataset.interactions is not None:
+            changes['interactions'] = dataset.interactions.append(
+                new_transactions, new_clicks, self.engine.config
+            )
+        return dataset.replace(**changes)
+
+    def _first_purchases(self, dataset: EngineDataset, transactions: pd.DataFrame) -> np.ndarray:
+        """True for each transaction that is the customer's first purchase of the product."""
+        first_in_batch = ~transactions.duplicated(['customer_id', 'product_id']).values
+        if dataset.interactions is not None:
+            previous = dataset.interactions.values_at(
+                'purchase_count', transactions['customer_id'], transactions['product_id']
+            )
+            return first_in_batch & (previous == 0)
+        batch_pairs = pd.MultiIndex.from_frame(transactions[['customer_id', 'product_id']])
+        if dataset.history_summary is not None:
+            # The loaded transactions may be truncated; the repurchase stats
+            # cover every pair ever purchased
+            return first_in_batch & ~batch_pairs.isin(dataset.history_summary.repurchase.index)
+        known_pairs = pd.MultiIndex.from_frame(dataset.transactions[['customer_id', 'product_id']])
+        return first_in_batch & ~batch_pairs.isin(known_pairs)
+
+    def _transactions_frame(
+        self,
+        records: List[Dict],
+        dataset: EngineDataset,
+        current_time: datetime
+    ) -> pd.DataFrame:
+        """Validate transaction records and shape them like the loaded table."""
+        frame = _records_frame(records, ('customer_id', 'product_id'), 'transaction')
+        if len(frame) == 0:
+            return dataset.transactions.iloc[0:0]
+
+        # Transactions are dated by day (see src.schemas): a time of day would
+        # score differently live than after the flushed file is reloaded
+        frame['date_of_transaction'] = _timestamps(
+            frame, 'date_of_transaction', current_time
+        ).dt.normalize()
+        if 'quantity' not in frame:
+            frame['quantity'] = 1
+        try:
+            frame['quantity'] = pd.to_numeric(frame['quantity']).fillna(1).astype(np.int64)
+        except (ValueError, TypeError) as e:
+            raise ValueError(f"Invalid quantity: {e}")
+        if (frame['quantity'] <= 0).any():
+            raise ValueError("Transaction quantity must be positive")
+        frame['product_category'] = _catalog_lookup(
+            frame, dataset.products, 'product_category', 'product_category'
+        )
+        if 'total_amount' not in frame and 'price' in dataset.products:
+            prices = dataset.products.set_index('product_id')['price']
+            frame['total_amount'] = frame['product_id'].map(prices) * frame['quantity']
+        return _conform(frame, dataset.transactions)
+
+    def _clickstream_frame(
+        self,
+        records: List[Dict],
+        dataset: EngineDataset,
+        current_time: datetime
+    ) -> pd.DataFrame:
+        """Validate clickstream records and shape them like the loaded table."""
+        frame = _records_frame(records, ('customer_id', 'event_type'), 'clickstream event')
+        if len(frame) == 0:
+            return dataset.clickstream.iloc[0:0]
+
+        frame['event_timestamp'] = _timestamps(frame, 'event_timestamp', current_time)
+        if 'product_id' not in frame:
+            frame['product_id'] = None
+        frame['page_category'] = _catalog_lookup(
+            frame, dataset.products, 'page_category', 'product_category'
+        )
+        return _conform(frame, dataset.clickstream)
+
+
+def _records_frame(records: List[Dict], required: tuple, kind: str) -> pd.DataFrame:
+    """DataFrame of event records, checking required fields are present."""
+    frame = pd.DataFrame(records)
+    if len(frame) == 0:
+        return frame
+    for column in required:
+        if column not in frame or frame[column].isna().any():
+            raise ValueError(f"Every {kind} needs a {column}")
+    return frame
+
+
+def _timestamps(frame: pd.DataFrame, column: str, current_time: datetime) -> pd.Series:
+    """Parsed timestamps of a column, current_time where missing."""
+    if column not in frame:
+        return pd.Series(pd.Timestamp(current_time), index=frame.index)
+    try:
+        # The tables hold naive times: times with a UTC offset are converted
+        # to naive UTC, times without one are kept as given
+        values = pd.to_datetime(frame[column], format='ISO8601', utc=True).dt.tz_convert(None)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid {column}: {e}")
+    return values.fillna(pd.Timestamp(current_time))
+
+
+def _catalog_lookup(frame: pd.DataFrame, products: pd.DataFrame, column: str, catalog_column: str) -> pd.Series:
+    """Column values with gaps filled from the product catalog."""
+    catalog = products.set_index('product_id')[catalog_column]
+    looked_up = frame['product_id'].map(catalog)
+    if column not in frame:
+        return looked_up
+    return frame[column].fillna(looked_up)
+
+
+def _conform(frame: pd.DataFrame, table: pd.DataFrame) -> pd.DataFrame:
+    """Frame with exactly the table's columns and datetime columns in the table's dtype."""
+    frame = frame.reindex(columns=table.columns)
+    for column in table.columns:
+        if pd.api.types.is_datetime64_any_dtype(table[column]):
+            frame[column] = frame[column].astype(table[column].dtype)
+    if ROW_COUNT in table.columns:
+        # Tables read with a rollup count raw rows once each
+        frame[ROW_COUNT] = np.ones(len(frame), dtype=table[ROW_COUNT].dtype)
+    return frame
+
+
+def _append_csv(path: str, frames: List[pd.DataFrame]) -> int:
+    """
+    Append rows to a CSV file in the file's column order.
+
+    Datetime columns are written in the format of the file's first data row,
+    so the loader's format inference keeps working after the append. Where
+    available, an exclusive file lock keeps appends from several API worker
+    processes from interleaving.
+    """
+    frames = [frame for frame in frames if len(frame) > 0]
+    if not frames:
+        return 0
+    rows = pd.concat(frames, ignore_index=True)
+    first_row = pd.read_csv(path, nrows=1, dtype=str)
+    rows = rows.reindex(columns=first_row.columns)
+    for column in rows.columns:
+        if pd.api.types.is_datetime64_any_dtype(rows[column]):
+            sample = first_row[column].iloc[0] if len(first_row) else None
+            rows[column] = rows[column].dt.strftime(_datetime_format(sample))
+
+    with _open_locked(path) as f:
+        with open(path, 'rb') as existing:
+            existing.seek(0, 2)
+            needs_newline = False
+            if existing.tell() > 0:
+                existing.seek(-1, 2)
+                needs_newline = existing.read(1) != b'\n'
+        if needs_newline:
+            f.write('\n')
+        rows.to_csv(f, header=False, index=False)
+        f.flush()
+    return len(rows)
+
+
+def _open_locked(path: str):
+    """
+    Open a file for appending under an exclusive lock, where available.
+
+    Compaction (src.rollup) replaces the file under the same lock, so after
+    waiting for the lock the file is reopened if it was replaced meanwhile.
+    """
+    while True:
+        f = open(path, 'a', newline='')
+        if not HAS_FCNTL:
+            return f
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        if os.fstat(f.fileno()).st_ino == os.stat(path).st_ino:
+            return f
+        f.close()
+
+
+def _datetime_format(sample: Optional[str]) -> str:
+    """strftime format matching an existing timestamp string."""
+    if not isinstance(sample, str):
+        return '%Y-%m-%dT%H:%M:%S'
+    if len(sample) == 10:
+        return '%Y-%m-%d'
+    separator = 'T' if 'T' in sample else ' '
+    fraction = '.%f' if '.' in sample else ''
+    return f'%Y-%m-%d{separator}%H:%M:%S{fraction}'
@@ -0,0 +1,280 @@
+"""
+Factor Model
+
+This module factorizes the customer x product interaction matrix with a
+truncated SVD into compact float32 customer and product factor arrays. A
+customer's affinity to every product is then a single matrix-vector product,
+and batch retrieval scores blocks of customers at once with argpartition
+top-k, so neither path touches the transaction tables.
+
+The factorized matrix combines purchases and product clicks:
+R = log1p(purchase_quantity) + click_weight * click_event_weight.
+
+Usage:
+    python -m src.factor_model build <products.csv> <transactions.csv> <clickstream.csv> <out.npz>
+        [--rank 32]
+    python -m src.factor_model topk <model.npz> [--k 10] [--customers C001 C002 ...]
+        [--block-size 1024] [--output topk.jsonl]
+"""
+
+import argparse
+import json
+import logging
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy.sparse.linalg import svds
+
+
+class FactorModel:
+    """
+    Low-rank customer and product factors.
+
+    Attributes:
+        customer_ids: Customer ID of each customer factor row
+        product_ids: Product ID of each product factor row
+        customer_factors: float32 [n_customers, rank]
+        product_factors: float32 [n_products, rank]
+    """
+
+    def __init__(
+        self,
+        customer_ids: pd.Index,
+        product_ids: pd.Index,
+        customer_factors: np.ndarray,
+        product_factors: np.ndarray
+    ):
+        self.customer_ids = customer_ids
+        self.product_ids = product_ids
+        self.customer_factors = customer_factors
+        self.product_factors = product_factors
+
+    @property
+    def rank(self) -> int:
+        """Number of latent factors."""
+        return self.product_factors.shape[1]
+
+    @classmethod
+    def build(cls, interactions, config: Dict) -> 'FactorModel':
+        """
+        Factorize an InteractionMatrix with a truncated SVD.
+
+        Singular values are split evenly between the two sides
+        (U * sqrt(S), V * sqrt(S)), so affinity is the plain dot product.
+
+        Args:
+            interactions: InteractionMatrix
+            config: Configuration dictionary
+
+        Returns:
+            FactorModel
+        """
+        logger = logging.getLogger(__name__)
+        factor_config = config.get('factor_model', {}) or {}
+        start = time.perf_counter()
+
+        ratings = interactions.matrices['purchase_quantity'].copy()
+        ratings.data = np.log1p(ratings.data)
+        ratings = ratings + factor_config.get('click_weight', 0.5) * interactions.matrices['click_event_weight']
+        ratings = ratings.astype(np.float64).tocsr()
+
+        # svds needs rank < min(shape)
+        rank = min(factor_config.get('rank', 32), min(ratings.shape) - 1)
+        if rank < 1:
+            raise ValueError(f"Interaction matrix {ratings.shape} is too small to factorize")
+
+        u, s, vt = svds(ratings, k=rank, random_state=factor_config.get('random_state', 0))
+        scale = np.sqrt(s)
+        model = cls(
+            interactions.customer_ids,
+            interactions.product_ids,
+            (u * scale).astype(np.float32),
+            (vt.T * scale).astype(np.float32)
+        )
+        logger.info(
+            f"Factorized {ratings.shape[0]} customers x {ratings.shape[1]} products "
+            f"at rank {rank} in {time.perf_counter() - start:.2f}s "
+            f"({model.memory_usage() / 1e6:.1f} MB)"
+        )
+        return model
+
+    def affinity(self, customer_id: str) -> Optional[np.ndarray]:
+        """
+        Affinity of one customer to every product.
+
+        Args:
+            customer_id: Customer ID
+
+        Returns:
+            float32 array aligned with product_ids, or None for unknown customers
+        """
+        row = self.customer_ids.get_indexer([customer_id])[0]
+        if row < 0:
+            return None
+        return self.product_factors @ self.customer_factors[row]
+
+    def top_k(
+        self,
+        customer_ids: List[str],
+        k: int = 10,
+        block_size: int = 1024
+    ) -> Tuple[List[str], np.ndarray, np.ndarray]:
+        """
+        Top-k products by affinity for many customers.
+
+        Customers are scored in blocks of block_size with one float32 matrix
+        product per block; argpartition selects each row's top k before the
+        k winners are sorted.
+
+        Args:
+            customer_ids: Customer IDs (unknown customers are skipped)
+            k: Products per customer
+            block_size: Customers per block
+
+        Returns:
+            Tuple of (known customer IDs, product positions [n, k], scores [n, k])
+        """
+        rows = self.customer_ids.get_indexer(customer_ids)
+        known = rows >= 0
+        rows = rows[known]
+        known_ids = [customer_id for customer_id, is_known in zip(customer_ids, known) if is_known]
+
+        k = min(k, len(self.product_ids))
+        positions = np.empty((len(rows), k), dtype=np.int64)
+        scores = np.empty((len(rows), k), dtype=np.float32)
+        product_factors_t = np.ascontiguousarray(self.product_factors.T)
+
+        for block_start in range(0, len(rows), block_size):
+            block = slice(block_start, block_start + block_size)
+            block_scores = self.customer_factors[rows[block]] @ product_factors_t
+            top = np.argpartition(-block_scores, k - 1, axis=1)[:, :k]
+            top_scores = np.take_along_axis(block_scores, top, axis=1)
+            order = np.argsort(-top_scores, axis=1, kind='stable')
+            positions[block] = np.take_along_axis(top, order, axis=1)
+            scores[block] = np.take_along_axis(top_scores, order, axis=1)
+
+        return known_ids, positions, scores
+
+    def restrict(self, customer_mask: np.ndarray) -> 'FactorModel':
+        """
+        Model keeping only some customers' factors (product factors are shared).
+
+        Args:
+            customer_mask: Boolean mask aligned with customer_ids
+
+        Returns:
+            FactorModel
+        """
+        return FactorModel(
+            self.customer_ids[customer_mask],
+            self.product_ids,
+            self.customer_factors[customer_mask],
+            self.product_factors
+        )
+
+    def memory_usage(self) -> int:
+        """Memory footprint of the factor arrays in bytes."""
+        return int(self.customer_factors.nbytes + self.product_factors.nbytes)
+
+    def save(self, path: str):
+        """Save the model to an .npz file."""
+        np.savez(
+            path,
+            customer_ids=np.asarray(self.customer_ids, dtype=str),
+            product_ids=np.asarray(self.product_ids, dtype=str),
+            customer_factors=self.customer_factors,
+            product_factors=self.product_factors
+        )
+
+    @classmethod
+    def load(cls, path: str) -> 'FactorModel':
+        """Load a model saved with save()."""
+        with np.load(path) as data:
+            return cls(
+                pd.Index(data['customer_ids'].astype(object)),
+                pd.Index(data['product_ids'].astype(object)),
+                data['customer_factors'].copy(),
+                data['product_factors'].copy()
+            )
+
+
+def main():
+    """CLI entry point for building factor models and batch retrieval."""
+    import yaml
+
+    parser = argparse.ArgumentParser(description="Low-rank customer/product factor model")
+    parser.add_argument('--config', default='config/config.yaml')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build = subparsers.add_parser('build', help="Factorize interactions from CSVs")
+    build.add_argument('products')
+    build.add_argument('transactions')
+    build.add_argument('clickstream')
+    build.add_argument('output')
+    build.add_argument('--rank', type=int, default=None)
+
+    topk = subparsers.add_parser('topk', help="Batch top-k retrieval")
+    topk.add_argument('model')
+    topk.add_argument('--k', type=int, default=10)
+    topk.add_argument('--customers', nargs='*', default=None, help="Defaults to all customers")
+    topk.add_argument('--block-size', type=int, default=None)
+    topk.add_argument('--output', default=None, help="JSONL output path (default stdout)")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    with open(args.config, 'r') as f:
+        config = yaml.safe_load(f)
+    factor_config = config.setdefault('factor_model', {})
+
+    if args.command == 'build':
+        from src.interaction_matrix import InteractionMatrix
+        from src.rollup import read_table
+        from src.schemas import CLICKSTREAM, PRODUCTS, TRANSACTIONS, CsvLoader
+
+        if args.rank is not None:
+            factor_config['rank'] = args.rank
+
+        loader = CsvLoader(config)
+        products = loader.read(args.products, PRODUCTS)
+        transactions = read_table(args.transactions, TRANSACTIONS, loader)
+        clickstream = read_table(args.clickstream, CLICKSTREAM, loader)
+
+        interactions = InteractionMatrix.build(products, transactions, clickstream, config)
+        model = FactorModel.build(interactions, config)
+        model.save(args.output)
+        print(f"Saved rank-{model.rank} factor model ({len(model.customer_ids)} customers, "
+              f"{len(model.product_ids)} products) to {args.output}")
+
+    elif args.command == 'topk':
+        model = FactorModel.load(args.model)
+        customer_ids = args.customers or list(model.customer_ids)
+        block_size = args.block_size or factor_config.get('block_size', 1024)
+
+        start = time.perf_counter()
+        known_ids, positions, scores = model.top_k(customer_ids, k=args.k, block_size=block_size)
+        elapsed = time.perf_counter() - start
+
+        output = open(args.output, 'w') if args.output else sys.stdout
+        try:
+            for customer_id, row_positions, row_scores in zip(known_ids, positions, scores):
+                output.write(json.dumps({
+                    'customer_id': customer_id,
+                    'product_ids': model.product_ids[row_positions].tolist(),
+                    'scores': [round(float(score), 6) for score in row_scores]
+                }) + '\n')
+        finally:
+            if args.output:
+                output.close()
+
+        per_customer = elapsed / max(len(known_ids), 1)
+        print(f"Retrieved top {args.k} for {len(known_ids)} customers over "
+              f"{len(model.product_ids)} products in {elapsed:.3f}s "
+              f"({per_customer * 1e6:.1f} us per customer)", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
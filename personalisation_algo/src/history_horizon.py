@@ -0,0 +1,459 @@
+"""
+History Horizon
+
+This module prunes transactions and clickstream events whose time-decayed
+weight has fallen below a tolerance, keeping a compact summary of the pruned
+rows so that the non-decaying parts of the scores are preserved.
+
+The horizon is derived from the decay parameters and the tolerance ε:
+
+    horizon_days  = decay_days  * ln(1 / ε)    (category affinity)
+    horizon_hours = decay_hours * ln(1 / ε)    (clickstream intent)
+
+Any row older than the horizon contributes a decayed weight of at most ε.
+
+Usage:
+    python -m src.history_horizon <products.csv> <transactions.csv> <clickstream.csv>
+        [--tolerance 0.001] [--sample 50]
+"""
+
+import argparse
+import logging
+import math
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src.rollup import row_counts
+
+
+# Weight used by the clickstream scorer for event types missing from the config
+DEFAULT_EVENT_WEIGHT = 0.3
+
+
+class HistorySummary:
+    """
+    Compact summary of history that was pruned (or must survive pruning).
+
+    Attributes:
+        reference_time: Time the horizon was anchored at
+        category_history: Pruned transactions per (customer_id, product_category)
+            with columns decayed_weight (at reference_time) and quantity
+        click_history: Pruned clicks per (customer_id, product_id) with column
+            event_weight (sum of event type weights)
+        repurchase: Full-history purchase stats per (customer_id, product_id)
+            with columns purchase_count, last_purchase, cycle_days_sum
+    """
+
+    def __init__(
+        self,
+        reference_time: datetime,
+        category_history: pd.DataFrame,
+        click_history: pd.DataFrame,
+        repurchase: pd.DataFrame
+    ):
+        self.reference_time = reference_time
+        self.category_history = category_history
+        self.click_history = click_history
+        self.repurchase = repurchase
+
+    def customer_categories(self, customer_id: str) -> pd.DataFrame:
+        """Pruned category history for a customer, indexed by product_category."""
+        return _customer_rows(self.category_history, customer_id)
+
+    def customer_clicks(self, customer_id: str) -> pd.DataFrame:
+        """Pruned click history for a customer, indexed by product_id."""
+        return _customer_rows(self.click_history, customer_id)
+
+    def customer_repurchase(self, customer_id: str) -> pd.DataFrame:
+        """Full-history repurchase stats for a customer, indexed by product_id."""
+        return _customer_rows(self.repurchase, customer_id)
+
+    def with_transactions(self, transactions: pd.DataFrame) -> 'HistorySummary':
+        """
+        New summary with purchases appended to the repurchase stats.
+
+        Pruned category and click history cover only rows that were dropped
+        at load time, so appended rows leave them unchanged. Transactions are
+        dated by day, so the summed gaps of a product equal the days between
+        its first and last purchase and the stats merge exactly.
+
+        Args:
+            transactions: New transactions with datetime date_of_transaction
+
+        Returns:
+            New HistorySummary (this one is not modified)
+        """
+        added = summarize_repurchase(transactions)
+        known = self.repurchase.reindex(added.index)
+        known_first = known['last_purchase'] - pd.to_timedelta(known['cycle_days_sum'], unit='D')
+        added_first = added['last_purchase'] - pd.to_timedelta(added['cycle_days_sum'], unit='D')
+        first_purchase = known_first.where(known_first < added_first, added_first)
+        last_purchase = known['last_purchase'].where(
+            known['last_purchase'] > added['last_purchase'], added['last_purchase']
+        )
+        merged = pd.DataFrame({
+            'purchase_count': (known['purchase_count'].fillna(0) + added['purchase_count']).astype(np.int64),
+            'last_purchase': last_purchase,
+            'cycle_days_sum': (last_purchase - first_purchase).dt.days.astype(np.float64)
+        })
+        repurchase = pd.concat([
+            self.repurchase[~self.repurchase.index.isin(added.index)], merged
+        ])
+        return HistorySummary(
+            reference_time=self.reference_time,
+            category_history=self.category_history,
+            click_history=self.click_history,
+            repurchase=repurchase
+        )
+
+    def memory_usage(self) -> int:
+        """Approximate memory footprint of the summary in bytes."""
+        return int(sum(
+            frame.memory_usage(deep=True, index=True).sum()
+            for frame in (
+                self.category_history, self.click_history, self.repurchase
+            )
+        ))
+
+
+def _customer_rows(frame: pd.DataFrame, customer_id: str) -> pd.DataFrame:
+    """Select one customer's rows from a (customer_id, key) indexed frame."""
+    try:
+        return frame.xs(customer_id, level='customer_id')
+    except KeyError:
+        return frame.iloc[0:0].droplevel('customer_id')
+
+
+class HistoryHorizon:
+    """
+    Prune rows beyond the decay horizon and summarise what was pruned.
+    """
+
+    def __init__(self, config: Dict):
+        """
+        Initialize the history horizon with configuration.
+
+        Args:
+            config: Configuration dictionary
+        """
+        self.config = config
+        self.horizon_config = config.get('history_horizon', {}) or {}
+        self.logger = logging.getLogger(__name__)
+
+    @property
+    def enabled(self) -> bool:
+        """Whether load-time truncation is enabled."""
+        return bool(self.horizon_config.get('enabled', False))
+
+    @property
+    def tolerance(self) -> float:
+        """Maximum decayed weight of a pruned row (ε)."""
+        tolerance = float(self.horizon_config.get('tolerance', 0.001))
+        if not (0.0 < tolerance < 1.0):
+            raise ValueError(f"history_horizon.tolerance must be in (0, 1), got {tolerance}")
+        return tolerance
+
+    def horizon_days(self) -> int:
+        """
+        Transaction horizon in days.
+
+        Never shorter than the recent-purchase constraint window, which needs
+        raw rows to exclude recently purchased products.
+        """
+        decay_days = self.config['category_affinity']['decay_days']
+        horizon = math.ceil(decay_days * math.log(1.0 / self.tolerance))
+        exclude_days = self.config['constraints'].get('exclude_recent_purchases_days', 0)
+        return max(horizon, exclude_days)
+
+    def horizon_hours(self) -> float:
+        """Clickstream horizon in hours."""
+        decay_hours = self.config['clickstream_intent']['decay_hours']
+        return decay_hours * math.log(1.0 / self.tolerance)
+
+    def reference_time(self) -> datetime:
+        """Time the horizon is anchored at (configured or now)."""
+        configured = self.horizon_config.get('reference_time')
+        if configured:
+            return pd.Timestamp(configured).to_pydatetime()
+        return datetime.now()
+
+    def truncate(
+        self,
+        transactions: pd.DataFrame,
+        clickstream: pd.DataFrame,
+        reference_time: datetime = None
+    ) -> Tuple[pd.DataFrame, pd.DataFrame, HistorySummary]:
+        """
+        Prune rows older than the horizon and summarise them.
+
+        Scores computed at any current_time >= reference_time stay within the
+        tolerance of the untruncated scores; earlier times (e.g. backtests)
+        are not covered by the guarantee. Popularity is not part of the
+        summary: compute it from the full history before truncating.
+
+        Args:
+            transactions: Transaction history with datetime date_of_transaction
+            clickstream: Clickstream data with datetime event_timestamp
+            reference_time: Anchor time (defaults to configured value or now)
+
+        Returns:
+            Tuple of (kept transactions, kept clickstream, HistorySummary)
+        """
+        if reference_time is None:
+            reference_time = self.reference_time()
+
+        txn_cutoff = reference_time - timedelta(days=self.horizon_days())
+        click_cutoff = reference_time - timedelta(hours=self.horizon_hours())
+
+        # Repurchase statistics do not decay and are taken from the full history
+        repurchase = summarize_repurchase(transactions)
+
+        txn_old = transactions['date_of_transaction'] < txn_cutoff
+        click_old = clickstream['event_timestamp'] < click_cutoff
+
+        category_history = self._summarize_pruned_transactions(
+            transactions[txn_old], reference_time
+        )
+        click_history = self._summarize_pruned_clicks(clickstream[click_old])
+
+        kept_transactions = transactions[~txn_old].reset_index(drop=True)
+        kept_clickstream = clickstream[~click_old].reset_index(drop=True)
+
+        self.logger.info(
+            f"History horizon (eps={self.tolerance}): kept "
+            f"{len(kept_transactions)}/{len(transactions)} transactions "
+            f"(horizon {self.horizon_days()} days), "
+            f"{len(kept_clickstream)}/{len(clickstream)} clickstream events "
+            f"(horizon {self.horizon_hours():.1f} hours)"
+        )
+
+        summary = HistorySummary(
+            reference_time=reference_time,
+            category_history=category_history,
+            click_history=click_history,
+            repurchase=repurchase
+        )
+        return kept_transactions, kept_clickstream, summary
+
+    def _summarize_pruned_transactions(
+        self,
+        pruned: pd.DataFrame,
+        reference_time: datetime
+    ) -> pd.DataFrame:
+        """
+        Summarise pruned transactions per (customer_id, product_category).
+
+        The decayed weight is kept alongside the quantity: category affinity is
+        normalised by the customer's best category, so for a customer whose
+        whole history lies beyond the horizon dropping the mass would not be a
+        bounded change.
+        """
+        decay_days = self.config['category_affinity']['decay_days']
+        days_ago = (reference_time - pruned['date_of_transaction']).dt.days
+        frame = pd.DataFrame({
+            'customer_id': pruned['customer_id'],
+            'product_category': pruned['product_category'],
+            'decayed_weight': np.exp(-days_ago / decay_days) * row_counts(pruned),
+            'quantity': pruned['quantity']
+        })
+        return frame.groupby(['customer_id', 'product_category']).sum()
+
+    def _summarize_pruned_clicks(self, pruned: pd.DataFrame) -> pd.DataFrame:
+        """
+        Summarise pruned product clicks per (customer_id, product_id).
+
+        Only the event type weight is kept; the recency term of each pruned
+        event is at most ε and is dropped.
+        """
+        event_weights = self.config['clickstream_intent']['event_weights']
+        pruned = pruned[pruned['product_id'].notna()]
+        frame = pd.DataFrame({
+            'customer_id': pruned['customer_id'],
+            'product_id': pruned['product_id'],
+            'event_weight': pruned['event_type'].map(event_weights).astype(np.float64).fillna(DEFAULT_EVENT_WEIGHT) * row_counts(pruned)
+        })
+        return frame.groupby(['customer_id', 'product_id']).sum()
+
+
+def summarize_repurchase(transactions: pd.DataFrame) -> pd.DataFrame:
+    """
+    Per (customer_id, product_id) purchase count, last purchase and the sum of
+    whole-day gaps between consecutive purchases.
+
+    Rollup rows (see src.rollup) count once per purchase they stand for; the
+    purchases they merge fall on one day, so the gaps are unchanged.
+
+    Args:
+        transactions: Transaction history with datetime date_of_transaction
+
+    Returns:
+        DataFrame indexed by (customer_id, product_id)
+    """
+    txns = transactions[['customer_id', 'product_id', 'date_of_transaction']].assign(
+        purchases=row_counts(transactions)
+    ).sort_values(['customer_id', 'product_id', 'date_of_transaction'])
+    keys = [txns['customer_id'], txns['product_id']]
+    gaps = txns.groupby(keys, sort=False)['date_of_transaction'].diff().dt.days
+    grouped = txns.groupby(keys)['date_of_transaction']
+    return pd.DataFrame({
+        'purchase_count': txns.groupby(keys)['purchases'].sum().astype(np.int64),
+        'last_purchase': grouped.max(),
+        'cycle_days_sum': gaps.groupby(keys).sum()
+    })
+
+
+def deviation_report(
+    scoring_engine,
+    horizon: HistoryHorizon,
+    products: pd.DataFrame,
+    transactions: pd.DataFrame,
+    clickstream: pd.DataFrame,
+    customer_ids: List[str],
+    current_time: datetime = None
+) -> Dict:
+    """
+    Measure the score deviation caused by truncation.
+
+    Scores every given customer on the full history and on the truncated
+    history plus summary, and reports the maximum absolute deviation of each
+    deterministic component and of the final score without exploration.
+
+    Args:
+        scoring_engine: ProductScoringEngine to score with
+        horizon: HistoryHorizon used for truncation
+        products: Product catalog
+        transactions: Full transaction history (datetime columns)
+        clickstream: Full clickstream data (datetime columns)
+        customer_ids: Customers to compare
+        current_time: Scoring time (defaults to the truncation reference time)
+
+    Returns:
+        Report dictionary
+    """
+    reference_time = horizon.reference_time()
+    if current_time is None:
+        current_time = reference_time
+
+    popularity = scoring_engine.compute_popularity(transactions)
+    kept_txns, kept_clicks, summary = horizon.truncate(
+        transactions, clickstream, reference_time=reference_time
+    )
+
+    components = [
+        'category_affinity',
+        'repurchase_likelihood',
+        'clickstream_intent',
+        'product_popularity'
+    ]
+    weights = scoring_engine.weights
+    max_deviation = {name: 0.0 for name in components + ['final_score']}
+    full_seconds = 0.0
+    truncated_seconds = 0.0
+
+    for customer_id in customer_ids:
+        start = time.perf_counter()
+        full = scoring_engine.score_products(
+            customer_id, products, transactions, clickstream, current_time
+        )
+        full_seconds += time.perf_counter() - start
+
+        start = time.perf_counter()
+        truncated = scoring_engine.score_products(
+            customer_id, products, kept_txns, kept_clicks, current_time,
+            history_summary=summary, popularity=popularity
+        )
+        truncated_seconds += time.perf_counter() - start
+
+        full_final = sum(weights[name] * full[name] for name in components)
+        truncated_final = sum(weights[name] * truncated[name] for name in components)
+
+        for name in components:
+            deviation = float((full[name] - truncated[name]).abs().max())
+            max_deviation[name] = max(max_deviation[name], deviation)
+        deviation = float((full_final - truncated_final).abs().max())
+        max_deviation['final_score'] = max(max_deviation['final_score'], deviation)
+
+    def frame_bytes(*frames):
+        return int(sum(frame.memory_usage(deep=True).sum() for frame in frames))
+
+    return {
+        'tolerance': horizon.tolerance,
+        'horizon_days': horizon.horizon_days(),
+        'horizon_hours': horizon.horizon_hours(),
+        'reference_time': reference_time.isoformat(),
+        'current_time': current_time.isoformat(),
+        'customers_compared': len(customer_ids),
+        'transactions_kept': len(kept_txns),
+        'transactions_total': len(transactions),
+        'clickstream_kept': len(kept_clicks),
+        'clickstream_total': len(clickstream),
+        'memory_bytes_full': frame_bytes(transactions, clickstream),
+        'memory_bytes_truncated': frame_bytes(kept_txns, kept_clicks) + summary.memory_usage(),
+        'scoring_seconds_full': full_seconds,
+        'scoring_seconds_truncated': truncated_seconds,
+        'max_deviation': max_deviation
+    }
+
+
+def main():
+    """CLI entry point: print a truncation deviation report."""
+    from src.main import RecommendationEngine
+
+    parser = argparse.ArgumentParser(description="Report the effect of history horizon truncation")
+    parser.add_argument('products')
+    parser.add_argument('transactions')
+    parser.add_argument('clickstream')
+    parser.add_argument('--config', default='config/config.yaml')
+    parser.add_argument('--tolerance', type=float, default=None, help="Override ε")
+    parser.add_argument('--reference-time', default=None, help="Anchor time (ISO format)")
+    parser.add_argument('--sample', type=int, default=50, help="Number of customers to compare")
+    args = parser.parse_args()
+
+    engine = RecommendationEngine(args.config)
+    config = engine.config
+    config.setdefault('history_horizon', {})
+    if args.tolerance is not None:
+        config['history_horizon']['tolerance'] = args.tolerance
+    if args.reference_time is not None:
+        config['history_horizon']['reference_time'] = args.reference_time
+
+    # Load without truncation so the report can compare against full history,
+    # and in the loaded layout truncate works on (see src.compact)
+    config['history_horizon']['enabled'] = False
+    config.setdefault('compact_tables', {})['enabled'] = False
+    products, transactions, clickstream = engine.load_data(
+        args.products, args.transactions, args.clickstream
+    )
+
+    customer_ids = transactions['customer_id'].drop_duplicates().head(args.sample).tolist()
+    report = deviation_report(
+        engine.scoring_engine,
+        HistoryHorizon(config),
+        products, transactions, clickstream,
+        customer_ids
+    )
+
+    print("\n" + "="*60)
+    print("HISTORY HORIZON REPORT")
+    print("="*60)
+    print(f"Tolerance (eps): {report['tolerance']}")
+    print(f"Horizon: {report['horizon_days']} days (transactions), "
+          f"{report['horizon_hours']:.1f} hours (clickstream)")
+    print(f"Transactions kept: {report['transactions_kept']} / {report['transactions_total']}")
+    print(f"Clickstream kept: {report['clickstream_kept']} / {report['clickstream_total']}")
+    print(f"Memory: {report['memory_bytes_full'] / 1e6:.2f} MB -> "
+          f"{report['memory_bytes_truncated'] / 1e6:.2f} MB")
+    print(f"Scoring time ({report['customers_compared']} customers): "
+          f"{report['scoring_seconds_full']:.2f}s -> {report['scoring_seconds_truncated']:.2f}s")
+    print("\nMaximum score deviation:")
+    for name, deviation in report['max_deviation'].items():
+        print(f"  {name}: {deviation:.6f}")
+    print("="*60)
+
+
+if __name__ == '__main__':
+    main()
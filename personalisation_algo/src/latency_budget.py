@@ -0,0 +1,60 @@
+"""
+Latency Budget
+
+This module tracks a per-request time budget. Scoring checks the budget
+before each expensive component and skips the component (scoring it 0.0)
+when the remaining time is below the component's expected cost; skipped
+components are recorded so the response can report them.
+"""
+
+import time
+from typing import List, Optional
+
+
+class LatencyBudget:
+    """
+    Deadline for one request, measured on the monotonic clock.
+    """
+
+    def __init__(self, seconds: float, start: Optional[float] = None):
+        """
+        Start a budget.
+
+        Args:
+            seconds: Total time allowed for the request
+            start: time.perf_counter() value the budget started at (defaults to now)
+        """
+        if seconds <= 0:
+            raise ValueError(f"Latency budget must be positive, got {seconds}")
+        self.seconds = seconds
+        self.start = time.perf_counter() if start is None else start
+        self.deadline = self.start + seconds
+        self.degraded: List[str] = []
+
+    @classmethod
+    def from_milliseconds(cls, milliseconds: Optional[float]) -> Optional['LatencyBudget']:
+        """Budget of the given milliseconds, or None for no deadline."""
+        if milliseconds is None:
+            return None
+        return cls(milliseconds / 1000.0)
+
+    def remaining(self) -> float:
+        """Seconds left before the deadline (negative once expired)."""
+        return self.deadline - time.perf_counter()
+
+    def expired(self) -> bool:
+        """Whether the deadline has passed."""
+        return self.remaining() <= 0
+
+    def allows(self, expected_seconds: float = 0.0) -> bool:
+        """Whether work expected to take expected_seconds fits in the remaining time."""
+        return self.remaining() > expected_seconds
+
+    def degrade(self, component: str):
+        """Record that a component was skipped or shortcut."""
+        if component not in self.degraded:
+            self.degraded.append(component)
+
+    def elapsed_ms(self) -> float:
+        """Milliseconds since the budget started."""
+        return (time.perf_counter() - self.start) * 1000.0
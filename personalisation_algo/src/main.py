@@ -4,16 +4,35 @@ Main Recommendation Engine
 This module orchestrates the entire recommendation pipeline.
 """
 
+import os
 import pandas as pd
 import yaml
 import logging
+from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Any, Dict, List, Optional
 from datetime import datetime
 
-from src.scoring_engine import ProductScoringEngine
+from src.scoring_engine import ProductScoringEngine, active_components
 from src.constraint_filter import ConstraintFilter
 from src.selector import ProductSelector
+from src.history_horizon import HistoryHorizon
+from src.dataset import EngineDataset, file_signature
+from src.candidate_generator import CandidateGenerator
+from src.interaction_matrix import InteractionMatrix
+from src.copurchase import CoPurchaseIndex
+from src.factor_model import FactorModel
+from src.latency_budget import LatencyBudget
+from src.events import EventIngestor
+from src.snapshot import save_snapshot, load_snapshot
+from src.refresher import DatasetRefresher
+from src.sharding import ShardSpec, WrongShardError
+from src.rollup import read_table
+from src.compact import compact_table, expand_table, release_memory, table_bytes
+from src.base_scores import BaseScoreCache
+from src.catalog_feed import CatalogFeed, LiveCatalog
+from src.audience import AudienceSelector
+from src.schemas import CLICKSTREAM, PRODUCTS, TRANSACTIONS, CsvLoader
 
 # FastAPI imports for API
 from fastapi import FastAPI, HTTPException
@@ -38,10 +57,35 @@ class RecommendationEngine:
         self.config = self._load_config()
         self._setup_logging()
         
+        # Customer shard this process serves (None: every customer)
+        self.shard = ShardSpec.from_config(self.config)
+        
         # Initialize components
         self.scoring_engine = ProductScoringEngine(self.config)
         self.constraint_filter = ConstraintFilter(self.config)
-        self.selector = ProductSelector(self.config)
+        if self.shard is not None:
+            self.selector = self._shard_selector('data/shown_products.json')
+        else:
+            self.selector = ProductSelector(self.config)
+        self.history_horizon = HistoryHorizon(self.config)
+        self.candidate_generator = CandidateGenerator(self.config)
+        self.csv_loader = CsvLoader(self.config)
+        self.audience_selector = AudienceSelector(
+            self.config, self.scoring_engine, self.constraint_filter
+        )
+        
+        # Slow score components kept between requests (see src.base_scores)
+        self.base_scores = BaseScoreCache(self.config)
+        
+        # Stock and discount updates since the products file (see src.catalog_feed)
+        self.live_catalog = LiveCatalog()
+        
+        # Tables and derived state from the last load_data call
+        self.dataset: Optional[EngineDataset] = None
+        
+        # Where the dataset came from ('csv' or 'snapshot') and the snapshot version
+        self.dataset_source: Optional[str] = None
+        self.snapshot_version: Optional[str] = None
         
         self.logger.info("Recommendation engine initialized")
     
@@ -51,17 +95,27 @@ class RecommendationEngine:
         products: pd.DataFrame,
         transactions: pd.DataFrame,
         clickstream: pd.DataFrame,
-        current_time: datetime = None
+        current_time: datetime = None,
+        budget: Optional[LatencyBudget] = None,
+        dataset: Optional[EngineDataset] = None
     ) -> Optional[Dict]:
         """
         Recommend a single product for a customer.
         
+        With a latency budget, components that do not fit in the remaining
+        time are skipped, and if the budget is already spent or scoring fails
+        the recommendation falls back to precomputed popularity. The result
+        then lists degraded_components and the fallback used (if any).
+        
         Args:
             customer_id: Customer ID to recommend for
             products: Product catalog DataFrame
             transactions: Transaction history DataFrame
             clickstream: Clickstream data DataFrame
             current_time: Current timestamp (defaults to now)
+            budget: Optional LatencyBudget for this request
+            dataset: Loaded dataset the tables come from, when the caller holds
+                one that may since have been replaced (defaults to the current one)
             
         Returns:
             Dictionary with recommendation and metadata, or None if no valid products
@@ -71,14 +125,44 @@ class RecommendationEngine:
         
         self.logger.info(f"Generating recommendation for customer {customer_id}")
         
+        if dataset is None or not dataset.matches(products, transactions, clickstream):
+            dataset = self._dataset_for(products, transactions, clickstream)
+        
+        if budget is not None and budget.expired():
+            self.logger.warning(
+                f"Latency budget spent before scoring customer {customer_id} "
+                f"({budget.elapsed_ms():.0f} ms); using fallback"
+            )
+            return self._fallback_recommendation(
+                customer_id, products, transactions, current_time, dataset, 'deadline'
+            )
+        
         try:
+            # Step 0: Narrow the catalog to candidates from precomputed indexes
+            if self.candidate_generator.enabled and dataset and dataset.candidate_index:
+                positions = self.candidate_generator.generate(customer_id, dataset.candidate_index)
+                if len(positions) > 0:
+                    self.logger.debug(
+                        f"Scoring {len(positions)} candidates out of {len(products)} products"
+                    )
+                    products = products.iloc[positions]
+            
             # Step 1: Score all products
+            timings = {}
             scored_products = self.scoring_engine.score_products(
                 customer_id=customer_id,
                 products=products,
                 transactions=transactions,
                 clickstream=clickstream,
-                current_time=current_time
+                current_time=current_time,
+                budget=budget,
+                timings=timings,
+                base_scores=self.base_scores.for_dataset(dataset),
+                **(dataset.scoring_inputs() if dataset else {})
+            )
+            self.logger.debug(
+                "Component timings for %s: %s", customer_id,
+                ", ".join(f"{name} {seconds * 1000:.1f} ms" for name, seconds in timings.items())
             )
             
             if self.config['logging']['verbose']:
@@ -89,7 +173,9 @@ class RecommendationEngine:
                 customer_id=customer_id,
                 scored_products=scored_products,
                 transactions=transactions,
-                current_time=current_time
+                current_time=current_time,
+                interactions=dataset.interactions if dataset else None,
+                catalog_mask=dataset.catalog_mask if dataset else None
             )
             
             # Step 3: Select final product
@@ -99,12 +185,87 @@ class RecommendationEngine:
                 current_time=current_time
             )
             
+            if budget is not None and recommendation is not None:
+                recommendation['degraded_components'] = list(budget.degraded)
+                recommendation['fallback'] = None
+                if budget.degraded:
+                    self.logger.warning(
+                        f"Degraded {budget.degraded} for customer {customer_id} "
+                        f"to meet the latency budget"
+                    )
+            
             return recommendation
             
         except Exception as e:
             self.logger.error(f"Error generating recommendation for {customer_id}: {e}", exc_info=True)
+            if budget is not None:
+                return self._fallback_recommendation(
+                    customer_id, products, transactions, current_time, dataset, 'error'
+                )
             return None
     
+    def _fallback_recommendation(
+        self,
+        customer_id: str,
+        products: pd.DataFrame,
+        transactions: pd.DataFrame,
+        current_time: datetime,
+        dataset: Optional[EngineDataset],
+        reason: str
+    ) -> Optional[Dict]:
+        """
+        Recommend from precomputed popularity without customer-specific scoring.
+        
+        Constraints and the selector's variety mechanism still apply. Without
+        precomputed popularity every product scores the neutral 0.5.
+        
+        Args:
+            customer_id: Customer ID
+            products: Product catalog DataFrame
+            transactions: Transaction history DataFrame
+            current_time: Current timestamp
+            dataset: Loaded dataset for these tables, if any
+            reason: Why the fallback was used ('deadline' or 'error')
+            
+        Returns:
+            Dictionary with recommendation and metadata, or None if no valid products
+        """
+        scored_products = products.copy()
+        components = active_components(self.scoring_engine.weights)
+        for name in components:
+            scored_products[name] = 0.0
+        
+        if dataset is not None and dataset.popularity is not None:
+            scored_products['product_popularity'] = self.scoring_engine._score_product_popularity(
+                scored_products, transactions, popularity=dataset.popularity
+            )
+            source = 'popularity'
+        else:
+            scored_products['product_popularity'] = 0.5
+            source = 'catalog'
+        scored_products['final_score'] = scored_products['product_popularity']
+        
+        filtered_products = self.constraint_filter.filter_products(
+            customer_id=customer_id,
+            scored_products=scored_products,
+            transactions=transactions,
+            current_time=current_time,
+            interactions=dataset.interactions if dataset else None,
+            catalog_mask=dataset.catalog_mask if dataset else None
+        )
+        recommendation = self.selector.select_product(
+            customer_id=customer_id,
+            scored_products=filtered_products,
+            current_time=current_time
+        )
+        if recommendation is not None:
+            recommendation['degraded_components'] = [
+                name for name in components if name != 'product_popularity'
+            ]
+            recommendation['fallback'] = source
+            recommendation['fallback_reason'] = reason
+        return recommendation
+    
     def recommend_batch(
         self,
         customer_ids: List[str],
@@ -153,6 +314,38 @@ class RecommendationEngine:
         
         return recommendations
     
+    def select_audience(
+        self,
+        product_id: Optional[str] = None,
+        category: Optional[str] = None,
+        top_n: Optional[int] = None,
+        current_time: datetime = None,
+        dataset: Optional[EngineDataset] = None
+    ) -> Dict:
+        """
+        Find the customers to target with a product or category.
+        
+        Every customer is scored against the target at once (see
+        src.audience) instead of running recommend_product per customer.
+        
+        Args:
+            product_id: Product to find an audience for
+            category: Category to find an audience for (instead of product_id)
+            top_n: Number of customers (defaults to audience.top_n)
+            current_time: Current timestamp (defaults to now)
+            dataset: Loaded dataset to select from (defaults to the current one)
+            
+        Returns:
+            Dictionary with the audience and selection counts
+        """
+        dataset = dataset or self.dataset
+        if dataset is None:
+            raise ValueError("No dataset is loaded to select an audience from")
+        return self.audience_selector.select(
+            dataset, product_id=product_id, category=category,
+            top_n=top_n, current_time=current_time
+        )
+    
     def load_data(
         self,
         products_path: str,
@@ -162,6 +355,12 @@ class RecommendationEngine:
         """
         Load data from CSV files.
         
+        When history_horizon is enabled, rows beyond the decay horizon are
+        pruned and summarised; pass the returned tables back to
+        recommend_product so the summary is used. With compact_tables
+        enabled (the default), transactions and clickstream are returned in
+        the compact layout of src.compact; expand_table converts them back.
+        
         Args:
             products_path: Path to products CSV
             transactions_path: Path to transactions CSV
@@ -170,26 +369,376 @@ class RecommendationEngine:
         Returns:
             Tuple of (products, transactions, clickstream) DataFrames
         """
+        self.set_dataset(
+            self.build_dataset(products_path, transactions_path, clickstream_path), 'csv'
+        )
+        return self.dataset.as_tuple()
+    
+    def build_dataset(
+        self,
+        products_path: str,
+        transactions_path: str,
+        clickstream_path: str
+    ) -> EngineDataset:
+        """
+        Read the CSV files and build a dataset with all load-time derived state.
+        
+        The engine's current dataset is not touched, so this can run off the
+        request path while requests keep using it.
+        
+        Args:
+            products_path: Path to products CSV
+            transactions_path: Path to transactions CSV
+            clickstream_path: Path to clickstream CSV
+            
+        Returns:
+            New EngineDataset
+        """
         self.logger.info("Loading data files...")
         
         try:
-            products = pd.read_csv(products_path)
-            self.logger.info(f"Loaded {len(products)} products from {products_path}")
+            source_paths = tuple(
+                os.path.abspath(path) for path in (products_path, transactions_path, clickstream_path)
+            )
+            # Taken before reading so a concurrent write forces a later reload
+            source_signature = file_signature(source_paths)
             
-            transactions = pd.read_csv(transactions_path)
-            transactions['date_of_transaction'] = pd.to_datetime(transactions['date_of_transaction'])
+            # Typed reads of the three files, concurrently (see src.schemas);
+            # old rows may have been compacted into daily rollups (see src.rollup)
+            loader = self.csv_loader
+            products, transactions, clickstream = loader.gather(
+                lambda: loader.read(products_path, PRODUCTS),
+                lambda: read_table(transactions_path, TRANSACTIONS, loader),
+                lambda: read_table(clickstream_path, CLICKSTREAM, loader)
+            )
+            self.logger.info(f"Loaded {len(products)} products from {products_path}")
             self.logger.info(f"Loaded {len(transactions)} transactions from {transactions_path}")
-            
-            clickstream = pd.read_csv(clickstream_path)
-            clickstream['event_timestamp'] = pd.to_datetime(clickstream['event_timestamp'])
             self.logger.info(f"Loaded {len(clickstream)} clickstream events from {clickstream_path}")
             
-            return products, transactions, clickstream
+            # Popularity is global and not decayed: compute it before any pruning
+            popularity = self.scoring_engine.compute_popularity(transactions)
+            
+            # Co-purchase neighbors, only needed when the component is weighted
+            copurchase = None
+            if self.scoring_engine.weights.get('copurchase', 0) > 0:
+                copurchase = self._load_copurchase(transactions)
+            
+            # A shard computes the global state above (and product factors)
+            # from every customer, then keeps only its own customers' rows
+            reference_time = None
+            factors = None
+            if self.shard is not None:
+                reference_time = transactions['date_of_transaction'].max().normalize()
+                if self.scoring_engine.weights.get('factor_affinity', 0) > 0:
+                    factors = self._load_factors(products, transactions, clickstream, None)
+                    factors = factors.restrict(self.shard.mask(factors.customer_ids))
+                transactions = self.shard.filter(transactions)
+                clickstream = self.shard.filter(clickstream)
+                self.logger.info(
+                    f"Shard {self.shard.shard_id} of {self.shard.num_shards} keeps "
+                    f"{len(transactions)} transactions and {len(clickstream)} clickstream events"
+                )
+            
+            # Candidate indexes see the full history, before any pruning
+            candidate_index = None
+            if self.candidate_generator.enabled:
+                candidate_index = self.candidate_generator.build_index(
+                    products, transactions, clickstream, popularity
+                )
+            
+            # Sparse customer history, built once from the full tables
+            interactions = None
+            if self.config.get('interactions', {}).get('enabled', True):
+                interactions = InteractionMatrix.build(
+                    products, transactions, clickstream, self.config,
+                    reference_time=reference_time
+                )
+            
+            # Customer/product factors, only needed when the component is weighted
+            if factors is None and self.scoring_engine.weights.get('factor_affinity', 0) > 0:
+                factors = self._load_factors(products, transactions, clickstream, interactions)
+            
+            history_summary = None
+            if self.history_horizon.enabled:
+                transactions, clickstream, history_summary = self.history_horizon.truncate(
+                    transactions, clickstream
+                )
+            
+            # Derived state is built: keep the tables in the narrow layout
+            # scoring reads per customer (see src.compact)
+            if (self.config.get('compact_tables') or {}).get('enabled', True):
+                before = table_bytes(transactions, clickstream)
+                transactions = compact_table(transactions)
+                clickstream = compact_table(clickstream)
+                release_memory()
+                after = table_bytes(transactions, clickstream)
+                self.logger.info(
+                    f"Compacted transactions and clickstream from {before / 1e6:.1f} MB "
+                    f"to {after / 1e6:.1f} MB"
+                )
+            
+            return EngineDataset(
+                products, transactions, clickstream,
+                history_summary=history_summary,
+                popularity=popularity,
+                candidate_index=candidate_index,
+                interactions=interactions,
+                copurchase=copurchase,
+                factors=factors,
+                source_paths=source_paths,
+                source_signature=source_signature
+            )
             
         except Exception as e:
             self.logger.error(f"Error loading data: {e}", exc_info=True)
             raise
     
+    def set_dataset(
+        self,
+        dataset: EngineDataset,
+        source: str,
+        snapshot_version: Optional[str] = None
+    ):
+        """
+        Make a dataset the one requests use.
+        
+        Requests already holding the previous dataset finish on it; it is
+        freed once the last of them drops its reference. Cached base scores
+        are dropped. The stock and discount constraints are precompiled for
+        its catalog, and live flag updates newer than its products file are
+        applied to it (see src.catalog_feed).
+        
+        Args:
+            dataset: Dataset to serve
+            source: Where it came from ('csv' or 'snapshot')
+            snapshot_version: Snapshot version it was restored from
+        """
+        if dataset.catalog_mask is None:
+            dataset.catalog_mask = self.constraint_filter.compile(dataset.products)
+        dataset = self.live_catalog.restore(dataset)
+        self.base_scores.clear(dataset)
+        self.dataset = dataset
+        self.dataset_source = source
+        self.snapshot_version = snapshot_version
+    
+    def prepare_components(self, components: List[str]):
+        """
+        Build load-time state for additional components the loaded dataset lacks.
+        
+        load_data only builds the co-purchase index and factor model when their
+        configured weight is positive; callers scoring other weight
+        configurations (e.g. a weight grid) use this to add them afterwards.
+        The state is added to a copy of the dataset, which is then swapped in.
+        
+        Args:
+            components: Score components that will be computed
+        """
+        dataset = self.dataset
+        if dataset is None:
+            return
+        changes = {}
+        if 'copurchase' in components and dataset.copurchase is None:
+            changes['copurchase'] = self._load_copurchase(expand_table(dataset.transactions))
+        if 'factor_affinity' in components and dataset.factors is None:
+            changes['factors'] = self._load_factors(
+                dataset.products, expand_table(dataset.transactions),
+                expand_table(dataset.clickstream), dataset.interactions
+            )
+        if changes:
+            # Swapped in whole, like live updates: requests never see it half built
+            self.dataset = dataset.replace(**changes)
+    
+    def _load_copurchase(self, transactions: pd.DataFrame) -> CoPurchaseIndex:
+        """
+        Load the offline co-purchase index, or build it from the loaded transactions.
+        
+        Args:
+            transactions: Full transaction history
+            
+        Returns:
+            CoPurchaseIndex
+        """
+        index_path = self.config.get('copurchase', {}).get('index_path')
+        if index_path:
+            self.logger.info(f"Loading co-purchase index from {index_path}")
+            return CoPurchaseIndex.load(index_path)
+        return CoPurchaseIndex.build(transactions, self.config)
+    
+    def _load_factors(
+        self,
+        products: pd.DataFrame,
+        transactions: pd.DataFrame,
+        clickstream: pd.DataFrame,
+        interactions: Optional[InteractionMatrix]
+    ) -> FactorModel:
+        """
+        Load the offline factor model, or factorize the loaded interactions.
+        
+        Args:
+            products: Product catalog
+            transactions: Full transaction history
+            clickstream: Full clickstream
+            interactions: InteractionMatrix if already built
+            
+        Returns:
+            FactorModel
+        """
+        model_path = self.config.get('factor_model', {}).get('model_path')
+        if model_path:
+            self.logger.info(f"Loading factor model from {model_path}")
+            return FactorModel.load(model_path)
+        if interactions is None:
+            interactions = InteractionMatrix.build(products, transactions, clickstream, self.config)
+        return FactorModel.build(interactions, self.config)
+    
+    def current_dataset(
+        self,
+        products_path: str,
+        transactions_path: str,
+        clickstream_path: str,
+        allow_stale: bool = False
+    ) -> Optional[EngineDataset]:
+        """
+        Return the loaded dataset if it came from these files and they are unchanged.
+        
+        Args:
+            products_path: Path to products CSV
+            transactions_path: Path to transactions CSV
+            clickstream_path: Path to clickstream CSV
+            allow_stale: Also return it if the files changed since loading
+                (a background refresh will replace it)
+            
+        Returns:
+            The loaded EngineDataset, or None if the files need (re)loading
+        """
+        dataset = self.dataset
+        source_paths = tuple(
+            os.path.abspath(path) for path in (products_path, transactions_path, clickstream_path)
+        )
+        if dataset is None:
+            return None
+        if allow_stale and dataset.source_paths == source_paths:
+            return dataset
+        if dataset.is_current(source_paths):
+            return dataset
+        return None
+    
+    def save_snapshot(self, path: Optional[str] = None) -> str:
+        """
+        Checkpoint the loaded dataset and shown products history to disk.
+        
+        Args:
+            path: Snapshot directory (defaults to snapshot.path in the config)
+            
+        Returns:
+            Name of the written snapshot version
+        """
+        path = path or self.config.get('snapshot', {}).get('path')
+        if not path:
+            raise ValueError("No snapshot path given or configured (snapshot.path)")
+        if self.dataset is None:
+            raise ValueError("No dataset is loaded to snapshot")
+        return save_snapshot(
+            self.dataset, path, self.config,
+            shown_products=self.selector.shown_products,
+            keep_versions=self.config.get('snapshot', {}).get('keep_versions', 2)
+        )
+    
+    def restore_snapshot(self, path: Optional[str] = None) -> bool:
+        """
+        Restore the dataset and shown products history from a snapshot.
+        
+        Numeric state is memory-mapped from the snapshot files. Snapshots from
+        another format version or configuration, or (unless snapshot.shared)
+        taken before the source CSVs last changed, are ignored.
+        
+        Args:
+            path: Snapshot directory (defaults to snapshot.path in the config)
+            
+        Returns:
+            True if the snapshot was restored, False to start cold
+        """
+        path = path or self.config.get('snapshot', {}).get('path')
+        if not path:
+            return False
+        try:
+            dataset, shown_products, manifest = self.read_snapshot(path)
+        except (ValueError, OSError) as e:
+            self.logger.warning(f"Not restoring snapshot, starting cold: {e}")
+            return False
+        
+        self.set_dataset(dataset, 'snapshot', manifest['version'])
+        if shown_products:
+            self.selector.merge_shown_products(shown_products)
+        return True
+    
+    def read_snapshot(self, path: str) -> tuple:
+        """
+        Load a snapshot with this engine's snapshot options, without serving it.
+        
+        With snapshot.shared, string columns stay categoricals over the
+        mapped codes so worker processes share them, and the source CSVs are
+        not checked (the publisher rebuilds when they change).
+        
+        Args:
+            path: Snapshot directory
+            
+        Returns:
+            Tuple of (EngineDataset, shown products or None, manifest)
+        """
+        snapshot_config = self.config.get('snapshot', {})
+        shared = bool(snapshot_config.get('shared', False))
+        return load_snapshot(
+            path, self.config,
+            mmap=snapshot_config.get('mmap', True),
+            check_sources=not shared,
+            categorical=shared
+        )
+    
+    def _dataset_for(
+        self,
+        products: pd.DataFrame,
+        transactions: pd.DataFrame,
+        clickstream: pd.DataFrame
+    ) -> Optional[EngineDataset]:
+        """Return the loaded dataset if these are its tables, otherwise None."""
+        if self.dataset is not None and self.dataset.matches(products, transactions, clickstream):
+            return self.dataset
+        return None
+    
+    def _shard_selector(self, shown_products_path: str) -> ProductSelector:
+        """
+        Selector keeping this shard's shown products history in its own file.
+        
+        The shard number is recorded in the config, so snapshots of different
+        shards never match, and snapshot.path gets the same per-shard suffix
+        as the history file. The first time a shard starts, its history is
+        seeded with its customers' entries from the unsharded file.
+        
+        Args:
+            shown_products_path: Unsharded shown products file
+            
+        Returns:
+            ProductSelector for this shard
+        """
+        self.config.setdefault('sharding', {})['shard_id'] = self.shard.shard_id
+        snapshot_config = self.config.get('snapshot') or {}
+        if snapshot_config.get('path'):
+            snapshot_config['path'] = self.shard.path(snapshot_config['path'])
+        
+        shard_path = self.shard.path(shown_products_path)
+        seed = not Path(shard_path).exists() and Path(shown_products_path).exists()
+        selector = ProductSelector(self.config, shard_path)
+        if seed:
+            unsharded = ProductSelector(self.config, shown_products_path)
+            selector.merge_shown_products(self.shard.select(unsharded.shown_products))
+            selector.save_shown_products()
+            self.logger.info(
+                f"Seeded shown products of {len(selector.shown_products)} customers "
+                f"from {shown_products_path}"
+            )
+        return selector
+    
     def _load_config(self) -> Dict:
         """Load configuration from YAML file."""
         try:
@@ -235,6 +784,9 @@ def cli_main(engine: RecommendationEngine):
     # Check if data paths provided
     if len(sys.argv) < 4:
         print("Usage: python -m src.main <products.csv> <transactions.csv> <clickstream.csv> [customer_id]")
+        print("       python -m src.main batch <products.csv> <transactions.csv> <clickstream.csv> [options]")
+        print("       python -m src.main audience <products.csv> <transactions.csv> <clickstream.csv> "
+              "(--product ID | --category NAME) [options]")
         print("\nExample:")
         print("  python -m src.main data/products.csv data/transactions.csv data/clickstream.csv C001")
         return
@@ -285,10 +837,57 @@ class RecommendRequest(BaseModel):
     products_path: str
     transactions_path: str
     clickstream_path: str
+    deadline_ms: Optional[float] = None  # Latency budget; defaults to latency_budget.deadline_ms
+
+
+class EventsRequest(BaseModel):
+    transactions: List[Dict[str, Any]] = []
+    clickstream: List[Dict[str, Any]] = []
+
+
+class CatalogRequest(BaseModel):
+    products: List[Dict[str, Any]] = []  # product_id plus in_stock and/or is_discounted
+
+
+class AudienceRequest(BaseModel):
+    products_path: str
+    transactions_path: str
+    clickstream_path: str
+    product_id: Optional[str] = None
+    category: Optional[str] = None  # Instead of product_id
+    top_n: Optional[int] = None  # Defaults to audience.top_n
 
 
 def create_app() -> FastAPI:
-    app = FastAPI(title="Recommendation Engine API", version="1.0.0")
+    engine = RecommendationEngine('config/config.yaml')
+    ingestor = EventIngestor(engine, engine.config)
+    refresher = DatasetRefresher(engine, engine.config, ingestor=ingestor)
+    catalog_feed = CatalogFeed(engine, engine.config, ingestor=ingestor)
+    
+    snapshot_config = engine.config.get('snapshot', {})
+    # Workers of a snapshot publisher (e.g. uvicorn --workers) attach to its
+    # versions and never load CSVs or write snapshots themselves
+    shared = bool(snapshot_config.get('path') and snapshot_config.get('shared', False))
+    
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        if snapshot_config.get('path') and (shared or snapshot_config.get('restore_on_startup', True)):
+            engine.restore_snapshot()
+        ingestor.start()
+        refresher.start()
+        catalog_feed.start()
+        yield
+        catalog_feed.stop()
+        refresher.stop()
+        ingestor.stop()
+        if snapshot_config.get('path') and snapshot_config.get('save_on_shutdown', True) and not shared:
+            if engine.dataset is not None:
+                try:
+                    engine.save_snapshot()
+                except (ValueError, OSError) as e:
+                    engine.logger.error(f"Error saving snapshot on shutdown: {e}")
+    
+    app = FastAPI(title="Recommendation Engine API", version="1.0.0", lifespan=lifespan)
     app.add_middleware(
         CORSMiddleware,
         allow_origins=["*"],
@@ -297,36 +896,127 @@ def create_app() -> FastAPI:
         allow_headers=["*"],
     )
     
-    engine = RecommendationEngine('config/config.yaml')
+    def request_dataset(products_path: str, transactions_path: str, clickstream_path: str) -> EngineDataset:
+        # Reuse the loaded dataset (including ingested events) while its
+        # files are unchanged, or until the refresher replaces it; write
+        # pending events before any reload
+        dataset = engine.current_dataset(
+            products_path, transactions_path, clickstream_path,
+            allow_stale=refresher.enabled
+        )
+        if dataset is None and shared:
+            raise HTTPException(
+                status_code=503, detail="No published snapshot for these files yet"
+            )
+        if dataset is None:
+            ingestor.flush()
+            engine.load_data(
+                products_path=products_path,
+                transactions_path=transactions_path,
+                clickstream_path=clickstream_path
+            )
+            dataset = engine.dataset
+        return dataset
     
     @app.post("/recommend")
     def recommend(payload: RecommendRequest):
+        # The budget covers the whole request, including loading data
+        deadline_ms = payload.deadline_ms
+        if deadline_ms is None:
+            deadline_ms = engine.config.get('latency_budget', {}).get('deadline_ms')
+        budget = LatencyBudget.from_milliseconds(deadline_ms)
         try:
-            products, transactions, clickstream = engine.load_data(
-                products_path=payload.products_path,
-                transactions_path=payload.transactions_path,
-                clickstream_path=payload.clickstream_path
+            if engine.shard is not None:
+                engine.shard.check([payload.customer_id])
+            dataset = request_dataset(
+                payload.products_path, payload.transactions_path, payload.clickstream_path
             )
+            products, transactions, clickstream = dataset.as_tuple()
             rec = engine.recommend_product(
                 customer_id=payload.customer_id,
                 products=products,
                 transactions=transactions,
-                clickstream=clickstream
+                clickstream=clickstream,
+                budget=budget,
+                dataset=dataset
             )
             if not rec:
                 raise HTTPException(status_code=404, detail="No recommendation available")
             return rec
+        except HTTPException:
+            raise
+        except WrongShardError as e:
+            raise HTTPException(status_code=421, detail=str(e))
         except FileNotFoundError as e:
             raise HTTPException(status_code=400, detail=str(e))
         except Exception as e:
             raise HTTPException(status_code=500, detail=str(e))
     
+    @app.post("/audience")
+    def audience(payload: AudienceRequest):
+        try:
+            dataset = request_dataset(
+                payload.products_path, payload.transactions_path, payload.clickstream_path
+            )
+            return engine.select_audience(
+                product_id=payload.product_id,
+                category=payload.category,
+                top_n=payload.top_n,
+                dataset=dataset
+            )
+        except HTTPException:
+            raise
+        except (ValueError, FileNotFoundError) as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+    
+    @app.get("/ready")
+    def ready():
+        # Warm: a dataset is in memory and /recommend for its files skips loading
+        return {
+            'status': 'warm' if engine.dataset is not None else 'cold',
+            'source': engine.dataset_source,
+            'snapshot_version': engine.snapshot_version,
+            'pending_events': ingestor.pending_rows,
+            'last_refresh': refresher.last_refresh,
+            'retired_datasets': refresher.retired_datasets,
+            'base_scores': engine.base_scores.stats(),
+            'catalog_updates': engine.live_catalog.stats()
+        }
+    
+    @app.post("/events")
+    def events(payload: EventsRequest):
+        try:
+            return ingestor.ingest(payload.transactions, payload.clickstream)
+        except WrongShardError as e:
+            raise HTTPException(status_code=421, detail=str(e))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except RuntimeError as e:
+            raise HTTPException(status_code=409, detail=str(e))
+    
+    @app.post("/catalog")
+    def catalog(payload: CatalogRequest):
+        try:
+            return ingestor.update_catalog(payload.products)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except RuntimeError as e:
+            raise HTTPException(status_code=409, detail=str(e))
+    
     return app
 
 
 if __name__ == '__main__':
     import sys
-    if len(sys.argv) > 1:
+    if len(sys.argv) > 1 and sys.argv[1] == 'batch':
+        from src.batch import main as batch_main
+        batch_main(sys.argv[2:])
+    elif len(sys.argv) > 1 and sys.argv[1] == 'audience':
+        from src.audience import main as audience_main
+        audience_main(sys.argv[2:])
+    elif len(sys.argv) > 1:
         cli_main(RecommendationEngine('config/config.yaml'))
     else:
         app = create_app()
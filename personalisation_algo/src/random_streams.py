@@ -0,0 +1,40 @@
+"""
+Random Streams
+
+This module derives an independent numpy Generator for each random draw a
+request makes (exploration scores, the selector's weighted pick) from the
+configured seed, the customer ID and the stream name. Requests therefore
+never share mutable random state: concurrent requests cannot disturb each
+other, and with selection.random_seed set a customer's draws are the same
+whatever else is running or in which order customers are processed.
+"""
+
+import hashlib
+from typing import Optional
+
+import numpy as np
+
+
+def _stable_hash(value: str) -> int:
+    """64-bit hash of a string that is the same in every process."""
+    return int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def request_generator(seed: Optional[int], customer_id: str, stream: str) -> np.random.Generator:
+    """
+    Random generator for one stream of one request.
+
+    Args:
+        seed: Configured random seed, or None for fresh OS entropy
+        customer_id: Customer the request is for
+        stream: Name of the draw (e.g. 'exploration', 'selection'), so
+            different draws of the same request are independent
+
+    Returns:
+        numpy Generator owned by the caller
+    """
+    if seed is None:
+        return np.random.default_rng()
+    return np.random.default_rng(
+        np.random.SeedSequence([int(seed), _stable_hash(str(customer_id)), _stable_hash(stream)])
+    )
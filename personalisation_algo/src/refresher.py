@@ -0,0 +1,212 @@
+"""
+Dataset Refresher
+
+This module keeps the engine's dataset up to date without restarts or
+reloads on the request path. A background thread polls either the source
+CSV files of the loaded dataset or a snapshot directory. When they change,
+it builds a complete new dataset (tables and every load-time index) while
+requests keep using the current one, then swaps it in with a single
+reference assignment.
+
+Requests that started before the swap finish on the dataset they picked
+up; the old dataset is freed, and its memory released, when the last of
+them returns. Events ingested while a new dataset is being built are
+applied to it before the swap, so none are lost.
+"""
+
+import contextlib
+import logging
+import os
+import threading
+import time
+import weakref
+from typing import Dict, Optional
+
+from src.dataset import EngineDataset
+from src.snapshot import read_manifest
+
+
+REFRESH_SOURCES = ('files', 'snapshot')
+
+
+class DatasetRefresher:
+    """
+    Rebuild or restore the engine's dataset in the background and swap it in.
+    """
+
+    def __init__(self, engine, config: Dict, ingestor=None):
+        """
+        Initialize the refresher.
+
+        Args:
+            engine: RecommendationEngine whose dataset is refreshed
+            config: Configuration dictionary (uses the refresh and snapshot sections)
+            ingestor: EventIngestor of the engine, if events are ingested
+        """
+        refresh_config = config.get('refresh', {}) or {}
+        self.engine = engine
+        self.ingestor = ingestor
+        self.config = config
+        self.enabled = bool(refresh_config.get('enabled', False))
+        self.poll_interval = refresh_config.get('poll_interval_seconds', 30)
+        self.source = refresh_config.get('source', 'files')
+        self.save_snapshot = bool(refresh_config.get('save_snapshot', False))
+        self.snapshot_path = (config.get('snapshot', {}) or {}).get('path')
+        self.logger = logging.getLogger(__name__)
+
+        # Workers sharing a published snapshot always follow its new versions
+        if self.snapshot_path and (config.get('snapshot', {}) or {}).get('shared', False):
+            self.enabled = True
+            self.source = 'snapshot'
+
+        if self.source not in REFRESH_SOURCES:
+            raise ValueError(f"Unknown refresh.source '{self.source}', expected one of {REFRESH_SOURCES}")
+        if self.source == 'snapshot' and not self.snapshot_path:
+            raise ValueError("refresh.source 'snapshot' needs snapshot.path")
+
+        # Files to load when nothing is loaded yet
+        initial_paths = tuple(
+            refresh_config.get(key) for key in ('products_path', 'transactions_path', 'clickstream_path')
+        )
+        self.initial_paths = initial_paths if all(initial_paths) else None
+
+        self.last_refresh: Optional[float] = None
+        self._failed_version: Optional[str] = None
+        self._retired = weakref.WeakSet()
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def retired_datasets(self) -> int:
+        """Replaced datasets still held by in-flight requests."""
+        return len(self._retired)
+
+    def check(self) -> bool:
+        """
+        Refresh now if the watched source changed.
+
+        Returns:
+            True if a new dataset was swapped in
+        """
+        with self._refresh_lock:
+            if self.source == 'snapshot':
+                return self._refresh_from_snapshot()
+            return self._refresh_from_files()
+
+    def start(self):
+        """Start polling every poll_interval_seconds in the background (if enabled)."""
+        if not self.enabled or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='dataset-refresh', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop polling, waiting for a refresh in progress to finish."""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        # Check once right away so configured files load without waiting a period
+        while True:
+            try:
+                self.check()
+            except Exception as e:
+                self.logger.error(f"Error refreshing dataset: {e}", exc_info=True)
+            if self._stop.wait(self.poll_interval):
+                return
+
+    def _refresh_from_files(self) -> bool:
+        """Rebuild from the loaded dataset's CSV files if they changed."""
+        current = self.engine.dataset
+        if current is None:
+            if self.initial_paths is None:
+                return False
+            source_paths = tuple(os.path.abspath(path) for path in self.initial_paths)
+        elif current.source_paths is None or current.is_current(current.source_paths):
+            return False
+        else:
+            source_paths = current.source_paths
+
+        start = time.perf_counter()
+        with self._holding_files():
+            dataset = self.engine.build_dataset(*source_paths)
+            swapped = self._swap(dataset, 'csv')
+        if not swapped:
+            return False
+
+        self._retire(current)
+        self.logger.info(f"Refreshed dataset from {source_paths} in {time.perf_counter() - start:.2f}s")
+        if self.save_snapshot and self.snapshot_path:
+            self.engine.save_snapshot(self.snapshot_path)
+        return True
+
+    def _refresh_from_snapshot(self) -> bool:
+        """Restore the snapshot directory's current version if it is new."""
+        try:
+            version = read_manifest(self.snapshot_path)['version']
+        except ValueError:
+            return False
+        if version in (self.engine.snapshot_version, self._failed_version):
+            return False
+
+        current = self.engine.dataset
+        start = time.perf_counter()
+        with self._holding_files():
+            try:
+                dataset, _, manifest = self.engine.read_snapshot(self.snapshot_path)
+            except (ValueError, OSError) as e:
+                # Not retried until a newer version appears
+                self.logger.warning(f"Not refreshing from snapshot {version}: {e}")
+                self._failed_version = version
+                return False
+            swapped = self._swap(dataset, 'snapshot', manifest['version'])
+        if not swapped:
+            return False
+
+        self._retire(current)
+        self.logger.info(
+            f"Refreshed dataset from snapshot {manifest['version']} "
+            f"in {time.perf_counter() - start:.2f}s"
+        )
+        return True
+
+    def _holding_files(self):
+        """
+        Context in which ingested events are not flushed to the source files.
+
+        Pending events are flushed first, so the files read next hold every
+        event except those ingested during the rebuild, which _swap replays.
+        """
+        if self.ingestor is None:
+            return contextlib.nullcontext()
+        self.ingestor.flush()
+        return self.ingestor.hold_flush()
+
+    def _swap(self, dataset: EngineDataset, source: str, snapshot_version: Optional[str] = None) -> bool:
+        """Swap in a new dataset unless the engine moved on to other files meanwhile."""
+        previous = self.engine.dataset
+        if self.ingestor is not None:
+            swapped = self.ingestor.swap_dataset(dataset, source, snapshot_version)
+        else:
+            current = self.engine.dataset
+            swapped = current is None or current.source_paths == dataset.source_paths
+            if swapped:
+                self.engine.set_dataset(dataset, source, snapshot_version)
+        if not swapped:
+            self.logger.info("Engine switched to other files during refresh, discarding rebuilt dataset")
+            return False
+        # Events ingested during the rebuild replaced the dataset read at its start
+        self._retire(previous)
+        self.last_refresh = time.time()
+        return True
+
+    def _retire(self, dataset: Optional[EngineDataset]):
+        """Track a replaced dataset until in-flight requests release it."""
+        if dataset is None:
+            return
+        self._retired.add(dataset)
+        weakref.finalize(dataset, self.logger.debug, "Released replaced dataset")
@@ -0,0 +1,343 @@
+"""
+Replay Backtest
+
+This module replays historical traffic through the recommendation engine.
+Time is stepped from a start to an end time; at each step the customers
+active in the coming window are sent a request with current_time set to the
+step time, using only transactions and clickstream events before that time.
+A recommendation is a hit if the customer buys the recommended product
+within the evaluation horizon.
+
+The replay is incremental: tables are sorted once by (customer, time) so a
+customer's history up to any time is a positional slice, and popularity
+statistics are updated with each step's new transactions instead of being
+recomputed from the full prefix. Each request scores from a one-customer
+InteractionMatrix built from that customer's slice, without the base score
+cache (its entries hold for a day, and the history grows within one).
+
+Usage:
+    python -m src.replay <products.csv> <transactions.csv> <clickstream.csv>
+        [--start ISO] [--end ISO] [--step 1D] [--horizon-days 7]
+        [--max-customers-per-step 50] [--output replay.json]
+"""
+
+import argparse
+import json
+import logging
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src.base_scores import BaseScoreCache
+from src.dataset import EngineDataset
+from src.interaction_matrix import InteractionMatrix
+from src.rollup import read_table
+from src.schemas import CLICKSTREAM, PRODUCTS, TRANSACTIONS
+from src.scoring_engine import CORE_COMPONENTS, active_components
+from src.selector import ProductSelector
+
+
+class CustomerTimeline:
+    """
+    One table sorted by (customer, time) with per-customer prefix slicing.
+    """
+
+    def __init__(self, table: pd.DataFrame, time_column: str):
+        """
+        Sort the table and index each customer's block of rows.
+
+        Args:
+            table: Transactions or clickstream
+            time_column: Datetime column to order by
+        """
+        self.table = table.sort_values(['customer_id', time_column], kind='stable').reset_index(drop=True)
+        self.times = self.table[time_column].values
+        customer_codes, self.customer_ids = pd.factorize(self.table['customer_id'])
+        self.starts = np.searchsorted(customer_codes, np.arange(len(self.customer_ids)), side='left')
+        self.ends = np.searchsorted(customer_codes, np.arange(len(self.customer_ids)), side='right')
+        self.codes = {customer_id: code for code, customer_id in enumerate(self.customer_ids)}
+
+    def _bounds(self, customer_id: str) -> Tuple[int, int]:
+        code = self.codes.get(customer_id)
+        if code is None:
+            return 0, 0
+        return self.starts[code], self.ends[code]
+
+    def before(self, customer_id: str, cutoff: np.datetime64) -> pd.DataFrame:
+        """Customer rows strictly before cutoff."""
+        start, end = self._bounds(customer_id)
+        stop = start + np.searchsorted(self.times[start:end], cutoff, side='left')
+        return self.table.iloc[start:stop]
+
+    def between(self, customer_id: str, begin: np.datetime64, end_time: np.datetime64) -> pd.DataFrame:
+        """Customer rows in [begin, end_time)."""
+        start, end = self._bounds(customer_id)
+        times = self.times[start:end]
+        lo = start + np.searchsorted(times, begin, side='left')
+        hi = start + np.searchsorted(times, end_time, side='left')
+        return self.table.iloc[lo:hi]
+
+
+class RunningPopularity:
+    """
+    Popularity statistics (unique customers, total quantity) updated per step.
+    """
+
+    def __init__(self, transactions: pd.DataFrame):
+        """
+        Args:
+            transactions: All transactions; consumed in time order by advance()
+        """
+        self.transactions = transactions.sort_values('date_of_transaction', kind='stable').reset_index(drop=True)
+        self.times = self.transactions['date_of_transaction'].values
+        self.position = 0
+        self.seen_pairs: Set[Tuple[str, str]] = set()
+        self.stats = pd.DataFrame(
+            {'unique_customers': pd.Series(dtype=np.int64), 'total_quantity': pd.Series(dtype=np.int64)}
+        )
+
+    def advance(self, cutoff: np.datetime64) -> pd.DataFrame:
+        """
+        Include transactions before cutoff and return the current statistics.
+
+        Args:
+            cutoff: Exclusive upper bound on transaction time
+
+        Returns:
+            DataFrame indexed by product_id with unique_customers and total_quantity
+        """
+        stop = np.searchsorted(self.times, cutoff, side='left')
+        if stop > self.position:
+            new_rows = self.transactions.iloc[self.position:stop]
+            self.position = stop
+
+            quantities = new_rows.groupby('product_id')['quantity'].sum()
+            pairs = new_rows[['customer_id', 'product_id']].drop_duplicates()
+            new_pairs = [
+                (customer_id, product_id)
+                for customer_id, product_id in zip(pairs['customer_id'], pairs['product_id'])
+                if (customer_id, product_id) not in self.seen_pairs
+            ]
+            self.seen_pairs.update(new_pairs)
+            new_customers = pd.Series(
+                [product_id for _, product_id in new_pairs], dtype=object
+            ).value_counts()
+
+            update = pd.DataFrame({'unique_customers': new_customers, 'total_quantity': quantities}).fillna(0)
+            self.stats = self.stats.add(update, fill_value=0)
+
+        return self.stats
+
+
+def replay(
+    engine,
+    products: pd.DataFrame,
+    transactions: pd.DataFrame,
+    clickstream: pd.DataFrame,
+    start: datetime,
+    end: datetime,
+    step: str = '1D',
+    horizon_days: int = 7,
+    max_customers_per_step: Optional[int] = None
+) -> Dict:
+    """
+    Replay traffic between start and end and measure hit rate and latency.
+
+    Args:
+        engine: RecommendationEngine (while the replay runs, its selector is
+            redirected to a temporary shown-products file so the replay does
+            not touch live state, and its base score cache is replaced by a
+            disabled one; its own are put back afterwards)
+        products: Product catalog
+        transactions: Transactions with datetime date_of_transaction
+        clickstream: Clickstream with datetime event_timestamp
+        start: First step time
+        end: Replay stops before this time
+        step: Step length as a pandas offset alias (e.g. '1D', '6h')
+        horizon_days: A recommendation hits if bought within this many days
+        max_customers_per_step: Cap on requests per step (first active customers)
+
+    Returns:
+        Report dictionary with per-step and overall metrics
+    """
+    logger = logging.getLogger(__name__)
+    horizon = np.timedelta64(horizon_days, 'D')
+
+    extra_components = [
+        name for name in active_components(engine.scoring_engine.weights)
+        if name not in CORE_COMPONENTS
+    ]
+    if extra_components:
+        raise ValueError(
+            f"Replay only supports the core components; set weights of {extra_components} to 0"
+        )
+
+    transaction_timeline = CustomerTimeline(transactions, 'date_of_transaction')
+    click_timeline = CustomerTimeline(clickstream, 'event_timestamp')
+    popularity = RunningPopularity(transactions)
+
+    # Customers are active in a step if they have an event in that window
+    activity = pd.concat([
+        transactions[['customer_id']].assign(time=transactions['date_of_transaction']),
+        clickstream[['customer_id']].assign(time=clickstream['event_timestamp'])
+    ]).sort_values('time', kind='stable')
+    activity_times = activity['time'].values
+    activity_customers = activity['customer_id'].values
+
+    use_interactions = engine.config.get('interactions', {}).get('enabled', True)
+
+    # The engine's own state is put back when the replay ends
+    saved_selector, saved_base_scores, saved_dataset = engine.selector, engine.base_scores, engine.dataset
+    shown_products = Path(tempfile.mkdtemp()) / 'shown_products.json'
+    engine.selector = ProductSelector(engine.config, shown_products_path=str(shown_products))
+    # Datasets are swapped in per request below, bypassing set_dataset, and
+    # steps shorter than a day see new history under the same cache day
+    engine.base_scores = BaseScoreCache({'base_scores': {'enabled': False}})
+
+    try:
+        steps = []
+        latencies: List[float] = []
+        hits = 0
+        requests = 0
+        replay_start = time.perf_counter()
+
+        for step_time in pd.date_range(start, end, freq=step, inclusive='left'):
+            cutoff = np.datetime64(step_time)
+            window_end = np.datetime64(step_time + pd.tseries.frequencies.to_offset(step))
+            current_popularity = popularity.advance(cutoff)
+
+            lo, hi = np.searchsorted(activity_times, [cutoff, window_end], side='left')
+            active = pd.unique(activity_customers[lo:hi])
+            if max_customers_per_step is not None:
+                active = active[:max_customers_per_step]
+
+            step_latencies = []
+            step_hits = 0
+            step_start = time.perf_counter()
+            for customer_id in active:
+                customer_txns = transaction_timeline.before(customer_id, cutoff)
+                customer_clicks = click_timeline.before(customer_id, cutoff)
+
+                # Derived state is passed through the engine's dataset hook; a
+                # one-customer interaction matrix is far cheaper than the table path
+                interactions = None
+                if use_interactions:
+                    interactions = InteractionMatrix.build(
+                        products, customer_txns, customer_clicks, engine.config
+                    )
+                engine.dataset = EngineDataset(
+                    products, customer_txns, customer_clicks,
+                    popularity=current_popularity, interactions=interactions
+                )
+
+                request_start = time.perf_counter()
+                recommendation = engine.recommend_product(
+                    customer_id, products, customer_txns, customer_clicks,
+                    current_time=step_time.to_pydatetime()
+                )
+                step_latencies.append(time.perf_counter() - request_start)
+
+                if recommendation is not None:
+                    future = transaction_timeline.between(customer_id, cutoff, cutoff + horizon)
+                    if (future['product_id'] == recommendation['recommended_product_id']).any():
+                        step_hits += 1
+
+            steps.append({
+                'time': step_time.isoformat(),
+                'requests': len(active),
+                'hits': step_hits,
+                'hit_rate': step_hits / len(active) if len(active) else 0.0,
+                'p50_ms': float(np.percentile(step_latencies, 50) * 1000) if step_latencies else 0.0,
+                'p95_ms': float(np.percentile(step_latencies, 95) * 1000) if step_latencies else 0.0,
+                'seconds': time.perf_counter() - step_start
+            })
+            logger.info(
+                f"Replay step {step_time}: {len(active)} requests, {step_hits} hits, "
+                f"{steps[-1]['seconds']:.2f}s"
+            )
+            latencies.extend(step_latencies)
+            hits += step_hits
+            requests += len(active)
+
+        total_seconds = time.perf_counter() - replay_start
+    finally:
+        engine.selector, engine.base_scores, engine.dataset = saved_selector, saved_base_scores, saved_dataset
+
+    return {
+        'start': pd.Timestamp(start).isoformat(),
+        'end': pd.Timestamp(end).isoformat(),
+        'step': step,
+        'horizon_days': horizon_days,
+        'requests': requests,
+        'hits': hits,
+        'hit_rate': hits / requests if requests else 0.0,
+        'latency_ms': {
+            f'p{q}': float(np.percentile(latencies, q) * 1000) if latencies else 0.0
+            for q in (50, 95, 99)
+        },
+        'throughput_per_second': requests / total_seconds if total_seconds > 0 else 0.0,
+        'total_seconds': total_seconds,
+        'steps': steps
+    }
+
+
+def main():
+    """CLI entry point: replay historical traffic."""
+    from src.main import RecommendationEngine
+
+    parser = argparse.ArgumentParser(description="Replay historical traffic and backtest recommendations")
+    parser.add_argument('products')
+    parser.add_argument('transactions')
+    parser.add_argument('clickstream')
+    parser.add_argument('--config', default='config/config.yaml')
+    parser.add_argument('--start', default=None, help="First step (ISO); defaults to 30 days before the last event")
+    parser.add_argument('--end', default=None, help="End time (ISO); defaults to the day after the last event")
+    parser.add_argument('--step', default='1D', help="Step length (pandas offset alias)")
+    parser.add_argument('--horizon-days', type=int, default=7)
+    parser.add_argument('--max-customers-per-step', type=int, default=None)
+    parser.add_argument('--output', default=None, help="Write the report as JSON")
+    args = parser.parse_args()
+
+    engine = RecommendationEngine(args.config)
+    # One interaction matrix is built per request; keep its build log quiet
+    logging.getLogger('src.interaction_matrix').setLevel(logging.WARNING)
+
+    loader = engine.csv_loader
+    products = loader.read(args.products, PRODUCTS)
+    transactions = read_table(args.transactions, TRANSACTIONS, loader)
+    clickstream = read_table(args.clickstream, CLICKSTREAM, loader)
+
+    last_event = max(transactions['date_of_transaction'].max(), clickstream['event_timestamp'].max())
+    end = pd.Timestamp(args.end) if args.end else last_event.normalize() + pd.Timedelta(days=1)
+    start = pd.Timestamp(args.start) if args.start else end - pd.Timedelta(days=30)
+
+    report = replay(
+        engine, products, transactions, clickstream, start, end,
+        step=args.step, horizon_days=args.horizon_days,
+        max_customers_per_step=args.max_customers_per_step
+    )
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    print("\n" + "="*60)
+    print("REPLAY BACKTEST")
+    print("="*60)
+    print(f"Window: {report['start']} to {report['end']} in steps of {report['step']}")
+    print(f"Requests: {report['requests']}   Hits: {report['hits']}   "
+          f"Hit rate ({report['horizon_days']}d): {report['hit_rate']:.3f}")
+    latency = report['latency_ms']
+    print(f"Latency: p50 {latency['p50']:.1f} ms, p95 {latency['p95']:.1f} ms, p99 {latency['p99']:.1f} ms")
+    print(f"Throughput: {report['throughput_per_second']:.1f} requests/s "
+          f"({report['total_seconds']:.1f}s total)")
+    print("="*60)
+
+
+if __name__ == '__main__':
+    main()
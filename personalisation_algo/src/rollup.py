@@ -0,0 +1,383 @@
+"""
+Rollup Tier
+
+This module compacts old transactions and clickstream events into daily
+aggregate tables stored next to the raw CSV files:
+
+    transactions.csv  ->  transactions.rollup.csv
+        one row per (customer_id, product_id, product_category, store_id, day)
+        with summed quantity and total_amount
+    clickstream.csv   ->  clickstream.rollup.csv
+        one row per (customer_id, product_id, event_type, page_category, day);
+        session, event and device columns are dropped
+
+Every rollup row has a row_count column with the number of raw rows it
+stands for. read_table returns the rollup and the remaining raw rows as one
+table, and every consumer weights rows by row_counts, so scores match the
+uncompacted history:
+
+- Transaction dates are kept at day resolution, which is all scoring reads
+  (whole days since purchase, whole-day repurchase cycles, daily baskets).
+- A rolled-up click's event_timestamp is the effective time at which
+  row_count events carry the same exponentially decayed recency
+  (clickstream_intent.decay_hours) as the events it replaces, at any later
+  scoring time. It is exact while decay_hours is unchanged.
+
+Compaction moves rows from the raw file into the rollup; rolling up a day
+that already has rollup rows merges them.
+
+Usage:
+    python -m src.rollup compact <transactions.csv> <clickstream.csv> [--older-than-days 90]
+    python -m src.rollup info <transactions.csv> <clickstream.csv>
+"""
+
+import argparse
+import contextlib
+import io
+import logging
+import os
+import stat
+import tempfile
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+import yaml
+
+from src.schemas import CLICKSTREAM, TRANSACTIONS, CsvLoader, TableSchema, concat_tables
+
+try:
+    import fcntl
+    HAS_FCNTL = True
+except ImportError:
+    HAS_FCNTL = False
+
+
+# Number of raw rows a (rollup) row stands for
+ROW_COUNT = 'row_count'
+
+TRANSACTION_KEYS = ('customer_id', 'product_id', 'product_category', 'store_id')
+TRANSACTION_SUMS = ('quantity', 'total_amount')
+CLICK_KEYS = ('customer_id', 'product_id', 'event_type', 'page_category')
+
+# Rollup files keep a row count, and rolled-up click times have microseconds
+ROLLUP_SCHEMAS = {
+    'transactions': TRANSACTIONS.extend('transactions rollup', dtypes={ROW_COUNT: 'int64'}),
+    'clickstream': CLICKSTREAM.extend(
+        'clickstream rollup', dtypes={ROW_COUNT: 'int64'},
+        time_formats={'event_timestamp': '%Y-%m-%dT%H:%M:%S.%f'}
+    )
+}
+
+
+def rollup_path(path: str) -> str:
+    """Rollup file of a raw CSV file ('data/clickstream.csv' -> 'data/clickstream.rollup.csv')."""
+    root, ext = os.path.splitext(path)
+    return f"{root}.rollup{ext}"
+
+
+def row_counts(frame: pd.DataFrame) -> np.ndarray:
+    """
+    Raw rows each row of a table stands for (all ones without rollups).
+
+    Args:
+        frame: Transactions or clickstream table
+
+    Returns:
+        float64 array aligned with the rows
+    """
+    if ROW_COUNT in frame.columns:
+        return frame[ROW_COUNT].to_numpy(dtype=np.float64)
+    return np.ones(len(frame))
+
+
+def read_table(path: str, schema: TableSchema, loader: Optional[CsvLoader] = None) -> pd.DataFrame:
+    """
+    Read a raw CSV file together with its rollup, if it has one.
+
+    Args:
+        path: Raw CSV file
+        schema: TRANSACTIONS or CLICKSTREAM
+        loader: CsvLoader to read with (defaults to the default csv settings)
+
+    Returns:
+        DataFrame with rollup rows first; it has a row_count column only when
+        a rollup exists
+    """
+    loader = loader or CsvLoader({})
+    rollup_file = rollup_path(path)
+    if not os.path.exists(rollup_file):
+        return loader.read(path, schema)
+
+    rollup, raw = loader.gather(
+        lambda: loader.read(rollup_file, ROLLUP_SCHEMAS[schema.name]),
+        lambda: loader.read(path, schema)
+    )
+    raw[ROW_COUNT] = 1
+    if len(raw) == 0:
+        # Everything was rolled up; keep the rollup's column types
+        raw = raw.astype({column: rollup[column].dtype for column in raw.columns if column in rollup.columns})
+    table = concat_tables([rollup, raw])
+    table[ROW_COUNT] = table[ROW_COUNT].astype(np.int64)
+    return table[list(raw.columns)]
+
+
+def rollup_transactions(transactions: pd.DataFrame) -> pd.DataFrame:
+    """
+    Aggregate transactions per customer, product and day.
+
+    Args:
+        transactions: Raw or rollup rows with datetime date_of_transaction
+
+    Returns:
+        Rollup rows (date_of_transaction at midnight)
+    """
+    frame = transactions.assign(**{
+        'date_of_transaction': transactions['date_of_transaction'].dt.normalize(),
+        ROW_COUNT: row_counts(transactions).astype(np.int64)
+    })
+    keys = [column for column in TRANSACTION_KEYS if column in frame.columns] + ['date_of_transaction']
+    sums = [column for column in TRANSACTION_SUMS if column in frame.columns] + [ROW_COUNT]
+    rolled = frame.groupby(keys, dropna=False, sort=False)[sums].sum().reset_index()
+    return rolled[_rollup_columns(rolled, transactions)]
+
+
+def rollup_clicks(clickstream: pd.DataFrame, decay_hours: float) -> pd.DataFrame:
+    """
+    Aggregate clickstream events per customer, product, event type and day.
+
+    The rolled-up timestamp t of a group of n events at times t_i satisfies
+    n * exp(t / decay_hours) = sum(exp(t_i / decay_hours)), so the decayed
+    recency of the group is preserved.
+
+    Args:
+        clickstream: Raw or rollup rows with datetime event_timestamp
+        decay_hours: Recency decay of clickstream intent
+
+    Returns:
+        Rollup rows
+    """
+    frame = pd.DataFrame({
+        column: clickstream[column] for column in CLICK_KEYS if column in clickstream.columns
+    })
+    keys = list(frame.columns) + ['day']
+    frame['day'] = clickstream['event_timestamp'].dt.normalize()
+    frame[ROW_COUNT] = row_counts(clickstream)
+
+    # Group-wise log-mean-exp of the event times, relative to the latest one
+    frame['latest'] = clickstream['event_timestamp']
+    frame['latest'] = frame.groupby(keys, dropna=False, sort=False)['latest'].transform('max')
+    hours_before_latest = (frame['latest'] - clickstream['event_timestamp']) / pd.Timedelta(hours=1)
+    frame['decayed'] = frame[ROW_COUNT] * np.exp(-hours_before_latest.to_numpy() / decay_hours)
+
+    rolled = frame.groupby(keys, dropna=False, sort=False).agg(
+        latest=('latest', 'max'), decayed=('decayed', 'sum'), **{ROW_COUNT: (ROW_COUNT, 'sum')}
+    ).reset_index()
+    offset_hours = decay_hours * np.log(rolled['decayed'] / rolled[ROW_COUNT])
+    rolled['event_timestamp'] = (
+        rolled['latest'] + pd.to_timedelta(offset_hours, unit='h')
+    ).dt.round('us')
+    rolled[ROW_COUNT] = rolled[ROW_COUNT].astype(np.int64)
+    return rolled[_rollup_columns(rolled, clickstream)]
+
+
+def _rollup_columns(rolled: pd.DataFrame, source: pd.DataFrame) -> List[str]:
+    """Columns of the source table the rollup kept, in its order, then row_count."""
+    return [
+        column for column in source.columns if column in rolled.columns and column != ROW_COUNT
+    ] + [ROW_COUNT]
+
+
+class RollupCompactor:
+    """
+    Move old rows of the raw CSV files into their daily rollups.
+    """
+
+    def __init__(self, config: Dict):
+        """
+        Initialize the compactor.
+
+        Args:
+            config: Configuration dictionary (uses the rollup and clickstream_intent sections)
+        """
+        self.config = config
+        self.rollup_config = config.get('rollup', {}) or {}
+        self.decay_hours = config['clickstream_intent']['decay_hours']
+        self.loader = CsvLoader(config)
+        self.logger = logging.getLogger(__name__)
+
+    def cutoff(self, older_than_days: Optional[int] = None, now: Optional[datetime] = None) -> pd.Timestamp:
+        """
+        Start of the oldest day kept raw.
+
+        Whole days are rolled up, so the cutoff is a midnight.
+
+        Args:
+            older_than_days: Age beyond which rows are rolled up (defaults to
+                rollup.older_than_days)
+            now: Current time (defaults to now)
+
+        Returns:
+            Cutoff timestamp
+        """
+        if older_than_days is None:
+            older_than_days = self.rollup_config.get('older_than_days', 90)
+        if older_than_days < 1:
+            raise ValueError(f"rollup.older_than_days must be at least 1, got {older_than_days}")
+        now = pd.Timestamp(now if now is not None else datetime.now())
+        return (now - timedelta(days=older_than_days)).normalize()
+
+    def compact(
+        self,
+        transactions_path: str,
+        clickstream_path: str,
+        older_than_days: Optional[int] = None,
+        now: Optional[datetime] = None
+    ) -> Dict:
+        """
+        Roll up the rows of both files older than the cutoff.
+
+        Args:
+            transactions_path: Raw transactions CSV
+            clickstream_path: Raw clickstream CSV
+            older_than_days: Age beyond which rows are rolled up
+            now: Current time (defaults to now)
+
+        Returns:
+            Dictionary with the cutoff and per-table row counts
+        """
+        cutoff = self.cutoff(older_than_days, now)
+        report = {'cutoff': cutoff.isoformat()}
+        report['transactions'] = self._compact_file(
+            transactions_path, TRANSACTIONS, cutoff, rollup_transactions
+        )
+        report['clickstream'] = self._compact_file(
+            clickstream_path, CLICKSTREAM, cutoff,
+            lambda frame: rollup_clicks(frame, self.decay_hours)
+        )
+        return report
+
+    def _compact_file(self, path: str, schema: TableSchema, cutoff: pd.Timestamp, aggregate) -> Dict:
+        """
+        Move one file's rows before the cutoff into its rollup.
+
+        The raw file stays locked while it is rewritten, so event appends
+        (see src.events) wait and then append to the new file. The rollup is
+        replaced before the raw file; a reader in between sees rows twice,
+        but the raw file's new signature makes it reload.
+        """
+        rollup_file = rollup_path(path)
+        rollup_schema = ROLLUP_SCHEMAS[schema.name]
+        time_column, = schema.time_formats
+        with _locked(path):
+            # Strings as read, so kept rows are written back unchanged
+            raw = pd.read_csv(path, dtype=str, keep_default_na=False)
+            times = pd.to_datetime(raw[time_column])
+            old = (times < cutoff).to_numpy()
+            result = {'rolled_rows': int(old.sum()), 'raw_rows': int((~old).sum())}
+            if not old.any():
+                result['rollup_rows'] = _count_rows(rollup_file)
+                return result
+
+            rows = self.loader.read(io.StringIO(raw[old].to_csv(index=False)), schema)
+            rows[ROW_COUNT] = 1
+            if os.path.exists(rollup_file):
+                rows = concat_tables([self.loader.read(rollup_file, rollup_schema), rows])
+            rolled = aggregate(rows)
+            rolled = rolled.sort_values(time_column, kind='stable')
+            result['rollup_rows'] = len(rolled)
+
+            _write_atomic(rollup_file, rolled, date_format=rollup_schema.time_formats[time_column])
+            _write_atomic(path, raw[~old])
+
+        self.logger.info(
+            f"Rolled {result['rolled_rows']} rows of {path} before {cutoff.date()} into "
+            f"{rollup_file} ({result['rollup_rows']} rollup rows, {result['raw_rows']} raw rows kept)"
+        )
+        return result
+
+
+@contextlib.contextmanager
+def _locked(path: str):
+    """Hold the same exclusive lock on a file as event appends take."""
+    with open(path, 'a') as f:
+        if HAS_FCNTL:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        yield
+
+
+def _write_atomic(path: str, frame: pd.DataFrame, **to_csv_args):
+    """Write a CSV file through a temporary file and a rename."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(prefix='.rollup-', suffix='.csv', dir=directory)
+    try:
+        with os.fdopen(fd, 'w', newline='') as f:
+            frame.to_csv(f, index=False, **to_csv_args)
+        # mkstemp creates the file 0600; keep the mode the file had, or give
+        # a new file the mode open() would
+        os.chmod(temp_path, _file_mode(path))
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def _file_mode(path: str) -> int:
+    """Permission bits of an existing file, or the umask default for a new one."""
+    if os.path.exists(path):
+        return stat.S_IMODE(os.stat(path).st_mode)
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+def _count_rows(path: str) -> int:
+    """Data rows of a CSV file (0 if missing)."""
+    if not os.path.exists(path):
+        return 0
+    return len(pd.read_csv(path, usecols=[0]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Roll old events up into daily aggregates")
+    parser.add_argument('--config', default='config/config.yaml', help="Configuration file")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    compact_parser = subparsers.add_parser('compact', help="Move old rows into the rollups")
+    compact_parser.add_argument('transactions')
+    compact_parser.add_argument('clickstream')
+    compact_parser.add_argument('--older-than-days', type=int, default=None,
+                                help="Roll up rows older than this (default: rollup.older_than_days)")
+
+    info_parser = subparsers.add_parser('info', help="Show raw and rollup row counts")
+    info_parser.add_argument('transactions')
+    info_parser.add_argument('clickstream')
+
+    args = parser.parse_args()
+    with open(args.config, 'r') as f:
+        config = yaml.safe_load(f)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    if args.command == 'compact':
+        report = RollupCompactor(config).compact(
+            args.transactions, args.clickstream, older_than_days=args.older_than_days
+        )
+        print(f"Rolled up rows before {report['cutoff']}")
+        for name in ('transactions', 'clickstream'):
+            counts = report[name]
+            print(f"  {name}: {counts['rolled_rows']} rows rolled up, "
+                  f"{counts['rollup_rows']} rollup rows, {counts['raw_rows']} raw rows kept")
+    else:
+        loader = CsvLoader(config)
+        for schema, path in ((TRANSACTIONS, args.transactions), (CLICKSTREAM, args.clickstream)):
+            table = read_table(path, schema, loader)
+            counts = row_counts(table)
+            rolled = counts[:len(table) - _count_rows(path)]
+            print(f"{schema.name}: {_count_rows(path)} raw rows, {len(rolled)} rollup rows "
+                  f"standing for {int(rolled.sum())} events")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,273 @@
+"""
+Table Schemas
+
+This module declares the column types of the products, transactions and
+clickstream CSV files and reads them with those types instead of pandas'
+per-column inference:
+
+- ID and free-text columns are strings, counts and amounts are numeric and
+  the product flags are booleans.
+- Low-cardinality string columns (categories, stores, event and device
+  types) are read as categoricals, which keeps one copy of each distinct
+  value and a small integer code per row.
+- Timestamp columns are parsed with an exact format. A file that does not
+  match it (e.g. written by another tool) falls back to format inference,
+  with a warning.
+
+CsvLoader reads a file with the pyarrow parser when it is installed (it
+parses with several threads), otherwise with the C parser. It can read the
+three tables concurrently, and in chunked mode each chunk is converted to
+the compact types before the next one is parsed, so the raw strings of a
+large file are never all in memory at once. Columns a file has beyond its
+schema are read with inference, as before.
+"""
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+
+PARSER_ENGINES = ('auto', 'pyarrow', 'c')
+
+
+class TableSchema:
+    """
+    Declared column types of one CSV table.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        dtypes: Dict[str, str],
+        time_formats: Optional[Dict[str, str]] = None,
+        categorical: Tuple[str, ...] = ()
+    ):
+        """
+        Initialize the schema.
+
+        Args:
+            name: Table name, used in messages
+            dtypes: Column name to pandas dtype, for non-timestamp columns
+            time_formats: Timestamp column name to its strptime format
+            categorical: String columns to read as categoricals
+        """
+        self.name = name
+        self.dtypes = dict(dtypes)
+        self.time_formats = dict(time_formats or {})
+        self.categorical = tuple(categorical)
+
+    def extend(
+        self,
+        name: str,
+        dtypes: Optional[Dict[str, str]] = None,
+        time_formats: Optional[Dict[str, str]] = None
+    ) -> 'TableSchema':
+        """
+        Schema with extra columns or different timestamp formats.
+
+        Args:
+            name: Name of the new schema
+            dtypes: Additional (or replaced) column dtypes
+            time_formats: Replaced timestamp formats
+
+        Returns:
+            New TableSchema
+        """
+        return TableSchema(
+            name,
+            {**self.dtypes, **(dtypes or {})},
+            {**self.time_formats, **(time_formats or {})},
+            self.categorical
+        )
+
+    def read_dtypes(self, categorical: bool = True) -> Dict[str, str]:
+        """
+        dtype argument for read_csv: timestamps are read as strings and
+        parsed afterwards.
+
+        Args:
+            categorical: Read the categorical columns as categoricals
+
+        Returns:
+            Column name to dtype
+        """
+        dtypes = dict(self.dtypes)
+        dtypes.update({column: 'str' for column in self.time_formats})
+        if categorical:
+            dtypes.update({column: 'category' for column in self.categorical})
+        return dtypes
+
+
+PRODUCTS = TableSchema('products', {
+    'product_id': 'str',
+    'product_name': 'str',
+    'product_category': 'str',
+    'is_discounted': 'bool',
+    'in_stock': 'bool',
+    'price': 'float64'
+})
+
+TRANSACTIONS = TableSchema('transactions', {
+    'customer_id': 'str',
+    'product_id': 'str',
+    'quantity': 'int64',
+    'product_category': 'str',
+    'total_amount': 'float64',
+    'store_id': 'str'
+}, time_formats={
+    'date_of_transaction': '%Y-%m-%d'
+}, categorical=('product_category', 'store_id'))
+
+CLICKSTREAM = TableSchema('clickstream', {
+    'customer_id': 'str',
+    'session_id': 'str',
+    'event_id': 'str',
+    'event_type': 'str',
+    'page_category': 'str',
+    'device_type': 'str',
+    'product_id': 'str'
+}, time_formats={
+    'event_timestamp': '%Y-%m-%dT%H:%M:%S'
+}, categorical=('event_type', 'page_category', 'device_type'))
+
+
+def concat_tables(frames: List[pd.DataFrame]) -> pd.DataFrame:
+    """
+    Concatenate tables, keeping categorical columns categorical.
+
+    pd.concat falls back to object (or string) columns when categoricals
+    have different categories, so each categorical column is first recoded
+    to the sorted union of the categories and of the other frames' values.
+
+    Args:
+        frames: Tables with the same columns
+
+    Returns:
+        Concatenated table with a fresh RangeIndex
+    """
+    frames = list(frames)
+    if len(frames) == 1:
+        return frames[0].reset_index(drop=True)
+    for column in frames[0].columns:
+        series = [frame[column] for frame in frames if column in frame.columns]
+        if not any(isinstance(values.dtype, pd.CategoricalDtype) for values in series):
+            continue
+        categories = pd.Index([])
+        for values in series:
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                categories = categories.union(values.cat.categories)
+            else:
+                categories = categories.union(pd.Index(values.dropna().unique()))
+        dtype = pd.CategoricalDtype(categories)
+        frames = [
+            frame.assign(**{column: frame[column].astype(dtype)})
+            if column in frame.columns and frame[column].dtype != dtype else frame
+            for frame in frames
+        ]
+    return pd.concat(frames, ignore_index=True)
+
+
+class CsvLoader:
+    """
+    Read CSV tables with their declared schemas.
+    """
+
+    def __init__(self, config: Dict):
+        """
+        Initialize the loader.
+
+        Args:
+            config: Configuration dictionary (uses the csv section)
+        """
+        self.logger = logging.getLogger(__name__)
+        csv_config = config.get('csv', {}) or {}
+
+        engine = csv_config.get('engine', 'auto')
+        if engine not in PARSER_ENGINES:
+            raise ValueError(f"Unknown csv.engine '{engine}', expected one of {PARSER_ENGINES}")
+        if engine == 'pyarrow' and not HAS_PYARROW:
+            self.logger.warning("csv.engine is pyarrow but pyarrow is not installed; using the C parser")
+        self.engine = 'pyarrow' if engine != 'c' and HAS_PYARROW else 'c'
+
+        self.concurrent = csv_config.get('concurrent', True)
+        self.chunksize = csv_config.get('chunksize')
+        self.categorical = csv_config.get('categorical', True)
+
+    def read(self, path: str, schema: TableSchema) -> pd.DataFrame:
+        """
+        Read one CSV file.
+
+        Args:
+            path: CSV file
+            schema: Declared column types of the file
+
+        Returns:
+            DataFrame with typed columns and parsed timestamps
+
+        Raises:
+            ValueError: If a column cannot be read as its declared type
+        """
+        try:
+            if self.chunksize:
+                # The pyarrow parser has no chunked mode
+                chunks = [
+                    self._parse_times(chunk, schema, path)
+                    for chunk in pd.read_csv(
+                        path, dtype=schema.read_dtypes(self.categorical), chunksize=int(self.chunksize)
+                    )
+                ]
+                if chunks:
+                    return concat_tables(chunks)
+                frame = pd.read_csv(path, dtype=schema.read_dtypes(self.categorical))
+            elif self.engine == 'pyarrow':
+                frame = pd.read_csv(path, dtype=schema.read_dtypes(categorical=False), engine='pyarrow')
+                if self.categorical:
+                    frame = frame.astype({
+                        column: 'category' for column in schema.categorical if column in frame.columns
+                    })
+            else:
+                frame = pd.read_csv(path, dtype=schema.read_dtypes(self.categorical))
+        except (ValueError, TypeError) as e:
+            raise ValueError(f"{path} does not match the {schema.name} schema: {e}")
+        return self._parse_times(frame, schema, path)
+
+    def gather(self, *readers: Callable[[], pd.DataFrame]) -> List[pd.DataFrame]:
+        """
+        Run several reads, concurrently unless csv.concurrent is off.
+
+        Parsing releases the GIL for much of its work, so files read on
+        separate threads overlap.
+
+        Args:
+            *readers: Functions that each read and return one table
+
+        Returns:
+            The tables, in the order of readers
+        """
+        if not self.concurrent or len(readers) < 2:
+            return [reader() for reader in readers]
+        with ThreadPoolExecutor(max_workers=len(readers), thread_name_prefix='csv') as pool:
+            futures = [pool.submit(reader) for reader in readers]
+            return [future.result() for future in futures]
+
+    def _parse_times(self, frame: pd.DataFrame, schema: TableSchema, path: str) -> pd.DataFrame:
+        """Parse the timestamp columns with their formats, inferring where they do not match."""
+        for column, time_format in schema.time_formats.items():
+            if column not in frame.columns:
+                continue
+            try:
+                frame[column] = pd.to_datetime(frame[column], format=time_format)
+            except ValueError:
+                self.logger.warning(
+                    f"{column} in {path} does not match '{time_format}'; inferring the format"
+                )
+                frame[column] = pd.to_datetime(frame[column])
+        return frame
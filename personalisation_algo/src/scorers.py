@@ -0,0 +1,261 @@
+"""
+Scorer Registry
+
+This module holds the registry of score components. Each scorer declares
+the request inputs it reads (e.g. the customer's transactions, the
+interaction matrix, global popularity); the scoring engine runs only the
+scorers with a positive weight and resolves only the inputs they declare,
+each at most once per request.
+
+Adding a signal is a matter of registering a scorer (and, if it needs a new
+derived input, an input resolver) from a module listed under
+scorer_plugins in the config:
+
+    from src.scorers import Scorer, register_scorer
+
+    def score_margin(engine, products, inputs):
+        return products['margin'] / products['margin'].max()
+
+    register_scorer(Scorer('margin', inputs=(), compute=score_margin))
+"""
+
+import threading
+from typing import Callable, Dict, Iterator, List, Mapping, Optional, Tuple
+
+import pandas as pd
+
+from src.compact import expand_table
+
+
+# Inputs supplied by the caller of score_products for every request
+REQUEST_INPUTS = (
+    'customer_id',
+    'transactions',
+    'clickstream',
+    'current_time',
+    'history_summary',
+    'popularity',
+    'interactions',
+    'copurchase',
+    'factors'
+)
+
+
+class Scorer:
+    """
+    One score component and the inputs it reads.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        inputs: Tuple[str, ...],
+        compute: Callable,
+        sparse_inputs: Optional[Tuple[str, ...]] = None,
+        sparse_compute: Optional[Callable] = None,
+        budgeted: bool = True
+    ):
+        """
+        Define a scorer.
+
+        Args:
+            name: Component name, as used in scoring_weights
+            inputs: Names of the inputs compute reads
+            compute: Callable (engine, products, inputs) -> Series of scores
+                indexed like products
+            sparse_inputs: Inputs of sparse_compute
+            sparse_compute: Optional variant used when an InteractionMatrix is
+                available, reading the customer's history from its rows
+            budgeted: Whether the component may be skipped to meet a latency budget
+        """
+        self.name = name
+        self.inputs = tuple(inputs)
+        self.compute = compute
+        self.sparse_inputs = tuple(sparse_inputs or ())
+        self.sparse_compute = sparse_compute
+        self.budgeted = budgeted
+
+    @property
+    def reads_customer(self) -> bool:
+        """
+        Whether the scores may depend on the customer being scored.
+
+        Derived inputs (e.g. customer_transactions) are assumed to.
+        """
+        return any(
+            name == 'customer_id' or name not in REQUEST_INPUTS
+            for name in self.inputs + self.sparse_inputs
+        )
+
+    def variant(self, context: 'ScoringContext') -> Tuple[Callable, Tuple[str, ...]]:
+        """
+        Pick the compute function and declared inputs for a request.
+
+        Args:
+            context: Inputs of the request being scored
+
+        Returns:
+            Tuple of (compute function, input names)
+        """
+        if self.sparse_compute is not None and context.get('interactions') is not None:
+            return self.sparse_compute, self.sparse_inputs
+        return self.compute, self.inputs
+
+
+_SCORERS: Dict[str, Scorer] = {}
+_INPUT_RESOLVERS: Dict[str, Callable] = {}
+
+
+def register_scorer(scorer: Scorer, replace: bool = False) -> Scorer:
+    """
+    Add a scorer to the registry.
+
+    Args:
+        scorer: Scorer to register
+        replace: Allow replacing a scorer registered under the same name
+
+    Returns:
+        The registered scorer
+    """
+    if scorer.name in _SCORERS and not replace:
+        raise ValueError(f"Scorer '{scorer.name}' is already registered")
+    _SCORERS[scorer.name] = scorer
+    return scorer
+
+
+def register_input(name: str, resolver: Callable, replace: bool = False):
+    """
+    Add a derived input that scorers can declare.
+
+    Args:
+        name: Input name
+        resolver: Callable (context) -> value, run at most once per request
+        replace: Allow replacing a resolver registered under the same name
+    """
+    if name in REQUEST_INPUTS or (name in _INPUT_RESOLVERS and not replace):
+        raise ValueError(f"Scorer input '{name}' is already defined")
+    _INPUT_RESOLVERS[name] = resolver
+
+
+def get_scorer(name: str) -> Scorer:
+    """
+    Look up a registered scorer.
+
+    Args:
+        name: Component name
+
+    Returns:
+        The registered Scorer
+    """
+    if name not in _SCORERS:
+        raise ValueError(
+            f"Unknown score component '{name}'; registered: {registered_scorers()}"
+        )
+    return _SCORERS[name]
+
+
+def registered_scorers() -> List[str]:
+    """Names of all registered scorers, in registration (and computation) order."""
+    return list(_SCORERS)
+
+
+class ScorerInputs(Mapping):
+    """
+    Read-only view of a request's inputs restricted to a scorer's declaration.
+
+    Values are resolved on first access, so a declared input a scorer does
+    not end up reading is never computed.
+    """
+
+    def __init__(self, context: 'ScoringContext', names: Tuple[str, ...], scorer: str):
+        self._context = context
+        self._names = names
+        self._scorer = scorer
+
+    def __getitem__(self, name: str):
+        if name not in self._names:
+            raise KeyError(f"Scorer '{self._scorer}' did not declare input '{name}'")
+        return self._context.get(name)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._names)
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+
+class ScoringContext:
+    """
+    Inputs for scoring one customer, with derived inputs cached on first use.
+
+    Safe to share between the threads scoring one request: each derived
+    input is resolved by exactly one thread while the others wait for it.
+    """
+
+    def __init__(self, **values):
+        """
+        Initialize the context.
+
+        Args:
+            **values: Request inputs (see REQUEST_INPUTS)
+        """
+        unknown = [name for name in values if name not in REQUEST_INPUTS]
+        if unknown:
+            raise ValueError(f"Unknown request inputs: {unknown}")
+        self._values = {name: None for name in REQUEST_INPUTS}
+        self._values.update(values)
+        self._lock = threading.Lock()
+        self._input_locks: Dict[str, threading.Lock] = {}
+
+    def get(self, name: str):
+        """
+        Value of an input, resolving and caching derived inputs.
+
+        Args:
+            name: Input name
+
+        Returns:
+            The input's value
+        """
+        if name in self._values:
+            return self._values[name]
+        resolver = _INPUT_RESOLVERS.get(name)
+        if resolver is None:
+            raise ValueError(f"Unknown scorer input '{name}'")
+        with self._lock:
+            input_lock = self._input_locks.setdefault(name, threading.Lock())
+        with input_lock:
+            if name not in self._values:
+                self._values[name] = resolver(self)
+        return self._values[name]
+
+    def inputs_for(self, scorer: Scorer) -> Tuple[Callable, ScorerInputs]:
+        """
+        Compute function and input view for a scorer on this request.
+
+        Args:
+            scorer: Scorer about to run
+
+        Returns:
+            Tuple of (compute function, ScorerInputs)
+        """
+        compute, names = scorer.variant(self)
+        return compute, ScorerInputs(self, names, scorer.name)
+
+
+def _customer_transactions(context: ScoringContext) -> pd.DataFrame:
+    transactions = context.get('transactions')
+    return expand_table(
+        transactions[transactions['customer_id'] == context.get('customer_id')].copy()
+    )
+
+
+def _customer_clicks(context: ScoringContext) -> pd.DataFrame:
+    clickstream = context.get('clickstream')
+    return expand_table(
+        clickstream[clickstream['customer_id'] == context.get('customer_id')].copy()
+    )
+
+
+register_input('customer_transactions', _customer_transactions)
+register_input('customer_clicks', _customer_clicks)
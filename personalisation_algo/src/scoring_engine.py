@@ -8,8 +8,78 @@ to score products for recommendation.
 import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+import importlib
 import logging
+import time
+
+from src.sketches import ProductPopularitySketch
+from src.copurchase import CoPurchaseIndex
+from src.base_scores import SHARED
+from src.compact import expand_table
+from src.rollup import row_counts
+from src.interaction_matrix import InteractionMatrix, gather, to_epoch_seconds, SECONDS_PER_DAY
+from src.factor_model import FactorModel
+from src.random_streams import request_generator
+from src.scorers import Scorer, ScoringContext, get_scorer, register_scorer, registered_scorers
+
+
+# Components always reported; additional components (e.g. copurchase,
+# factor_affinity) are reported only when their weight is positive
+CORE_COMPONENTS = [
+    'category_affinity',
+    'repurchase_likelihood',
+    'clickstream_intent',
+    'product_popularity',
+    'exploration'
+]
+
+
+def active_components(weights: Dict[str, float]) -> List[str]:
+    """
+    Score components contributing to the final score.
+    
+    Args:
+        weights: Scoring weights by component name
+        
+    Returns:
+        Core components followed by additional components with positive weight
+    """
+    return CORE_COMPONENTS + [
+        name for name, weight in weights.items()
+        if name not in CORE_COMPONENTS and weight > 0
+    ]
+
+
+def weighted_components(weights: Dict[str, float]) -> List[str]:
+    """
+    Score components that need computing for a weight configuration.
+    
+    Args:
+        weights: Scoring weights by component name
+        
+    Returns:
+        Registered components with positive weight, in computation order
+    """
+    return [name for name in registered_scorers() if weights.get(name, 0.0) > 0]
+
+
+def grid_components(weight_grid: Dict[str, Dict[str, float]]) -> List[str]:
+    """
+    Components needed to evaluate every configuration of a weight grid.
+    
+    Args:
+        weight_grid: Scoring weights by configuration name
+        
+    Returns:
+        Components with a positive weight in some configuration, in
+        computation order
+    """
+    needed = set()
+    for weights in weight_grid.values():
+        needed.update(weighted_components(weights))
+    return [name for name in registered_scorers() if name in needed]
 
 
 class ProductScoringEngine:
@@ -29,6 +99,21 @@ class ProductScoringEngine:
         self.weights = config['scoring_weights']
         self.logger = logging.getLogger(__name__)
         
+        # Modules that register additional scorers on import
+        for module in config.get('scorer_plugins') or []:
+            importlib.import_module(module)
+        for name in self.weights:
+            get_scorer(name)
+        
+        # Running average duration of each budgeted component (seconds)
+        self._component_seconds: Dict[str, float] = {}
+        
+        # Thread pool shared by all requests, created on first parallel use
+        parallel_config = config.get('parallel_scoring', {})
+        self.parallel = parallel_config.get('enabled', False)
+        self.max_workers = parallel_config.get('max_workers', 4)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        
         # Validate weights sum to 1.0
         weight_sum = sum(self.weights.values())
         if not (0.99 <= weight_sum <= 1.01):  # Allow small floating point error
@@ -40,10 +125,26 @@ class ProductScoringEngine:
         products: pd.DataFrame,
         transactions: pd.DataFrame,
         clickstream: pd.DataFrame,
-        current_time: datetime = None
+        current_time: datetime = None,
+        history_summary=None,
+        popularity: pd.DataFrame = None,
+        interactions=None,
+        copurchase=None,
+        factors=None,
+        components: List[str] = None,
+        budget=None,
+        timings: Optional[Dict[str, float]] = None,
+        base_scores=None
     ) -> pd.DataFrame:
         """
-        Score all products for a given customer using all components.
+        Score all products for a given customer.
+        
+        Only the components being computed run, and only the inputs their
+        scorers declare are derived (see src.scorers). Core components that are
+        not computed are reported as 0.0. With parallel_scoring enabled the
+        components run concurrently on a shared thread pool; each one only
+        reads the request inputs, so the scores do not depend on the order
+        they finish in.
         
         Args:
             customer_id: Customer ID to score products for
@@ -51,6 +152,22 @@ class ProductScoringEngine:
             transactions: Transaction history DataFrame
             clickstream: Clickstream data DataFrame
             current_time: Current timestamp (defaults to now)
+            history_summary: Optional HistorySummary of rows pruned at load time
+            popularity: Optional precomputed popularity stats (see compute_popularity)
+            interactions: Optional InteractionMatrix; when given, customer history
+                is read from its sparse rows instead of the tables
+            copurchase: Optional prebuilt CoPurchaseIndex for the copurchase component
+            factors: Optional prebuilt FactorModel for the factor_affinity component
+            components: Components to compute (defaults to the components with
+                positive configured weight)
+            budget: Optional LatencyBudget; customer-history and additional
+                components that do not fit in the remaining time score 0.0
+                and are recorded in budget.degraded
+            timings: Optional dictionary to fill with each computed
+                component's duration in seconds
+            base_scores: Optional BaseScores of the dataset being read; the
+                components it caches are read from it where present and only
+                the rest are computed (see src.base_scores)
             
         Returns:
             DataFrame with products and their scores
@@ -58,50 +175,333 @@ class ProductScoringEngine:
         if current_time is None:
             current_time = datetime.now()
             
-        # Filter customer data
-        customer_txns = transactions[transactions['customer_id'] == customer_id].copy()
-        customer_clicks = clickstream[clickstream['customer_id'] == customer_id].copy()
-        
         # Initialize scores DataFrame
         scored_products = products.copy()
         
         # Calculate each scoring component
         self.logger.debug(f"Scoring {len(scored_products)} products for customer {customer_id}")
         
-        scored_products['category_affinity'] = self._score_category_affinity(
-            scored_products, customer_txns, current_time
+        if components is None:
+            components = weighted_components(self.weights)
+        context = ScoringContext(
+            customer_id=customer_id,
+            transactions=transactions,
+            clickstream=clickstream,
+            current_time=current_time,
+            history_summary=history_summary,
+            popularity=popularity,
+            interactions=interactions,
+            copurchase=copurchase,
+            factors=factors
         )
         
-        scored_products['repurchase_likelihood'] = self._score_repurchase_likelihood(
-            scored_products, customer_txns, current_time
+        index = scored_products.index
+        scorers = [get_scorer(name) for name in registered_scorers() if name in components]
+        scores = {}
+        if base_scores is not None:
+            scores = self._cached_scores(base_scores, scorers, scored_products, context, budget, timings)
+            scorers = [scorer for scorer in scorers if scorer.name not in scores]
+        scores.update(self._run_scorers(scorers, scored_products, context, budget, timings))
+        
+        # Columns are added after every component has run so scorers never
+        # see a frame that is being modified, and all at once: with cached
+        # base scores, assembling the frame is most of a request's work
+        columns = {}
+        for name in registered_scorers():
+            if name in scores:
+                values = scores[name]
+                if not values.index.equals(index):
+                    values = values.reindex(index)
+                columns[name] = values.to_numpy()
+            elif name in CORE_COMPONENTS:
+                # Reported but unweighted: not worth computing
+                columns[name] = np.zeros(len(index))
+        
+        # Calculate final weighted score
+        columns['final_score'] = sum(
+            self.weights.get(name, 0.0) * columns[name]
+            for name in active_components(self.weights)
         )
         
-        scored_products['clickstream_intent'] = self._score_clickstream_intent(
-            scored_products, customer_clicks, current_time
+        return pd.concat([scored_products, pd.DataFrame(columns, index=index)], axis=1)
+    
+    def score_weight_grid(
+        self,
+        scored_products: pd.DataFrame,
+        weight_grid: Dict[str, Dict[str, float]]
+    ) -> pd.DataFrame:
+        """
+        Final scores for many weight configurations from one scoring pass.
+        
+        final_score is linear in the component columns, so stacking them into
+        a products x components matrix and multiplying by a components x K
+        weight matrix gives all K final scores at once.
+        
+        Args:
+            scored_products: Output of score_products, computed with every
+                component any configuration uses
+            weight_grid: Scoring weights by configuration name
+            
+        Returns:
+            DataFrame of final scores, one column per configuration
+        """
+        components = grid_components(weight_grid)
+        missing = [name for name in components if name not in scored_products.columns]
+        if missing:
+            raise ValueError(f"Scored products are missing components: {missing}")
+        
+        component_matrix = scored_products[components].to_numpy(dtype=np.float64)
+        weight_matrix = np.array([
+            [weights.get(name, 0.0) for weights in weight_grid.values()]
+            for name in components
+        ])
+        return pd.DataFrame(
+            component_matrix @ weight_matrix,
+            index=scored_products.index,
+            columns=list(weight_grid.keys())
         )
+    
+    def _run_scorers(
+        self,
+        scorers: List[Scorer],
+        products: pd.DataFrame,
+        context: ScoringContext,
+        budget=None,
+        timings: Optional[Dict[str, float]] = None
+    ) -> Dict[str, pd.Series]:
+        """
+        Compute several components, on the shared thread pool if parallel
+        scoring is enabled.
+        
+        Args:
+            scorers: Scorers to run
+            products: Products being scored
+            context: Inputs of the request
+            budget: Optional LatencyBudget
+            timings: Optional dictionary to record durations in
+            
+        Returns:
+            Component scores by name
+        """
+        if self.parallel and len(scorers) > 1:
+            futures = {
+                scorer.name: self._get_executor().submit(
+                    self._run_scorer, scorer, products, context, budget, timings
+                )
+                for scorer in scorers
+            }
+            return {name: future.result() for name, future in futures.items()}
+        return {
+            scorer.name: self._run_scorer(scorer, products, context, budget, timings)
+            for scorer in scorers
+        }
+    
+    def _cached_scores(
+        self,
+        base_scores,
+        scorers: List[Scorer],
+        products: pd.DataFrame,
+        context: ScoringContext,
+        budget=None,
+        timings: Optional[Dict[str, float]] = None
+    ) -> Dict[str, pd.Series]:
+        """
+        Components served by the base score cache.
+        
+        Rows the cache lacks are computed (only those rows) and stored,
+        unless the latency budget skipped one of the components.
+        
+        Args:
+            base_scores: BaseScores of the dataset being read
+            scorers: Scorers of the request
+            products: Products being scored
+            context: Inputs of the request
+            budget: Optional LatencyBudget
+            timings: Optional dictionary to record durations in
+            
+        Returns:
+            Component scores by name, for the cached components
+        """
+        cached = base_scores.components([scorer.name for scorer in scorers])
+        day = pd.Timestamp(context.get('current_time')).normalize()
+        customer_id = context.get('customer_id')
+        
+        scores = {}
+        for shared in (True, False):
+            group = [
+                scorer for scorer in scorers
+                if scorer.name in cached and scorer.reads_customer != shared
+            ]
+            if not group:
+                continue
+            names = tuple(scorer.name for scorer in group)
+            key = SHARED if shared else customer_id
+            values, missing = base_scores.lookup(key, names, products.index, day)
+            if missing.any():
+                degraded = len(budget.degraded) if budget is not None else 0
+                computed = self._run_scorers(
+                    group, products[missing], context, budget, timings
+                )
+                labels = products.index[missing]
+                rows = np.column_stack([
+                    computed[name].reindex(labels).to_numpy(dtype=np.float64) for name in names
+                ])
+                values[missing] = rows
+                if budget is None or len(budget.degraded) == degraded:
+                    base_scores.store(key, names, labels, rows, day)
+            for column, name in enumerate(names):
+                scores[name] = pd.Series(values[:, column], index=products.index)
+        return scores
+    
+    def _run_scorer(
+        self,
+        scorer: Scorer,
+        scored_products: pd.DataFrame,
+        context: ScoringContext,
+        budget=None,
+        timings: Optional[Dict[str, float]] = None
+    ) -> pd.Series:
+        """
+        Compute one registered component for a request.
         
-        scored_products['product_popularity'] = self._score_product_popularity(
-            scored_products, transactions
+        Args:
+            scorer: Scorer to run
+            scored_products: Products being scored
+            context: Inputs of the request
+            budget: Optional LatencyBudget (ignored for unbudgeted scorers)
+            timings: Optional dictionary to record the duration in
+            
+        Returns:
+            Series of component scores
+        """
+        compute, inputs = context.inputs_for(scorer)
+        return self._run_component(
+            scorer.name, scored_products.index,
+            budget if scorer.budgeted else None,
+            lambda: compute(self, scored_products, inputs),
+            timings=timings
         )
+    
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """Shared thread pool for parallel component evaluation."""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix='scoring'
+            )
+        return self._executor
+    
+    def _run_component(
+        self,
+        name: str,
+        index: pd.Index,
+        budget,
+        compute,
+        timings: Optional[Dict[str, float]] = None
+    ) -> pd.Series:
+        """
+        Compute one component, or skip it if it does not fit in the budget.
         
-        scored_products['exploration'] = self._score_exploration(scored_products)
+        The expected cost of each component is a running average of its
+        previous durations, so a component is skipped before it would overrun
+        the deadline rather than after.
         
-        # Calculate final weighted score
-        scored_products['final_score'] = (
-            self.weights['category_affinity'] * scored_products['category_affinity'] +
-            self.weights['repurchase_likelihood'] * scored_products['repurchase_likelihood'] +
-            self.weights['clickstream_intent'] * scored_products['clickstream_intent'] +
-            self.weights['product_popularity'] * scored_products['product_popularity'] +
-            self.weights['exploration'] * scored_products['exploration']
+        Args:
+            name: Component name
+            index: Index of the products being scored
+            budget: Optional LatencyBudget
+            compute: Callable returning the component's scores
+            timings: Optional dictionary to record the duration in
+            
+        Returns:
+            Series of component scores (0.0 if skipped)
+        """
+        expected = self._component_seconds.get(name, 0.0)
+        if budget is not None and not budget.allows(expected):
+            budget.degrade(name)
+            self.logger.debug(f"Skipping {name}: {budget.remaining() * 1000:.1f} ms left, "
+                              f"expected {expected * 1000:.1f} ms")
+            return pd.Series(0.0, index=index)
+        
+        start = time.perf_counter()
+        scores = compute()
+        elapsed = time.perf_counter() - start
+        if timings is not None:
+            timings[name] = elapsed
+        self._component_seconds[name] = (
+            elapsed if name not in self._component_seconds
+            else 0.8 * self._component_seconds[name] + 0.2 * elapsed
         )
+        return scores
+    
+    def compute_popularity(self, transactions: pd.DataFrame) -> pd.DataFrame:
+        """
+        Compute per-product popularity statistics over all transactions.
+        
+        With product_popularity.distinct_customers set to 'hll', distinct
+        customers are estimated with a HyperLogLog sketch built in chunks
+        instead of an exact groupby nunique.
         
-        return scored_products
+        Args:
+            transactions: All transaction data
+            
+        Returns:
+            DataFrame indexed by product_id with unique_customers and total_quantity
+        """
+        popularity_config = self.config['product_popularity']
+        mode = popularity_config.get('distinct_customers', 'exact')
+        
+        if mode == 'hll':
+            chunk_size = popularity_config.get('hll_chunk_size', 1_000_000)
+            chunks = (
+                transactions.iloc[start:start + chunk_size]
+                for start in range(0, len(transactions), chunk_size)
+            )
+            sketch = ProductPopularitySketch.from_frames(
+                chunks, precision=popularity_config.get('hll_precision', 10)
+            )
+            return sketch.estimate()
+        
+        if mode != 'exact':
+            raise ValueError(f"Unknown product_popularity.distinct_customers mode: {mode}")
+        
+        return transactions.groupby('product_id').agg({
+            'customer_id': 'nunique',  # Unique customers
+            'quantity': 'sum'           # Total quantity sold
+        }).rename(columns={'customer_id': 'unique_customers', 'quantity': 'total_quantity'})
+    
+    def update_popularity(
+        self,
+        popularity: pd.DataFrame,
+        transactions: pd.DataFrame,
+        new_customer: np.ndarray
+    ) -> pd.DataFrame:
+        """
+        Add new transactions to popularity statistics from compute_popularity.
+        
+        Args:
+            popularity: Current per-product unique_customers and total_quantity
+            transactions: New transactions
+            new_customer: Boolean per transaction, True for the first purchase
+                of the product by that customer
+            
+        Returns:
+            Updated popularity DataFrame (the input is left unchanged)
+        """
+        delta = pd.DataFrame({
+            'product_id': transactions['product_id'].values,
+            'unique_customers': np.asarray(new_customer, dtype=np.int64),
+            'total_quantity': transactions['quantity'].values
+        }).groupby('product_id').sum()
+        updated = popularity.add(delta, fill_value=0)
+        return updated.astype(popularity.dtypes.to_dict())
     
     def _score_category_affinity(
         self,
         products: pd.DataFrame,
         customer_txns: pd.DataFrame,
-        current_time: datetime
+        current_time: datetime,
+        pruned_categories: pd.DataFrame = None,
+        reference_time: datetime = None
     ) -> pd.Series:
         """
         Score products based on time-weighted historical category preferences.
@@ -112,11 +512,15 @@ class ProductScoringEngine:
             products: Product catalog
             customer_txns: Customer transaction history
             current_time: Current timestamp
+            pruned_categories: Optional per-category summary of pruned transactions
+                (decayed_weight at reference_time, quantity)
+            reference_time: Time the pruned decayed weights are anchored at
             
         Returns:
             Series of category affinity scores [0, 1]
         """
-        if len(customer_txns) == 0:
+        has_pruned = pruned_categories is not None and len(pruned_categories) > 0
+        if len(customer_txns) == 0 and not has_pruned:
             return pd.Series(0.0, index=products.index)
         
         decay_days = self.config['category_affinity']['decay_days']
@@ -131,13 +535,24 @@ class ProductScoringEngine:
         customer_txns['days_ago'] = (current_time - customer_txns['date_of_transaction']).dt.days
         
         # Apply exponential decay: weight = exp(-days_ago / decay_days)
-        customer_txns['weight'] = np.exp(-customer_txns['days_ago'] / decay_days)
+        # (rollup rows count once per purchase they stand for)
+        customer_txns['weight'] = np.exp(-customer_txns['days_ago'] / decay_days) * row_counts(customer_txns)
         
         # Calculate weighted category scores
         category_scores = customer_txns.groupby('product_category').agg({
             'weight': 'sum',
             'quantity': 'sum'
         })
+        
+        # Fold in pruned history, rescaling its decay from the reference time
+        if has_pruned:
+            days_since_reference = (current_time - reference_time).days
+            pruned_scores = pd.DataFrame({
+                'weight': pruned_categories['decayed_weight'] * np.exp(-days_since_reference / decay_days),
+                'quantity': pruned_categories['quantity']
+            })
+            category_scores = category_scores.add(pruned_scores, fill_value=0)
+        
         category_scores['score'] = category_scores['weight'] * np.log1p(category_scores['quantity'])
         
         # Normalize to [0, 1]
@@ -189,7 +604,9 @@ class ProductScoringEngine:
                 customer_txns['product_id'] == product['product_id']
             ].sort_values('date_of_transaction')
             
-            if len(product_txns) < min_purchases:
+            # Rollup rows stand for several purchases on their day
+            purchases = row_counts(product_txns).sum()
+            if purchases < min_purchases:
                 scores.append(0.0)
                 continue
             
@@ -198,10 +615,10 @@ class ProductScoringEngine:
             days_since = (current_time - last_purchase).days
             
             # Calculate average cycle for this product
-            if len(product_txns) >= 2:
+            if purchases >= 2:
                 purchase_dates = product_txns['date_of_transaction'].values
                 cycles = np.diff(purchase_dates).astype('timedelta64[D]').astype(int)
-                avg_cycle = np.mean(cycles)
+                avg_cycle = np.sum(cycles) / (purchases - 1)
             else:
                 avg_cycle = expected_cycle
             
@@ -214,11 +631,56 @@ class ProductScoringEngine:
         
         return pd.Series(scores, index=products.index)
     
+    def _score_repurchase_from_summary(
+        self,
+        products: pd.DataFrame,
+        repurchase_stats: pd.DataFrame,
+        current_time: datetime
+    ) -> pd.Series:
+        """
+        Score repurchase likelihood from per-product purchase statistics.
+        
+        Equivalent to _score_repurchase_likelihood, but reads the purchase
+        count, last purchase and summed cycle gaps from a HistorySummary
+        instead of the raw transactions.
+        
+        Args:
+            products: Product catalog
+            repurchase_stats: Customer stats indexed by product_id
+            current_time: Current timestamp
+            
+        Returns:
+            Series of repurchase likelihood scores [0, 1]
+        """
+        if len(repurchase_stats) == 0:
+            return pd.Series(0.0, index=products.index)
+        
+        expected_cycle = self.config['repurchase_likelihood']['expected_cycle_days']
+        cycle_std = self.config['repurchase_likelihood']['cycle_std_days']
+        min_purchases = self.config['repurchase_likelihood']['min_purchases']
+        
+        stats = repurchase_stats.reindex(products['product_id'])
+        purchase_count = stats['purchase_count'].fillna(0).values
+        days_since = (current_time - stats['last_purchase']).dt.days.values
+        
+        avg_cycle = np.where(
+            purchase_count >= 2,
+            stats['cycle_days_sum'].values / np.maximum(purchase_count - 1, 1),
+            expected_cycle
+        )
+        
+        deviation = np.abs(days_since - avg_cycle)
+        scores = np.exp(-(deviation ** 2) / (2 * cycle_std ** 2))
+        scores = np.where(purchase_count >= max(min_purchases, 1), scores, 0.0)
+        
+        return pd.Series(scores, index=products.index)
+    
     def _score_clickstream_intent(
         self,
         products: pd.DataFrame,
         customer_clicks: pd.DataFrame,
-        current_time: datetime
+        current_time: datetime,
+        pruned_clicks: pd.DataFrame = None
     ) -> pd.Series:
         """
         Score products based on real-time browsing behavior.
@@ -229,11 +691,14 @@ class ProductScoringEngine:
             products: Product catalog
             customer_clicks: Customer clickstream data
             current_time: Current timestamp
+            pruned_clicks: Optional per-product summary of pruned clicks
+                (summed event_weight)
             
         Returns:
             Series of clickstream intent scores [0, 1]
         """
-        if len(customer_clicks) == 0:
+        has_pruned = pruned_clicks is not None and len(pruned_clicks) > 0
+        if len(customer_clicks) == 0 and not has_pruned:
             return pd.Series(0.0, index=products.index)
         
         recency_weight = self.config['clickstream_intent']['recency_weight']
@@ -260,21 +725,28 @@ class ProductScoringEngine:
             event_weights
         ).fillna(0.3)  # Default weight for unknown events
         
-        # Combined score: weighted average of recency and event type
+        # Combined score: weighted average of recency and event type, once
+        # per event a rollup row stands for
         customer_clicks['combined_score'] = (
             recency_weight * customer_clicks['recency_score'] +
             (1 - recency_weight) * customer_clicks['event_weight']
-        )
+        ) * row_counts(customer_clicks)
         
         # Aggregate by product - filter clicks with product_id
         product_clicks = customer_clicks[customer_clicks['product_id'].notna()]
         
-        if len(product_clicks) == 0:
+        if len(product_clicks) == 0 and not has_pruned:
             return pd.Series(0.0, index=products.index)
         
         # Sum scores by product
         click_scores = product_clicks.groupby('product_id')['combined_score'].sum()
         
+        # Pruned clicks keep their event type term; their recency term is below tolerance
+        if has_pruned:
+            click_scores = click_scores.add(
+                (1 - recency_weight) * pruned_clicks['event_weight'], fill_value=0
+            )
+        
         # Normalize to [0, 1]
         if click_scores.max() > 0:
             click_scores = click_scores / click_scores.max()
@@ -284,10 +756,243 @@ class ProductScoringEngine:
         
         return scores
     
+    def _score_category_affinity_sparse(
+        self,
+        products: pd.DataFrame,
+        interactions,
+        customer_id: str
+    ) -> pd.Series:
+        """
+        Category affinity from the customer's sparse category row.
+        
+        The decayed weights are anchored at the matrix reference time; moving
+        to current_time multiplies every category by the same factor, which
+        the max normalisation cancels.
+        
+        Args:
+            products: Product catalog
+            interactions: InteractionMatrix
+            customer_id: Customer ID
+            
+        Returns:
+            Series of category affinity scores [0, 1]
+        """
+        columns, weights = interactions.row('category_weight', customer_id)
+        if len(columns) == 0:
+            return pd.Series(0.0, index=products.index)
+        _, quantities = interactions.row('category_quantity', customer_id)
+        
+        category_scores = weights * np.log1p(quantities)
+        if category_scores.max() > 0:
+            category_scores = category_scores / category_scores.max()
+        
+        scores = gather(
+            interactions.category_columns(products['product_category']),
+            columns, category_scores, len(interactions.categories)
+        )
+        return pd.Series(scores, index=products.index)
+    
+    def _score_repurchase_sparse(
+        self,
+        products: pd.DataFrame,
+        interactions,
+        customer_id: str,
+        current_time: datetime
+    ) -> pd.Series:
+        """
+        Repurchase likelihood from the customer's sparse purchase-stat rows.
+        
+        Args:
+            products: Product catalog
+            interactions: InteractionMatrix
+            customer_id: Customer ID
+            current_time: Current timestamp
+            
+        Returns:
+            Series of repurchase likelihood scores [0, 1]
+        """
+        columns, purchase_count = interactions.row('purchase_count', customer_id)
+        if len(columns) == 0:
+            return pd.Series(0.0, index=products.index)
+        _, last_purchase = interactions.row('last_purchase', customer_id)
+        _, cycle_days_sum = interactions.row('cycle_days_sum', customer_id)
+        
+        expected_cycle = self.config['repurchase_likelihood']['expected_cycle_days']
+        cycle_std = self.config['repurchase_likelihood']['cycle_std_days']
+        min_purchases = self.config['repurchase_likelihood']['min_purchases']
+        
+        days_since = np.floor((to_epoch_seconds(current_time) - last_purchase) / SECONDS_PER_DAY)
+        avg_cycle = np.where(
+            purchase_count >= 2,
+            cycle_days_sum / np.maximum(purchase_count - 1, 1),
+            expected_cycle
+        )
+        deviation = np.abs(days_since - avg_cycle)
+        row_scores = np.exp(-(deviation ** 2) / (2 * cycle_std ** 2))
+        row_scores = np.where(purchase_count >= max(min_purchases, 1), row_scores, 0.0)
+        
+        scores = gather(
+            interactions.product_columns(products['product_id']),
+            columns, row_scores, len(interactions.product_ids)
+        )
+        return pd.Series(scores, index=products.index)
+    
+    def _score_clickstream_intent_sparse(
+        self,
+        products: pd.DataFrame,
+        interactions,
+        customer_id: str,
+        current_time: datetime
+    ) -> pd.Series:
+        """
+        Clickstream intent from the customer's sparse click rows.
+        
+        Args:
+            products: Product catalog
+            interactions: InteractionMatrix
+            customer_id: Customer ID
+            current_time: Current timestamp
+            
+        Returns:
+            Series of clickstream intent scores [0, 1]
+        """
+        columns, recency = interactions.row('click_recency', customer_id)
+        if len(columns) == 0:
+            return pd.Series(0.0, index=products.index)
+        _, event_weight = interactions.row('click_event_weight', customer_id)
+        
+        recency_weight = self.config['clickstream_intent']['recency_weight']
+        decay_hours = self.config['clickstream_intent']['decay_hours']
+        
+        # Rescale recency from the matrix reference time to current_time
+        hours_since_reference = (
+            to_epoch_seconds(current_time) - to_epoch_seconds(interactions.reference_time)
+        ) / 3600
+        recency = recency * np.exp(-hours_since_reference / decay_hours)
+        
+        click_scores = recency_weight * recency + (1 - recency_weight) * event_weight
+        if click_scores.max() > 0:
+            click_scores = click_scores / click_scores.max()
+        
+        scores = gather(
+            interactions.product_columns(products['product_id']),
+            columns, click_scores, len(interactions.product_ids)
+        )
+        return pd.Series(scores, index=products.index)
+    
+    def _score_copurchase(
+        self,
+        products: pd.DataFrame,
+        customer_id: str,
+        transactions: pd.DataFrame,
+        current_time: datetime,
+        copurchase,
+        interactions=None
+    ) -> pd.Series:
+        """
+        Score products frequently bought together with the customer's purchases.
+        
+        Takes the customer's most recently weighted purchases (exponential
+        decay over category_affinity.decay_days) and sums the similarity of
+        their precomputed neighbors, so the cost is O(history_size x top_m).
+        
+        Args:
+            products: Product catalog
+            customer_id: Customer ID
+            transactions: Transaction history DataFrame
+            current_time: Current timestamp
+            copurchase: Optional CoPurchaseIndex (built from transactions if None)
+            interactions: Optional InteractionMatrix to read purchases from
+            
+        Returns:
+            Series of co-purchase scores [0, 1]
+        """
+        if copurchase is None:
+            copurchase = CoPurchaseIndex.build(expand_table(transactions), self.config)
+        
+        history_size = self.config.get('copurchase', {}).get('history_size', 20)
+        
+        if interactions is not None:
+            # Weights are anchored at the matrix reference time; the common
+            # rescaling factor cancels in the normalisation below
+            columns, weights = interactions.row('purchase_weight', customer_id)
+            history_products = interactions.product_ids[columns]
+        else:
+            decay_days = self.config['category_affinity']['decay_days']
+            customer_txns = expand_table(transactions[transactions['customer_id'] == customer_id])
+            days_ago = (current_time - pd.to_datetime(customer_txns['date_of_transaction'])).dt.days
+            history = pd.Series(np.exp(-days_ago.values / decay_days) * row_counts(customer_txns)).groupby(
+                customer_txns['product_id'].values
+            ).sum()
+            history_products, weights = history.index, history.values
+        
+        if len(weights) == 0:
+            return pd.Series(0.0, index=products.index)
+        
+        if len(weights) > history_size:
+            recent = np.argpartition(-weights, history_size - 1)[:history_size]
+            history_products, weights = history_products[recent], weights[recent]
+        
+        neighbor_scores = copurchase.score(np.asarray(history_products), weights)
+        if len(neighbor_scores) == 0:
+            return pd.Series(0.0, index=products.index)
+        
+        neighbor_scores = neighbor_scores / neighbor_scores.max()
+        return products['product_id'].map(neighbor_scores).fillna(0.0)
+    
+    def _score_factor_affinity(
+        self,
+        products: pd.DataFrame,
+        customer_id: str,
+        transactions: pd.DataFrame,
+        clickstream: pd.DataFrame,
+        factors,
+        interactions=None
+    ) -> pd.Series:
+        """
+        Score products by low-rank customer/product factor affinity.
+        
+        The customer's affinity to the whole catalog is one float32
+        matrix-vector product; scores are min-max scaled over the catalog so
+        they do not depend on which products are being scored.
+        
+        Args:
+            products: Product catalog
+            customer_id: Customer ID
+            transactions: Transaction history DataFrame
+            clickstream: Clickstream data DataFrame
+            factors: Optional FactorModel (built from interactions if None)
+            interactions: Optional InteractionMatrix to build factors from
+            
+        Returns:
+            Series of factor affinity scores [0, 1]
+        """
+        if factors is None:
+            if interactions is None:
+                interactions = InteractionMatrix.build(
+                    products, expand_table(transactions), expand_table(clickstream), self.config
+                )
+            factors = FactorModel.build(interactions, self.config)
+        
+        affinity = factors.affinity(customer_id)
+        if affinity is None:
+            return pd.Series(0.0, index=products.index)
+        
+        spread = affinity.max() - affinity.min()
+        if spread <= 0:
+            return pd.Series(0.0, index=products.index)
+        affinity = (affinity - affinity.min()) / spread
+        
+        columns = factors.product_ids.get_indexer(products['product_id'])
+        # Index -1 (products unknown to the model) reads the trailing zero
+        scores = np.append(affinity, 0.0)[columns]
+        return pd.Series(scores.astype(np.float64), index=products.index)
+    
     def _score_product_popularity(
         self,
         products: pd.DataFrame,
-        all_transactions: pd.DataFrame
+        all_transactions: pd.DataFrame,
+        popularity: pd.DataFrame = None
     ) -> pd.Series:
         """
         Score products based on global popularity.
@@ -297,21 +1002,23 @@ class ProductScoringEngine:
         Args:
             products: Product catalog
             all_transactions: All transaction data
+            popularity: Optional precomputed per-product unique_customers and
+                total_quantity (used instead of all_transactions)
             
         Returns:
             Series of popularity scores [0, 1]
         """
-        if len(all_transactions) == 0:
+        if popularity is None and len(all_transactions) == 0:
             return pd.Series(0.5, index=products.index)  # Neutral score
         
         customer_weight = self.config['product_popularity']['customer_weight']
         frequency_weight = self.config['product_popularity']['frequency_weight']
         
         # Calculate metrics by product
-        popularity = all_transactions.groupby('product_id').agg({
-            'customer_id': 'nunique',  # Unique customers
-            'quantity': 'sum'           # Total quantity sold
-        }).rename(columns={'customer_id': 'unique_customers', 'quantity': 'total_quantity'})
+        if popularity is None:
+            popularity = self.compute_popularity(expand_table(all_transactions))
+        else:
+            popularity = popularity.copy()
         
         # Normalize each metric to [0, 1]
         if popularity['unique_customers'].max() > 0:
@@ -340,24 +1047,148 @@ class ProductScoringEngine:
         
         return scores
     
-    def _score_exploration(self, products: pd.DataFrame) -> pd.Series:
+    def _score_exploration(self, products: pd.DataFrame, customer_id: str) -> pd.Series:
         """
         Generate random exploration scores for variety.
         
+        Draws from the request's own generator (see src.random_streams), so
+        concurrent requests do not share random state.
+        
         Args:
             products: Product catalog
+            customer_id: Customer ID the request is for
             
         Returns:
             Series of random scores [0, 1]
         """
-        random_seed = self.config['selection'].get('random_seed')
-        
-        if random_seed is not None:
-            np.random.seed(random_seed)
+        rng = request_generator(
+            self.config['selection'].get('random_seed'), customer_id, 'exploration'
+        )
         
         scores = pd.Series(
-            np.random.random(len(products)),
+            rng.random(len(products)),
             index=products.index
         )
         
         return scores
+
+
+# Built-in scorers. Table variants read the customer's rows filtered from the
+# long-format tables; sparse variants read them from the InteractionMatrix.
+
+def _category_affinity(engine: ProductScoringEngine, products: pd.DataFrame, inputs) -> pd.Series:
+    history_summary = inputs['history_summary']
+    return engine._score_category_affinity(
+        products, inputs['customer_transactions'], inputs['current_time'],
+        pruned_categories=(
+            history_summary.customer_categories(inputs['customer_id']) if history_summary else None
+        ),
+        reference_time=history_summary.reference_time if history_summary else None
+    )
+
+
+def _category_affinity_sparse(engine: ProductScoringEngine, products: pd.DataFrame, inputs) -> pd.Series:
+    return engine._score_category_affinity_sparse(
+        products, inputs['interactions'], inputs['customer_id']
+    )
+
+
+def _repurchase_likelihood(engine: ProductScoringEngine, products: pd.DataFrame, inputs) -> pd.Series:
+    history_summary = inputs['history_summary']
+    if history_summary is not None:
+        return engine._score_repurchase_from_summary(
+            products, history_summary.customer_repurchase(inputs['customer_id']),
+            inputs['current_time']
+        )
+    return engine._score_repurchase_likelihood(
+        products, inputs['customer_transactions'], inputs['current_time']
+    )
+
+
+def _repurchase_likelihood_sparse(engine: ProductScoringEngine, products: pd.DataFrame, inputs) -> pd.Series:
+    return engine._score_repurchase_sparse(
+        products, inputs['interactions'], inputs['customer_id'], inputs['current_time']
+    )
+
+
+def _clickstream_intent(engine: ProductScoringEngine, products: pd.DataFrame, inputs) -> pd.Series:
+    history_summary = inputs['history_summary']
+    return engine._score_clickstream_intent(
+        products, inputs['customer_clicks'], inputs['current_time'],
+        pruned_clicks=(
+            history_summary.customer_clicks(inputs['customer_id']) if history_summary else None
+        )
+    )
+
+
+def _clickstream_intent_sparse(engine: ProductScoringEngine, products: pd.DataFrame, inputs) -> pd.Series:
+    return engine._score_clickstream_intent_sparse(
+        products, inputs['interactions'], inputs['customer_id'], inputs['current_time']
+    )
+
+
+def _product_popularity(engine: ProductScoringEngine, products: pd.DataFrame, inputs) -> pd.Series:
+    return engine._score_product_popularity(
+        products, inputs['transactions'], popularity=inputs['popularity']
+    )
+
+
+def _exploration(engine: ProductScoringEngine, products: pd.DataFrame, inputs) -> pd.Series:
+    return engine._score_exploration(products, inputs['customer_id'])
+
+
+def _copurchase(engine: ProductScoringEngine, products: pd.DataFrame, inputs) -> pd.Series:
+    return engine._score_copurchase(
+        products, inputs['customer_id'], inputs['transactions'], inputs['current_time'],
+        inputs['copurchase'], interactions=inputs['interactions']
+    )
+
+
+def _factor_affinity(engine: ProductScoringEngine, products: pd.DataFrame, inputs) -> pd.Series:
+    return engine._score_factor_affinity(
+        products, inputs['customer_id'], inputs['transactions'], inputs['clickstream'],
+        inputs['factors'], interactions=inputs['interactions']
+    )
+
+
+_HISTORY_INPUTS = ('customer_id', 'current_time', 'history_summary')
+_SPARSE_INPUTS = ('customer_id', 'current_time', 'interactions')
+
+register_scorer(Scorer(
+    'category_affinity',
+    inputs=_HISTORY_INPUTS + ('customer_transactions',),
+    compute=_category_affinity,
+    sparse_inputs=_SPARSE_INPUTS,
+    sparse_compute=_category_affinity_sparse
+))
+register_scorer(Scorer(
+    'repurchase_likelihood',
+    inputs=_HISTORY_INPUTS + ('customer_transactions',),
+    compute=_repurchase_likelihood,
+    sparse_inputs=_SPARSE_INPUTS,
+    sparse_compute=_repurchase_likelihood_sparse
+))
+register_scorer(Scorer(
+    'clickstream_intent',
+    inputs=_HISTORY_INPUTS + ('customer_clicks',),
+    compute=_clickstream_intent,
+    sparse_inputs=_SPARSE_INPUTS,
+    sparse_compute=_clickstream_intent_sparse
+))
+register_scorer(Scorer(
+    'product_popularity',
+    inputs=('transactions', 'popularity'),
+    compute=_product_popularity,
+    budgeted=False
+))
+register_scorer(Scorer('exploration', inputs=('customer_id',), compute=_exploration, budgeted=False))
+register_scorer(Scorer(
+    'copurchase',
+    inputs=('customer_id', 'transactions', 'current_time', 'copurchase', 'interactions'),
+    compute=_copurchase
+))
+register_scorer(Scorer(
+    'factor_affinity',
+    inputs=('customer_id', 'transactions', 'clickstream', 'factors', 'interactions'),
+    compute=_factor_affinity
+))
@@ -7,11 +7,15 @@ This module implements the final product selection logic with variety mechanisms
 import pandas as pd
 import numpy as np
 import json
+import threading
 from datetime import datetime, timedelta
 from typing import Dict, Optional
 from pathlib import Path
 import logging
 
+from src.scoring_engine import active_components
+from src.random_streams import request_generator
+
 
 class ProductSelector:
     """
@@ -32,6 +36,13 @@ class ProductSelector:
         self.shown_products_path = Path(shown_products_path)
         self.logger = logging.getLogger(__name__)
         
+        # Rewrite the shown products file after every selection; batch runs
+        # turn this off and call save_shown_products once per chunk
+        self.autosave = True
+        # Concurrent requests record and save shown products through one lock,
+        # so the history is never written while another request changes it
+        self._lock = threading.RLock()
+        
         # Load shown products history
         self._load_shown_products()
     
@@ -87,7 +98,7 @@ class ProductSelector:
                 return None
         
         # Weighted random selection
-        selected_product = self._weighted_random_selection(candidates)
+        selected_product = self._weighted_random_selection(candidates, customer_id)
         
         # Get product rank in original scored list
         rank = (scored_products['final_score'] > selected_product['final_score']).sum() + 1
@@ -100,11 +111,8 @@ class ProductSelector:
             'product_category': selected_product.get('product_category', 'Unknown'),
             'final_score': float(selected_product['final_score']),
             'score_components': {
-                'category_affinity': float(selected_product['category_affinity']),
-                'repurchase_likelihood': float(selected_product['repurchase_likelihood']),
-                'clickstream_intent': float(selected_product['clickstream_intent']),
-                'product_popularity': float(selected_product['product_popularity']),
-                'exploration': float(selected_product['exploration'])
+                name: float(selected_product[name])
+                for name in active_components(self.config['scoring_weights'])
             },
             'rank': int(rank),
             'total_candidates': len(scored_products),
@@ -162,19 +170,21 @@ class ProductSelector:
         
         return products
     
-    def _weighted_random_selection(self, candidates: pd.DataFrame) -> pd.Series:
+    def _weighted_random_selection(self, candidates: pd.DataFrame, customer_id: str) -> pd.Series:
         """
         Perform weighted random selection based on final scores.
         
-        Higher scores have higher probability of selection.
+        Higher scores have higher probability of selection. The draw uses the
+        request's own generator (see src.random_streams).
         
         Args:
             candidates: Candidate products with scores
+            customer_id: Customer ID the selection is for
             
         Returns:
             Selected product as Series
         """
-        random_seed = self.selection_config.get('random_seed')
+        rng = request_generator(self.selection_config.get('random_seed'), customer_id, 'selection')
         
         # Ensure scores are non-negative
         scores = candidates['final_score'].values
@@ -187,15 +197,9 @@ class ProductSelector:
         probabilities = scores / scores.sum()
         
         # Random selection
-        if random_seed is not None:
-            np.random.seed(random_seed)
+        selected_position = rng.choice(len(candidates), p=probabilities)
         
-        selected_idx = np.random.choice(
-            candidates.index,
-            p=probabilities
-        )
-        
-        return candidates.loc[selected_idx]
+        return candidates.iloc[selected_position]
     
     def _load_shown_products(self):
         """Load shown products history from JSON file."""
@@ -225,20 +229,45 @@ class ProductSelector:
             product_id: Product ID
             current_time: Timestamp when shown
         """
-        if customer_id not in self.shown_products:
-            self.shown_products[customer_id] = {}
-        
-        self.shown_products[customer_id][product_id] = current_time.isoformat()
-        
-        # Save to file
+        with self._lock:
+            if customer_id not in self.shown_products:
+                self.shown_products[customer_id] = {}
+            
+            self.shown_products[customer_id][product_id] = current_time.isoformat()
+            self.logger.debug(f"Recorded shown product {product_id} for customer {customer_id}")
+            
+            if self.autosave:
+                self.save_shown_products()
+    
+    def save_shown_products(self):
+        """Write shown products history to the JSON file."""
         try:
             self.shown_products_path.parent.mkdir(parents=True, exist_ok=True)
-            with open(self.shown_products_path, 'w') as f:
+            with self._lock, open(self.shown_products_path, 'w') as f:
                 json.dump(self.shown_products, f, indent=2)
-            self.logger.debug(f"Recorded shown product {product_id} for customer {customer_id}")
         except Exception as e:
             self.logger.error(f"Error saving shown products: {e}")
     
+    def merge_shown_products(self, shown_products: Dict[str, Dict[str, str]]):
+        """
+        Merge shown products history from another source (e.g. a snapshot).
+    
+        For each customer and product the later timestamp is kept.
+    
+        Args:
+            shown_products: History in the same customer -> product -> ISO
+                timestamp form as the JSON file
+        """
+        with self._lock:
+            for customer_id, shown in shown_products.items():
+                current = self.shown_products.setdefault(customer_id, {})
+                for product_id, timestamp_str in shown.items():
+                    existing = current.get(product_id)
+                    if existing is None or (
+                        datetime.fromisoformat(timestamp_str) > datetime.fromisoformat(existing)
+                    ):
+                        current[product_id] = timestamp_str
+    
     def clear_shown_products(self, customer_id: Optional[str] = None):
         """
         Clear shown products history.
@@ -257,7 +286,7 @@ class ProductSelector:
         
         # Save to file
         try:
-            with open(self.shown_products_path, 'w') as f:
+            with self._lock, open(self.shown_products_path, 'w') as f:
                 json.dump(self.shown_products, f, indent=2)
         except Exception as e:
             self.logger.error(f"Error saving shown products: {e}")
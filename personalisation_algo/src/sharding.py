@@ -0,0 +1,443 @@
+"""
+Customer Sharding
+
+This module splits customers across several engine processes on one host.
+Each customer belongs to one shard, chosen by a stable hash of their ID. A
+shard process keeps only its customers' transactions, clickstream, derived
+per-customer state and shown products history; state that needs every
+customer (popularity, co-purchase neighbours, product factors) is still
+computed from the full files at load time. A small router in front forwards
+each /recommend request to the customer's shard, splits /events batches
+between shards and sends /catalog updates to all of them. /audience requests
+go to every shard too, and the shards' audiences are merged.
+
+Shard processes are the regular API (src.main:create_app) started with the
+RECSYS_SHARD environment variable set to their shard number; the router and
+shard count come from the sharding section of the configuration.
+
+Usage:
+    python -m src.sharding serve [--port 8000]
+    python -m src.sharding shard-of <customer_id> [...]
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import subprocess
+import sys
+import urllib.error
+import urllib.request
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import yaml
+
+
+# Shard number of an engine process (0-based); unset in the router
+SHARD_ENV = 'RECSYS_SHARD'
+
+
+class WrongShardError(ValueError):
+    """A customer was sent to a shard that does not own them."""
+
+
+def shard_of(customer_id, num_shards: int) -> int:
+    """
+    Shard owning a customer.
+
+    An unkeyed BLAKE2 digest of the ID, so every process and every run
+    agree (unlike hash()) and similar IDs spread evenly.
+
+    Args:
+        customer_id: Customer ID
+        num_shards: Number of shards
+
+    Returns:
+        Shard number in [0, num_shards)
+    """
+    digest = hashlib.blake2b(str(customer_id).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little') % num_shards
+
+
+class ShardSpec:
+    """
+    One shard of a customer-sharded deployment.
+    """
+
+    def __init__(self, shard_id: int, num_shards: int):
+        """
+        Initialize the shard.
+
+        Args:
+            shard_id: Shard number in [0, num_shards)
+            num_shards: Number of shards
+        """
+        if num_shards < 1 or not 0 <= shard_id < num_shards:
+            raise ValueError(f"Invalid shard {shard_id} of {num_shards}")
+        self.shard_id = shard_id
+        self.num_shards = num_shards
+
+    @classmethod
+    def from_config(cls, config: Dict) -> Optional['ShardSpec']:
+        """
+        Shard of this process, or None if it serves every customer.
+
+        The shard number is taken from RECSYS_SHARD, falling back to
+        sharding.shard_id in the config.
+
+        Args:
+            config: Configuration dictionary
+
+        Returns:
+            ShardSpec, or None when sharding is off or this is the router
+        """
+        sharding_config = config.get('sharding', {}) or {}
+        num_shards = int(sharding_config.get('num_shards', 1))
+        shard_id = os.environ.get(SHARD_ENV, sharding_config.get('shard_id'))
+        if num_shards <= 1 or shard_id in (None, ''):
+            return None
+        return cls(int(shard_id), num_shards)
+
+    def __repr__(self) -> str:
+        return f"ShardSpec({self.shard_id}, {self.num_shards})"
+
+    def owns(self, customer_id) -> bool:
+        """Whether the customer belongs to this shard."""
+        return shard_of(customer_id, self.num_shards) == self.shard_id
+
+    def mask(self, customer_ids) -> np.ndarray:
+        """
+        Boolean mask of the customers that belong to this shard.
+
+        Each distinct ID is hashed once.
+
+        Args:
+            customer_ids: Customer IDs (Series, Index or array)
+
+        Returns:
+            Boolean array aligned with customer_ids
+        """
+        codes, uniques = pd.factorize(pd.Series(np.asarray(customer_ids, dtype=object)))
+        owned = np.fromiter(
+            (shard_of(customer_id, self.num_shards) == self.shard_id for customer_id in uniques),
+            dtype=bool, count=len(uniques)
+        )
+        # NaN IDs (code -1) belong to no shard
+        return np.append(owned, False)[codes]
+
+    def filter(self, frame: pd.DataFrame) -> pd.DataFrame:
+        """Rows of a table whose customer_id belongs to this shard."""
+        return frame[self.mask(frame['customer_id'])].reset_index(drop=True)
+
+    def select(self, by_customer: Dict) -> Dict:
+        """Entries of a customer-keyed mapping that belong to this shard."""
+        return {customer_id: value for customer_id, value in by_customer.items() if self.owns(customer_id)}
+
+    def check(self, customer_ids):
+        """
+        Reject customers owned by another shard.
+
+        Args:
+            customer_ids: Customer IDs
+
+        Raises:
+            WrongShardError: If any customer belongs to another shard
+        """
+        customer_ids = pd.Series(np.asarray(customer_ids, dtype=object))
+        foreign = customer_ids[~self.mask(customer_ids)]
+        if len(foreign) > 0:
+            customer_id = foreign.iloc[0]
+            raise WrongShardError(
+                f"Customer {customer_id} belongs to shard "
+                f"{shard_of(customer_id, self.num_shards)}, not {self.shard_id}"
+            )
+
+    def path(self, path: str) -> str:
+        """
+        Per-shard variant of a file or directory path.
+
+        'data/shown_products.json' becomes 'data/shown_products.shard-1-of-4.json'.
+        """
+        root, ext = os.path.splitext(path.rstrip(os.sep))
+        return f"{root}.shard-{self.shard_id}-of-{self.num_shards}{ext}"
+
+
+class ShardRouter:
+    """
+    Forward API requests to the shard owning each customer.
+    """
+
+    def __init__(self, config: Dict):
+        """
+        Initialize the router.
+
+        Args:
+            config: Configuration dictionary (uses the sharding section)
+        """
+        sharding_config = config.get('sharding', {}) or {}
+        self.num_shards = int(sharding_config.get('num_shards', 1))
+        self.audience_top_n = (config.get('audience', {}) or {}).get('top_n', 100)
+        host = sharding_config.get('host', '127.0.0.1')
+        base_port = int(sharding_config.get('base_port', 8101))
+        self.shard_urls = [f"http://{host}:{base_port + shard}" for shard in range(self.num_shards)]
+        self.timeout = sharding_config.get('timeout_seconds', 30)
+        self.logger = logging.getLogger(__name__)
+
+    def forward(self, shard: int, method: str, path: str, payload: Optional[Dict] = None) -> Tuple[int, Dict]:
+        """
+        Send one request to a shard.
+
+        Args:
+            shard: Shard number
+            method: HTTP method
+            path: Request path, e.g. '/recommend'
+            payload: JSON body
+
+        Returns:
+            Tuple of (status code, decoded JSON response); status 503 if the
+            shard cannot be reached
+        """
+        data = json.dumps(payload).encode('utf-8') if payload is not None else None
+        request = urllib.request.Request(
+            self.shard_urls[shard] + path, data=data, method=method,
+            headers={'Content-Type': 'application/json'}
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return response.status, json.loads(response.read() or b'null')
+        except urllib.error.HTTPError as e:
+            body = e.read()
+            try:
+                return e.code, json.loads(body)
+            except ValueError:
+                return e.code, {'detail': body.decode('utf-8', 'replace')}
+        except (urllib.error.URLError, OSError) as e:
+            self.logger.warning(f"Shard {shard} at {self.shard_urls[shard]} is unreachable: {e}")
+            return 503, {'detail': f"Shard {shard} is unavailable"}
+
+    def split_events(self, transactions: List[Dict], clickstream: List[Dict]) -> Dict[int, Dict]:
+        """
+        Group event records by the shard owning their customer.
+
+        Args:
+            transactions: Transaction records
+            clickstream: Clickstream records
+
+        Returns:
+            Dictionary mapping shard number to its {'transactions', 'clickstream'} payload
+
+        Raises:
+            ValueError: If a record has no customer_id
+        """
+        batches: Dict[int, Dict] = {}
+        for key, records in (('transactions', transactions), ('clickstream', clickstream)):
+            for record in records:
+                if record.get('customer_id') is None:
+                    raise ValueError(f"Missing customer_id in {key} record")
+                batch = batches.setdefault(
+                    shard_of(record['customer_id'], self.num_shards),
+                    {'transactions': [], 'clickstream': []}
+                )
+                batch[key].append(record)
+        return batches
+
+    def merge_audiences(self, results: List[Dict], top_n: int) -> Dict:
+        """
+        Combine the audiences selected by several shards.
+
+        Each shard returns its own top_n customers, so the overall top_n is
+        among them.
+
+        Args:
+            results: /audience responses of the shards
+            top_n: Number of customers to keep
+
+        Returns:
+            Response of the first shard with the merged audience and the
+            customer counts summed over shards
+        """
+        audience = sorted(
+            (entry for result in results for entry in result['audience']),
+            key=lambda entry: (-entry['score'], entry['customer_id'])
+        )[:top_n]
+        merged = dict(results[0], audience=audience)
+        for key in ('customers_scored', 'excluded_customers'):
+            merged[key] = sum(result[key] for result in results)
+        return merged
+
+
+def create_router_app(config: Dict):
+    """
+    FastAPI app that routes /recommend and /events to the customer's shard,
+    and /catalog updates and /audience requests to every shard.
+
+    Args:
+        config: Configuration dictionary
+
+    Returns:
+        FastAPI app
+    """
+    from fastapi import FastAPI, HTTPException
+    from fastapi.middleware.cors import CORSMiddleware
+    from fastapi.responses import JSONResponse
+
+    router = ShardRouter(config)
+    app = FastAPI(title="Recommendation Engine Router", version="1.0.0")
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+
+    @app.post("/recommend")
+    def recommend(payload: Dict):
+        if payload.get('customer_id') is None:
+            raise HTTPException(status_code=422, detail="customer_id is required")
+        shard = shard_of(payload['customer_id'], router.num_shards)
+        status, body = router.forward(shard, 'POST', '/recommend', payload)
+        return JSONResponse(status_code=status, content=body)
+
+    @app.post("/events")
+    def events(payload: Dict):
+        try:
+            batches = router.split_events(
+                payload.get('transactions') or [], payload.get('clickstream') or []
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        # Each shard accepts or rejects its part of the batch on its own
+        totals = {'transactions': 0, 'clickstream': 0, 'pending_rows': 0}
+        errors = {}
+        for shard, batch in sorted(batches.items()):
+            status, body = router.forward(shard, 'POST', '/events', batch)
+            if status != 200:
+                errors[shard] = {'status': status, 'detail': body.get('detail') if isinstance(body, dict) else body}
+                continue
+            for key in totals:
+                totals[key] += body.get(key, 0)
+        if errors:
+            return JSONResponse(status_code=207 if len(errors) < len(batches) else 502,
+                                content=dict(totals, errors=errors))
+        return totals
+
+    @app.post("/catalog")
+    def catalog(payload: Dict):
+        # Every shard serves the whole catalog
+        results = {}
+        errors = {}
+        for shard in range(router.num_shards):
+            status, body = router.forward(shard, 'POST', '/catalog', payload)
+            if status != 200:
+                errors[shard] = {'status': status, 'detail': body.get('detail') if isinstance(body, dict) else body}
+            else:
+                results[shard] = body
+        summary = next(iter(results.values()), {})
+        if errors:
+            return JSONResponse(status_code=207 if results else 502, content=dict(summary, errors=errors))
+        return summary
+
+    @app.post("/audience")
+    def audience(payload: Dict):
+        # Every shard selects from its own customers
+        top_n = payload.get('top_n') or router.audience_top_n
+        results = []
+        errors = {}
+        for shard in range(router.num_shards):
+            status, body = router.forward(shard, 'POST', '/audience', dict(payload, top_n=top_n))
+            if status != 200:
+                errors[shard] = {'status': status, 'detail': body.get('detail') if isinstance(body, dict) else body}
+            else:
+                results.append(body)
+        if not results:
+            if all(error['status'] == 400 for error in errors.values()):
+                # An invalid request fails the same way on every shard
+                return JSONResponse(status_code=400, content={'detail': errors[0]['detail']})
+            return JSONResponse(status_code=502, content={'errors': errors})
+        merged = router.merge_audiences(results, top_n)
+        if errors:
+            return JSONResponse(status_code=207, content=dict(merged, errors=errors))
+        return merged
+
+    @app.get("/ready")
+    def ready():
+        shards = []
+        for shard in range(router.num_shards):
+            status, body = router.forward(shard, 'GET', '/ready')
+            shards.append(body if status == 200 else {'status': 'unavailable'})
+        return {
+            'status': 'warm' if all(shard.get('status') == 'warm' for shard in shards) else 'cold',
+            'shards': shards
+        }
+
+    return app
+
+
+def serve(config: Dict, host: str, port: int):
+    """
+    Start one API process per shard plus the router, until interrupted.
+
+    Shard processes load config/config.yaml from the working directory, like
+    the unsharded API.
+
+    Args:
+        config: Configuration dictionary
+        host: Router host
+        port: Router port
+    """
+    import uvicorn
+
+    router = ShardRouter(config)
+    if router.num_shards <= 1:
+        raise ValueError("sharding.num_shards must be greater than 1 to serve shards")
+    sharding_config = config.get('sharding', {}) or {}
+    shard_host = sharding_config.get('host', '127.0.0.1')
+    base_port = int(sharding_config.get('base_port', 8101))
+
+    processes = []
+    try:
+        for shard in range(router.num_shards):
+            env = dict(os.environ, **{SHARD_ENV: str(shard)})
+            processes.append(subprocess.Popen(
+                [sys.executable, '-m', 'uvicorn', 'src.main:create_app', '--factory',
+                 '--host', shard_host, '--port', str(base_port + shard)],
+                env=env
+            ))
+        uvicorn.run(create_router_app(config), host=host, port=port)
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Customer-sharded engine processes")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    serve_parser = subparsers.add_parser('serve', help="Start the shard processes and the router")
+    serve_parser.add_argument('--host', default='0.0.0.0', help="Router host")
+    serve_parser.add_argument('--port', type=int, default=8000, help="Router port")
+
+    shard_parser = subparsers.add_parser('shard-of', help="Print the shard of customer IDs")
+    shard_parser.add_argument('customer_ids', nargs='+')
+
+    args = parser.parse_args()
+    with open('config/config.yaml', 'r') as f:
+        config = yaml.safe_load(f)
+    num_shards = int((config.get('sharding', {}) or {}).get('num_shards', 1))
+
+    if args.command == 'serve':
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+        serve(config, args.host, args.port)
+    else:
+        for customer_id in args.customer_ids:
+            print(f"{customer_id}\t{shard_of(customer_id, num_shards)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,593 @@
+"""
+Engine Snapshot
+
+This module checkpoints a RecommendationEngine's loaded state to disk and
+restores it on startup, so a restarted server serves at full speed without
+reparsing the CSVs and rebuilding derived state.
+
+A snapshot directory holds versions side by side and a CURRENT file naming
+the latest one. A version is written completely before CURRENT is replaced,
+so readers only ever see whole snapshots:
+
+    <path>/CURRENT
+    <path>/v-<timestamp>/manifest.json
+    <path>/v-<timestamp>/*.npy              # numeric arrays, memory-mapped on restore
+    <path>/v-<timestamp>/candidate_index.pkl
+    <path>/v-<timestamp>/shown_products.json
+
+Table columns are stored as raw arrays (numbers, booleans, datetimes) or
+as integer codes into their distinct values (strings and other objects).
+Sparse matrices, co-purchase neighbors and factors are memory-mapped, so
+restoring them costs page faults rather than parsing.
+
+A snapshot is only restored when its format version and configuration
+match the running engine and the source CSVs are unchanged since it was
+taken; otherwise the engine starts cold and loads the CSVs as before.
+
+Several API worker processes can share one copy of the data: a publisher
+process writes versions (ideally under /dev/shm, so the files are shared
+memory) and every worker, with snapshot.shared set, maps them read-only.
+String columns then stay encoded as categoricals over the mapped codes
+rather than being decoded into per-process objects, and workers follow
+new versions as the publisher writes them.
+
+Usage:
+    python -m src.snapshot save <products.csv> <transactions.csv> <clickstream.csv> <path>
+    python -m src.snapshot publish <products.csv> <transactions.csv> <clickstream.csv> <path>
+        [--poll-interval 30]
+    python -m src.snapshot info <path>
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import pickle
+import shutil
+import time
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from src.copurchase import CoPurchaseIndex
+from src.dataset import EngineDataset, file_signature
+from src.factor_model import FactorModel
+from src.history_horizon import HistorySummary
+from src.interaction_matrix import InteractionMatrix
+
+
+# Bump when the on-disk layout changes; older snapshots are then ignored
+SNAPSHOT_FORMAT_VERSION = 1
+
+CURRENT_FILE = 'CURRENT'
+MANIFEST_FILE = 'manifest.json'
+
+# Config sections that do not affect the saved state
+RUNTIME_SECTIONS = (
+    'snapshot', 'refresh', 'events', 'latency_budget', 'parallel_scoring', 'logging', 'rollup', 'csv',
+    'base_scores', 'catalog_feed', 'audience'
+)
+
+logger = logging.getLogger(__name__)
+
+
+def config_fingerprint(config: Dict) -> str:
+    """Hash of the configuration the derived state was built with."""
+    relevant = {key: value for key, value in config.items() if key not in RUNTIME_SECTIONS}
+    encoded = json.dumps(relevant, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def save_snapshot(
+    dataset: EngineDataset,
+    path: str,
+    config: Dict,
+    shown_products: Optional[Dict] = None,
+    keep_versions: int = 2
+) -> str:
+    """
+    Write a new snapshot version and make it current.
+
+    Args:
+        dataset: Loaded dataset to checkpoint
+        path: Snapshot directory
+        config: Configuration the dataset was built with
+        shown_products: Selector shown-products state to include
+        keep_versions: Versions to keep, including the new one, so readers
+            that just read CURRENT can still open the previous version
+
+    Returns:
+        Name of the written version
+    """
+    start = time.perf_counter()
+    os.makedirs(path, exist_ok=True)
+    version = f"v-{time.time_ns()}"
+    staging = os.path.join(path, f".{version}.tmp")
+    os.makedirs(staging)
+
+    try:
+        writer = _Writer(staging)
+        manifest = {
+            'format_version': SNAPSHOT_FORMAT_VERSION,
+            'version': version,
+            'created_at': datetime.now().isoformat(),
+            'config_fingerprint': config_fingerprint(config),
+            'source_paths': list(dataset.source_paths) if dataset.source_paths else None,
+            'source_signature': (
+                [list(entry) for entry in dataset.source_signature]
+                if dataset.source_signature else None
+            ),
+            'products': writer.frame('products', dataset.products),
+            'transactions': writer.frame('transactions', dataset.transactions),
+            'clickstream': writer.frame('clickstream', dataset.clickstream),
+            'popularity': _optional(writer.frame, 'popularity', dataset.popularity),
+            'history_summary': _optional(_write_history_summary, writer, dataset.history_summary),
+            'interactions': _optional(_write_interactions, writer, dataset.interactions),
+            'copurchase': _optional(_write_copurchase, writer, dataset.copurchase),
+            'factors': _optional(_write_factors, writer, dataset.factors),
+            'candidate_index': None,
+            'shown_products': None
+        }
+        if dataset.candidate_index is not None:
+            # Source indexes are whatever each (possibly plugin) source builds
+            with open(os.path.join(staging, 'candidate_index.pkl'), 'wb') as f:
+                pickle.dump(dataset.candidate_index, f, protocol=pickle.HIGHEST_PROTOCOL)
+            manifest['candidate_index'] = 'candidate_index.pkl'
+        if shown_products is not None:
+            with open(os.path.join(staging, 'shown_products.json'), 'w') as f:
+                json.dump(shown_products, f)
+            manifest['shown_products'] = 'shown_products.json'
+
+        with open(os.path.join(staging, MANIFEST_FILE), 'w') as f:
+            json.dump(manifest, f, indent=2)
+
+        os.rename(staging, os.path.join(path, version))
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    _write_current(path, version)
+    _remove_old_versions(path, keep_versions)
+
+    logger.info(f"Saved snapshot {version} to {path} in {time.perf_counter() - start:.2f}s")
+    return version
+
+
+def load_snapshot(
+    path: str,
+    config: Dict,
+    mmap: bool = True,
+    check_sources: bool = True,
+    categorical: bool = False
+) -> Tuple[EngineDataset, Optional[Dict], Dict]:
+    """
+    Restore the current snapshot version.
+
+    Args:
+        path: Snapshot directory
+        config: Configuration of the engine restoring it
+        mmap: Memory-map numeric arrays instead of reading them into memory
+        check_sources: Refuse the snapshot if its source CSVs changed since
+            (workers of a publisher skip this: the publisher tracks the files)
+        categorical: Restore the string columns of transactions and
+            clickstream as categoricals whose codes stay memory-mapped,
+            instead of decoding them
+
+    Returns:
+        Tuple of (EngineDataset, shown products or None, manifest)
+
+    Raises:
+        ValueError: If there is no usable snapshot (missing, other format
+            version, other configuration or changed source files)
+    """
+    start = time.perf_counter()
+    manifest = read_manifest(path)
+    version_dir = os.path.join(path, manifest['version'])
+
+    if manifest.get('format_version') != SNAPSHOT_FORMAT_VERSION:
+        raise ValueError(
+            f"Snapshot {manifest['version']} has format version "
+            f"{manifest.get('format_version')}, expected {SNAPSHOT_FORMAT_VERSION}"
+        )
+    if manifest.get('config_fingerprint') != config_fingerprint(config):
+        raise ValueError(f"Snapshot {manifest['version']} was built with a different configuration")
+
+    source_paths = tuple(manifest['source_paths']) if manifest.get('source_paths') else None
+    source_signature = None
+    if source_paths is not None:
+        source_signature = tuple(tuple(entry) for entry in manifest['source_signature'])
+    if source_paths is not None and check_sources:
+        try:
+            current_signature = file_signature(source_paths)
+        except OSError as e:
+            raise ValueError(f"Snapshot source files are not readable: {e}")
+        if current_signature != source_signature:
+            raise ValueError(f"Source files changed since snapshot {manifest['version']}")
+
+    reader = _Reader(version_dir, mmap)
+    candidate_index = None
+    if manifest.get('candidate_index'):
+        with open(os.path.join(version_dir, manifest['candidate_index']), 'rb') as f:
+            candidate_index = pickle.load(f)
+    shown_products = None
+    if manifest.get('shown_products'):
+        with open(os.path.join(version_dir, manifest['shown_products']), 'r') as f:
+            shown_products = json.load(f)
+
+    dataset = EngineDataset(
+        reader.frame(manifest['products']),
+        reader.frame(manifest['transactions'], categorical=categorical),
+        reader.frame(manifest['clickstream'], categorical=categorical),
+        history_summary=_optional(_read_history_summary, reader, manifest.get('history_summary')),
+        popularity=_optional(reader.frame, manifest.get('popularity')),
+        candidate_index=candidate_index,
+        interactions=_optional(_read_interactions, reader, manifest.get('interactions')),
+        copurchase=_optional(_read_copurchase, reader, manifest.get('copurchase')),
+        factors=_optional(_read_factors, reader, manifest.get('factors')),
+        source_paths=source_paths,
+        source_signature=source_signature
+    )
+
+    logger.info(
+        f"Restored snapshot {manifest['version']} from {path} "
+        f"in {time.perf_counter() - start:.2f}s"
+    )
+    return dataset, shown_products, manifest
+
+
+def read_manifest(path: str) -> Dict:
+    """
+    Read the manifest of the current snapshot version.
+
+    Args:
+        path: Snapshot directory
+
+    Returns:
+        Manifest dictionary
+
+    Raises:
+        ValueError: If the directory holds no snapshot
+    """
+    try:
+        with open(os.path.join(path, CURRENT_FILE), 'r') as f:
+            version = f.read().strip()
+        with open(os.path.join(path, version, MANIFEST_FILE), 'r') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        raise ValueError(f"No snapshot at {path}: {e}")
+
+
+def _write_current(path: str, version: str):
+    """Atomically point CURRENT at a version."""
+    temporary = os.path.join(path, f".{CURRENT_FILE}.tmp")
+    with open(temporary, 'w') as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, os.path.join(path, CURRENT_FILE))
+
+
+def _remove_old_versions(path: str, keep_versions: int):
+    """
+    Delete all but the newest keep_versions versions.
+
+    Processes that still map an old version's files keep reading them: the
+    files are only unlinked, not truncated.
+    """
+    versions = sorted(
+        (name for name in os.listdir(path) if name.startswith('v-')),
+        key=lambda name: int(name[2:])
+    )
+    for name in versions[:-max(keep_versions, 1)]:
+        shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+
+
+def _optional(function, *args):
+    """function(*args), or None when the last argument is None."""
+    if args[-1] is None:
+        return None
+    return function(*args)
+
+
+def _encode_time(value) -> Optional[str]:
+    return None if value is None else pd.Timestamp(value).isoformat()
+
+
+def _decode_time(value: Optional[str]) -> Optional[datetime]:
+    return None if value is None else pd.Timestamp(value).to_pydatetime()
+
+
+class _Writer:
+    """Write arrays, indexes and tables into a snapshot version directory."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def array(self, name: str, values: np.ndarray) -> str:
+        """Save an array that can be memory-mapped back."""
+        filename = f"{name}.npy"
+        np.save(os.path.join(self.directory, filename), values)
+        return filename
+
+    def objects(self, name: str, values) -> str:
+        """Save a (small) array of Python objects, e.g. distinct labels."""
+        filename = f"{name}.npy"
+        np.save(
+            os.path.join(self.directory, filename),
+            np.asarray(values, dtype=object),
+            allow_pickle=True
+        )
+        return filename
+
+    def index(self, name: str, index: pd.Index) -> Dict:
+        """Save index labels with their dtype and name."""
+        return {
+            'file': self.objects(name, index),
+            'dtype': str(index.dtype),
+            'name': index.name
+        }
+
+    def frame(self, name: str, frame: pd.DataFrame) -> Dict:
+        """
+        Save a DataFrame column by column.
+
+        A non-default index is stored as leading columns and restored with
+        set_index.
+        """
+        index_names = None
+        if not (isinstance(frame.index, pd.RangeIndex) and frame.index.start == 0 and frame.index.step == 1):
+            index_names = list(frame.index.names)
+            level_columns = [f"__index_{i}" for i in range(frame.index.nlevels)]
+            frame = frame.reset_index(names=level_columns)
+
+        columns = []
+        for i, column in enumerate(frame.columns):
+            series = frame[column]
+            prefix = f"{name}.{i}"
+            entry = {'name': column, 'dtype': str(series.dtype)}
+            if isinstance(series.dtype, np.dtype) and series.dtype.kind in 'biufcmM':
+                entry['values'] = self.array(prefix, series.to_numpy())
+            else:
+                codes, uniques = pd.factorize(series)
+                entry['codes'] = self.array(f"{prefix}.codes", codes.astype(_code_dtype(len(uniques))))
+                entry['uniques'] = self.objects(f"{prefix}.uniques", uniques)
+            columns.append(entry)
+
+        return {'rows': len(frame), 'columns': columns, 'index_names': index_names}
+
+
+def _code_dtype(categories: int) -> type:
+    """Smallest code dtype, as pandas picks for a Categorical of this many categories."""
+    for dtype in (np.int8, np.int16, np.int32):
+        if categories < np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+
+class _Reader:
+    """Read back what _Writer wrote."""
+
+    def __init__(self, directory: str, mmap: bool):
+        self.directory = directory
+        self.mmap_mode = 'r' if mmap else None
+
+    def array(self, filename: str) -> np.ndarray:
+        # A plain (read-only) ndarray view of the mapping, not an np.memmap
+        return np.asarray(np.load(os.path.join(self.directory, filename), mmap_mode=self.mmap_mode))
+
+    def objects(self, filename: str) -> np.ndarray:
+        return np.load(os.path.join(self.directory, filename), allow_pickle=True)
+
+    def index(self, entry: Dict) -> pd.Index:
+        return pd.Index(self.objects(entry['file']), dtype=entry['dtype'], name=entry['name'])
+
+    def frame(self, entry: Dict, categorical: bool = False) -> pd.DataFrame:
+        data = {}
+        for column in entry['columns']:
+            if 'values' in column:
+                data[column['name']] = self.array(column['values'])
+            elif categorical and not str(column['name']).startswith('__index_'):
+                # Codes already have the dtype pandas uses, so they are not copied
+                uniques = self.objects(column['uniques'])
+                categories = (
+                    pd.Index(uniques) if column['dtype'] == 'category'
+                    else pd.Index(uniques, dtype=column['dtype'])
+                )
+                data[column['name']] = pd.Categorical.from_codes(
+                    self.array(column['codes']), categories=categories
+                )
+            else:
+                codes = np.asarray(self.array(column['codes']))
+                uniques = self.objects(column['uniques'])
+                values = uniques.take(codes) if len(uniques) else np.empty(len(codes), dtype=object)
+                if (codes < 0).any():
+                    values[codes < 0] = np.nan
+                data[column['name']] = pd.Series(values, copy=False).astype(column['dtype'])
+
+        frame = pd.DataFrame(data, copy=False)
+        if entry['index_names'] is not None:
+            level_columns = [f"__index_{i}" for i in range(len(entry['index_names']))]
+            frame = frame.set_index(level_columns)
+            frame.index.names = entry['index_names']
+        return frame
+
+
+def _write_sparse(writer: _Writer, name: str, matrix: sparse.csr_matrix) -> Dict:
+    return {
+        'shape': list(matrix.shape),
+        'data': writer.array(f"{name}.data", matrix.data),
+        'indices': writer.array(f"{name}.indices", matrix.indices),
+        'indptr': writer.array(f"{name}.indptr", matrix.indptr)
+    }
+
+
+def _read_sparse(reader: _Reader, entry: Dict) -> sparse.csr_matrix:
+    return sparse.csr_matrix(
+        (reader.array(entry['data']), reader.array(entry['indices']), reader.array(entry['indptr'])),
+        shape=tuple(entry['shape']),
+        copy=False
+    )
+
+
+def _write_interactions(writer: _Writer, interactions: InteractionMatrix) -> Dict:
+    return {
+        'customer_ids': writer.index('interactions.customer_ids', interactions.customer_ids),
+        'product_ids': writer.index('interactions.product_ids', interactions.product_ids),
+        'categories': writer.index('interactions.categories', interactions.categories),
+        'reference_time': _encode_time(interactions.reference_time),
+        'matrices': {
+            name: _write_sparse(writer, f"interactions.{name}", matrix)
+            for name, matrix in interactions.matrices.items()
+        }
+    }
+
+
+def _read_interactions(reader: _Reader, entry: Dict) -> InteractionMatrix:
+    return InteractionMatrix(
+        reader.index(entry['customer_ids']),
+        reader.index(entry['product_ids']),
+        reader.index(entry['categories']),
+        _decode_time(entry['reference_time']),
+        {name: _read_sparse(reader, matrix) for name, matrix in entry['matrices'].items()}
+    )
+
+
+def _write_history_summary(writer: _Writer, summary: HistorySummary) -> Dict:
+    return {
+        'reference_time': _encode_time(summary.reference_time),
+        'category_history': writer.frame('history.category', summary.category_history),
+        'click_history': writer.frame('history.click', summary.click_history),
+        'repurchase': writer.frame('history.repurchase', summary.repurchase)
+    }
+
+
+def _read_history_summary(reader: _Reader, entry: Dict) -> HistorySummary:
+    return HistorySummary(
+        _decode_time(entry['reference_time']),
+        reader.frame(entry['category_history']),
+        reader.frame(entry['click_history']),
+        reader.frame(entry['repurchase'])
+    )
+
+
+def _write_copurchase(writer: _Writer, index: CoPurchaseIndex) -> Dict:
+    return {
+        'product_ids': writer.index('copurchase.product_ids', index.product_ids),
+        'neighbors': writer.array('copurchase.neighbors', index.neighbors),
+        'weights': writer.array('copurchase.weights', index.weights)
+    }
+
+
+def _read_copurchase(reader: _Reader, entry: Dict) -> CoPurchaseIndex:
+    return CoPurchaseIndex(
+        reader.index(entry['product_ids']),
+        reader.array(entry['neighbors']),
+        reader.array(entry['weights'])
+    )
+
+
+def _write_factors(writer: _Writer, model: FactorModel) -> Dict:
+    return {
+        'customer_ids': writer.index('factors.customer_ids', model.customer_ids),
+        'product_ids': writer.index('factors.product_ids', model.product_ids),
+        'customer_factors': writer.array('factors.customer_factors', model.customer_factors),
+        'product_factors': writer.array('factors.product_factors', model.product_factors)
+    }
+
+
+def _read_factors(reader: _Reader, entry: Dict) -> FactorModel:
+    return FactorModel(
+        reader.index(entry['customer_ids']),
+        reader.index(entry['product_ids']),
+        reader.array(entry['customer_factors']),
+        reader.array(entry['product_factors'])
+    )
+
+
+def main():
+    """CLI entry point for writing and inspecting snapshots."""
+    parser = argparse.ArgumentParser(description="Engine state snapshots")
+    parser.add_argument('--config', default='config/config.yaml')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    save = subparsers.add_parser('save', help="Load the CSVs and write a snapshot")
+    save.add_argument('products')
+    save.add_argument('transactions')
+    save.add_argument('clickstream')
+    save.add_argument('path')
+
+    publish = subparsers.add_parser(
+        'publish', help="Write a snapshot for API workers and republish when the CSVs change"
+    )
+    publish.add_argument('products')
+    publish.add_argument('transactions')
+    publish.add_argument('clickstream')
+    publish.add_argument('path')
+    publish.add_argument('--poll-interval', type=float, default=30.0)
+
+    info = subparsers.add_parser('info', help="Describe the current snapshot")
+    info.add_argument('path')
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    if args.command == 'save':
+        from src.main import RecommendationEngine
+
+        engine = RecommendationEngine(args.config)
+        engine.load_data(args.products, args.transactions, args.clickstream)
+        version = engine.save_snapshot(args.path)
+        print(f"Saved snapshot {version} to {args.path}")
+
+    elif args.command == 'publish':
+        from src.main import RecommendationEngine
+        from src.refresher import DatasetRefresher
+
+        engine = RecommendationEngine(args.config)
+        engine.load_data(args.products, args.transactions, args.clickstream)
+        version = engine.save_snapshot(args.path)
+        print(f"Published snapshot {version} to {args.path}")
+
+        # Rebuild from the CSVs whenever they change and write a new version
+        refresh_config = dict(engine.config)
+        refresh_config['refresh'] = {'source': 'files', 'save_snapshot': True}
+        refresh_config['snapshot'] = dict(
+            engine.config.get('snapshot', {}) or {}, path=args.path, shared=False
+        )
+        refresher = DatasetRefresher(engine, refresh_config)
+        try:
+            while True:
+                time.sleep(args.poll_interval)
+                try:
+                    if refresher.check():
+                        print(f"Published snapshot {read_manifest(args.path)['version']} to {args.path}")
+                except Exception as e:
+                    logger.error(f"Error republishing snapshot: {e}", exc_info=True)
+        except KeyboardInterrupt:
+            pass
+
+    elif args.command == 'info':
+        manifest = read_manifest(args.path)
+        version_dir = os.path.join(args.path, manifest['version'])
+        size = sum(
+            os.path.getsize(os.path.join(version_dir, name)) for name in os.listdir(version_dir)
+        )
+        print(json.dumps({
+            'version': manifest['version'],
+            'format_version': manifest['format_version'],
+            'created_at': manifest['created_at'],
+            'source_paths': manifest['source_paths'],
+            'rows': {
+                table: manifest[table]['rows']
+                for table in ('products', 'transactions', 'clickstream')
+            },
+            'size_bytes': size
+        }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,239 @@
+"""
+Weight Grid Evaluation
+
+This module evaluates many scoring weight configurations with one scoring
+pass per customer. Each customer's products are scored and filtered once;
+the component columns are then multiplied by a components x K weight matrix
+(ProductScoringEngine.score_weight_grid) to rank under all K configurations.
+
+Grid files are YAML or JSON mapping configuration names to scoring weights:
+
+    baseline:
+      category_affinity: 0.30
+      repurchase_likelihood: 0.25
+      clickstream_intent: 0.25
+      product_popularity: 0.10
+      exploration: 0.10
+    more_intent:
+      category_affinity: 0.20
+      ...
+
+Usage:
+    python -m src.weight_grid <products.csv> <transactions.csv> <clickstream.csv> <grid.yaml>
+        [--k 10] [--sample 100] [--current-time ISO] [--output results.json]
+"""
+
+import argparse
+import json
+import logging
+import time
+from datetime import datetime
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+import yaml
+
+from src.scoring_engine import CORE_COMPONENTS, grid_components
+
+
+def load_weight_grid(path: str) -> Dict[str, Dict[str, float]]:
+    """
+    Load and validate a weight grid file.
+
+    Args:
+        path: YAML or JSON file mapping configuration names to weights
+
+    Returns:
+        Scoring weights by configuration name
+    """
+    with open(path, 'r') as f:
+        grid = yaml.safe_load(f)  # JSON is a subset of YAML
+
+    if not isinstance(grid, dict) or not grid:
+        raise ValueError(f"Weight grid {path} must map configuration names to weights")
+
+    logger = logging.getLogger(__name__)
+    for name, weights in grid.items():
+        if not isinstance(weights, dict):
+            raise ValueError(f"Weights for configuration '{name}' must be a mapping")
+        missing = [component for component in CORE_COMPONENTS if component not in weights]
+        if missing:
+            raise ValueError(f"Configuration '{name}' is missing weights for {missing}")
+        weight_sum = sum(weights.values())
+        if not (0.99 <= weight_sum <= 1.01):
+            logger.warning(f"Configuration '{name}' weights sum to {weight_sum}, expected 1.0")
+
+    return grid
+
+
+def evaluate_weight_grid(
+    engine,
+    customer_ids: List[str],
+    products: pd.DataFrame,
+    transactions: pd.DataFrame,
+    clickstream: pd.DataFrame,
+    weight_grid: Dict[str, Dict[str, float]],
+    k: int = 10,
+    current_time: datetime = None
+) -> Dict:
+    """
+    Rank products for each customer under every configuration of a weight grid.
+
+    Selection stats describe the selector's weighted random draw over each
+    configuration's top selection.top_k products (recently shown products
+    are not excluded): the probability of picking the top product, the
+    expected final score of the pick and the effective number of candidates
+    (exp of the selection entropy).
+
+    Args:
+        engine: RecommendationEngine
+        customer_ids: Customers to evaluate
+        products: Product catalog returned by engine.load_data
+        transactions: Transactions returned by engine.load_data
+        clickstream: Clickstream returned by engine.load_data
+        weight_grid: Scoring weights by configuration name
+        k: Number of top products to report per customer and configuration
+        current_time: Scoring time (defaults to now)
+
+    Returns:
+        Report dictionary with per-configuration summaries and per-customer top-k
+    """
+    if current_time is None:
+        current_time = datetime.now()
+
+    components = grid_components(weight_grid)
+    engine.prepare_components(components)
+    dataset = engine.dataset
+    if dataset is not None and not dataset.matches(products, transactions, clickstream):
+        dataset = None
+    scoring_inputs = dataset.scoring_inputs() if dataset else {}
+    selection_k = engine.config['selection']['top_k']
+
+    names = list(weight_grid.keys())
+    top_products = {name: {} for name in names}
+    stats = {name: {'top_score': [], 'top_pick_probability': [],
+                    'expected_pick_score': [], 'effective_candidates': []} for name in names}
+    scoring_seconds = 0.0
+    ranking_seconds = 0.0
+
+    for customer_id in customer_ids:
+        start = time.perf_counter()
+        scored = engine.scoring_engine.score_products(
+            customer_id, products, transactions, clickstream, current_time,
+            components=components, **scoring_inputs
+        )
+        filtered = engine.constraint_filter.filter_products(
+            customer_id, scored, transactions, current_time,
+            interactions=scoring_inputs.get('interactions')
+        )
+        scoring_seconds += time.perf_counter() - start
+        if len(filtered) == 0:
+            continue
+
+        start = time.perf_counter()
+        grid_scores = engine.scoring_engine.score_weight_grid(filtered, weight_grid).to_numpy()
+        product_ids = filtered['product_id'].to_numpy()
+
+        depth = min(max(k, selection_k), len(filtered))
+        top = np.argpartition(-grid_scores, depth - 1, axis=0)[:depth]
+        top_scores = np.take_along_axis(grid_scores, top, axis=0)
+        order = np.argsort(-top_scores, axis=0, kind='stable')
+        top = np.take_along_axis(top, order, axis=0)
+        top_scores = np.take_along_axis(top_scores, order, axis=0)
+
+        for column, name in enumerate(names):
+            top_products[name][customer_id] = product_ids[top[:k, column]].tolist()
+
+            # Same probabilities as ProductSelector._weighted_random_selection
+            pick_scores = np.maximum(top_scores[:selection_k, column], 0) + 1e-10
+            probabilities = pick_scores / pick_scores.sum()
+            customer_stats = stats[name]
+            customer_stats['top_score'].append(float(top_scores[0, column]))
+            customer_stats['top_pick_probability'].append(float(probabilities[0]))
+            customer_stats['expected_pick_score'].append(
+                float((probabilities * top_scores[:selection_k, column]).sum())
+            )
+            customer_stats['effective_candidates'].append(
+                float(np.exp(-(probabilities * np.log(probabilities)).sum()))
+            )
+        ranking_seconds += time.perf_counter() - start
+
+    baseline = names[0]
+    configurations = {}
+    for name in names:
+        customer_tops = top_products[name]
+        overlaps = [
+            len(set(customer_tops[customer_id]) & set(top_products[baseline][customer_id]))
+            / max(len(customer_tops[customer_id]), 1)
+            for customer_id in customer_tops
+        ]
+        configurations[name] = {
+            'weights': weight_grid[name],
+            'catalog_coverage': len({p for top in customer_tops.values() for p in top}) / max(len(products), 1),
+            f'overlap_at_{k}_with_{baseline}': float(np.mean(overlaps)) if overlaps else 0.0,
+            **{
+                f'mean_{stat}': float(np.mean(values)) if values else 0.0
+                for stat, values in stats[name].items()
+            }
+        }
+
+    return {
+        'k': k,
+        'customers': len(customer_ids),
+        'configurations': configurations,
+        'top_products': top_products,
+        'scoring_seconds': scoring_seconds,
+        'ranking_seconds': ranking_seconds
+    }
+
+
+def main():
+    """CLI entry point: evaluate a weight grid on replayed data."""
+    from src.main import RecommendationEngine
+
+    parser = argparse.ArgumentParser(description="Evaluate a grid of scoring weight configurations")
+    parser.add_argument('products')
+    parser.add_argument('transactions')
+    parser.add_argument('clickstream')
+    parser.add_argument('grid', help="YAML/JSON file mapping configuration names to weights")
+    parser.add_argument('--config', default='config/config.yaml')
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--sample', type=int, default=100, help="Number of customers to evaluate")
+    parser.add_argument('--current-time', default=None, help="Replay time (ISO format)")
+    parser.add_argument('--output', default=None, help="Write the full report (with top-k lists) as JSON")
+    args = parser.parse_args()
+
+    weight_grid = load_weight_grid(args.grid)
+    engine = RecommendationEngine(args.config)
+    products, transactions, clickstream = engine.load_data(
+        args.products, args.transactions, args.clickstream
+    )
+
+    current_time = pd.Timestamp(args.current_time).to_pydatetime() if args.current_time else None
+    customer_ids = transactions['customer_id'].drop_duplicates().head(args.sample).tolist()
+    report = evaluate_weight_grid(
+        engine, customer_ids, products, transactions, clickstream,
+        weight_grid, k=args.k, current_time=current_time
+    )
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    print("\n" + "="*60)
+    print("WEIGHT GRID EVALUATION")
+    print("="*60)
+    print(f"Customers: {report['customers']}   Configurations: {len(weight_grid)}")
+    for name, summary in report['configurations'].items():
+        print(f"\n{name}")
+        for key, value in summary.items():
+            if key != 'weights':
+                print(f"  {key}: {value:.3f}")
+    print(f"\nScoring time: {report['scoring_seconds']:.2f}s (one pass per customer), "
+          f"ranking time: {report['ranking_seconds']:.2f}s")
+    print("="*60)
+
+
+if __name__ == '__main__':
+    main()